@@ -1,3 +1,4 @@
+import ast
 import random
 import re
 from copy import deepcopy
@@ -241,11 +242,11 @@ Current Behavior Guidelines:
             if "json" in llm_output:
                 json_tasks = extract_code_blocks(llm_output)[0].strip()
                 json_tasks = json_tasks.replace("false", "False").replace("true", "True")
-                assigned_tasks = eval(json_tasks)
+                assigned_tasks = ast.literal_eval(json_tasks)
             else:
                 code_blocks = extract_code_blocks(llm_output, "text")
                 json_idx = 1 + self.send_message
-                assigned_tasks = eval(code_blocks[json_idx])
+                assigned_tasks = ast.literal_eval(code_blocks[json_idx])
         except Exception as e:
             logger.error(f"Error: {e}")
             assigned_tasks = None
@@ -508,11 +509,11 @@ Current Behavior Guidelines:
             if "json" in llm_output:
                 json_tasks = extract_code_blocks(llm_output)[0].strip()
                 json_tasks = json_tasks.replace("false", "False").replace("true", "True")
-                assigned_tasks = eval(json_tasks)
+                assigned_tasks = ast.literal_eval(json_tasks)
             else:
                 code_blocks = extract_code_blocks(llm_output, "text")
                 json_idx = 1 + self.send_message
-                assigned_tasks = eval(code_blocks[json_idx])
+                assigned_tasks = ast.literal_eval(code_blocks[json_idx])
         except Exception as e:
             logger.error(f"Error: {e}")
             assigned_tasks = None
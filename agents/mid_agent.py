@@ -30,12 +30,37 @@ class MidAgent:
         self.mid_planner = MidPlanner(self.text_agent, self.world)
         self.prev_text_action = ""
 
+        # fast-forward of the ticks in which the text action is certain to stay (see `next_interesting_tick`)
+        self.fast_forward = True
+        self._idle_ticks = 0
+        self._idle_key = None
+
     def update(self, text_action_agent: TextAgent, cooking_world: CookingWorld):
         self.world = cooking_world
         self.text_agent = text_action_agent
         self.agent_idx = self.text_agent.agent_idx
         self.agent = self.text_agent.agent
         self.mid_planner.update(self.text_agent, self.world)
+        self._idle_ticks = 0
+
+    def _world_signature(self) -> Tuple:
+        """
+        The world except the progress of the food: agents, and where and what the dynamic objects are
+        """
+        return (
+            tuple((agent.location, agent.orientation, id(agent.holding)) for agent in self.world.agents),
+            tuple(
+                (id(obj), obj.location, getattr(obj, "chop_state", None))
+                for obj in self.world.get_dynamic_object_list()
+            ),
+        )
+
+    def next_interesting_tick(self) -> int:
+        """
+        Ticks until the output of get_action may change, 1 if it may at the next tick. Until then, get_action with the
+        same mid action returns (False, 0, "Working...") without planning, unless the world changes otherwise.
+        """
+        return self._idle_ticks + 1
 
     def get_action(self, func: str, *args, **kwargs) -> Tuple[bool, int, str]:
         """
@@ -46,6 +71,16 @@ class MidAgent:
             execution result | str,
         )
         """
+        idle_key = (func, args, tuple(kwargs.items()))
+        if self._idle_ticks > 0:
+            self._idle_ticks -= 1
+            key, signature = self._idle_key
+            if key == idle_key and (
+                self.text_agent.current_task == self.text_agent.wait or signature == self._world_signature()
+            ):
+                return False, self.text_agent.skip_idle_tick(), "Working..."
+            self._idle_ticks = 0
+
         end = False
         action = TEXT_ACTION_SUCCESS
         text_action = None
@@ -118,6 +153,10 @@ class MidAgent:
                     status = text_action
             else:
                 status = "Working..."
+                if action == 0 and self.fast_forward:
+                    self._idle_ticks = self.text_agent.idle_ticks()
+                    if self._idle_ticks > 0:
+                        self._idle_key = (idle_key, self._world_signature())
 
         assert action in [0, 1, 2, 3, 4, 5], action
         assert not end or ((status.startswith("Succeeded") or status.startswith("Failed")) and action == 0), (
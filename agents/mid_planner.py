@@ -1,11 +1,11 @@
 import random
 from collections import defaultdict
+from functools import partial
 from typing import Callable, Dict, List, Tuple, Union
 
 from gym_cooking.cooking_world.cooking_world import CookingWorld
 from gym_cooking.cooking_world.world_objects import *
 from loguru import logger
-from rich.pretty import pretty_repr
 
 from agents.text_agent import TextAgent
 
@@ -142,9 +142,15 @@ def is_closest_to_ready_pan(
     )
     if len(pan_objects) == 0:
         return True
-    # the reachability may change, but I have no idea how to deal with it
-    _, target_to_pan = agent.closest(pan_objects, target_obj.location)
-    _, plate_to_pan = agent.closest(pan_objects, plate_obj.location)
+    if agent.use_walking_distances:
+        # the distances to the nearest pan around the counters
+        pan_distance = agent.walking_distances([pan.location for pan in pan_objects])
+        target_to_pan = pan_distance(target_obj.location)
+        plate_to_pan = pan_distance(plate_obj.location)
+    else:
+        # the reachability may change, but I have no idea how to deal with it
+        _, target_to_pan = agent.closest(pan_objects, target_obj.location)
+        _, plate_to_pan = agent.closest(pan_objects, plate_obj.location)
 
     return target_to_agent + target_to_pan < plate_to_agent + plate_to_pan
 
@@ -157,6 +163,145 @@ def get_occupy_counter(agent: TextAgent, world: CookingWorld) -> List[Counter]:
     return agent.get_objects("Counter", check=lambda x: len(world.get_objects_at(x.location)) > 1)
 
 
+def is_in_center_counter(agent: TextAgent, world: CookingWorld, x: Object) -> bool:
+    counter_objects = world.get_objects_at(x.location, Counter)
+    return len(counter_objects) == 1 and agent.is_target_status(counter_objects[0], "center")
+
+
+def is_valid_center_counter(agent: TextAgent, world: CookingWorld, thing: str, thing_status: str, x: Object) -> bool:
+    """
+    Check whether the counter `x` is a center counter to pass on the `thing` with `thing_status`.
+    """
+    if (thing, thing_status) in [("Lettuce", "done"), ("Bread", "")]:
+        plate_objects = world.get_objects_at(x.location, Plate)
+        if len(plate_objects) > 0:
+            return agent.is_target_status(x, "center") and len(plate_objects[0].content) == 0
+    return agent.is_target_status(x, "center") and (len(world.get_objects_at(x.location)) == 1)
+
+
+def is_center_counter_available(agent: TextAgent, world: CookingWorld, thing: str, thing_status: str) -> bool:
+    return is_ingredients_available(
+        agent, world, ["Counter"], [partial(is_valid_center_counter, agent, world, thing, thing_status)]
+    )
+
+
+def is_pan_food_passable(agent: TextAgent, world: CookingWorld, thing: str, thing_status: str) -> bool:
+    """
+    Check whether the `thing` with `thing_status` in a pan can be plated and put onto a center counter.
+    """
+    return is_ingredients_available(
+        agent,
+        world,
+        [thing, "Counter"],
+        [
+            lambda x: agent.is_target_status(x, thing_status) and len(world.get_objects_at(x.location, Pan)) == 1,
+            partial(is_valid_center_counter, agent, world, thing, thing_status),
+        ],
+    )
+
+
+def is_food_passable(agent: TextAgent, world: CookingWorld, thing: str, thing_status: str) -> bool:
+    """
+    Check whether the `thing` with `thing_status` not on a center counter can be put onto a center counter.
+    """
+    return is_ingredients_available(
+        agent,
+        world,
+        ["Counter", thing],
+        [
+            partial(is_valid_center_counter, agent, world, thing, thing_status),
+            lambda x: agent.is_target_status(x, thing_status) and not is_in_center_counter(agent, world, x),
+        ],
+    )
+
+
+class ProcessGraph:
+    """
+    The subtask sequences of a process compiled into a state machine, shared by all MidPlanner instances.
+
+    State `i` stands for the subtasks done so far, `prefixes[i]` (state 0 for none). `transitions[i]` are the candidate
+    next subtasks as (subtask, predicate id or -1, next state), in the order of the sequences, `terminal[i]` is whether
+    the process is done and `parents[i]` is the state before the last subtask. The predicate `predicates[j]` is a
+    (function, args) pair checked with `function(agent, world, *args)`.
+    """
+
+    def __init__(self, name: str, sequences: List[list]):
+        self.name = name
+        forward_index: Dict[Tuple[str, ...], list | bool] = {}
+        for sequence in sequences:
+            steps = [(st, None, ()) if isinstance(st, str) else st for st in sequence]
+            prefix = ()
+            forward_index[prefix] = forward_index.get(prefix, []) + [steps[0]]
+            for i, step in enumerate(steps):
+                prefix = prefix + (step[0],)
+                if i == len(steps) - 1:
+                    forward_index[prefix] = True
+                else:
+                    forward_index[prefix] = forward_index.get(prefix, []) + [steps[i + 1]]
+
+        self.prefixes: List[Tuple[str, ...]] = list(forward_index)
+        self.state_ids: Dict[Tuple[str, ...], int] = {prefix: i for i, prefix in enumerate(self.prefixes)}
+        self.parents: List[int] = [self.state_ids[prefix[:-1]] if prefix else 0 for prefix in self.prefixes]
+        self.terminal: List[bool] = [cands is True for cands in forward_index.values()]
+        self.predicates: List[Tuple[Callable, tuple]] = []
+        self.transitions: List[Tuple[Tuple[str, int, int], ...]] = [
+            (
+                ()
+                if cands is True
+                else tuple(
+                    (subtask, self._predicate_id(predicate, args), self.state_ids[prefix + (subtask,)])
+                    for subtask, predicate, args in cands
+                )
+            )
+            for prefix, cands in forward_index.items()
+        ]
+
+    def _predicate_id(self, predicate: Callable | None, args: tuple) -> int:
+        if predicate is None:
+            return -1
+        for i, (_predicate, _args) in enumerate(self.predicates):
+            if _predicate is predicate and _args == args:
+                return i
+        self.predicates.append((predicate, args))
+        return len(self.predicates) - 1
+
+    def next_subtasks(
+        self, state: int, agent: TextAgent, world: CookingWorld, valid_actions: List[str], first: bool = False
+    ) -> List[Tuple[str, int]]:
+        """
+        The (subtask, next state) candidates of `state` which are valid actions and whose predicates hold, only the
+        first one if `first`. Each predicate is checked at most once.
+        """
+        checked = {}
+        cands = []
+        for subtask, predicate_id, next_state in self.transitions[state]:
+            if subtask not in valid_actions:
+                continue
+            if predicate_id >= 0:
+                holds = checked.get(predicate_id)
+                if holds is None:
+                    predicate, args = self.predicates[predicate_id]
+                    holds = checked[predicate_id] = bool(predicate(agent, world, *args))
+                if not holds:
+                    continue
+            cands.append((subtask, next_state))
+            if first:
+                break
+        return cands
+
+    def describe(self) -> str:
+        lines = [f"{self.name}: {len(self.prefixes)} states, {len(self.predicates)} predicates"]
+        for state, prefix in enumerate(self.prefixes):
+            nexts = (
+                "done" if self.terminal[state] else ", ".join(f"{st}[{p}]->{n}" for st, p, n in self.transitions[state])
+            )
+            lines.append(f"  {state} {prefix}: {nexts}")
+        return "\n".join(lines)
+
+    def __repr__(self) -> str:
+        return f"ProcessGraph({self.name!r}, states={len(self.prefixes)}, predicates={len(self.predicates)})"
+
+
 class MidPlanner:
     valid_actions = {
         "prepare": [
@@ -187,712 +332,685 @@ class MidPlanner:
         "clean_a_counter": [{"center": False}, {"center": True}],
     }
 
-    def __init__(self, agent: TextAgent, world: CookingWorld, max_n_try: int = 10):
-        self.text_agent = agent
-        self.agent = agent.agent
-        self.agent_idx = self.text_agent.agent_idx
-        self.world = world
-        self.prev_subtasks: List[str] = []
-        self.prev_task: tuple = None
-        self.max_n_try = max_n_try
-
-        self._assemble_prev_recipes: List[Tuple[str]] = []
-
-        # Two methods to check state: valid action, check function
-        self._prepare_process = {
-            "Lettuce": {
-                True: [  # priority
-                    [
-                        (
-                            "get_plate_from_station",
-                            lambda agent, world: not is_cutboard_available(agent, world),
-                            (self.text_agent, self.world),
-                        ),
-                        "plate_lettuce_done_from_cutboard",
-                        (
-                            "get_lettuce_from_station",
-                            lambda: is_cutboard_available(self.text_agent, self.world),
-                            (),
-                        ),
-                        "put_onto_cutboard",
-                        "chop_lettuce",
-                        (
-                            "get_plate_from_station",
-                            is_cutboard_ready,
-                            (self.text_agent, self.world),
-                        ),
-                        "plate_lettuce_done_from_cutboard",
-                    ],
-                    [
-                        "chop_lettuce",
-                        (
-                            "get_plate_from_station",
-                            is_cutboard_ready,
-                            (self.text_agent, self.world),
-                        ),
-                        "plate_lettuce_done_from_cutboard",
-                    ],
-                    [
-                        (
-                            "get_lettuce_from_station",
-                            lambda: is_cutboard_available(self.text_agent, self.world),
-                            (),
-                        ),
-                        "put_onto_cutboard",
-                        "chop_lettuce",
-                        (
-                            "get_plate_from_station",
-                            is_cutboard_ready,
-                            (self.text_agent, self.world),
-                        ),
-                        "plate_lettuce_done_from_cutboard",
-                    ],
+    # Two methods to check state: valid action, check function
+    # A subtask is a str or (subtask, predicate, args), checked with `predicate(agent, world, *args)`
+    _prepare_process = {
+        "Lettuce": {
+            True: [  # priority
+                [
+                    (
+                        "get_plate_from_station",
+                        lambda agent, world: not is_cutboard_available(agent, world),
+                        (),
+                    ),
+                    "plate_lettuce_done_from_cutboard",
+                    (
+                        "get_lettuce_from_station",
+                        is_cutboard_available,
+                        (),
+                    ),
+                    "put_onto_cutboard",
+                    "chop_lettuce",
+                    (
+                        "get_plate_from_station",
+                        is_cutboard_ready,
+                        (),
+                    ),
+                    "plate_lettuce_done_from_cutboard",
                 ],
-                False: [
-                    [
-                        (
-                            "get_plate_from_station",
-                            lambda agent, world: not is_cutboard_available(agent, world),
-                            (self.text_agent, self.world),
-                        ),
-                        "plate_lettuce_done_from_cutboard",
-                        (
-                            "get_lettuce_from_station",
-                            lambda: is_cutboard_available(self.text_agent, self.world),
-                            (),
-                        ),
-                        "put_onto_cutboard",
-                        "chop_lettuce",
-                    ],
-                    [
-                        "chop_lettuce",
-                    ],
-                    [
-                        (
-                            "get_lettuce_from_station",
-                            lambda: is_cutboard_available(self.text_agent, self.world),
-                            (),
-                        ),
-                        "put_onto_cutboard",
-                        "chop_lettuce",
-                    ],
+                [
+                    "chop_lettuce",
+                    (
+                        "get_plate_from_station",
+                        is_cutboard_ready,
+                        (),
+                    ),
+                    "plate_lettuce_done_from_cutboard",
                 ],
-            },
-            "Beef": {
-                True: [
-                    [
-                        (
-                            "get_beef_from_station",
-                            is_pan_available,
-                            (self.text_agent, self.world),
-                        ),
-                        "put_onto_pan",
-                        (
-                            "get_plate_from_station",
-                            is_pan_ready,
-                            (self.text_agent, self.world),
-                        ),
-                        "plate_beef_done_from_pan",
-                    ],
-                    [
-                        (
-                            "get_plate_from_station",
-                            lambda agent, world: not is_pan_available(agent, world)
-                            and is_ingredients_available(agent, world, ["Beef"], ["overcooked"]),
-                            (self.text_agent, self.world),
-                        ),
-                        "plate_beef_overcooked_from_pan",
-                        "drop_food",
-                        (
-                            "get_beef_from_station",
-                            is_pan_available,
-                            (self.text_agent, self.world),
-                        ),
-                        "put_onto_pan",
-                        (
-                            "get_plate_from_station",
-                            is_pan_ready,
-                            (self.text_agent, self.world),
-                        ),
-                        "plate_beef_done_from_pan",
-                    ],
-                    [  # no dustbin
-                        (
-                            "get_plate_from_station",
-                            lambda agent, world: not is_pan_available(agent, world)
-                            and is_ingredients_available(agent, world, ["Beef"], ["overcooked"]),
-                            (self.text_agent, self.world),
-                        ),
-                        "plate_beef_overcooked_from_pan",
-                        (
-                            "get_beef_from_station",
-                            is_pan_available,
-                            (self.text_agent, self.world),
-                        ),
-                        "put_onto_pan",
-                        (
-                            "get_plate_from_station",
-                            is_pan_ready,
-                            (self.text_agent, self.world),
-                        ),
-                        "plate_beef_done_from_pan",
-                    ],
-                    [
-                        (
-                            "get_plate_from_station",
-                            lambda agent, world: not is_pan_available(agent, world) and is_pan_ready(agent, world),
-                            (self.text_agent, self.world),
-                        ),
-                        "plate_beef_done_from_pan",
-                        (
-                            "get_beef_from_station",
-                            is_pan_available,
-                            (self.text_agent, self.world),
-                        ),
-                        "put_onto_pan",
-                        (
-                            "get_plate_from_station",
-                            is_pan_ready,
-                            (self.text_agent, self.world),
-                        ),
-                        "plate_beef_done_from_pan",
-                    ],
+                [
+                    (
+                        "get_lettuce_from_station",
+                        is_cutboard_available,
+                        (),
+                    ),
+                    "put_onto_cutboard",
+                    "chop_lettuce",
+                    (
+                        "get_plate_from_station",
+                        is_cutboard_ready,
+                        (),
+                    ),
+                    "plate_lettuce_done_from_cutboard",
                 ],
-                False: [
-                    [
-                        (
-                            "get_beef_from_station",
-                            is_pan_available,
-                            (self.text_agent, self.world),
-                        ),
-                        "put_onto_pan",
-                    ],
-                    [
-                        (
-                            "get_plate_from_station",
-                            lambda agent, world: not is_pan_available(agent, world)
-                            and is_ingredients_available(agent, world, ["Beef"], ["overcooked"]),
-                            (self.text_agent, self.world),
-                        ),
-                        "plate_beef_overcooked_from_pan",
-                        "drop_food",
-                        (
-                            "get_beef_from_station",
-                            is_pan_available,
-                            (self.text_agent, self.world),
-                        ),
-                        "put_onto_pan",
-                    ],
-                    [  # no dustbin
-                        (
-                            "get_plate_from_station",
-                            lambda agent, world: not is_pan_available(agent, world)
-                            and is_ingredients_available(agent, world, ["Beef"], ["overcooked"]),
-                            (self.text_agent, self.world),
-                        ),
-                        "plate_beef_overcooked_from_pan",
-                        (
-                            "get_beef_from_station",
-                            is_pan_available,
-                            (self.text_agent, self.world),
-                        ),
-                        "put_onto_pan",
-                    ],
-                    [
-                        (
-                            "get_plate_from_station",
-                            lambda agent, world: not is_pan_available(agent, world) and is_pan_ready(agent, world),
-                            (self.text_agent, self.world),
-                        ),
-                        "plate_beef_done_from_pan",
-                        (
-                            "get_beef_from_station",
-                            is_pan_available,
-                            (self.text_agent, self.world),
-                        ),
-                        "put_onto_pan",
-                    ],
+            ],
+            False: [
+                [
+                    (
+                        "get_plate_from_station",
+                        lambda agent, world: not is_cutboard_available(agent, world),
+                        (),
+                    ),
+                    "plate_lettuce_done_from_cutboard",
+                    (
+                        "get_lettuce_from_station",
+                        is_cutboard_available,
+                        (),
+                    ),
+                    "put_onto_cutboard",
+                    "chop_lettuce",
                 ],
-            },
-            "Bread": {
-                True: [
-                    [
-                        "get_bread_from_station",
-                        "put_onto_plate",
-                    ],
-                    [
-                        "get_bread_from_station",
-                        "put_onto_counter",
-                        (
-                            "get_plate_from_station",
-                            is_ingredients_available,
-                            (self.text_agent, self.world, ["Bread"], [""]),
-                        ),
-                        "plate_bread",
-                    ],
+                [
+                    "chop_lettuce",
                 ],
-                False: [
-                    [
-                        "get_bread_from_station",
-                    ]
+                [
+                    (
+                        "get_lettuce_from_station",
+                        is_cutboard_available,
+                        (),
+                    ),
+                    "put_onto_cutboard",
+                    "chop_lettuce",
                 ],
-            },
-        }
-        assert self._check_process(self._prepare_process)
-        self._prepare_process_forward_index = self._processes_transform(self._prepare_process)
-        logger.trace("\n" + pretty_repr(self._prepare_process_forward_index))
-
-        # MARK: priority, first bread on counter, then no bread on counter
-        self._num_assemble_process = {
-            "LettuceBurger": {
-                ("Lettuce",): 7,
-            },
-            "BeefBurger": {
-                ("Beef",): 8,
-            },
-            "BeefLettuceBurger": {
-                ("Beef", "LettuceBurger"): 4,
-                ("BeefLettuce",): 3,
-                ("BeefBurger", "Lettuce"): 1,
-            },
-            "BeefLettuce": {
-                ("Beef", "Lettuce"): 4,
-            },
-        }
-        self.food_ingredients_index = {
-            "LettuceBurger": {
-                (): [("LettuceBurger", ["Lettuce"], ["done"])],
-                (
+            ],
+        },
+        "Beef": {
+            True: [
+                [
                     (
-                        "LettuceBurger",
-                        ("Lettuce",),
+                        "get_beef_from_station",
+                        is_pan_available,
+                        (),
                     ),
-                ): True,
-            },
-            "BeefBurger": {
-                (): [
+                    "put_onto_pan",
                     (
-                        "BeefBurger",
-                        ["Beef"],
-                        [
-                            lambda x: is_pan_ready(self.text_agent, self.world)
-                            or self.text_agent.is_target_status(x, "done"),
-                        ],
+                        "get_plate_from_station",
+                        is_pan_ready,
+                        (),
                     ),
+                    "plate_beef_done_from_pan",
                 ],
-                (
+                [
                     (
-                        "BeefBurger",
-                        ("Beef",),
-                    ),
-                ): True,
-            },
-            "BeefLettuce": {
-                (): [
-                    (
-                        "BeefLettuce",
-                        ["Beef", "Lettuce"],
-                        [
-                            lambda x: is_pan_ready(self.text_agent, self.world)
-                            or self.text_agent.is_target_status(x, "done"),
-                            "done",
-                        ],
-                    ),  # make a BeefLettuce\
+                        "get_plate_from_station",
+                        lambda agent, world: not is_pan_available(agent, world)
+                        and is_ingredients_available(agent, world, ["Beef"], ["overcooked"]),
+                        (),
+                    ),
+                    "plate_beef_overcooked_from_pan",
+                    "drop_food",
+                    (
+                        "get_beef_from_station",
+                        is_pan_available,
+                        (),
+                    ),
+                    "put_onto_pan",
+                    (
+                        "get_plate_from_station",
+                        is_pan_ready,
+                        (),
+                    ),
+                    "plate_beef_done_from_pan",
                 ],
-                (("BeefLettuce", ("Beef", "Lettuce")),): True,
-            },
-            "BeefLettuceBurger": {
-                (): [
+                [  # no dustbin
                     (
-                        "BeefLettuce",
-                        ["Beef", "Lettuce"],
-                        [
-                            lambda x: is_pan_ready(self.text_agent, self.world),
-                            "done",
-                        ],  # make a BeefLettuce
+                        "get_plate_from_station",
+                        lambda agent, world: not is_pan_available(agent, world)
+                        and is_ingredients_available(agent, world, ["Beef"], ["overcooked"]),
+                        (),
                     ),
+                    "plate_beef_overcooked_from_pan",
                     (
-                        (
-                            "BeefBurger",
-                            lambda: is_ingredients_available(
-                                self.text_agent, self.world, ["Lettuce"], ["done"]
-                            ),  # other conditions except for available ingredients for making this burger
-                        ),
-                        [
-                            "Beef",
-                        ],
-                        [
-                            lambda x: is_pan_ready(self.text_agent, self.world),
-                        ],
+                        "get_beef_from_station",
+                        is_pan_available,
+                        (),
                     ),
+                    "put_onto_pan",
                     (
-                        "BeefLettuceBurger",
-                        ["Beef", "LettuceBurger"],
-                        [lambda x: is_pan_ready(self.text_agent, self.world), ""],
+                        "get_plate_from_station",
+                        is_pan_ready,
+                        (),
                     ),
+                    "plate_beef_done_from_pan",
+                ],
+                [
                     (
-                        "BeefLettuce",
-                        ["Beef", "Lettuce"],
-                        [
-                            "done",
-                            "done",
-                        ],
-                    ),  # make a BeefLettuce
-                    ("BeefLettuceBurger", ["BeefLettuce"], [""]),
+                        "get_plate_from_station",
+                        lambda agent, world: not is_pan_available(agent, world) and is_pan_ready(agent, world),
+                        (),
+                    ),
+                    "plate_beef_done_from_pan",
                     (
-                        (
-                            "BeefBurger",
-                            lambda: is_ingredients_available(
-                                self.text_agent, self.world, ["Lettuce"], ["done"]
-                            ),  # other conditions except for available ingredients for making this burger
-                        ),
-                        [
-                            "Beef",
-                        ],
-                        [
-                            "done",
-                        ],
+                        "get_beef_from_station",
+                        is_pan_available,
+                        (),
                     ),
+                    "put_onto_pan",
                     (
-                        (
-                            "LettuceBurger",
-                            lambda: is_ingredients_available(
-                                self.text_agent, self.world, ["Beef"], ["done"]
-                            ),  # other conditions except for available ingredients for making this burger
-                        ),
-                        ["Lettuce"],
-                        ["done"],
+                        "get_plate_from_station",
+                        is_pan_ready,
+                        (),
                     ),
-                    ("BeefLettuceBurger", ["BeefBurger", "Lettuce"], ["", "done"]),
-                    ("BeefLettuceBurger", ["Beef", "LettuceBurger"], ["done", ""]),
+                    "plate_beef_done_from_pan",
                 ],
-                (("BeefLettuce", ("Beef", "Lettuce")),): [("BeefLettuceBurger", ["BeefLettuce"], [""])],
-                (
-                    ("BeefLettuce", ("Beef", "Lettuce")),
-                    ("BeefLettuceBurger", ("BeefLettuce",)),
-                ): True,
-                (("BeefBurger", ("Beef",)),): [("BeefLettuceBurger", ["BeefBurger", "Lettuce"], ["", "done"])],
+            ],
+            False: [
+                [
+                    (
+                        "get_beef_from_station",
+                        is_pan_available,
+                        (),
+                    ),
+                    "put_onto_pan",
+                ],
+                [
+                    (
+                        "get_plate_from_station",
+                        lambda agent, world: not is_pan_available(agent, world)
+                        and is_ingredients_available(agent, world, ["Beef"], ["overcooked"]),
+                        (),
+                    ),
+                    "plate_beef_overcooked_from_pan",
+                    "drop_food",
+                    (
+                        "get_beef_from_station",
+                        is_pan_available,
+                        (),
+                    ),
+                    "put_onto_pan",
+                ],
+                [  # no dustbin
+                    (
+                        "get_plate_from_station",
+                        lambda agent, world: not is_pan_available(agent, world)
+                        and is_ingredients_available(agent, world, ["Beef"], ["overcooked"]),
+                        (),
+                    ),
+                    "plate_beef_overcooked_from_pan",
+                    (
+                        "get_beef_from_station",
+                        is_pan_available,
+                        (),
+                    ),
+                    "put_onto_pan",
+                ],
+                [
+                    (
+                        "get_plate_from_station",
+                        lambda agent, world: not is_pan_available(agent, world) and is_pan_ready(agent, world),
+                        (),
+                    ),
+                    "plate_beef_done_from_pan",
+                    (
+                        "get_beef_from_station",
+                        is_pan_available,
+                        (),
+                    ),
+                    "put_onto_pan",
+                ],
+            ],
+        },
+        "Bread": {
+            True: [
+                [
+                    "get_bread_from_station",
+                    "put_onto_plate",
+                ],
+                [
+                    "get_bread_from_station",
+                    "put_onto_counter",
+                    (
+                        "get_plate_from_station",
+                        is_ingredients_available,
+                        (["Bread"], [""]),
+                    ),
+                    "plate_bread",
+                ],
+            ],
+            False: [
+                [
+                    "get_bread_from_station",
+                ]
+            ],
+        },
+    }
+
+    # MARK: priority, first bread on counter, then no bread on counter
+    _num_assemble_process = {
+        "LettuceBurger": {
+            ("Lettuce",): 7,
+        },
+        "BeefBurger": {
+            ("Beef",): 8,
+        },
+        "BeefLettuceBurger": {
+            ("Beef", "LettuceBurger"): 4,
+            ("BeefLettuce",): 3,
+            ("BeefBurger", "Lettuce"): 1,
+        },
+        "BeefLettuce": {
+            ("Beef", "Lettuce"): 4,
+        },
+    }
+    # (sub food or (sub food, condition(agent, world)), ingredients, statuses), a callable status is `status(agent, world, x)`
+    food_ingredients_index = {
+        "LettuceBurger": {
+            (): [("LettuceBurger", ["Lettuce"], ["done"])],
+            (
                 (
-                    ("BeefBurger", ("Beef",)),
-                    ("BeefLettuceBurger", ("BeefBurger", "Lettuce")),
-                ): True,
-                (("LettuceBurger", ("Lettuce",)),): [("BeefLettuceBurger", ["Beef", "LettuceBurger"], ["done", ""])],
+                    "LettuceBurger",
+                    ("Lettuce",),
+                ),
+            ): True,
+        },
+        "BeefBurger": {
+            (): [
                 (
-                    ("LettuceBurger", ("Lettuce",)),
-                    ("BeefLettuceBurger", ("Beef", "LettuceBurger")),
-                ): True,
-                (("BeefLettuceBurger", ("BeefBurger", "Lettuce")),): True,
-                (("BeefLettuceBurger", ("BeefLettuce",)),): True,
-                (("BeefLettuceBurger", ("Beef", "LettuceBurger")),): True,
-            },
-        }
-        self.food_ingredients_urgency = {
-            "LettuceBurger": {},
-            "BeefBurger": {},
-            "BeefLettuce": {},
-            "BeefLettuceBurger": {(): [1, 1, 1, 2, 2, 2, 2, 2, 2]},
-        }
-        self._assemble_process = {
-            "LettuceBurger": {
-                ("Lettuce",): [
+                    "BeefBurger",
+                    ["Beef"],
                     [
-                        (
-                            "pickup_bread_in_plate",
-                            lambda agent, world: is_ingredients_available(agent, world, ["Lettuce"], ["done"]),
-                            (self.text_agent, self.world),
-                        ),
-                        "plate_lettuce_done",
-                    ],
-                    [
-                        (
-                            "get_bread_from_station",
-                            lambda agent, world: is_ingredients_available(agent, world, ["Lettuce"], ["in_plate"]),
-                            (self.text_agent, self.world),
-                        ),
-                        "put_onto_plate_with_lettuce",
-                    ],
-                    [  # change to pickup bread
-                        (
-                            "get_bread_from_station",
-                            lambda agent, world: is_ingredients_available(agent, world, ["Lettuce"], ["in_plate"]),
-                            (self.text_agent, self.world),
-                        ),
-                        "plate_lettuce_done",
-                    ],
-                    [
-                        (
-                            "pickup_lettuce_in_plate",
-                            is_ingredients_available,
-                            (
-                                self.text_agent,
-                                self.world,
-                                ["Lettuce", "Bread"],
-                                ["in_plate", ""],
-                            ),
-                        ),
-                        "plate_bread",
-                    ],
-                    [
-                        (
-                            "get_plate_from_station",
-                            lambda agent, world: is_ingredients_available(agent, world, ["Lettuce"], ["done"])
-                            and not is_ingredients_available(agent, world, ["Lettuce"], ["in_plate"]),
-                            (self.text_agent, self.world),
-                        ),
-                        "plate_lettuce_done",
-                        "plate_bread",
-                    ],
-                    [
-                        (
-                            "get_plate_from_station",
-                            lambda agent, world: is_ingredients_available(agent, world, ["Lettuce"], ["done"])
-                            and not is_ingredients_available(agent, world, ["Lettuce"], ["in_plate"]),
-                            (self.text_agent, self.world),
-                        ),
-                        "plate_lettuce_done",
-                        (
-                            "get_bread_from_station",
-                            is_ingredients_available,
-                            (self.text_agent, self.world, ["Lettuce"], ["in_plate"]),
-                        ),
-                        "put_onto_plate_with_lettuce",
-                    ],
-                    [  # change to pickup bread
-                        (
-                            "get_plate_from_station",
-                            lambda agent, world: is_ingredients_available(agent, world, ["Lettuce"], ["in_plate"])
-                            and not is_ingredients_available(agent, world, ["Lettuce"], ["in_plate"]),
-                            (self.text_agent, self.world),
-                        ),
-                        "plate_lettuce_done",
-                        (
-                            "get_bread_from_station",
-                            is_ingredients_available,
-                            (self.text_agent, self.world, ["Lettuce"], ["done"]),
-                        ),
-                        "plate_lettuce_done",
-                    ],
-                ],
-            },
-            "BeefBurger": {
-                ("Beef",): [
-                    [
-                        (
-                            "pickup_bread_in_plate",
-                            is_closest_to_ready_pan,
-                            (self.text_agent, self.world, "Bread", "in_plate"),
-                        ),
-                        "plate_beef_done_from_pan",
-                    ],
-                    [
-                        (
-                            "get_plate_from_station",
-                            is_pan_ready,
-                            (
-                                self.text_agent,
-                                self.world,
-                            ),
-                        ),
-                        "plate_beef_done_from_pan",
-                        "plate_bread",
-                    ],
-                    [
-                        (
-                            "get_plate_from_station",
-                            is_pan_ready,
-                            (
-                                self.text_agent,
-                                self.world,
-                            ),
-                        ),
-                        "plate_beef_done_from_pan",
-                        (
-                            "get_bread_from_station",
-                            is_ingredients_available,
-                            (self.text_agent, self.world, ["Beef"], ["in_plate"]),
-                        ),
-                        "put_onto_plate_with_beef",
-                    ],
-                    [  # change to pickup
-                        (
-                            "get_plate_from_station",
-                            is_pan_ready,
-                            (
-                                self.text_agent,
-                                self.world,
-                            ),
-                        ),
-                        "plate_beef_done_from_pan",
-                        (
-                            "get_bread_from_station",
-                            is_ingredients_available,
-                            (self.text_agent, self.world, ["Beef"], ["in_plate"]),
-                        ),
-                        "plate_beef_done",
+                        lambda agent, world, x: is_pan_ready(agent, world) or agent.is_target_status(x, "done"),
                     ],
+                ),
+            ],
+            (
+                (
+                    "BeefBurger",
+                    ("Beef",),
+                ),
+            ): True,
+        },
+        "BeefLettuce": {
+            (): [
+                (
+                    "BeefLettuce",
+                    ["Beef", "Lettuce"],
                     [
-                        (
-                            "pickup_bread_in_plate",
-                            lambda agent, world: not is_pan_ready(agent, world),
-                            (self.text_agent, self.world),
-                        ),
-                        "plate_beef_done",
+                        lambda agent, world, x: is_pan_ready(agent, world) or agent.is_target_status(x, "done"),
+                        "done",
                     ],
+                ),  # make a BeefLettuce\
+            ],
+            (("BeefLettuce", ("Beef", "Lettuce")),): True,
+        },
+        "BeefLettuceBurger": {
+            (): [
+                (
+                    "BeefLettuce",
+                    ["Beef", "Lettuce"],
                     [
-                        (
-                            "pickup_beef_done",
-                            lambda agent, world, ingredients, status_list: is_ingredients_available(
-                                agent, world, ingredients, status_list
-                            )
-                            and not is_pan_ready(agent, world),
-                            (
-                                self.text_agent,
-                                self.world,
-                                ["Beef", "Bread"],
-                                ["in_plate", ""],
-                            ),
-                        ),
-                        "plate_bread",
-                    ],
+                        lambda agent, world, x: is_pan_ready(agent, world),
+                        "done",
+                    ],  # make a BeefLettuce
+                ),
+                (
+                    (
+                        "BeefBurger",
+                        lambda agent, world: is_ingredients_available(
+                            agent, world, ["Lettuce"], ["done"]
+                        ),  # other conditions except for available ingredients for making this burger
+                    ),
                     [
-                        (
-                            "get_bread_from_station",
-                            lambda agent, world: is_ingredients_available(agent, world, ["Beef"], ["in_plate"])
-                            and not is_pan_ready(agent, world),
-                            (self.text_agent, self.world),
-                        ),
-                        "put_onto_plate_with_beef",
+                        "Beef",
                     ],
                     [
-                        (
-                            "get_bread_from_station",
-                            lambda agent, world: is_ingredients_available(agent, world, ["Beef"], ["in_plate"])
-                            and not is_pan_ready(agent, world),
-                            (self.text_agent, self.world),
-                        ),
-                        "plate_beef_done",
+                        lambda agent, world, x: is_pan_ready(agent, world),
                     ],
-                ]
-            },
-            "BeefLettuce": {
-                ("Beef", "Lettuce"): [
+                ),
+                (
+                    "BeefLettuceBurger",
+                    ["Beef", "LettuceBurger"],
+                    [lambda agent, world, x: is_pan_ready(agent, world), ""],
+                ),
+                (
+                    "BeefLettuce",
+                    ["Beef", "Lettuce"],
                     [
-                        (
-                            "pickup_lettuce_in_plate",
-                            is_closest_to_ready_pan,
-                            (self.text_agent, self.world, "Lettuce", "in_plate"),
-                        ),
-                        "plate_beef_done_from_pan",
+                        "done",
+                        "done",
                     ],
+                ),  # make a BeefLettuce
+                ("BeefLettuceBurger", ["BeefLettuce"], [""]),
+                (
+                    (
+                        "BeefBurger",
+                        lambda agent, world: is_ingredients_available(
+                            agent, world, ["Lettuce"], ["done"]
+                        ),  # other conditions except for available ingredients for making this burger
+                    ),
                     [
-                        (
-                            "get_plate_from_station",
-                            is_pan_ready,
-                            (self.text_agent, self.world),
-                        ),
-                        (
-                            "plate_beef_done_from_pan",
-                            is_ingredients_available,
-                            (self.text_agent, self.world, ["Lettuce"], ["done"]),
-                        ),
-                        "plate_lettuce_done",
+                        "Beef",
                     ],
                     [
-                        (
-                            "pickup_lettuce_in_plate",
-                            lambda agent, world: not is_pan_ready(agent, world),
-                            (self.text_agent, self.world),
-                        ),
-                        "plate_beef_done",
+                        "done",
                     ],
-                    [
+                ),
+                (
+                    (
+                        "LettuceBurger",
+                        lambda agent, world: is_ingredients_available(
+                            agent, world, ["Beef"], ["done"]
+                        ),  # other conditions except for available ingredients for making this burger
+                    ),
+                    ["Lettuce"],
+                    ["done"],
+                ),
+                ("BeefLettuceBurger", ["BeefBurger", "Lettuce"], ["", "done"]),
+                ("BeefLettuceBurger", ["Beef", "LettuceBurger"], ["done", ""]),
+            ],
+            (("BeefLettuce", ("Beef", "Lettuce")),): [("BeefLettuceBurger", ["BeefLettuce"], [""])],
+            (
+                ("BeefLettuce", ("Beef", "Lettuce")),
+                ("BeefLettuceBurger", ("BeefLettuce",)),
+            ): True,
+            (("BeefBurger", ("Beef",)),): [("BeefLettuceBurger", ["BeefBurger", "Lettuce"], ["", "done"])],
+            (
+                ("BeefBurger", ("Beef",)),
+                ("BeefLettuceBurger", ("BeefBurger", "Lettuce")),
+            ): True,
+            (("LettuceBurger", ("Lettuce",)),): [("BeefLettuceBurger", ["Beef", "LettuceBurger"], ["done", ""])],
+            (
+                ("LettuceBurger", ("Lettuce",)),
+                ("BeefLettuceBurger", ("Beef", "LettuceBurger")),
+            ): True,
+            (("BeefLettuceBurger", ("BeefBurger", "Lettuce")),): True,
+            (("BeefLettuceBurger", ("BeefLettuce",)),): True,
+            (("BeefLettuceBurger", ("Beef", "LettuceBurger")),): True,
+        },
+    }
+    food_ingredients_urgency = {
+        "LettuceBurger": {},
+        "BeefBurger": {},
+        "BeefLettuce": {},
+        "BeefLettuceBurger": {(): [1, 1, 1, 2, 2, 2, 2, 2, 2]},
+    }
+    _assemble_process = {
+        "LettuceBurger": {
+            ("Lettuce",): [
+                [
+                    (
+                        "pickup_bread_in_plate",
+                        lambda agent, world: is_ingredients_available(agent, world, ["Lettuce"], ["done"]),
+                        (),
+                    ),
+                    "plate_lettuce_done",
+                ],
+                [
+                    (
+                        "get_bread_from_station",
+                        lambda agent, world: is_ingredients_available(agent, world, ["Lettuce"], ["in_plate"]),
+                        (),
+                    ),
+                    "put_onto_plate_with_lettuce",
+                ],
+                [  # change to pickup bread
+                    (
+                        "get_bread_from_station",
+                        lambda agent, world: is_ingredients_available(agent, world, ["Lettuce"], ["in_plate"]),
+                        (),
+                    ),
+                    "plate_lettuce_done",
+                ],
+                [
+                    (
+                        "pickup_lettuce_in_plate",
+                        is_ingredients_available,
                         (
-                            "pickup_beef_done",
-                            lambda agent, world: not is_pan_ready(agent, world),
-                            (self.text_agent, self.world),
+                            ["Lettuce", "Bread"],
+                            ["in_plate", ""],
                         ),
-                        "plate_lettuce_done",
-                    ],
+                    ),
+                    "plate_bread",
+                ],
+                [
+                    (
+                        "get_plate_from_station",
+                        lambda agent, world: is_ingredients_available(agent, world, ["Lettuce"], ["done"])
+                        and not is_ingredients_available(agent, world, ["Lettuce"], ["in_plate"]),
+                        (),
+                    ),
+                    "plate_lettuce_done",
+                    "plate_bread",
+                ],
+                [
+                    (
+                        "get_plate_from_station",
+                        lambda agent, world: is_ingredients_available(agent, world, ["Lettuce"], ["done"])
+                        and not is_ingredients_available(agent, world, ["Lettuce"], ["in_plate"]),
+                        (),
+                    ),
+                    "plate_lettuce_done",
+                    (
+                        "get_bread_from_station",
+                        is_ingredients_available,
+                        (["Lettuce"], ["in_plate"]),
+                    ),
+                    "put_onto_plate_with_lettuce",
+                ],
+                [  # change to pickup bread
+                    (
+                        "get_plate_from_station",
+                        lambda agent, world: is_ingredients_available(agent, world, ["Lettuce"], ["in_plate"])
+                        and not is_ingredients_available(agent, world, ["Lettuce"], ["in_plate"]),
+                        (),
+                    ),
+                    "plate_lettuce_done",
+                    (
+                        "get_bread_from_station",
+                        is_ingredients_available,
+                        (["Lettuce"], ["done"]),
+                    ),
+                    "plate_lettuce_done",
+                ],
+            ],
+        },
+        "BeefBurger": {
+            ("Beef",): [
+                [
+                    (
+                        "pickup_bread_in_plate",
+                        is_closest_to_ready_pan,
+                        ("Bread", "in_plate"),
+                    ),
+                    "plate_beef_done_from_pan",
+                ],
+                [
+                    (
+                        "get_plate_from_station",
+                        is_pan_ready,
+                        (),
+                    ),
+                    "plate_beef_done_from_pan",
+                    "plate_bread",
+                ],
+                [
+                    (
+                        "get_plate_from_station",
+                        is_pan_ready,
+                        (),
+                    ),
+                    "plate_beef_done_from_pan",
+                    (
+                        "get_bread_from_station",
+                        is_ingredients_available,
+                        (["Beef"], ["in_plate"]),
+                    ),
+                    "put_onto_plate_with_beef",
                 ],
-            },
-            "BeefLettuceBurger": {
-                ("Beef", "LettuceBurger"): [
-                    [
-                        (
-                            "pickup_lettuceburger",
-                            is_closest_to_ready_pan,
-                            (self.text_agent, self.world, "LettuceBurger", ""),
-                        ),
-                        "plate_beef_done_from_pan",
-                    ],
-                    [
-                        (
-                            "get_plate_from_station",
-                            is_pan_ready,
-                            (self.text_agent, self.world),
-                        ),
-                        (
-                            "plate_beef_done_from_pan",
-                            is_ingredients_available,
-                            (agent, world, ["LettuceBurger"], [""]),
-                        ),
-                        "plate_lettuceburger",
-                    ],
-                    [
-                        (
-                            "pickup_lettuceburger",
-                            lambda agent, world: not is_pan_ready(agent, world),
-                            (self.text_agent, self.world),
-                        ),
-                        "plate_beef_done",
-                    ],
-                    [
+                [  # change to pickup
+                    (
+                        "get_plate_from_station",
+                        is_pan_ready,
+                        (),
+                    ),
+                    "plate_beef_done_from_pan",
+                    (
+                        "get_bread_from_station",
+                        is_ingredients_available,
+                        (["Beef"], ["in_plate"]),
+                    ),
+                    "plate_beef_done",
+                ],
+                [
+                    (
+                        "pickup_bread_in_plate",
+                        lambda agent, world: not is_pan_ready(agent, world),
+                        (),
+                    ),
+                    "plate_beef_done",
+                ],
+                [
+                    (
+                        "pickup_beef_done",
+                        lambda agent, world, ingredients, status_list: is_ingredients_available(
+                            agent, world, ingredients, status_list
+                        )
+                        and not is_pan_ready(agent, world),
                         (
-                            "pickup_beef_done",
-                            lambda agent, world: not is_pan_ready(agent, world),
-                            (self.text_agent, self.world),
+                            ["Beef", "Bread"],
+                            ["in_plate", ""],
                         ),
-                        "plate_lettuceburger",
-                    ],
+                    ),
+                    "plate_bread",
                 ],
-                ("BeefLettuce",): [
-                    [
+                [
+                    (
                         "get_bread_from_station",
-                        "put_onto_plate_with_beeflettuce",
-                    ],
-                    [
+                        lambda agent, world: is_ingredients_available(agent, world, ["Beef"], ["in_plate"])
+                        and not is_pan_ready(agent, world),
+                        (),
+                    ),
+                    "put_onto_plate_with_beef",
+                ],
+                [
+                    (
                         "get_bread_from_station",
-                        "plate_beeflettuce",
-                    ],  # change to pickup
-                    [
-                        (
-                            "pickup_beeflettuce",
-                            is_ingredients_available,
-                            (self.text_agent, self.world, ["Bread"], [""]),
-                        ),
-                        "plate_bread",
-                    ],
+                        lambda agent, world: is_ingredients_available(agent, world, ["Beef"], ["in_plate"])
+                        and not is_pan_ready(agent, world),
+                        (),
+                    ),
+                    "plate_beef_done",
+                ],
+            ]
+        },
+        "BeefLettuce": {
+            ("Beef", "Lettuce"): [
+                [
+                    (
+                        "pickup_lettuce_in_plate",
+                        is_closest_to_ready_pan,
+                        ("Lettuce", "in_plate"),
+                    ),
+                    "plate_beef_done_from_pan",
+                ],
+                [
+                    (
+                        "get_plate_from_station",
+                        is_pan_ready,
+                        (),
+                    ),
+                    (
+                        "plate_beef_done_from_pan",
+                        is_ingredients_available,
+                        (["Lettuce"], ["done"]),
+                    ),
+                    "plate_lettuce_done",
                 ],
-                ("BeefBurger", "Lettuce"): [
-                    ["pickup_beefburger", "plate_lettuce_done"],
+                [
+                    (
+                        "pickup_lettuce_in_plate",
+                        lambda agent, world: not is_pan_ready(agent, world),
+                        (),
+                    ),
+                    "plate_beef_done",
                 ],
-            },
-        }
+                [
+                    (
+                        "pickup_beef_done",
+                        lambda agent, world: not is_pan_ready(agent, world),
+                        (),
+                    ),
+                    "plate_lettuce_done",
+                ],
+            ],
+        },
+        "BeefLettuceBurger": {
+            ("Beef", "LettuceBurger"): [
+                [
+                    (
+                        "pickup_lettuceburger",
+                        is_closest_to_ready_pan,
+                        ("LettuceBurger", ""),
+                    ),
+                    "plate_beef_done_from_pan",
+                ],
+                [
+                    (
+                        "get_plate_from_station",
+                        is_pan_ready,
+                        (),
+                    ),
+                    (
+                        "plate_beef_done_from_pan",
+                        is_ingredients_available,
+                        (["LettuceBurger"], [""]),
+                    ),
+                    "plate_lettuceburger",
+                ],
+                [
+                    (
+                        "pickup_lettuceburger",
+                        lambda agent, world: not is_pan_ready(agent, world),
+                        (),
+                    ),
+                    "plate_beef_done",
+                ],
+                [
+                    (
+                        "pickup_beef_done",
+                        lambda agent, world: not is_pan_ready(agent, world),
+                        (),
+                    ),
+                    "plate_lettuceburger",
+                ],
+            ],
+            ("BeefLettuce",): [
+                [
+                    "get_bread_from_station",
+                    "put_onto_plate_with_beeflettuce",
+                ],
+                [
+                    "get_bread_from_station",
+                    "plate_beeflettuce",
+                ],  # change to pickup
+                [
+                    (
+                        "pickup_beeflettuce",
+                        is_ingredients_available,
+                        (["Bread"], [""]),
+                    ),
+                    "plate_bread",
+                ],
+            ],
+            ("BeefBurger", "Lettuce"): [
+                ["pickup_beefburger", "plate_lettuce_done"],
+            ],
+        },
+    }
 
-        assert self._check_process(self._assemble_process)
-        for burger, ingredients_dict in self._num_assemble_process.items():
-            for ingredient, num in ingredients_dict.items():
-                assert (
-                    len(self._assemble_process[burger][ingredient]) == num
-                ), f"num error in processes for assemble {burger} using {ingredient}"
-        self._assemble_process_forward_index = self._processes_transform(self._assemble_process)
-        logger.trace("\n" + pretty_repr(self._assemble_process_forward_index))
-        logger.trace("\n" + pretty_repr(self.food_ingredients_index))
+    def __init__(self, agent: TextAgent, world: CookingWorld, max_n_try: int = 10):
+        self.text_agent = agent
+        self.agent = agent.agent
+        self.agent_idx = self.text_agent.agent_idx
+        self.world = world
+        self.prev_task: tuple = None
+        self.max_n_try = max_n_try
 
-        self._pass_on_process_forward_index = {}
-        self._serve_process_forward_index = {}
-        self._putout_fire_forward_index = {}
-        self._clean_a_counter_forward_index = {}
+        self._assemble_prev_recipes: List[Tuple[str]] = []
+        # the graph of the running (sub)task and the state reached in it, the graphs are shared by all instances
+        self._graph: ProcessGraph | None = None
+        self._state = 0
+        self.compile_processes()
+        self._valid_mid_actions_cache: Tuple[int, Dict[str, List[Dict]]] | None = None
 
         # with open("examples/mid_valid_actions.json", "w", encoding="utf-8") as f:
         #     json.dump(self.valid_actions, f)
@@ -902,44 +1020,117 @@ class MidPlanner:
         self.agent = agent.agent
         self.agent_idx = self.text_agent.agent_idx
         self.world = world
+        self._valid_mid_actions_cache = None
 
     def reset(self):
-        self.prev_subtasks: List[str] = []
         self.prev_task: tuple = None
         self._assemble_prev_recipes: List[Tuple[str]] = []
+        self._graph = None
+        self._state = 0
+
+    @property
+    def prev_subtasks(self) -> Tuple[str, ...]:
+        return self._graph.prefixes[self._state] if self._graph is not None else ()
+
+    def _enter(self, graph: ProcessGraph, resume: bool = True) -> None:
+        """
+        Run `graph` from the subtasks done so far if they are a state of it (and `resume`), otherwise from the start.
+        """
+        self._state = graph.state_ids.get(self.prev_subtasks, 0) if resume else 0
+        self._graph = graph
+
+    def _trace_back(self) -> str:
+        subtask = self.prev_subtasks[-1]
+        self._state = self._graph.parents[self._state]
+        return subtask
+
+    def _end_subtasks(self) -> None:
+        self._graph = None
+        self._state = 0
+
+    def get_valid_mid_actions(self) -> Dict[str, List[Dict]]:
+        """
+        The parameters in `valid_actions` each mid action can start with in the current world, without running the
+        planner or touching its memory: the entry subtasks of the processes are checked against one
+        `get_valid_actions()` of the text agent. Cached until the world changes (its `state_version`).
+
+        An action is valid if some of its random choices (the recipe to assemble, the object to clean) can start.
+        """
+        version = getattr(self.world, "state_version", None)
+        if version is not None and self._valid_mid_actions_cache is not None:
+            cached_version, cached = self._valid_mid_actions_cache
+            if cached_version == version:
+                return {action: list(params_list) for action, params_list in cached.items()}
 
-    def get_valid_mid_actions(self):
+        valid_actions = self.text_agent.get_valid_actions()
         _valid_actions = {
-            "prepare": [],
-            "assemble": [],
-            "pass_on": [],
-            "serve": [],
-            "putout_fire": [],
-            "clean_a_counter": [],
+            action: [params for params in params_list if getattr(self, f"_can_{action}")(valid_actions, **params)]
+            for action, params_list in self.valid_actions.items()
         }
-        if self.prev_subtasks or self.prev_task or self._assemble_prev_recipes:
-            logger.warning(f"Not empty running memory")
-            self.reset()
-        for action in self.valid_actions:
-            for params in self.valid_actions[action]:
-                end, _ = getattr(self, action)(**params, prev_subtask_succeeded=False)
-                self.reset()
-                if not end:
-                    _valid_actions[action].append(params)
-        return _valid_actions
-
-    def _check_process(self, process: Union[Dict, List]) -> bool:
+        if version is not None:
+            self._valid_mid_actions_cache = (version, _valid_actions)
+        return {action: list(params_list) for action, params_list in _valid_actions.items()}
+
+    def _can_start(self, graph: ProcessGraph, valid_actions: List[str]) -> bool:
+        return len(graph.next_subtasks(0, self.text_agent, self.world, valid_actions, first=True)) > 0
+
+    def _can_prepare(self, valid_actions: List[str], food: str, plate: bool = None) -> bool:
+        if plate is None:
+            plate = food in ["Beef"]
+        return self._can_start(self._graphs[("prepare", food, plate)], valid_actions)
+
+    def _can_assemble(self, valid_actions: List[str], food: str) -> bool:
+        return any(
+            self._can_start(self._graphs[("assemble", sub_food, ingredient_tuple)], valid_actions)
+            for sub_food, ingredient_tuple in self._urgent_recipes(food, ())
+        )
+
+    def _can_pass_on(self, valid_actions: List[str], thing: str, thing_status: str = "") -> bool:
+        graph = self._process_graph(
+            ("pass_on", thing, thing_status), lambda: self._pass_on_process(thing, thing_status)
+        )
+        return self._can_start(graph, valid_actions)
+
+    def _can_serve(self, valid_actions: List[str], food: str) -> bool:
+        graph = self._process_graph(("serve", food), lambda: [["pickup_" + CapToText[food], "deliver"]])
+        return self._can_start(graph, valid_actions)
+
+    def _can_putout_fire(self, valid_actions: List[str]) -> bool:
+        graph = self._process_graph(
+            ("putout_fire",), lambda: [[("pickup_fireextinguisher", is_on_fire, ()), "put_out_fire"]]
+        )
+        return self._can_start(graph, valid_actions)
+
+    def _can_clean_a_counter(self, valid_actions: List[str], center: bool = False) -> bool:
+        _, occupy_object_status_list, prior_to_clean = self._occupied_counters(center)
+        occupy_obj_sta_no_plate = [o_s for o_s in occupy_object_status_list if not isinstance(o_s[0], Plate)]
+        if not (len(occupy_obj_sta_no_plate) > 0 or (len(occupy_object_status_list) > 0 and center)):
+            return False
+        if self.agent.holding is not None:
+            return ("put_onto_edge_counter" if center else "put_onto_counter") in valid_actions
+        obj_sta_cands = [o_s for o_s in prior_to_clean if o_s in occupy_object_status_list][:1] or [
+            self._status_to_clean(o, s, occupy_object_status_list)
+            for o, s in (occupy_obj_sta_no_plate or occupy_object_status_list)
+        ]
+        return any(
+            self._clean_a_counter_process(center, obj_sta)[2][0] in valid_actions
+            for obj_sta in obj_sta_cands
+            if obj_sta is not None
+        )
+
+    @classmethod
+    def _check_process(cls, process: Union[Dict, List]) -> bool:
         """
         Check whether the process is legal.
         """
         if isinstance(process, dict):
             for target, target_iter in process.items():
                 if isinstance(target_iter, dict):
-                    if not self._check_process(target_iter):
+                    if not cls._check_process(target_iter):
                         logger.warning(f"Check process {target} failed!")
                         return False
                 elif isinstance(target_iter, list):
-                    if not self._check_process(target_iter):
+                    if not cls._check_process(target_iter):
                         logger.warning(f"Check process {target} failed!")
                         return False
                 else:
@@ -948,7 +1139,7 @@ class MidPlanner:
         else:  # list
             for target in process:
                 if isinstance(target, list):
-                    if not self._check_process(target):
+                    if not cls._check_process(target):
                         return False
                 elif isinstance(target, tuple):
                     if target[0] not in TextAgent.legal_text_actions:
@@ -966,40 +1157,49 @@ class MidPlanner:
 
         return True
 
-    def _processes_transform(self, process) -> Dict:
+    @classmethod
+    def compile_processes(cls) -> Dict[tuple, ProcessGraph]:
         """
-        Generate:
-        - A forward index dict (previous subtasks -> possible next subtasks) for each process
+        Compile the processes of the class into graphs once, keyed by ("prepare", food, plate) and
+        ("assemble", sub_food, ingredients). The graphs of pass_on, serve, putout_fire and clean_a_counter are added
+        when first used.
         """
-        forward_index = {}
-        for task, _p in process.items():
-            if isinstance(_p, dict):
-                forward_index[task] = self._processes_transform(_p)
-            elif isinstance(_p, list):
-                _index = {}
-                for _sp in _p:
-                    subtasks = []
-                    for i, _st in enumerate(_sp):
-                        # logger.trace(_index)
-                        if isinstance(_st, str):
-                            current_subtask = _st
-                            if i == 0:
-                                _index[tuple(subtasks)] = _index.get(tuple(subtasks), []) + [(current_subtask, None)]
-                        else:
-                            current_subtask = _st[0]
-                            if i == 0:
-                                _index[tuple(subtasks)] = _index.get(tuple(subtasks), []) + [_st]
-                        subtasks.append(current_subtask)
-                        if i == len(_sp) - 1:
-                            _index[tuple(subtasks)] = True
-                            continue
-                        if isinstance(_sp[i + 1], str):
-                            next_subtask = (_sp[i + 1], None)
-                        else:
-                            next_subtask = _sp[i + 1]
-                        _index[tuple(subtasks)] = _index.get(tuple(subtasks), []) + [next_subtask]
-                forward_index[task] = _index
-        return forward_index
+        graphs = cls.__dict__.get("_graphs")
+        if graphs is not None:
+            return graphs
+        assert cls._check_process(cls._prepare_process)
+        assert cls._check_process(cls._assemble_process)
+        for burger, ingredients_dict in cls._num_assemble_process.items():
+            for ingredient, num in ingredients_dict.items():
+                assert (
+                    len(cls._assemble_process[burger][ingredient]) == num
+                ), f"num error in processes for assemble {burger} using {ingredient}"
+
+        graphs = {}
+        for food, plate_processes in cls._prepare_process.items():
+            for plate, sequences in plate_processes.items():
+                graphs[("prepare", food, plate)] = ProcessGraph(f"prepare {food} plate={plate}", sequences)
+        for burger, ingredients_processes in cls._assemble_process.items():
+            for ingredients, sequences in ingredients_processes.items():
+                graphs[("assemble", burger, ingredients)] = ProcessGraph(f"assemble {burger} {ingredients}", sequences)
+        for graph in graphs.values():
+            logger.trace("\n" + graph.describe())
+        cls._graphs = graphs
+        return graphs
+
+    @classmethod
+    def _process_graph(cls, key: tuple, build: Callable[[], List[list]]) -> ProcessGraph:
+        """
+        The graph of `key`, compiled from the sequences of `build()` on first use.
+        """
+        graphs = cls.compile_processes()
+        graph = graphs.get(key)
+        if graph is None:
+            sequences = build()
+            assert cls._check_process(sequences)
+            graph = graphs[key] = ProcessGraph(" ".join(str(k) for k in key), sequences)
+            logger.debug("\n" + graph.describe())
+        return graph
 
     def _get_or_pickup(self, subtask: str, target: str, target_status: Union[str, Callable] = "") -> str:
         """
@@ -1072,34 +1272,27 @@ class MidPlanner:
         logger.debug(f"prepare {food} plate = {plate}")
         logger.debug(f"traj {self.prev_subtasks}")
         if not prev_subtask_succeeded and len(self.prev_subtasks) > 0:
-            self.prev_subtasks.pop()
+            self._trace_back()
             logger.trace(f"previous subtask failed, traj: {self.prev_subtasks}")
 
+        graph = self._graphs[("prepare", food, plate)]
         if self.prev_task != ("prepare", food, plate):
-            if tuple(self.prev_subtasks) not in self._prepare_process_forward_index[food][plate]:
-                self.prev_subtasks = []
+            self._enter(graph)
             self.prev_task = ("prepare", food, plate)
         valid_actions = self.text_agent.get_valid_actions()
 
         while current_subtask is None:
             n_try += 1
-            next_subtask_cands = self._prepare_process_forward_index[food][plate][tuple(self.prev_subtasks)]
-            if next_subtask_cands is True:
+            if graph.terminal[self._state]:
                 current_subtask = True
                 break
-            possible_cands = []
-            for n_st in next_subtask_cands:
-                logger.trace(f"n_st {n_st}")
-                if n_st[0] in valid_actions and (n_st[1] is None or n_st[1](*n_st[2])):
-                    logger.trace(f"{n_st[0]} valid")
-                    possible_cands.append(n_st)
-                    # current_subtask = n_st[0]
-                    # break
+            possible_cands = graph.next_subtasks(self._state, self.text_agent, self.world, valid_actions)
+            logger.trace(f"valid next subtasks {possible_cands}")
             if len(possible_cands) > 0:
-                current_subtask = random.choice(possible_cands)[0]
+                current_subtask, next_state = random.choice(possible_cands)
             if current_subtask is None:
                 if len(self.prev_subtasks) > 0:
-                    trace_back_subtask = self.prev_subtasks.pop()
+                    trace_back_subtask = self._trace_back()
                     logger.trace(f"trace_back {trace_back_subtask}, traj {self.prev_subtasks}")
                 else:
                     break
@@ -1120,10 +1313,10 @@ class MidPlanner:
             status = current_subtask
 
         if end:
-            self.prev_subtasks = []
+            self._end_subtasks()
             self.prev_task = None
         else:
-            self.prev_subtasks.append(current_subtask)
+            self._state = next_state
             if food in ["Lettuce", "Beef"] and "from_station" in current_subtask:
                 status = self._get_or_pickup(
                     current_subtask,
@@ -1136,6 +1329,43 @@ class MidPlanner:
         # )
         return (end, status)
 
+    def _is_recipe_valid(
+        self,
+        food: Union[str, Tuple[str, Callable]],
+        ingredient_list: List[str],
+        ingredient_status_list: List[Union[str, Callable]],
+    ) -> bool:
+        food_status = food[1] if isinstance(food, tuple) else lambda agent, world: True
+        ingredient_status_list = [
+            t_s if isinstance(t_s, str) else partial(t_s, self.text_agent, self.world) for t_s in ingredient_status_list
+        ]
+        if is_ingredients_available(
+            self.text_agent,
+            self.world,
+            ingredient_list,
+            ingredient_status_list,
+        ) and food_status(self.text_agent, self.world):
+            return True
+        return False
+
+    def _urgent_recipes(self, food: str, prev_recipes: Tuple[Tuple[str, tuple], ...]) -> List[Tuple[str, tuple]]:
+        """
+        The valid (sub_food, ingredients) recipes after `prev_recipes` with the highest urgency, to choose from.
+        """
+        ingredients_cands = self.food_ingredients_index[food][prev_recipes]
+        ingredients_urgency = self.food_ingredients_urgency[food].get(prev_recipes, [1] * len(ingredients_cands))
+        assert len(ingredients_cands) == len(ingredients_urgency)
+        urgency_to_ingredients_cands = defaultdict(list)
+        for (sub_food, ingredient_list, ingredient_status_list), urgency in zip(ingredients_cands, ingredients_urgency):
+            if self._is_recipe_valid(sub_food, ingredient_list, ingredient_status_list):
+                sub_food = sub_food[0] if isinstance(sub_food, tuple) else sub_food
+                urgency_to_ingredients_cands[urgency].append((sub_food, tuple(ingredient_list)))
+        if len(urgency_to_ingredients_cands) == 0:
+            return []
+        highest_urgency = min(urgency_to_ingredients_cands.keys())
+        logger.trace(f"highest_urgency {highest_urgency} for {food}, cands {urgency_to_ingredients_cands}")
+        return urgency_to_ingredients_cands[highest_urgency]
+
     def assemble(self, food: str, prev_subtask_succeeded: bool = True) -> Tuple[bool, str]:
         """
         Assemble a burger, available burgers are: LettuceBurger, BeefBurger, BeefLettuceBurger, which are made of different ingredients.
@@ -1163,25 +1393,6 @@ class MidPlanner:
         ]
         n_try = 0
 
-        def is_ingredients_recipe_valid(
-            food: Tuple[Union[str, Tuple[str, Callable]]],
-            ingredient_list: List[str],
-            ingredient_status_list: List[Union[str, Callable]],
-        ) -> bool:
-            food_status = food[1] if isinstance(food, tuple) else lambda: True
-            food = food[0] if isinstance(food, tuple) else food
-            if (
-                is_ingredients_available(
-                    self.text_agent,
-                    self.world,
-                    ingredient_list,
-                    ingredient_status_list,
-                )
-                and food_status()
-            ):
-                return True
-            return False
-
         status = ""
         end = False
         current_subtask = None
@@ -1189,7 +1400,7 @@ class MidPlanner:
         logger.trace(f"recipes {self._assemble_prev_recipes}")
         logger.trace(f"traj {self.prev_subtasks}")
         if not prev_subtask_succeeded:
-            self.prev_subtasks.pop()
+            self._trace_back()
             logger.trace(f"previous subtask failed, traj: {self.prev_subtasks}")
 
         valid_actions = self.text_agent.get_valid_actions()
@@ -1207,25 +1418,12 @@ class MidPlanner:
             logger.trace(f"current recipes {self._assemble_prev_recipes}")
 
         if len(self._assemble_prev_recipes) == 0:
-            ingredients_cands = self.food_ingredients_index[food][tuple(self._assemble_prev_recipes)]
-            ingredients_urgency = self.food_ingredients_urgency[food].get(
-                tuple(self._assemble_prev_recipes), [1] * len(ingredients_cands)
-            )
-            assert len(ingredients_cands) == len(ingredients_urgency)
-            urgency_to_ingredients_cands = defaultdict(list)
-            for (sub_food, ingredient_list, ingredient_status_list), urgency in zip(
-                ingredients_cands, ingredients_urgency
-            ):
-                if is_ingredients_recipe_valid(sub_food, ingredient_list, ingredient_status_list):
-                    sub_food = sub_food[0] if isinstance(sub_food, tuple) else sub_food
-                    urgency_to_ingredients_cands[urgency].append((sub_food, tuple(ingredient_list)))
-            if len(urgency_to_ingredients_cands) == 0:
+            recipe_cands = self._urgent_recipes(food, tuple(self._assemble_prev_recipes))
+            if len(recipe_cands) == 0:
                 sub_food = ""
                 ingredient_list = []
             else:
-                highest_urgency = min(urgency_to_ingredients_cands.keys())
-                logger.trace(f"highest_urgency {highest_urgency} for {food}, cands {urgency_to_ingredients_cands}")
-                cand = random.choice(urgency_to_ingredients_cands[highest_urgency])
+                cand = random.choice(recipe_cands)
                 sub_food, ingredient_list = cand[:2]
                 self._assemble_prev_recipes.append((sub_food, tuple(ingredient_list)))
 
@@ -1237,9 +1435,9 @@ class MidPlanner:
         while len(self._assemble_prev_recipes) > 0:
             sub_food = self._assemble_prev_recipes[-1][0]
             ingredient_tuple = self._assemble_prev_recipes[-1][1]
+            graph = self._graphs[("assemble", sub_food, ingredient_tuple)]
             if self.prev_task != ("assemble", food, sub_food, ingredient_tuple):
-                if tuple(self.prev_subtasks) not in self._assemble_process_forward_index[sub_food][ingredient_tuple]:
-                    self.prev_subtasks = []
+                self._enter(graph)
                 self.prev_task = ("assemble", food, sub_food, ingredient_tuple)
                 logger.trace(
                     f"assemble {food} through making {self._assemble_prev_recipes[-1][0],self._assemble_prev_recipes[-1][1]}"
@@ -1250,10 +1448,7 @@ class MidPlanner:
             while current_subtask is None:
                 logger.trace(f"n_try {n_try}")
                 n_try += 1
-                next_subtask_cands = self._assemble_process_forward_index[sub_food][ingredient_tuple][
-                    tuple(self.prev_subtasks)
-                ]
-                if next_subtask_cands is True:
+                if graph.terminal[self._state]:
                     logger.debug(f"sub_food {sub_food} is done")
                     current_subtask = True
                     break
@@ -1270,25 +1465,19 @@ class MidPlanner:
                             self._assemble_prev_recipes[-1][1]
                         ):
                             logger.debug(f"{sub_food} {ingredient_list} {ingredient_status_list}")
-                            if is_ingredients_recipe_valid(sub_food, ingredient_list, ingredient_status_list):
+                            if self._is_recipe_valid(sub_food, ingredient_list, ingredient_status_list):
                                 logger.debug(f"{sub_food} {ingredient_list} {ingredient_status_list} valid")
                                 break
                     else:
                         logger.debug(f"no valid recipe for sub_food {self._assemble_prev_recipes[-1]}")
                         break
-                possible_cands = []
-                for n_st in next_subtask_cands:
-                    logger.trace(f"n_st {n_st}")
-                    if n_st[0] in valid_actions and (n_st[1] is None or n_st[1](*n_st[2])):
-                        logger.trace(f"n_st {n_st} valid")
-                        possible_cands.append(n_st)
-                        # current_subtask = n_st[0]
-                        # break
+                possible_cands = graph.next_subtasks(self._state, self.text_agent, self.world, valid_actions)
+                logger.trace(f"valid next subtasks {possible_cands}")
                 if len(possible_cands) > 0:
-                    current_subtask = random.choice(possible_cands)[0]
+                    current_subtask, next_state = random.choice(possible_cands)
                 if current_subtask is None:
                     if len(self.prev_subtasks) > 0:
-                        trace_back_subtask = self.prev_subtasks.pop()
+                        trace_back_subtask = self._trace_back()
                         logger.trace(f"trace_back {trace_back_subtask}, traj {self.prev_subtasks}")
                     else:
                         logger.trace(f"can not trace_back traj {self.prev_subtasks}, try changing ingredients")
@@ -1313,22 +1502,9 @@ class MidPlanner:
                     logger.debug(f"food {food} is assembled")
                     break
                 current_subtask = None  # reset current_subtask for next sub_food
-                ingredients_urgency = self.food_ingredients_urgency[food].get(
-                    tuple(self._assemble_prev_recipes), [1] * len(ingredients_cands)
-                )
-                urgency_to_ingredients_cands = defaultdict(list)
-                for (
-                    sub_food,
-                    ingredient_list,
-                    ingredient_status_list,
-                ), urgency in zip(ingredients_cands, ingredients_urgency):
-                    if is_ingredients_recipe_valid(sub_food, ingredient_list, ingredient_status_list):
-                        sub_food = sub_food[0] if isinstance(sub_food, tuple) else sub_food
-                        urgency_to_ingredients_cands[urgency].append((sub_food, tuple(ingredient_list)))
-                if len(urgency_to_ingredients_cands) > 0:
-                    highest_urgency = min(urgency_to_ingredients_cands.keys())
-                    logger.trace(f"highest_urgency {highest_urgency} for {food}, cands {urgency_to_ingredients_cands}")
-                    cand = random.choice(urgency_to_ingredients_cands[highest_urgency])
+                recipe_cands = self._urgent_recipes(food, tuple(self._assemble_prev_recipes))
+                if len(recipe_cands) > 0:
+                    cand = random.choice(recipe_cands)
                     sub_food, ingredient_list = cand[:2]
                     if (sub_food, ingredient_list) != trace_back_recipe:
                         self._assemble_prev_recipes.append((sub_food, tuple(ingredient_list)))
@@ -1354,10 +1530,10 @@ class MidPlanner:
 
         if end:
             self.prev_task = None
-            self.prev_subtasks = []
+            self._end_subtasks()
             self._assemble_prev_recipes = []
         else:
-            self.prev_subtasks.append(current_subtask)
+            self._state = next_state
             if "from_station" in current_subtask:
                 status = self._get_or_pickup(
                     current_subtask,
@@ -1369,6 +1545,65 @@ class MidPlanner:
         # )
         return (end, status)
 
+    @classmethod
+    def _pass_on_process(cls, thing: str, thing_status: str) -> List[list]:
+        from_station_tuples = [
+            ("Lettuce", "fresh"),
+            ("Beef", "fresh"),
+            ("Bread", ""),
+            ("Plate", ""),
+        ]
+        if (thing, thing_status) in from_station_tuples:
+            pass_on_subtasks = [
+                [
+                    (
+                        "get_" + thing.lower() + "_from_station",
+                        is_center_counter_available,
+                        (thing, thing_status),
+                    ),
+                    "put_onto_center_counter",
+                ]
+            ]
+        elif (thing, thing_status) in [("Beef", "done"), ("Beef", "overcooked")]:
+            pass_on_subtasks = [
+                [
+                    (
+                        "get_plate_from_station",
+                        is_pan_food_passable,
+                        (thing, thing_status),
+                    ),
+                    "plate_" + thing.lower() + "_" + thing_status + "_from_pan",
+                    "put_onto_center_counter",
+                ],
+                [
+                    (
+                        "pickup_" + CapToText[thing] + "_" + thing_status,
+                        is_food_passable,
+                        (thing, thing_status),
+                    ),
+                    "put_onto_center_counter",
+                ],
+            ]
+        else:
+            pass_on_subtasks = [
+                [
+                    (
+                        (
+                            ("pickup_" + CapToText[thing] + "_" + thing_status)
+                            if thing_status != ""
+                            else "pickup_" + CapToText[thing]
+                        ),
+                        is_food_passable,
+                        (thing, thing_status),
+                    ),
+                    "put_onto_center_counter",
+                ]
+            ]
+
+        if (thing, thing_status) in [("Lettuce", "done"), ("Bread", "")]:
+            pass_on_subtasks.insert(0, [*pass_on_subtasks[-1][:-1], "put_onto_plate"])
+        return pass_on_subtasks
+
     def pass_on(self, thing: str, thing_status: str = "", prev_subtask_succeeded: bool = True) -> Tuple[bool, str]:
         n_try = 0
         status = ""
@@ -1384,143 +1619,39 @@ class MidPlanner:
             thing, thing_status = well_desc_to_code_pairs[(thing, thing_status)]
         assert (thing, thing_status) in self.text_agent.legal_pickup_targets
         logger.trace(f"traj {self.prev_subtasks}")
+
         # assert self.world == self.text_agent.world, (self.world, self.text_agent.world)
         # logger.debug(self.world.world_objects["Lettuce"])
         # logger.debug(self.text_agent.get_objects("Lettuce"))
-        from_station_tuples = [
-            ("Lettuce", "fresh"),
-            ("Beef", "fresh"),
-            ("Bread", ""),
-            ("Plate", ""),
-        ]
-
         def in_center_counter(x: Object):
-            counter_objects = self.world.get_objects_at(x.location, Counter)
-            return len(counter_objects) == 1 and self.text_agent.is_target_status(counter_objects[0], "center")
-
-        def is_valid_center_counter(x: Object):
-            if (thing, thing_status) in [("Lettuce", "done"), ("Bread", "")]:
-                plate_objects = self.world.get_objects_at(x.location, Plate)
-                if len(plate_objects) > 0:
-                    return self.text_agent.is_target_status(x, "center") and len(plate_objects[0].content) == 0
-            return self.text_agent.is_target_status(x, "center") and (len(self.world.get_objects_at(x.location)) == 1)
-
-        if (thing, thing_status) not in self._pass_on_process_forward_index:
-            if (thing, thing_status) in from_station_tuples:
-                pass_on_subtasks = [
-                    [
-                        (
-                            "get_" + thing.lower() + "_from_station",
-                            lambda agent, world: is_ingredients_available(
-                                agent,
-                                world,
-                                ["Counter"],
-                                [is_valid_center_counter],
-                            ),
-                            (self.text_agent, self.world),
-                        ),
-                        "put_onto_center_counter",
-                    ]
-                ]
-            elif (thing, thing_status) in [("Beef", "done"), ("Beef", "overcooked")]:
-                pass_on_subtasks = [
-                    [
-                        (
-                            "get_plate_from_station",
-                            is_ingredients_available,
-                            (
-                                self.text_agent,
-                                self.world,
-                                [thing, "Counter"],
-                                [
-                                    lambda x: self.text_agent.is_target_status(x, thing_status)
-                                    and len(self.world.get_objects_at(x.location, Pan)) == 1,
-                                    is_valid_center_counter,
-                                ],
-                            ),
-                        ),
-                        "plate_" + thing.lower() + "_" + thing_status + "_from_pan",
-                        "put_onto_center_counter",
-                    ],
-                    [
-                        (
-                            "pickup_" + CapToText[thing] + "_" + thing_status,
-                            lambda: is_ingredients_available(
-                                self.text_agent,
-                                self.world,
-                                ["Counter", thing],
-                                [
-                                    is_valid_center_counter,
-                                    lambda x: self.text_agent.is_target_status(x, thing_status)
-                                    and not in_center_counter(x),
-                                ],
-                            ),
-                            (),
-                        ),
-                        "put_onto_center_counter",
-                    ],
-                ]
-            else:
-                pass_on_subtasks = [
-                    [
-                        (
-                            (
-                                ("pickup_" + CapToText[thing] + "_" + thing_status)
-                                if thing_status != ""
-                                else "pickup_" + CapToText[thing]
-                            ),
-                            lambda: is_ingredients_available(
-                                self.text_agent,
-                                self.world,
-                                ["Counter", thing],
-                                [
-                                    is_valid_center_counter,
-                                    lambda x: self.text_agent.is_target_status(x, thing_status)
-                                    and not in_center_counter(x),
-                                ],
-                            ),
-                            (),
-                        ),
-                        "put_onto_center_counter",
-                    ]
-                ]
-
-            if (thing, thing_status) in [("Lettuce", "done"), ("Bread", "")]:
-                pass_on_subtasks.insert(0, [*pass_on_subtasks[-1][:-1], "put_onto_plate"])
+            return is_in_center_counter(self.text_agent, self.world, x)
 
-            pass_on_subtasks = {(thing, thing_status): pass_on_subtasks}
-            assert self._check_process(pass_on_subtasks)
-            self._pass_on_process_forward_index = self._processes_transform(pass_on_subtasks)
-
-            logger.debug(
-                f"pass_on {thing} {thing_status} forward index:\n {pretty_repr(self._pass_on_process_forward_index)}"
-            )
+        graph = self._process_graph(
+            ("pass_on", thing, thing_status), lambda: self._pass_on_process(thing, thing_status)
+        )
 
         if not prev_subtask_succeeded and len(self.prev_subtasks) > 0:
-            self.prev_subtasks.pop()
+            self._trace_back()
             logger.trace(f"previous subtask failed, traj: {self.prev_subtasks}")
 
         if self.prev_task != ("pass_on", thing, thing_status):
-            if tuple(self.prev_subtasks) not in self._pass_on_process_forward_index:
-                self.prev_subtasks = []
+            self._enter(graph, resume=False)
             self.prev_task = ("pass_on", thing, thing_status)
         valid_actions = self.text_agent.get_valid_actions()
         while current_subtask is None:
             n_try += 1
-            next_subtask_cands = self._pass_on_process_forward_index[(thing, thing_status)][tuple(self.prev_subtasks)]
-            if next_subtask_cands is True:
+            if graph.terminal[self._state]:
                 current_subtask = True
                 break
             else:
-                for n_t in next_subtask_cands:
-                    next_subtask = n_t[0]
-                    next_subtask_cond = n_t[1] is None or n_t[1](*n_t[2])
-                    if next_subtask in valid_actions and next_subtask_cond:
-                        current_subtask = next_subtask
-                        break
+                next_subtask_cands = graph.next_subtasks(
+                    self._state, self.text_agent, self.world, valid_actions, first=True
+                )
+                if len(next_subtask_cands) > 0:
+                    current_subtask, next_state = next_subtask_cands[0]
             if current_subtask is None:
                 if len(self.prev_subtasks) > 0:
-                    trace_back_subtask = self.prev_subtasks.pop()
+                    trace_back_subtask = self._trace_back()
                     logger.trace(f"trace_back {trace_back_subtask}, traj {self.prev_subtasks}")
                 else:
                     break
@@ -1555,9 +1686,9 @@ class MidPlanner:
 
         if end:
             self.prev_task = None
-            self.prev_subtasks = []
+            self._end_subtasks()
         else:
-            self.prev_subtasks.append(current_subtask)
+            self._state = next_state
             if "from_station" in current_subtask:
                 status = self._get_or_pickup(
                     current_subtask,
@@ -1599,41 +1730,32 @@ class MidPlanner:
         legal_foods = ["BeefBurger", "LettuceBurger", "BeefLettuceBurger"]
         assert food in legal_foods, food
 
-        if food not in self._serve_process_forward_index:
-            serve_subtasks = [["pickup_" + CapToText[food], "deliver"]]
-            serve_subtasks = {food: serve_subtasks}
-
-            assert self._check_process(serve_subtasks)
-            self._serve_process_forward_index = self._processes_transform(serve_subtasks)
-            logger.debug(f"serve {food} forward index:\n {pretty_repr(self._serve_process_forward_index)}")
+        graph = self._process_graph(("serve", food), lambda: [["pickup_" + CapToText[food], "deliver"]])
 
         if not prev_subtask_succeeded and len(self.prev_subtasks) > 0:
-            self.prev_subtasks.pop()
+            self._trace_back()
             logger.trace(f"previous subtask failed, traj: {self.prev_subtasks}")
 
         if self.prev_task != ("serve", food):
-            if tuple(self.prev_subtasks) not in self._serve_process_forward_index[food]:
-                self.prev_subtasks = []
+            self._enter(graph)
             self.prev_task = ("serve", food)
 
         valid_actions = self.text_agent.get_valid_actions()
 
         while current_subtask is None:
             n_try += 1
-            next_subtask_cands = self._serve_process_forward_index[food][tuple(self.prev_subtasks)]
-            if next_subtask_cands is True:
+            if graph.terminal[self._state]:
                 current_subtask = True
                 break
             else:
-                for n_t in next_subtask_cands:
-                    next_subtask = n_t[0]
-                    next_subtask_cond = n_t[1] is None or n_t[1](*n_t[2])
-                    if next_subtask in valid_actions and next_subtask_cond:
-                        current_subtask = next_subtask
-                        break
+                next_subtask_cands = graph.next_subtasks(
+                    self._state, self.text_agent, self.world, valid_actions, first=True
+                )
+                if len(next_subtask_cands) > 0:
+                    current_subtask, next_state = next_subtask_cands[0]
             if current_subtask is None:
                 if len(self.prev_subtasks) > 0:
-                    trace_back_subtask = self.prev_subtasks.pop()
+                    trace_back_subtask = self._trace_back()
                     logger.trace(f"trace_back {trace_back_subtask}, traj {self.prev_subtasks}")
                 else:
                     break
@@ -1654,9 +1776,9 @@ class MidPlanner:
 
         if end:
             self.prev_task = None
-            self.prev_subtasks = []
+            self._end_subtasks()
         else:
-            self.prev_subtasks.append(current_subtask)
+            self._state = next_state
 
         return (end, status)
 
@@ -1667,44 +1789,33 @@ class MidPlanner:
         current_subtask = None
         logger.trace(f"traj {self.prev_subtasks}")
 
-        if "fire" not in self._putout_fire_forward_index:
-            putout_fire_subtasks = [
-                [
-                    ("pickup_fireextinguisher", is_on_fire, (self.text_agent, self.world)),
-                    "put_out_fire",
-                ]
-            ]
-            putout_fire_subtasks = {"fire": putout_fire_subtasks}
-            assert self._check_process(putout_fire_subtasks)
-            self._putout_fire_forward_index = self._processes_transform(putout_fire_subtasks)
-            logger.debug(f"putout fire forward index:\n {pretty_repr(self._serve_process_forward_index)}")
+        graph = self._process_graph(
+            ("putout_fire",), lambda: [[("pickup_fireextinguisher", is_on_fire, ()), "put_out_fire"]]
+        )
 
         if not prev_subtask_succeeded and len(self.prev_subtasks) > 0:
-            self.prev_subtasks.pop()
+            self._trace_back()
             logger.trace(f"previous subtask failed, traj: {self.prev_subtasks}")
 
         if self.prev_task != ("putout_fire",):
-            if tuple(self.prev_subtasks) not in self._putout_fire_forward_index["fire"]:
-                self.prev_subtasks = []
+            self._enter(graph)
             self.prev_task = ("putout_fire",)
         valid_actions = self.text_agent.get_valid_actions()
 
         while current_subtask is None:
             n_try += 1
-            next_subtask_cands = self._putout_fire_forward_index["fire"][tuple(self.prev_subtasks)]
-            if next_subtask_cands is True:
+            if graph.terminal[self._state]:
                 current_subtask = True
                 break
             else:
-                for n_t in next_subtask_cands:
-                    next_subtask = n_t[0]
-                    next_subtask_cond = n_t[1] is None or n_t[1](*n_t[2])
-                    if next_subtask in valid_actions and next_subtask_cond:
-                        current_subtask = next_subtask
-                        break
+                next_subtask_cands = graph.next_subtasks(
+                    self._state, self.text_agent, self.world, valid_actions, first=True
+                )
+                if len(next_subtask_cands) > 0:
+                    current_subtask, next_state = next_subtask_cands[0]
             if current_subtask is None:
                 if len(self.prev_subtasks) > 0:
-                    trace_back_subtask = self.prev_subtasks.pop()
+                    trace_back_subtask = self._trace_back()
                     logger.trace(f"trace_back {trace_back_subtask}, traj {self.prev_subtasks}")
                 else:
                     break
@@ -1728,22 +1839,23 @@ class MidPlanner:
 
         if end:
             self.prev_task = None
-            self.prev_subtasks = []
+            self._end_subtasks()
         else:
-            self.prev_subtasks.append(current_subtask)
+            self._state = next_state
 
         return (end, status)
 
-    def clean_a_counter(self, center: bool = False, prev_subtask_succeeded: bool = True) -> Tuple[bool, str]:
+    _status_to_clean_priority = {
+        "Beef": ["overcooked", "fresh", "done"],
+        "Lettuce": ["fresh", "done"],
+    }
+
+    def _occupied_counters(
+        self, center: bool
+    ) -> Tuple[List[Counter], List[Tuple[Object, str]], List[Tuple[Beef, str]]]:
         """
-        The agent will drop an overcooked beef if it exists, or randomly drop a food
+        The occupied (center) counters, the (object, status) on them and the overcooked beefs to clean first.
         """
-        n_try = 0
-        end = False
-        status = ""
-        current_subtask = None
-        logger.trace(f"traj {self.prev_subtasks}")
-
         occupy_counter_list = get_occupy_counter(self.text_agent, self.world)
         if center:
             occupy_counter_list = [x for x in occupy_counter_list if self.text_agent.is_target_status(x, "center")]
@@ -1754,25 +1866,67 @@ class MidPlanner:
             for x in occupy_objects
             if not isinstance(x, (FireExtinguisher,)) or (isinstance(x, Plate) and len(x.content) == 0)
         ]
-        occupy_obj_sta_no_plate = [o_s for o_s in occupy_object_status_list if not isinstance(o_s[0], Plate)]
-
         prior_to_clean = [
             (bf, "overcooked")
             for bf in occupy_objects
             if isinstance(bf, Beef) and self.text_agent.is_target_status(bf, "overcooked")
         ]
-        status_to_clean_priority = {
-            "Beef": ["overcooked", "fresh", "done"],
-            "Lettuce": ["fresh", "done"],
-        }
+        return occupy_counter_list, occupy_object_status_list, prior_to_clean
+
+    def _status_to_clean(
+        self, o: Object, s: str, occupy_object_status_list: List[Tuple[Object, str]]
+    ) -> Tuple[Object, str] | None:
+        o_class_str = type(o).__name__
+        if o_class_str in self._status_to_clean_priority:
+            for _s in self._status_to_clean_priority[o_class_str]:
+                if (o, _s) in occupy_object_status_list:
+                    # logger.warning(f"clean a counter: {o} {_s}")
+                    return (o, _s)
+            return None
+        return (o, s)
+
+    def _clean_a_counter_process(self, center: bool, obj_sta: Tuple[Object, str]) -> Tuple[str, Tuple, List[str]]:
+        """
+        The class name of the object to clean, its (object, status) and the subtasks to clean it.
+        """
+        o_class_str = type(obj_sta[0]).__name__
+        if len(self.world.get_objects_at(obj_sta[0].location, Plate)) > 0 and o_class_str in [
+            "Lettuce",
+            "Bread",
+        ]:
+            obj_sta = (obj_sta[0], "in_plate")
+
+        o_class_str_lower = o_class_str.lower()
+        clean_a_counter_subtasks = [
+            f"pickup_{o_class_str_lower}_{obj_sta[1]}" if obj_sta[1] != "" else f"pickup_{o_class_str_lower}",
+        ]
+        if o_class_str not in ["Plate"]:
+            clean_a_counter_subtasks.append("drop_food")
+        if self.agent.holding is not None:
+            clean_a_counter_subtasks.insert(0, "put_onto_edge_counter" if center else "put_onto_counter")
+        if len(self.world.get_objects_at(obj_sta[0].location, Plate)) > 0:
+            clean_a_counter_subtasks.append("put_onto_edge_counter" if center else "put_onto_counter")
+        return o_class_str, obj_sta, clean_a_counter_subtasks
+
+    def clean_a_counter(self, center: bool = False, prev_subtask_succeeded: bool = True) -> Tuple[bool, str]:
+        """
+        The agent will drop an overcooked beef if it exists, or randomly drop a food
+        """
+        n_try = 0
+        end = False
+        status = ""
+        current_subtask = None
+        logger.trace(f"traj {self.prev_subtasks}")
+
+        occupy_counter_list, occupy_object_status_list, prior_to_clean = self._occupied_counters(center)
+        occupy_obj_sta_no_plate = [o_s for o_s in occupy_object_status_list if not isinstance(o_s[0], Plate)]
 
         if not prev_subtask_succeeded and len(self.prev_subtasks) > 0:
-            self.prev_subtasks.pop()
+            self._trace_back()
             logger.trace(f"previous subtask failed, traj: {self.prev_subtasks}")
 
         if self.prev_task is None or self.prev_task[0] != "clean_a_counter":
-            if tuple(self.prev_subtasks) not in self._clean_a_counter_forward_index:
-                self.prev_subtasks = []
+            self._end_subtasks()
             self.prev_task = None
 
         if (
@@ -1793,65 +1947,39 @@ class MidPlanner:
                         o, s = random.choice(occupy_obj_sta_no_plate)
                     else:
                         o, s = random.choice(occupy_object_status_list)
-                    o_class_str = type(o).__name__
-                    if o_class_str in status_to_clean_priority:
-                        for _s in status_to_clean_priority[o_class_str]:
-                            if (o, _s) in occupy_object_status_list:
-                                # logger.warning(f"clean a counter: {o} {_s}")
-                                obj_sta = (o, _s)
-                                break
-                    else:
-                        obj_sta = (o, s)
+                    obj_sta = self._status_to_clean(o, s, occupy_object_status_list)
 
                     # assert obj_sta != None, (occupy_object_status_list, o, o_class_str)
-                o_class_str = type(obj_sta[0]).__name__
-                if len(self.world.get_objects_at(obj_sta[0].location, Plate)) > 0 and o_class_str in [
-                    "Lettuce",
-                    "Bread",
-                ]:
-                    obj_sta = (obj_sta[0], "in_plate")
+                o_class_str, obj_sta, clean_a_counter_subtasks = self._clean_a_counter_process(center, obj_sta)
                 self.prev_task = ("clean_a_counter", center, o_class_str, (obj_sta[0], obj_sta[1]))
                 self.text_agent.assigned_pickup_target = obj_sta[0]
                 logger.error(self.text_agent.assigned_pickup_target)
 
-                o_class_str_lower = o_class_str.lower()
-                clean_a_counter_subtasks = [
-                    f"pickup_{o_class_str_lower}_{obj_sta[1]}" if obj_sta[1] != "" else f"pickup_{o_class_str_lower}",
-                ]
-                if o_class_str not in ["Plate"]:
-                    clean_a_counter_subtasks.append("drop_food")
-                if self.agent.holding is not None:
-                    clean_a_counter_subtasks.insert(0, "put_onto_edge_counter" if center else "put_onto_counter")
-                if len(self.world.get_objects_at(obj_sta[0].location, Plate)) > 0:
-                    clean_a_counter_subtasks.append("put_onto_edge_counter" if center else "put_onto_counter")
-
-                clean_a_counter_subtasks = {(o_class_str, obj_sta[1]): [clean_a_counter_subtasks]}
-                assert self._check_process(clean_a_counter_subtasks)
-                self._clean_a_counter_forward_index = self._processes_transform(clean_a_counter_subtasks)
-                logger.debug(f"clean a counter forward index:\n {pretty_repr(self._clean_a_counter_forward_index)}")
+                self._enter(
+                    self._process_graph(
+                        ("clean_a_counter", *clean_a_counter_subtasks), lambda: [clean_a_counter_subtasks]
+                    )
+                )
             else:
                 self.prev_task = None
-                self._clean_a_counter_forward_index = {}
 
         valid_actions = self.text_agent.get_valid_actions()
         if self.prev_task is not None:
-            obj_sta = (self.prev_task[2], self.prev_task[3][1])
+            graph = self._graph
             while current_subtask is None:
                 n_try += 1
-                next_subtask_cands = self._clean_a_counter_forward_index[obj_sta][tuple(self.prev_subtasks)]
-                if next_subtask_cands is True:
+                if graph.terminal[self._state]:
                     current_subtask = True
                     break
                 else:
-                    for n_t in next_subtask_cands:
-                        next_subtask = n_t[0]
-                        next_subtask_cond = n_t[1] is None or n_t[1](*n_t[2])
-                        if next_subtask in valid_actions and next_subtask_cond:
-                            current_subtask = next_subtask
-                            break
+                    next_subtask_cands = graph.next_subtasks(
+                        self._state, self.text_agent, self.world, valid_actions, first=True
+                    )
+                    if len(next_subtask_cands) > 0:
+                        current_subtask, next_state = next_subtask_cands[0]
                 if current_subtask is None:
                     if len(self.prev_subtasks) > 0:
-                        trace_back_subtask = self.prev_subtasks.pop()
+                        trace_back_subtask = self._trace_back()
                         logger.trace(f"trace_back {trace_back_subtask}, traj {self.prev_subtasks}")
                     else:
                         break
@@ -1876,7 +2004,7 @@ class MidPlanner:
 
         if end:
             self.prev_task = None
-            self.prev_subtasks = []
+            self._end_subtasks()
         else:
-            self.prev_subtasks.append(current_subtask)
+            self._state = next_state
         return (end, status)
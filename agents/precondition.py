@@ -0,0 +1,455 @@
+"""
+Compiler of the preconditions of the LLM-assigned actions, e.g.
+    "lambda json_state: json_state['objects'][('Beef', 'Well-cooked')] + json_state['objects'][('Beef', 'In-progress')]
+        < sum(order['name'] == 'BeefBurger' or order['name'] == 'BeefLettuceBurger' for order in json_state['orders'])"
+
+Instead of `eval`, the source is parsed into an AST restricted to comparisons of linear expressions over the state
+counters (objects, empty counters, total score, number of orders of each food, remaining time of the first `MAX_ORDER`
+orders) combined with `and`, `or` and `not`. Like `eval`, which raises an IndexError, reading the remaining time of a
+missing order is an error, propagated with the short-circuits of `and`, `or` and chained comparisons, and a
+precondition ending in an error does not hold.
+Each comparison is compiled into a row of weights over `STATE_FEATURES`, so that a precondition is evaluated on the
+integer state vector of `state_vector(json_state)`, and many preconditions with one matrix product, see
+`PreconditionSet`. Anything else (names, attributes, calls other than `sum`, `len`, `any`, `all`) is rejected with a
+`PreconditionError`. Compiled preconditions are cached by source string.
+"""
+
+import ast
+import operator
+from functools import lru_cache
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+from gym_cooking.cooking_world.cooking_world import CookingWorld
+
+OBJECT_KEYS = CookingWorld.STATE_OBJECT_KEYS
+# the food names of the orders
+ORDER_NAMES = tuple(dict.fromkeys(name for name, _ in OBJECT_KEYS))
+# the orders whose remain_time is a feature, the max_order of the env configs
+MAX_ORDER = 4
+# remain_time of a missing order in the state vector, unused since reading it is an error
+MISSING_REMAIN_TIME = 0
+STATE_FEATURES = (
+    tuple(("objects", key) for key in OBJECT_KEYS)
+    + (("counters", "Empty"), ("total_score", None))
+    + tuple(("orders", name) for name in ORDER_NAMES)
+    + tuple(("remain_time", i) for i in range(MAX_ORDER))
+)
+FEATURE_IDS = {feature: i for i, feature in enumerate(STATE_FEATURES)}
+
+# comparisons of an expression with 0, the other operators are normalized to these
+GT, GE, EQ, NE = range(4)
+# truth value of each comparison for the sign (-1, 0, 1) of the expression
+_SIGN_TRUTH = np.array(
+    [[False, False, True], [False, True, True], [False, True, False], [True, False, True]],
+    dtype=bool,
+)
+_COMPARE_OPS = {
+    ast.Gt: (GT, 1),
+    ast.GtE: (GE, 1),
+    ast.Lt: (GT, -1),
+    ast.LtE: (GE, -1),
+    ast.Eq: (EQ, 1),
+    ast.NotEq: (NE, 1),
+}
+_STATIC_COMPARE_OPS = {
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.In: lambda a, b: a in b,
+    ast.NotIn: lambda a, b: a not in b,
+}
+
+
+class PreconditionError(ValueError):
+    pass
+
+
+def state_vector(json_state: Dict, out: np.ndarray | None = None) -> np.ndarray:
+    """
+    Integer vector of `json_state` (see `CookingWorld.get_json_state_simple`) in the `STATE_FEATURES` layout.
+    """
+    if out is None:
+        out = np.zeros(len(STATE_FEATURES), dtype=np.int64)
+    else:
+        out[:] = 0
+    objects = json_state["objects"]
+    vector = getattr(objects, "vector", None)
+    if vector is not None:
+        # the counts of CookingWorld.get_state_counts
+        out[: len(OBJECT_KEYS)] = vector
+    else:
+        for i, key in enumerate(OBJECT_KEYS):
+            out[i] = objects.get(key, 0)
+    out[FEATURE_IDS[("counters", "Empty")]] = json_state.get("counters", {}).get("Empty", 0)
+    out[FEATURE_IDS[("total_score", None)]] = json_state.get("total_score", 0)
+    orders = json_state.get("orders", [])
+    for order in orders:
+        feature_id = FEATURE_IDS.get(("orders", order["name"]))
+        if feature_id is not None:
+            out[feature_id] += 1
+    for i in range(MAX_ORDER):
+        out[FEATURE_IDS[("remain_time", i)]] = orders[i]["remain_time"] if i < len(orders) else MISSING_REMAIN_TIME
+    return out
+
+
+class _Linear:
+    """
+    `weights . state + const`
+    """
+
+    def __init__(self, weights: Dict[int, float] | None = None, const: float = 0) -> None:
+        self.weights = weights or {}
+        self.const = const
+
+    def scale(self, factor: float) -> "_Linear":
+        return _Linear({i: w * factor for i, w in self.weights.items()}, self.const * factor)
+
+    def add(self, other: "_Linear", factor: float = 1) -> "_Linear":
+        weights = dict(self.weights)
+        for i, w in other.weights.items():
+            weights[i] = weights.get(i, 0) + w * factor
+        return _Linear(weights, self.const + other.const * factor)
+
+
+class _Compiler:
+    """
+    Compiles the body of a precondition into a boolean tree, ("const", bool), ("atom", i), ("not", node),
+    ("and", [nodes]) or ("or", [nodes]), over the atoms (linear expression, comparison with 0, number of orders read).
+    """
+
+    def __init__(self, source: str) -> None:
+        self.source = source
+        self.atoms: List[Tuple[_Linear, int, int]] = []
+        # the number of orders read by json_state['orders'][i]['remain_time'] since the last atom
+        self.n_orders_read = 0
+        try:
+            tree = ast.parse(source.strip(), mode="eval").body
+        except SyntaxError as e:
+            raise PreconditionError(f"Invalid precondition {source!r}: {e}") from e
+        if not isinstance(tree, ast.Lambda) or len(tree.args.args) != 1 or tree.args.vararg or tree.args.kwarg:
+            raise PreconditionError(f"Precondition {source!r} is not a lambda of the json state")
+        self.state_name = tree.args.args[0].arg
+        self.tree = self.compile_bool(tree.body)
+
+    def error(self, node: ast.AST, reason: str = "Unsupported expression") -> PreconditionError:
+        return PreconditionError(f"{reason} {ast.unparse(node)!r} in precondition {self.source!r}")
+
+    def atom(self, expr: _Linear, op: int) -> Tuple:
+        self.atoms.append((expr, op, self.n_orders_read))
+        self.n_orders_read = 0
+        return ("atom", len(self.atoms) - 1)
+
+    def compile_bool(self, node: ast.AST) -> Tuple:
+        if isinstance(node, ast.Constant) and isinstance(node.value, bool):
+            return ("const", node.value)
+        if isinstance(node, ast.BoolOp):
+            return ("and" if isinstance(node.op, ast.And) else "or", [self.compile_bool(v) for v in node.values])
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            return ("not", self.compile_bool(node.operand))
+        if isinstance(node, ast.Compare):
+            nodes, left = [], self.compile_linear(node.left)
+            for op, comparator in zip(node.ops, node.comparators):
+                if type(op) not in _COMPARE_OPS:
+                    raise self.error(node)
+                right = self.compile_linear(comparator)
+                code, sign = _COMPARE_OPS[type(op)]
+                nodes.append(self.atom(left.add(right, -1).scale(sign), code))
+                left = right
+            return nodes[0] if len(nodes) == 1 else ("and", nodes)
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in ["any", "all"]:
+            # the number of orders (not) satisfying the condition
+            if node.func.id == "any":
+                return self.atom(self.compile_order_sum(node), GT)
+            return self.atom(self.compile_order_sum(node, negate=True), EQ)
+        # truthiness of a number
+        return self.atom(self.compile_linear(node), NE)
+
+    def compile_linear(self, node: ast.AST) -> _Linear:
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+            return _Linear(const=node.value)
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+            return self.compile_linear(node.operand).scale(-1 if isinstance(node.op, ast.USub) else 1)
+        if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.Add, ast.Sub)):
+            return self.compile_linear(node.left).add(
+                self.compile_linear(node.right), -1 if isinstance(node.op, ast.Sub) else 1
+            )
+        if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Mult):
+            left, right = self.compile_linear(node.left), self.compile_linear(node.right)
+            if not left.weights:
+                return right.scale(left.const)
+            if not right.weights:
+                return left.scale(right.const)
+            raise self.error(node, "Non-linear expression")
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+            if node.func.id == "sum":
+                return self.compile_order_sum(node)
+            if node.func.id == "len" and len(node.args) == 1 and not node.keywords:
+                if self.state_key(node.args[0]) == ("orders",):
+                    return _Linear({FEATURE_IDS[("orders", name)]: 1 for name in ORDER_NAMES})
+            raise self.error(node)
+        return _Linear({self.feature(node): 1})
+
+    def state_key(self, node: ast.AST) -> Tuple | None:
+        """
+        The keys of `json_state[k0][k1]...`, None if the node is not such a subscript.
+        """
+        keys = []
+        while isinstance(node, ast.Subscript):
+            try:
+                keys.append(ast.literal_eval(node.slice))
+            except ValueError:
+                raise self.error(node)
+            node = node.value
+        if isinstance(node, ast.Name) and node.id == self.state_name:
+            return tuple(reversed(keys))
+        return None
+
+    def feature(self, node: ast.AST) -> int:
+        # json_state['objects'].get(key, 0)
+        if (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Attribute)
+            and node.func.attr == "get"
+            and len(node.args) in [1, 2]
+            and not node.keywords
+        ):
+            keys = self.state_key(node.func.value)
+            if keys is not None:
+                node = ast.Subscript(value=node.func.value, slice=node.args[0])
+        keys = self.state_key(node)
+        if keys is None:
+            raise self.error(node)
+        if len(keys) == 2 and keys[0] == "objects" and isinstance(keys[1], tuple):
+            feature = ("objects", keys[1])
+        elif keys == ("counters", "Empty"):
+            feature = ("counters", "Empty")
+        elif keys == ("total_score",):
+            feature = ("total_score", None)
+        elif len(keys) == 3 and keys[0] == "orders" and type(keys[1]) is int and keys[2] == "remain_time":
+            # json_state['orders'][i]['remain_time'], an error if there are not more than i orders
+            feature = ("remain_time", keys[1])
+            self.n_orders_read = max(self.n_orders_read, keys[1] + 1)
+        else:
+            raise self.error(node, "Unknown state entry")
+        if feature not in FEATURE_IDS:
+            raise self.error(node, "Unknown object" if feature[0] == "objects" else "Unknown order")
+        return FEATURE_IDS[feature]
+
+    def compile_order_sum(self, node: ast.Call, negate: bool = False) -> _Linear:
+        """
+        `sum(f(order) for order in json_state['orders'] if ...)` where f only depends on `order['name']`, the number
+        of orders of each food weighted by f. With `negate`, the number of orders not satisfying f.
+        """
+        if len(node.args) != 1 or node.keywords or not isinstance(node.args[0], ast.GeneratorExp):
+            raise self.error(node)
+        generator = node.args[0]
+        if len(generator.generators) != 1:
+            raise self.error(node)
+        comprehension = generator.generators[0]
+        if (
+            not isinstance(comprehension.target, ast.Name)
+            or self.state_key(comprehension.iter) != ("orders",)
+            or comprehension.is_async
+        ):
+            raise self.error(node)
+        order_var = comprehension.target.id
+        weights = {}
+        for name in ORDER_NAMES:
+            if not all(self.order_value(cond, order_var, name) for cond in comprehension.ifs):
+                continue
+            value = self.order_value(generator.elt, order_var, name)
+            if negate:
+                value = not value
+            if not isinstance(value, (bool, int, float)):
+                raise self.error(generator.elt)
+            if value:
+                weights[FEATURE_IDS[("orders", name)]] = float(value)
+        return _Linear(weights)
+
+    def order_value(self, node: ast.AST, order_var: str, name: str):
+        """
+        Static value of an expression of `order['name']`.
+        """
+        if isinstance(node, ast.Constant):
+            return node.value
+        if isinstance(node, (ast.Tuple, ast.List, ast.Set)):
+            return tuple(self.order_value(e, order_var, name) for e in node.elts)
+        if (
+            isinstance(node, ast.Subscript)
+            and isinstance(node.value, ast.Name)
+            and node.value.id == order_var
+            and isinstance(node.slice, ast.Constant)
+            and node.slice.value == "name"
+        ):
+            return name
+        if isinstance(node, ast.BoolOp):
+            values = [self.order_value(v, order_var, name) for v in node.values]
+            return all(values) if isinstance(node.op, ast.And) else any(values)
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            return not self.order_value(node.operand, order_var, name)
+        if isinstance(node, ast.Compare):
+            left = self.order_value(node.left, order_var, name)
+            for op, comparator in zip(node.ops, node.comparators):
+                right = self.order_value(comparator, order_var, name)
+                if type(op) not in _STATIC_COMPARE_OPS or not _STATIC_COMPARE_OPS[type(op)](left, right):
+                    return False
+                left = right
+            return True
+        raise self.error(node, "Unsupported order condition")
+
+
+def _evaluate_tree(node: Tuple, atoms: np.ndarray, errors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Truth values and errors of the node, like Python the first operand of `and` (`or`) which is an error or false
+    (true) decides, otherwise the last one.
+    """
+    kind = node[0]
+    if kind == "atom":
+        return atoms[..., node[1]], errors[..., node[1]]
+    if kind == "const":
+        return np.full(atoms.shape[:-1], node[1]), np.zeros(atoms.shape[:-1], dtype=bool)
+    if kind == "not":
+        value, error = _evaluate_tree(node[1], atoms, errors)
+        return np.logical_not(value), error
+    children = [_evaluate_tree(child, atoms, errors) for child in node[1]]
+    value, error = children[-1]
+    for child_value, child_error in reversed(children[:-1]):
+        decides = child_error | (np.logical_not(child_value) if kind == "and" else child_value)
+        value = np.where(decides, child_value, value)
+        error = np.where(decides, child_error, error)
+    return value, error
+
+
+def _shift_atoms(node: Tuple, offset: int) -> Tuple:
+    if node[0] == "atom":
+        return ("atom", node[1] + offset)
+    if node[0] == "not":
+        return ("not", _shift_atoms(node[1], offset))
+    if node[0] in ["and", "or"]:
+        return (node[0], [_shift_atoms(child, offset) for child in node[1]])
+    return node
+
+
+class PreconditionSet:
+    """
+    Preconditions evaluated together, all their comparisons in one matrix product over the state vectors.
+    """
+
+    def __init__(self, preconditions: Sequence["Precondition"]) -> None:
+        self.preconditions = tuple(preconditions)
+        self.trees = []
+        weights, consts, ops, n_orders = [], [], [], []
+        n_atoms = 0
+        for precondition in self.preconditions:
+            self.trees.append(_shift_atoms(precondition.tree, n_atoms))
+            n_atoms += len(precondition.consts)
+            weights.append(precondition.weights)
+            consts.append(precondition.consts)
+            ops.append(precondition.ops)
+            n_orders.append(precondition.n_orders)
+        self.weights = np.concatenate(weights) if weights else np.zeros((0, len(STATE_FEATURES)))
+        self.consts = np.concatenate(consts) if consts else np.zeros(0)
+        self.ops = np.concatenate(ops) if ops else np.zeros(0, dtype=np.int8)
+        self.n_orders = np.concatenate(n_orders) if n_orders else np.zeros(0, dtype=np.int64)
+        self._order_ids = [FEATURE_IDS[("orders", name)] for name in ORDER_NAMES]
+
+    def __len__(self) -> int:
+        return len(self.preconditions)
+
+    def evaluate_atoms(self, states: np.ndarray) -> np.ndarray:
+        """
+        Truth values of the comparisons, (..., n_atoms) for `states` (..., n_features).
+        """
+        values = states @ self.weights.T + self.consts
+        return _SIGN_TRUTH[self.ops, np.sign(values).astype(np.int64) + 1]
+
+    def evaluate_errors(self, states: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Truth values of the preconditions and whether they end in an error (reading a missing order),
+        (..., n_preconditions) each for `states` (..., n_features).
+        """
+        states = np.asarray(states)
+        atoms = self.evaluate_atoms(states)
+        if not self.trees:
+            empty = np.zeros(atoms.shape[:-1] + (0,), dtype=bool)
+            return empty, empty
+        errors = states[..., self._order_ids].sum(axis=-1, keepdims=True) < self.n_orders
+        results = [_evaluate_tree(tree, atoms, errors) for tree in self.trees]
+        return np.stack([value for value, _ in results], axis=-1), np.stack([error for _, error in results], axis=-1)
+
+    def evaluate(self, states: np.ndarray) -> np.ndarray:
+        """
+        Truth values of the preconditions, (..., n_preconditions) for `states` (..., n_features). A precondition
+        ending in an error does not hold.
+        """
+        values, errors = self.evaluate_errors(states)
+        return values & np.logical_not(errors)
+
+
+class Precondition:
+    """
+    A compiled precondition, `holds(state)` on a state vector, or called on a json state like the lambda it replaces.
+    Called on a json state, reading a missing order raises an IndexError like the lambda, so that the action is
+    rejected by `RuleAgent._correct_actions`, while it does not hold on the state vector.
+    """
+
+    def __init__(self, source: str) -> None:
+        compiler = _Compiler(source)
+        self.source = source
+        self.tree = compiler.tree
+        self.weights = np.zeros((len(compiler.atoms), len(STATE_FEATURES)))
+        self.consts = np.zeros(len(compiler.atoms))
+        self.ops = np.zeros(len(compiler.atoms), dtype=np.int8)
+        self.n_orders = np.zeros(len(compiler.atoms), dtype=np.int64)
+        for i, (expr, op, n_orders) in enumerate(compiler.atoms):
+            for feature_id, weight in expr.weights.items():
+                self.weights[i, feature_id] = weight
+            self.consts[i] = expr.const
+            self.ops[i] = op
+            self.n_orders[i] = n_orders
+        self._set = PreconditionSet([self])
+
+    def holds(self, state: np.ndarray) -> bool:
+        return bool(self._set.evaluate(state)[0])
+
+    def __call__(self, json_state: Dict) -> bool:
+        values, errors = self._set.evaluate_errors(state_vector(json_state))
+        if errors[0]:
+            raise IndexError(f"Missing order read by precondition {self.source!r}")
+        return bool(values[0])
+
+    def __repr__(self) -> str:
+        return f"Precondition({self.source!r})"
+
+    # immutable, shared by the copies of the behavior patterns
+    def __copy__(self) -> "Precondition":
+        return self
+
+    def __deepcopy__(self, memo) -> "Precondition":
+        return self
+
+
+@lru_cache(maxsize=4096)
+def compile_precondition(source: str) -> Precondition:
+    """
+    The compiled precondition of a source string, raises `PreconditionError` if it is not supported.
+    """
+    if not isinstance(source, str):
+        raise PreconditionError(f"Precondition {source!r} is not a string")
+    return Precondition(source)
+
+
+@lru_cache(maxsize=256)
+def precondition_set(preconditions: Tuple[Precondition, ...]) -> PreconditionSet:
+    return PreconditionSet(preconditions)
+
+
+def evaluate_preconditions(preconditions: Sequence[Precondition], state: np.ndarray) -> np.ndarray:
+    """
+    Truth values of `preconditions` on one state vector, evaluated together.
+    """
+    return precondition_set(tuple(preconditions)).evaluate(state)
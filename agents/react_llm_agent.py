@@ -1,3 +1,4 @@
+import ast
 import json
 import random
 import re
@@ -147,7 +148,7 @@ Current Assigned Tasks:
             try:
                 json_tasks = extract_code_blocks(llm_output)[0].strip()
                 json_tasks = json_tasks.replace("false", "False").replace("true", "True")
-                assigned_tasks = eval(json_tasks)
+                assigned_tasks = ast.literal_eval(json_tasks)
                 logger.debug(f"Original Assigned tasks: {assigned_tasks}")
                 self.text_assign_tasks = []
                 _assigned_tasks = []
@@ -320,7 +321,7 @@ Current Assigned Tasks:
             try:
                 json_tasks = extract_code_blocks(llm_output)[0].strip()
                 json_tasks = json_tasks.replace("false", "False").replace("true", "True")
-                assigned_tasks = eval(json_tasks)
+                assigned_tasks = ast.literal_eval(json_tasks)
                 logger.debug(f"Original Assigned tasks: {assigned_tasks}")
                 self.text_assign_tasks = []
                 _assigned_tasks = []
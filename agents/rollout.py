@@ -0,0 +1,143 @@
+"""
+Short rollouts of candidate mid actions on copies of the world, to compare how long they take.
+
+Each candidate is run by a fresh MidAgent on a copy of the world for at most `horizon` ticks, while the partners run
+their current mid actions (or stay). The result is the number of ticks until the mid action ends and the number of
+ticks in which a move of the agent was blocked by a partner. The rollouts are seeded and restore the global random
+states, so that evaluating does not change the episode.
+
+The evaluation is synchronous, it blocks the event loop of the episode for all the rollouts (about 50-120ms for three
+candidates with a horizon of 40 ticks in process), so it is only for the simulation mode where the game time does not
+advance meanwhile, see `runners.episode.Episode`. The process pool must be closed by `close()`.
+"""
+
+import copy
+import pickle
+import random
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+
+import numpy as np
+from gym_cooking.cooking_world.cooking_world import CookingWorld
+from loguru import logger
+
+from agents.mid_agent import MidAgent
+from agents.text_agent import TextAgent
+
+MidAction = Tuple[str, Dict]
+
+
+class RolloutResult(NamedTuple):
+    mid_action: MidAction
+    ticks: int  # ticks until the mid action ended, the horizon if it did not
+    succeeded: bool
+    failed: bool
+    conflicts: int  # ticks in which the agent moved to a cell taken by a partner
+    status: str
+
+    @property
+    def cost(self) -> Tuple[bool, int, int]:
+        return (self.failed, self.ticks, self.conflicts)
+
+
+def rollout(
+    world: CookingWorld,
+    agent_idx: int,
+    mid_action: MidAction,
+    partner_mid_actions: Dict[int, MidAction] | None = None,
+    horizon: int = 40,
+    seed: int = 0,
+) -> RolloutResult:
+    """
+    Run `mid_action` for the agent `agent_idx` on `world`, which is modified, pass a copy.
+    """
+    random_state, np_random_state = random.getstate(), np.random.get_state()
+    random.seed(seed)
+    np.random.seed(seed)
+    agent = world.agents[agent_idx]
+    mid_agents = {agent_idx: (MidAgent(TextAgent(world, agent_idx), world), mid_action)}
+    for idx, partner_mid_action in (partner_mid_actions or {}).items():
+        if partner_mid_action and idx != agent_idx:
+            mid_agents[idx] = (MidAgent(TextAgent(world, idx), world), partner_mid_action)
+    conflicts = 0
+    try:
+        for tick in range(horizon):
+            actions = [0] * len(world.agents)
+            for idx, (mid_agent, (func, kwargs)) in list(mid_agents.items()):
+                end, action, status = mid_agent.get_action(func, **kwargs)
+                if end and idx == agent_idx:
+                    succeeded = status.startswith("Succeeded")
+                    return RolloutResult(mid_action, tick, succeeded, not succeeded, conflicts, status)
+                if end:
+                    del mid_agents[idx]
+                actions[idx] = action
+
+            partner_locations = {a.location for i, a in enumerate(world.agents) if i != agent_idx}
+            if 0 < actions[agent_idx] < 5:
+                target_location = CookingWorld.get_target_location(agent, actions[agent_idx])
+            else:
+                target_location = None
+            world.perform_agent_actions(world.agents, actions)
+            partner_locations.update(a.location for i, a in enumerate(world.agents) if i != agent_idx)
+            if target_location in partner_locations:
+                conflicts += 1
+    except Exception as e:
+        logger.warning(f"Rollout of {mid_action} failed: {e!r}")
+        return RolloutResult(mid_action, horizon, False, True, conflicts, f"Failed, {e!r}")
+    finally:
+        random.setstate(random_state)
+        np.random.set_state(np_random_state)
+    return RolloutResult(mid_action, horizon, False, False, conflicts, "Working...")
+
+
+def _rollout_pickled(world_bytes: bytes, *args) -> RolloutResult:
+    return rollout(pickle.loads(world_bytes), *args)
+
+
+class MidActionEvaluator:
+    """
+    Estimate the ticks to complete candidate mid actions by rollouts, on `n_workers` processes (in process if 0).
+    """
+
+    def __init__(self, horizon: int = 40, n_workers: int = 0, seed: int = 0) -> None:
+        self.horizon = horizon
+        self.n_workers = n_workers
+        self.seed = seed
+        self._pool: ProcessPoolExecutor | None = None
+
+    def evaluate(
+        self,
+        world: CookingWorld,
+        agent_idx: int,
+        candidates: Sequence[MidAction],
+        partner_mid_actions: Dict[int, MidAction] | None = None,
+    ) -> List[RolloutResult]:
+        args = (partner_mid_actions, self.horizon, self.seed)
+        if self.n_workers == 0 or len(candidates) <= 1:
+            return [rollout(copy.deepcopy(world), agent_idx, mid_action, *args) for mid_action in candidates]
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.n_workers)
+        world_bytes = pickle.dumps(world)
+        futures = [
+            self._pool.submit(_rollout_pickled, world_bytes, agent_idx, mid_action, *args) for mid_action in candidates
+        ]
+        return [future.result() for future in futures]
+
+    def best(
+        self,
+        world: CookingWorld,
+        agent_idx: int,
+        candidates: Sequence[MidAction],
+        partner_mid_actions: Dict[int, MidAction] | None = None,
+    ) -> MidAction:
+        """
+        The candidate expected to complete first, not failing, with the fewest conflicts among ties (then the first).
+        """
+        results = self.evaluate(world, agent_idx, candidates, partner_mid_actions)
+        logger.debug("rollouts " + ", ".join(f"{r.mid_action}: {r.ticks} ticks {r.status}" for r in results))
+        return min(results, key=lambda r: r.cost).mid_action
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
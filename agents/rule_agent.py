@@ -2,15 +2,86 @@ import random
 from collections import Counter as CollectionCounter
 from copy import deepcopy
 from pprint import pformat
-from typing import Dict, List, Tuple
+from typing import Dict, List, Sequence, Tuple
 
 from gym_cooking.cooking_world.cooking_world import CookingWorld
 from loguru import logger
 
-from agents.mid_planner import MidPlanner, get_empty_counter
+from agents.mid_planner import MidPlanner
+from agents.precondition import (
+    PreconditionError,
+    compile_precondition,
+    evaluate_preconditions,
+    state_vector,
+)
+from agents.rollout import MidActionEvaluator
 from agents.text_agent import TextAgent
 
 
+class OrderPatternTrie:
+    """
+    Prefix trie over the order tuples of the behavior patterns, built once per assignment.
+    """
+
+    def __init__(self, order_tuples: Sequence[Tuple[str, ...]] = ()) -> None:
+        # nested dicts of the orders, the order tuple ending at a node is under the key None
+        self.root = {}
+        for o_t in order_tuples:
+            node = self.root
+            for order in o_t:
+                node = node.setdefault(order, {})
+            node[None] = o_t
+
+    def longest_match(self, orders: Sequence[str]) -> Tuple[str, ...] | None:
+        """
+        The longest order tuple that is a prefix of `orders`, in O(len(orders)).
+        """
+        node, matched = self.root, self.root.get(None)
+        for order in orders:
+            node = node.get(order)
+            if node is None:
+                break
+            matched = node.get(None, matched)
+        return matched
+
+
+class PatternMatch:
+    """
+    Progress in the steps of a matched order pattern, the steps are shared with `order_patterns` and not modified.
+    """
+
+    def __init__(self, orders: Tuple[str, ...], steps: Tuple) -> None:
+        self.orders = orders
+        self.steps = steps
+        self.cursor = 0
+        # indices of the steps removed after the cursor, the orders delivered in advance
+        self.removed = set()
+
+    def current(self):
+        """
+        The current step, None if the pattern is completed.
+        """
+        while self.cursor in self.removed:
+            self.cursor += 1
+        return self.steps[self.cursor] if self.cursor < len(self.steps) else None
+
+    def advance(self) -> None:
+        self.cursor += 1
+
+    def remove(self, order: str) -> None:
+        """
+        Remove the next step preparing `order` in default mode.
+        """
+        for i in range(self.cursor, len(self.steps)):
+            if i not in self.removed and self.steps[i] == order:
+                self.removed.add(i)
+                return
+
+    def __repr__(self) -> str:
+        remaining = [step for i, step in enumerate(self.steps) if i >= self.cursor and i not in self.removed]
+        return f"PatternMatch({self.orders}, {remaining})"
+
+
 class RuleAgent:
     """
     Rule-based agent for Cooking, driven by behavior patterns, and assigned orders and actions.
@@ -39,7 +110,8 @@ class RuleAgent:
         # self.old_assigned_tasks: list = []
         self.action_patterns = {}
         self.order_patterns = {}
-        self.matched_pattern = ()
+        self.order_pattern_trie = OrderPatternTrie()
+        self.matched_pattern: PatternMatch | None = None
 
         self.order_in_progress: List[str] = []  # for output messages
         self.dummy_json_state = None
@@ -48,6 +120,10 @@ class RuleAgent:
 
         self.controlled_by_fsm = False
 
+        # optional, choose among the ingredients to prepare by rollouts, with the partners' current mid actions
+        self.rollout_evaluator: MidActionEvaluator | None = None
+        self.partner_mid_actions: Dict[int, Tuple[str, Dict]] = {}
+
     def update(self, text_action_agent: TextAgent, cooking_world: CookingWorld, dummy_json_state: Dict = None):
         """
         Binding low-level test_agent and the cooking world
@@ -61,7 +137,8 @@ class RuleAgent:
         self.assigned_orders = []
         self.action_patterns = {}
         self.order_patterns = {}
-        self.matched_pattern = ()
+        self.order_pattern_trie = OrderPatternTrie()
+        self.matched_pattern: PatternMatch | None = None
 
         self.order_in_progress: List[str] = []  # for output messages
         self.dummy_json_state = dummy_json_state
@@ -130,8 +207,8 @@ class RuleAgent:
                 if food in self.valid_orders:
                     if food in self.assigned_orders:
                         self.assigned_orders.remove(food)
-                    if self.matched_pattern and food in self.matched_pattern[1]:
-                        self.matched_pattern[1].remove(food)
+                    if self.matched_pattern is not None:
+                        self.matched_pattern.remove(food)
                     if food in self.order_in_progress:
                         self.order_in_progress.remove(food)
 
@@ -144,7 +221,7 @@ class RuleAgent:
                 self.controlled_by_fsm = True
         if not mid_action:
             # clean a counter
-            n_empty_counter = len(get_empty_counter(self.text_agent, self.world))
+            n_empty_counter = self.world.get_state_counts(self.agent_idx)[len(CookingWorld.STATE_OBJECT_KEYS)]
             if n_empty_counter <= 0:
                 logger.debug("No empty counter detected")
                 mid_action = ("clean_a_counter", {"center": False})
@@ -174,10 +251,13 @@ class RuleAgent:
             for precond, action in self.action_patterns.items():
                 if (precond, action) not in self.assigned_actions:
                     self.assigned_actions.append((precond, action))
+        # the preconditions are evaluated on one state vector, the urgent ones together
+        state = state_vector(json_state)
+        satisfied = list(evaluate_preconditions([precond for precond, _ in self.assigned_actions], state))
         while len(self.assigned_actions) > 0:
             action = self.assigned_actions.pop(0)
             precond, action = action
-            if precond(json_state):
+            if satisfied.pop(0):
                 if action[0] not in ["serve"] or action[1]["food"] in orders:
                     mid_action = action
                     self.controlled_by_fsm = False
@@ -198,34 +278,25 @@ class RuleAgent:
             return mid_action
 
         if len(orders) > 0:
-            if not self.matched_pattern:
-                order_tuples = sorted(list(self.order_patterns.keys()), key=len, reverse=True)
-                for o_t in order_tuples:
-                    if orders[: len(o_t)] == list(o_t):
-                        self.matched_pattern = (o_t, deepcopy(self.order_patterns[o_t]))
-                        logger.debug(
-                            f"Preparing orders {self.matched_pattern[0]} using\n{pformat(self.matched_pattern[1])}"
-                        )
-                        self.order_in_progress = list(self.matched_pattern[0])
-                        break
-            while self.matched_pattern and len(self.matched_pattern[1]) > 0:
-                a_o = self.matched_pattern[1].pop(0)
+            if self.matched_pattern is None:
+                self._match_order_pattern(orders)
+            while self.matched_pattern is not None:
+                a_o = self.matched_pattern.current()
+                if a_o is None:  # the matched orders are completed
+                    self.matched_pattern = None
+                    break
                 if isinstance(a_o, str) and a_o in orders:  # prepare the food in default mode
-                    order = a_o
-                    mid_action = self._prepare_order(json_state, order)
-                    self.matched_pattern[1].insert(0, order)
+                    mid_action = self._prepare_order(json_state, a_o)
                     break
                 elif isinstance(a_o, tuple):
                     precond, action = a_o
-                    if precond(json_state):
+                    if precond.holds(state):
                         if (
                             action[0] not in ["serve"] or action[1]["food"] in orders
                         ):  # prepare food or serve in-demand food
                             mid_action = action
-                            self.matched_pattern[1].insert(0, a_o)
                             break
-            else:  # no break means the matched orders are completed
-                self.matched_pattern = ()
+                self.matched_pattern.advance()
             if not mid_action:
                 self.order_in_progress = [orders[0]]
                 mid_action = self._prepare_order(json_state, orders[0])
@@ -235,6 +306,16 @@ class RuleAgent:
         # ), f"Invalid mid action {mid_action}"
         return mid_action
 
+    def _match_order_pattern(self, orders: List[str]) -> None:
+        """
+        Start the pattern of the longest order tuple matching the first orders, if any
+        """
+        o_t = self.order_pattern_trie.longest_match(orders)
+        if o_t is not None:
+            self.matched_pattern = PatternMatch(o_t, self.order_patterns[o_t])
+            logger.debug(f"Preparing orders {o_t} using\n{pformat(self.order_patterns[o_t])}")
+            self.order_in_progress = list(o_t)
+
     def _remove_excess_orders(self, selected_orders: List, all_orders: List) -> List:
         """
         Remove the excess orders from the selected orders
@@ -267,7 +348,13 @@ class RuleAgent:
             if is_ingredients_ready:
                 mid_action = ("assemble", {"food": order})
             else:
-                mid_action = self._prepare_ingredient(json_state, order)
+                candidates = self._ingredient_candidates(json_state, order) if self.rollout_evaluator else []
+                if len(candidates) > 1:
+                    mid_action = self.rollout_evaluator.best(
+                        self.world, self.agent_idx, candidates, self.partner_mid_actions
+                    )
+                else:
+                    mid_action = self._prepare_ingredient(json_state, order)
         # assert (
         #     not mid_action or mid_action[1] in MidPlanner.valid_actions[mid_action[0]]
         # ), f"Invalid mid action {mid_action}"
@@ -293,9 +380,25 @@ class RuleAgent:
         else:
             return "prepare", {"food": food, "plate": True if food in ["Beef"] else False}
 
+    def _ingredient_candidates(self, json_state: Dict, food: str) -> List[Tuple[str, Dict]]:
+        """
+        All the mid actions _prepare_ingredient may choose, in order
+        """
+        if food not in self.food_to_ingredients:
+            return [("prepare", {"food": food, "plate": True if food in ["Beef"] else False})]
+        candidates = []
+        for ingredients in self.food_to_ingredients[food]:
+            for ingredient in ingredients:
+                if json_state["objects"][ingredient] == 0:
+                    for candidate in self._ingredient_candidates(json_state, ingredient[0]):
+                        if candidate not in candidates:
+                            candidates.append(candidate)
+        return candidates
+
     def _correct_actions(self, assigned_actions: List) -> Tuple[List, List]:
         """
-        Correct the actions, ensure the assigned actions are valid
+        Correct the actions, ensure the assigned actions are valid, the preconditions are compiled instead of evaluated,
+        see `agents.precondition`
         """
         assert self.dummy_json_state, "Dummy json state is not provided"
         corrected_actions = []
@@ -306,13 +409,13 @@ class RuleAgent:
                 continue
             try:
                 precond, action = pair
-                precond = eval(precond)
-                if (
-                    isinstance(precond(self.dummy_json_state), bool)
-                    and action[1] in MidPlanner.valid_actions[action[0]]
-                ):
+                precond = compile_precondition(precond)
+                precond(self.dummy_json_state)
+                if action[1] in MidPlanner.valid_actions[action[0]]:
                     corrected_actions.append((precond, action))
                     text_corrected_actions.append(pair)
+            except PreconditionError as e:
+                logger.error(f"Invalid precondition in action pair {pair}: {e}")
             except Exception as e:
                 logger.error(f"Error in correcting action pair {pair}: {e}")
         return corrected_actions, text_corrected_actions
@@ -386,7 +489,6 @@ class RuleAgent:
             text_assigned_tasks += text_actions
 
         if behavior_patterns:
-            behavior_patterns = deepcopy(behavior_patterns)
             self.action_patterns = {}
             self.order_patterns = {}
             for o_t in behavior_patterns:
@@ -401,13 +503,14 @@ class RuleAgent:
                             if a_o in self.food_to_ingredients:
                                 pattern.append(a_o)
                         else:
-                            corrected = self._correct_actions([a_o])
+                            corrected, _ = self._correct_actions([a_o])
                             if len(corrected) > 0:
                                 pattern.append(corrected[0])
-                    self.order_patterns[o_t] = pattern
+                    self.order_patterns[o_t] = tuple(pattern)
                 elif isinstance(o_t, str):
-                    corrected = self._correct_actions([(o_t, behavior_patterns[o_t])])
+                    corrected, _ = self._correct_actions([(o_t, behavior_patterns[o_t])])
                     if len(corrected) > 0:
                         self.action_patterns[corrected[0][0]] = corrected[0][1]
-            self.matched_pattern = ()
+            self.order_pattern_trie = OrderPatternTrie(self.order_patterns)
+            self.matched_pattern = None
         return text_assigned_tasks
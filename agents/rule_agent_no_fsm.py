@@ -1,11 +1,11 @@
-from copy import deepcopy
 from pprint import pformat
 from typing import Dict, Tuple
 
+from gym_cooking.cooking_world.cooking_world import CookingWorld
 from loguru import logger
 
 from agents import rule_agent
-from agents.mid_planner import get_empty_counter
+from agents.precondition import evaluate_preconditions, state_vector
 
 
 class RuleAgentNoFSM(rule_agent.RuleAgent):
@@ -68,8 +68,8 @@ class RuleAgentNoFSM(rule_agent.RuleAgent):
                 if food in self.valid_orders:
                     if food in self.assigned_orders:
                         self.assigned_orders.remove(food)
-                    if self.matched_pattern and food in self.matched_pattern[1]:
-                        self.matched_pattern[1].remove(food)
+                    if self.matched_pattern is not None:
+                        self.matched_pattern.remove(food)
                     if food in self.order_in_progress:
                         self.order_in_progress.remove(food)
 
@@ -81,7 +81,7 @@ class RuleAgentNoFSM(rule_agent.RuleAgent):
                 mid_action = ("putout_fire", {})
         if not mid_action:
             # clean a counter
-            n_empty_counter = len(get_empty_counter(self.text_agent, self.world))
+            n_empty_counter = self.world.get_state_counts(self.agent_idx)[len(CookingWorld.STATE_OBJECT_KEYS)]
             if n_empty_counter <= 0:
                 logger.debug("No empty counter detected")
                 mid_action = ("clean_a_counter", {"center": False})
@@ -116,11 +116,14 @@ class RuleAgentNoFSM(rule_agent.RuleAgent):
                     self.assigned_actions.append((precond, action))
 
         ## first complete all assigned actions
+        # the preconditions are evaluated on one state vector, the assigned ones together
+        state = state_vector(json_state)
+        satisfied = list(evaluate_preconditions([precond for precond, _ in self.assigned_actions], state))
         while len(self.assigned_actions) > 0:
             action = self.assigned_actions.pop(0)
             precond, action = action
             try:
-                if precond(json_state):
+                if satisfied.pop(0):
                     # if action[0] not in ["serve"] or action[1]["food"] in orders:
                     #     mid_action = action
                     #     break
@@ -144,37 +147,27 @@ class RuleAgentNoFSM(rule_agent.RuleAgent):
             return mid_action
 
         if len(orders) > 0:
-            if not self.matched_pattern:
-                order_tuples = sorted(list(self.order_patterns.keys()), key=len, reverse=True)
-                for o_t in order_tuples:
-                    if orders[: len(o_t)] == list(o_t):
-                        self.matched_pattern = (o_t, deepcopy(self.order_patterns[o_t]))
-                        logger.debug(
-                            f"Preparing orders {self.matched_pattern[0]} using\n{pformat(self.matched_pattern[1])}"
-                        )
-                        self.order_in_progress = list(self.matched_pattern[0])
-                        break
-            while self.matched_pattern and len(self.matched_pattern[1]) > 0:
-                a_o = self.matched_pattern[1].pop(0)
+            if self.matched_pattern is None:
+                self._match_order_pattern(orders)
+            while self.matched_pattern is not None:
+                a_o = self.matched_pattern.current()
+                if a_o is None:  # the matched orders are completed
+                    self.matched_pattern = None
+                    break
                 if isinstance(a_o, str) and a_o in orders:  # prepare the food in default mode
-                    order = a_o
-                    mid_action = self._prepare_order(json_state, order)
-                    self.matched_pattern[1].insert(0, order)
+                    mid_action = self._prepare_order(json_state, a_o)
                     break
                 elif isinstance(a_o, tuple):
                     precond, action = a_o
-                    if precond(json_state):
+                    if precond.holds(state):
                         # if (
                         #     action[0] not in ["serve"] or action[1]["food"] in orders
                         # ):  # prepare food or serve in-demand food
                         #     mid_action = action
-                        #     self.matched_pattern[1].insert(0, a_o)
                         #     break
                         mid_action = action
-                        self.matched_pattern[1].insert(0, a_o)
                         break
-            else:  # no break means the matched orders are completed
-                self.matched_pattern = ()
+                self.matched_pattern.advance()
             if not mid_action:
                 self.order_in_progress = [orders[0]]
                 mid_action = self._prepare_order(json_state, orders[0])
@@ -1,8 +1,9 @@
 import random
 from collections import Counter as Cnter
 from copy import deepcopy
-from typing import Callable, List, Tuple
+from typing import Callable, Dict, List, Tuple
 
+import numpy as np
 from gym_cooking.cooking_world.cooking_world import (
     CookingWorld,
     is_food_mixable,
@@ -11,6 +12,7 @@ from gym_cooking.cooking_world.cooking_world import (
 from gym_cooking.cooking_world.world_objects import *
 
 from utils.astar import *
+from utils.distance_map import UNREACHABLE, get_distance_maps
 
 TEXT_ACTION_SUCCESS = -1
 TEXT_ACTION_FAILURE = -2
@@ -141,7 +143,21 @@ class TextAgent:
     legal_drop_targets: List[Tuple[str, str]] = [("Dustbin", "")]
     legal_deliver_targets: List[Tuple[str, str]] = [("DeliverSquare", "")]
 
-    def __init__(self, world: CookingWorld, agent_idx, real_time_plan: bool = True) -> None:
+    # ticks planned ahead by the cooperative planner, and ticks an observed heading is extrapolated
+    cooperative_horizon: int = 16
+    heading_lookahead: int = 3
+    # destinations whose path planners are kept
+    max_path_planners: int = 16
+
+    def __init__(
+        self,
+        world: CookingWorld,
+        agent_idx,
+        real_time_plan: bool = True,
+        cooperative_plan: bool = False,
+        walking_distances: bool = False,
+        incremental_plan: bool = False,
+    ) -> None:
         self.current_task: Callable = None
         self.destination = None
         self.target = ""
@@ -167,6 +183,18 @@ class TextAgent:
 
         self.real_time_plan = real_time_plan
 
+        # plan in space-time around the predicted paths of the other agents, the paths planned by `partner_agents`
+        # (e.g. the text agents of FSM partners) or extrapolated from their observed headings
+        self.cooperative_plan = cooperative_plan
+        self.partner_agents: List[TextAgent] = []
+        self.planned_path: List[Tuple[int, int]] = []
+        self.observed_locations: Dict[int, Tuple[int, int]] = {}
+
+        # choose the nearest targets and positions by the steps around the counters instead of Manhattan distances
+        self.use_walking_distances = walking_distances
+        # step along the paths of `plan_path` (D* Lite) instead of `find_path`, equally short but not always the same
+        self.incremental_plan = incremental_plan
+
         # To match the content in a container
         self.plate_target = None
         self.assigned_target = None
@@ -174,6 +202,9 @@ class TextAgent:
         self.last_position = None
         self.last_destination = None
 
+        # incremental planners of the paths to the latest destinations, repaired as the other agents move
+        self.path_planners: Dict[Tuple[int, int], DStarLite] = {}
+
     def update_agent(self, world: CookingWorld, agent_idx):
         self.current_task: Callable = None
         self.destination = None
@@ -204,6 +235,9 @@ class TextAgent:
 
         self.last_position = None
         self.last_destination = None
+        self.planned_path = []
+        self.observed_locations = {}
+        self.path_planners = {}
 
     def search_valid_position(self, position, for_find_path=False):  # , search_step_left):
         (x, y) = position if position else self.destination
@@ -213,11 +247,12 @@ class TextAgent:
             if pos[0] < 0 or pos[0] >= self.world.width or pos[1] < 0 or pos[1] >= self.world.height:
                 continue
             valid_pos_list.append(pos)
+        distance = self.distances(avoid_agents=True)
         sorted_valid_pos_list = sorted(
             valid_pos_list,
             key=lambda x: (
                 level_array[x[0]][x[1]],
-                self.distance(x, self.agent.location),
+                distance(x),
             ),
         )
         for pos in sorted_valid_pos_list:
@@ -234,14 +269,14 @@ class TextAgent:
         if self.update_level_array(for_find_path=for_find_path)[x][y] == 1:
             res = self.search_valid_position((x, y)) if search else None
             if res:
-                path = find_path(self.agent.location, res, self.update_level_array())
+                path = self.plan_path(res)
                 if len(path) == 0:
                     return None
                 else:
                     return res
             else:
                 return None
-        path = find_path(self.agent.location, (x, y), self.update_level_array())
+        path = self.plan_path((x, y))
         if len(path) == 0:
             return None
         return (x, y)
@@ -255,18 +290,34 @@ class TextAgent:
         if self.update_level_array(for_find_path=for_find_path)[x][y] == 1:
             res = self.search_valid_position((x, y), for_find_path) if search else None
             if res:
-                path = find_path(self.agent.location, res, self.update_level_array())
+                path = self.plan_path(res)
                 if len(path) == 0:
                     return None
                 else:
                     return res
             else:
                 return None
-        path = find_path(self.agent.location, (x, y), self.update_level_array())
+        path = self.plan_path((x, y))
         if len(path) == 0:
             return None
         return (x, y)
 
+    def plan_path(self, destination: Tuple[int, int]) -> List[Tuple[int, int]]:
+        """
+        Shortest path to the destination around the other agents, from the planner kept for the destination. Its length
+        is that of `find_path` on `update_level_array()`, but not always its steps among equally short paths, so
+        `move_to` only steps along it with `incremental_plan`.
+        """
+        destination = tuple(destination)
+        planner = self.path_planners.pop(destination, None)
+        if planner is None or planner.level is not self.world.level_array:
+            planner = DStarLite(self.world.level_array, destination)
+        self.path_planners[destination] = planner  # latest last
+        if len(self.path_planners) > self.max_path_planners:
+            del self.path_planners[next(iter(self.path_planners))]
+        blocked = {agent.location for agent in self.world.agents if agent != self.agent}
+        return planner.find_path(self.agent.location, blocked)
+
     def turn(self, destination):
         dx = destination[0] - self.agent.location[0]
         dy = destination[1] - self.agent.location[1]
@@ -725,10 +776,52 @@ class TextAgent:
     def distance(self, location1, location2):
         return abs(location1[0] - location2[0]) + abs(location1[1] - location2[1])
 
-    def sort_object_by_distance(self, objects, source_location=None):
-        target_location = self.agent.location
+    def distance_map(self, sources: List[Tuple[int, int]] = None, avoid_agents: bool = False) -> np.ndarray:
+        """
+        Steps from the nearest of the sources (the agent by default) to every cell, cached until the world changes
+        """
+        if sources is None:
+            sources = [self.agent.location]
+        blocked = [agent.location for agent in self.world.agents if agent != self.agent] if avoid_agents else ()
+        return get_distance_maps(self.world).get(sources, blocked)
+
+    def walking_distances(
+        self, sources: List[Tuple[int, int]] = None, avoid_agents: bool = False
+    ) -> Callable[[Tuple[int, int]], int]:
+        """
+        Steps from the nearest of the sources (the agent by default) to a location around the counters, unreachable
+        locations come after all reachable ones, by their Manhattan distance
+        """
+        distances = self.distance_map(sources, avoid_agents)
+        sources = sources if sources is not None else [self.agent.location]
+        unreachable = self.world.width * self.world.height
+
+        def walking_distance(location: Tuple[int, int]) -> int:
+            d = int(distances[location[0], location[1]])
+            if d != UNREACHABLE:
+                return d
+            return unreachable + min(self.distance(location, source) for source in sources)
+
+        return walking_distance
 
-        objects.sort(key=lambda x: self.distance(x.location, target_location))
+    def walking_distance(self, location, sources: List[Tuple[int, int]] = None, avoid_agents: bool = False) -> int:
+        return self.walking_distances(sources, avoid_agents)(location)
+
+    def distances(
+        self, sources: List[Tuple[int, int]] = None, avoid_agents: bool = False
+    ) -> Callable[[Tuple[int, int]], int]:
+        """
+        Distance from the nearest of the sources (the agent by default) to a location, walking if
+        `use_walking_distances`, Manhattan otherwise
+        """
+        if self.use_walking_distances:
+            return self.walking_distances(sources, avoid_agents)
+        sources = sources if sources is not None else [self.agent.location]
+        return lambda location: min(self.distance(location, source) for source in sources)
+
+    def sort_object_by_distance(self, objects, source_location=None):
+        distance = self.distances()
+        objects.sort(key=lambda x: distance(x.location))
         # objects.sort(
         #     key=lambda x: len(
         #         self.findpath(
@@ -766,7 +859,7 @@ class TextAgent:
         # return closet_object, len(
         #     self.findpath(closet_object.location, target_location)
         # )
-        return closet_object, self.distance(closet_object.location, target_location)
+        return closet_object, self.distances([target_location])(closet_object.location)
 
     def is_target(self, holding, target: str, target_status: str = "", station: bool = False) -> bool:
         if holding is None:
@@ -968,11 +1061,7 @@ class TextAgent:
         else:
             if self.is_valid_position(for_find_path=True):
                 # print("valid_position", self.is_valid_position(for_find_path=True))
-                path: List[Tuple[int, int]] = find_path(
-                    self.agent.location,
-                    self.is_valid_position(for_find_path=True),
-                    self.update_level_array(),
-                )
+                path: List[Tuple[int, int]] = self.plan_path(self.is_valid_position(for_find_path=True))
                 if len(path) == 1:
                     return 0
                 if len(path) == 0:
@@ -1101,11 +1190,7 @@ class TextAgent:
             return self.turn(self.destination)
         else:
             if self.is_valid_position(for_find_path=True):
-                path: List[Tuple[int, int]] = find_path(
-                    self.agent.location,
-                    self.is_valid_position(for_find_path=True),
-                    self.update_level_array(),
-                )
+                path: List[Tuple[int, int]] = self.plan_path(self.is_valid_position(for_find_path=True))
                 if len(path) == 1:
                     return 0
                 if len(path) == 0:
@@ -1189,11 +1274,7 @@ class TextAgent:
             return self.turn(self.destination)
         else:
             if self.is_valid_position(for_find_path=True):
-                path: List[Tuple[int, int]] = find_path(
-                    self.agent.location,
-                    self.is_valid_position(for_find_path=True),
-                    self.update_level_array(),
-                )
+                path: List[Tuple[int, int]] = self.plan_path(self.is_valid_position(for_find_path=True))
                 if len(path) == 1:
                     return 0
                 if len(path) == 0:
@@ -1279,11 +1360,7 @@ class TextAgent:
             return self.turn(self.destination)
         else:
             if self.is_valid_position(for_find_path=True):
-                path: List[Tuple[int, int]] = find_path(
-                    self.agent.location,
-                    self.is_valid_position(for_find_path=True),
-                    self.update_level_array(),
-                )
+                path: List[Tuple[int, int]] = self.plan_path(self.is_valid_position(for_find_path=True))
                 if len(path) == 1:
                     return 0
                 if len(path) == 0:
@@ -1360,11 +1437,7 @@ class TextAgent:
             return self.turn(self.destination)
         else:
             if self.is_valid_position(for_find_path=True):
-                path: List[Tuple[int, int]] = find_path(
-                    self.agent.location,
-                    self.is_valid_position(for_find_path=True),
-                    self.update_level_array(),
-                )
+                path: List[Tuple[int, int]] = self.plan_path(self.is_valid_position(for_find_path=True))
                 if len(path) == 1:
                     return 0
                 if len(path) == 0:
@@ -1437,11 +1510,7 @@ class TextAgent:
             return self.turn(self.destination)
         else:
             if self.is_valid_position(for_find_path=True):
-                path: List[Tuple[int, int]] = find_path(
-                    self.agent.location,
-                    self.is_valid_position(for_find_path=True),
-                    self.update_level_array(),
-                )
+                path: List[Tuple[int, int]] = self.plan_path(self.is_valid_position(for_find_path=True))
                 if len(path) == 1:
                     return 0
                 if len(path) == 0:
@@ -1559,11 +1628,7 @@ class TextAgent:
             return self.turn(self.destination)
         else:
             if self.is_valid_position(for_find_path=True):
-                path: List[Tuple[int, int]] = find_path(
-                    self.agent.location,
-                    self.is_valid_position(for_find_path=True),
-                    self.update_level_array(),
-                )
+                path: List[Tuple[int, int]] = self.plan_path(self.is_valid_position(for_find_path=True))
                 if len(path) == 1:
                     return 0
                 if len(path) == 0:
@@ -1581,6 +1646,7 @@ class TextAgent:
         Returns:
             bool: True when the agent has reached the destination
         """
+        self.planned_path = []
         if not self.destination:
             if destination == self.agent.location:
                 # print("arrived")
@@ -1607,11 +1673,23 @@ class TextAgent:
                 self.prev_task = None
                 self.destination = None
             return self.turn(destination)
-        path: List[Tuple[int, int]] = find_path(
-            self.agent.location,
-            self.is_valid_position(for_find_path=True),
-            self.update_level_array(),
-        )
+        if self.cooperative_plan:
+            path = self.find_cooperative_path(self.is_valid_position(for_find_path=True))
+            self.planned_path = path
+            if path:
+                self.last_position = self.agent.location
+                self.last_destination = path[1] if len(path) > 1 else self.agent.location
+                return self.turn(self.last_destination)
+        if self.incremental_plan:
+            path: List[Tuple[int, int]] = self.plan_path(self.is_valid_position(for_find_path=True))
+        else:
+            # the step follows the tie-breaking of find_path among equally short paths
+            path: List[Tuple[int, int]] = find_path(
+                self.agent.location,
+                self.is_valid_position(for_find_path=True),
+                self.update_level_array(),
+            )
+        self.planned_path = path
         if len(path) == 1:
             self.last_position = self.agent.location
             self.last_destination = self.agent.location
@@ -1635,6 +1713,72 @@ class TextAgent:
         self.last_destination = path[1]
         return self.turn(path[1])
 
+    def predict_paths(self) -> List[List[Tuple[int, int]]]:
+        """
+        The predicted paths of the other agents, from their current locations
+        """
+        known_paths = {partner.agent_idx: partner.planned_path for partner in self.partner_agents}
+        paths = []
+        for idx, agent in enumerate(self.world.agents):
+            if agent == self.agent:
+                continue
+            location = agent.location
+            last_location = self.observed_locations.get(idx)
+            self.observed_locations[idx] = location
+            known_path = known_paths.get(idx, [])
+            if location in known_path:
+                paths.append(known_path[known_path.index(location) :])
+                continue
+            path = [location]
+            if last_location and self.distance(last_location, location) == 1:
+                heading = (location[0] - last_location[0], location[1] - last_location[1])
+                for _ in range(self.heading_lookahead):
+                    x, y = path[-1][0] + heading[0], path[-1][1] + heading[1]
+                    if not (0 <= x < self.world.width and 0 <= y < self.world.height) or self.world.level_array[x][y]:
+                        break
+                    path.append((x, y))
+            paths.append(path)
+        return paths
+
+    def find_cooperative_path(self, destination: Tuple[int, int] | None) -> List[Tuple[int, int]]:
+        """
+        Path to the destination avoiding the predicted paths of the other agents, the position at each tick
+        """
+        if destination is None:
+            return []
+        reserved = reserve_paths(self.predict_paths(), self.cooperative_horizon)
+        return find_path_cooperative(
+            self.agent.location, destination, self.world.level_array, reserved, self.cooperative_horizon
+        )
+
+    def idle_ticks(self) -> int:
+        """
+        Ticks after this one in which take_one_action is certain to return 0 again, as long as the world only changes
+        by the progress of the food: waiting, or holding a plate to a pan until the beef is done
+        """
+        if self.current_task == self.wait:
+            return max(0, self.target - 2)
+        if (
+            self.current_task == self.plate
+            and not self.is_task_to_finish
+            and self.destination is not None
+            and self.world.get_target_location(self.agent, self.agent.orientation) == self.destination
+            and self.is_target(self.plate_target, "Beef", "fresh")
+        ):
+            # the target may change when the beef in another pan is done first
+            pans = self.get_objects("Pan", check=lambda x: self.is_target(x.content, "Beef", "fresh"))
+            return max(0, min(pan.content.current_progress - pan.content.max_progress for pan in pans) - 1)
+        return 0
+
+    def skip_idle_tick(self) -> int:
+        """
+        take_one_action during the idle ticks, without planning
+        """
+        if self.current_task == self.wait:
+            self.target -= 1
+        self.task_step += 1
+        return 0
+
     def wait(self, target):
         if target <= 0:
             self.current_task = None
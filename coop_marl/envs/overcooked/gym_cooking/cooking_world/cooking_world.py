@@ -96,6 +96,51 @@ def is_food_mixable(food1, food2):
     return False
 
 
+class StateObjects(dict):
+    """
+    The `objects` dict of get_json_state_simple, also carrying its counts as the `vector` in STATE_OBJECT_KEYS order.
+    Any change of the dict drops the vector, which no longer matches.
+    """
+
+    def __init__(self, vector: np.ndarray) -> None:
+        super().__init__(zip(CookingWorld.STATE_OBJECT_KEYS, vector.tolist()))
+        self.vector = vector
+
+    def __setitem__(self, key, value) -> None:
+        self.vector = None
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key) -> None:
+        self.vector = None
+        super().__delitem__(key)
+
+    def __ior__(self, other):
+        self.vector = None
+        return super().__ior__(other)
+
+    def update(self, *args, **kwargs) -> None:
+        self.vector = None
+        super().update(*args, **kwargs)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self.vector = None
+        return super().setdefault(key, default)
+
+    def pop(self, key, *default):
+        if key in self:
+            self.vector = None
+        return super().pop(key, *default)
+
+    def popitem(self):
+        self.vector = None
+        return super().popitem()
+
+    def clear(self) -> None:
+        self.vector = None
+        super().clear()
+
+
 class CookingWorld:
     # COLORS = ["blue", "magenta", "yellow", "green"]
 
@@ -114,6 +159,25 @@ class CookingWorld:
 
     # AGENT_ACTIONS: 0: Noop, 1: Left, 2: right, 3: down, 4: up, 5: interact
 
+    # the keys of json_state_simple["objects"], in the order of the columns of get_state_record
+    STATE_OBJECT_KEYS = (
+        ("Beef", "Fresh"),
+        ("Beef", "In-progress"),
+        ("Beef", "Well-cooked"),
+        ("Beef", "Overcooked"),
+        ("Lettuce", "Unchopped"),
+        ("Lettuce", "Chopped"),
+        ("Bread", ""),
+        ("BeefLettuce", ""),
+        ("BeefBurger", ""),
+        ("LettuceBurger", ""),
+        ("BeefLettuceBurger", ""),
+        ("Plate", "Empty"),
+        ("FireExtinguisher", ""),
+        ("Fire", ""),
+    )
+    STATE_OBJECT_IDS = {key: i for i, key in enumerate(STATE_OBJECT_KEYS)}
+
     def __init__(self, agent_type=0):
         if agent_type == 0:
             self.COLORS = ["blue", "magenta", "red", "green"]
@@ -129,6 +193,9 @@ class CookingWorld:
         self.prev_holding = []
         self.deliver_log: list[tuple[int | str, str, int, dict]] = []
         # (idx, name, score)
+        # the state counters are recomputed once per change of the world, see get_state_counts
+        self.state_version = 0
+        self._state_counts_cache = {}
 
     def perceive_agent_event(self, idx) -> Union[str, None]:
         agent: Agent = self.agents[idx]
@@ -540,9 +607,11 @@ class CookingWorld:
 
     def add_object(self, obj):
         self.world_objects[type(obj).__name__].append(obj)
+        self.state_version += 1
 
     def delete_object(self, obj):
         self.world_objects[type(obj).__name__].remove(obj)
+        self.state_version += 1
 
     def accepts(self, static_object: StaticObject, dynamic_object: DynamicObject) -> bool:
         if static_object.accepts([dynamic_object]) and len(self.get_objects_at(static_object.location)) == 1:
@@ -612,6 +681,8 @@ class CookingWorld:
             action_rewards += action_reward
 
         self.progress_world()
+        # objects moved, were held, merged or progressed
+        self.state_version += 1
 
         # self.perceive_events(actions)
         # self.print_map(self.agents)
@@ -1276,6 +1347,7 @@ class CookingWorld:
     def load_level(self, level, num_agents):
         self.load_new_style_level(level, num_agents)
         self.index_objects()
+        self.state_version += 1
 
     def _get_object_desc(self, obj: Object) -> Dict:
         """
@@ -1300,59 +1372,75 @@ class CookingWorld:
         else:
             return {"name": ClassToString[obj.__class__], "status": ""}
 
-    def get_json_state_simple(self, agent_index):
-        json_state = {
-            "objects": {
-                ("Beef", "Fresh"): 0,
-                ("Beef", "In-progress"): 0,
-                ("Beef", "Well-cooked"): 0,
-                ("Beef", "Overcooked"): 0,
-                ("Lettuce", "Unchopped"): 0,
-                ("Lettuce", "Chopped"): 0,
-                ("Bread", ""): 0,
-                ("BeefLettuce", ""): 0,
-                ("BeefBurger", ""): 0,
-                ("LettuceBurger", ""): 0,
-                ("BeefLettuceBurger", ""): 0,
-                ("Plate", "Empty"): 0,
-                ("FireExtinguisher", ""): 0,
-                ("Fire", ""): 0,
-            },
-            "counters": {
-                "Empty": 0,
-            },
-            "inventory_other_player": {},
-        }
-        dynamic_objects = self.get_dynamic_object_list()
-        # dynamic_objects = [obj for obj in dynamic_objects if isinstance(obj, DynamicObject)]
-
-        static_objects = self.get_static_object_list()
-        for s_obj in static_objects:
-            if isinstance(s_obj, Counter):
-                if len(self.get_objects_at(s_obj.location)) == 1:
-                    json_state["counters"]["Empty"] += 1
-
-        other_agents = self.agents[:agent_index] + self.agents[agent_index + 1 :]
-        other_agent_idxs = list(range(0, agent_index)) + list(range(agent_index + 1, len(self.agents)))
-        other_agent_locations = [agent.location for agent in other_agents]
-
-        for agent_idx, agent in zip(other_agent_idxs, other_agents):
+    def get_state_counts(self, agent_index) -> np.ndarray:
+        """
+        The counters of get_json_state_simple as a read-only integer vector: [object counts in STATE_OBJECT_KEYS
+        order, empty counters, held object of each agent (index in STATE_OBJECT_KEYS, -1 if nothing or agent_index)].
+        Computed in one pass over the objects once per change of the world (`state_version`, bumped by the agent
+        actions and by adding or deleting objects), then shared by all the callers of the step.
+        """
+        cached = self._state_counts_cache.get(agent_index)
+        if cached is not None and cached[0] == self.state_version:
+            return cached[1]
+
+        n_objects = len(self.STATE_OBJECT_KEYS)
+        counts = np.zeros(n_objects + 1 + len(self.agents), dtype=np.int64)
+        held_descs = [None] * len(self.agents)
+        other_agent_locations = set()
+        for agent_idx, agent in enumerate(self.agents):
+            counts[n_objects + 1 + agent_idx] = -1
+            if agent_idx == agent_index:
+                continue
+            other_agent_locations.add(agent.location)
             if agent.holding:
                 if isinstance(agent.holding, Plate) and len(agent.holding.content) > 0:
                     obj_desc = self._get_object_desc(agent.holding.content[0])
                 else:
                     obj_desc = self._get_object_desc(agent.holding)
-            else:
-                obj_desc = None
-            json_state["inventory_other_player"][agent_idx] = obj_desc
+                held_descs[agent_idx] = obj_desc
+                counts[n_objects + 1 + agent_idx] = self.STATE_OBJECT_IDS.get(
+                    (obj_desc["name"], obj_desc["status"]), -1
+                )
+
+        # number of objects at each location, instead of get_objects_at for each counter
+        n_objects_at = defaultdict(int)
+        counter_locations = []
+        for objects in self.world_objects.values():
+            for obj in objects:
+                n_objects_at[obj.location] += 1
+                if isinstance(obj, Counter):
+                    counter_locations.append(obj.location)
+                elif isinstance(obj, DynamicObject):
+                    if obj.location in other_agent_locations:
+                        continue  # can not access
+                    if isinstance(obj, Plate) and len(obj.content) > 0:
+                        continue  # avoid duplicate counting
+                    obj_desc = self._get_object_desc(obj)
+                    counts[self.STATE_OBJECT_IDS[(obj_desc["name"], obj_desc["status"])]] += 1
+        counts[n_objects] = sum(1 for location in counter_locations if n_objects_at[location] == 1)
+
+        counts.flags.writeable = False
+        self._state_counts_cache[agent_index] = (self.state_version, counts, held_descs)
+        return counts
 
-        for obj in dynamic_objects:
-            if obj.location in other_agent_locations:
-                continue  # can not access
-            if isinstance(obj, Plate) and len(obj.content) > 0:
-                continue  # avoid duplicate counting
-            obj_dict = self._get_object_desc(obj)
-            json_state["objects"][(obj_dict["name"], obj_dict["status"])] += 1
+    def get_json_state_simple(self, agent_index):
+        """
+        Dict view of get_state_counts, with the deliver_log (consumed) and the total score.
+        """
+        counts = self.get_state_counts(agent_index)
+        held_descs = self._state_counts_cache[agent_index][2]
+        n_objects = len(self.STATE_OBJECT_KEYS)
+        json_state = {
+            "objects": StateObjects(counts[:n_objects]),
+            "counters": {
+                "Empty": int(counts[n_objects]),
+            },
+            "inventory_other_player": {
+                agent_idx: None if obj_desc is None else dict(obj_desc)
+                for agent_idx, obj_desc in enumerate(held_descs)
+                if agent_idx != agent_index
+            },
+        }
 
         json_state["deliver_log"] = self.deliver_log.copy()
         json_state["total_score"] = self.total_score
@@ -1361,6 +1449,22 @@ class CookingWorld:
 
         return json_state
 
+    def get_state_record(self, agent_index, out: np.ndarray) -> int:
+        """
+        Write the state of get_json_state_simple into the integer row `out` without building the dict:
+        [get_state_counts, total_score, delivered, missed].
+        Like get_json_state_simple, the deliver_log is consumed. Returns the number of columns written.
+        """
+        counts = self.get_state_counts(agent_index)
+        col = len(counts)
+        out[:col] = counts
+
+        n_missed = sum(1 for log in self.deliver_log if log[0] == "Missed")
+        out[col : col + 3] = (self.total_score, len(self.deliver_log) - n_missed, n_missed)
+        self.deliver_log = []
+
+        return col + 3
+
     def get_json_state(self, agent_index):
         middle = (self.width / 2, self.height / 2)
 
@@ -65,8 +65,17 @@ class OvercookedMaker:
         data = Arrdict()
         for p, k in zip(self.players, obs):
             data[p] = Arrdict(obs=obs[k], reward=np.float32(0), done=False)
-        self.graphic_pipeline = GraphicPipeline(self._env, display=self.graphic_pipeline.display, max_steps=horizon)
-        self.graphic_pipeline.on_init()
+        world = self._env.unwrapped.world
+        properties = self.graphic_pipeline.graphics_properties
+        if (properties.width_pixel, properties.height_pixel) == (
+            GraphicPipeline.PIXEL_PER_TILE * world.width,
+            GraphicPipeline.PIXEL_PER_TILE * (world.height + 2),
+        ):
+            # same layout, keep the screen and the scaled sprites
+            self.graphic_pipeline.max_steps = horizon
+        else:
+            self.graphic_pipeline = GraphicPipeline(self._env, display=self.graphic_pipeline.display, max_steps=horizon)
+            self.graphic_pipeline.on_init()
         return data
 
     def step(self, decision):
@@ -121,6 +130,20 @@ class OvercookedMaker:
 
         return world_state
 
+    def get_state_record(self, agent_idx: int, out: np.ndarray) -> int:
+        """
+        Integer row of get_json_state_simple, see CookingWorld.get_state_record, followed by (food, remain_time) of
+        each order slot, food is an index in CookingWorld.STATE_OBJECT_KEYS and -1 for an empty slot.
+        """
+        world = self._env.unwrapped.world
+        col = world.get_state_record(agent_idx, out)
+        out[col:] = -1
+        for recipe in self._env.unwrapped.recipe_graphs[: (len(out) - col) // 2]:
+            out[col] = world.STATE_OBJECT_IDS.get((recipe.foodname, ""), -1)
+            out[col + 1] = recipe.remain_time
+            col += 2
+        return col
+
     @staticmethod
     def make_env(*args, **kwargs):
         env = OvercookedMaker(*args, **kwargs)
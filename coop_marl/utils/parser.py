@@ -58,6 +58,21 @@ def create_parser():
     parser.add_argument("--fsm", action="store_true")
     parser.add_argument("--no-model", action="store_true")
     parser.add_argument("--display", "-d", action="store_true")
+    parser.add_argument(
+        "--mock_llm",
+        default=None,
+        type=str,
+        help="answer LLM calls offline, replaying a trajectory file/directory in results/ or 'synthesize'",
+    )
+    return parser
+
+
+def create_parser_webapp():
+    parser = create_parser()
+    parser.add_argument(
+        "--data_dir", default="./data", type=str, help="progress, questionnaires and trajectories of the participants"
+    )
+    parser.add_argument("--port", default=63000, type=int)
     return parser
 
 
@@ -91,6 +106,12 @@ def create_parser_act():
     )
     parser.add_argument("--fsm", action="store_true")
     parser.add_argument("--display", "-d", action="store_true")
+    parser.add_argument(
+        "--mock_llm",
+        default=None,
+        type=str,
+        help="answer LLM calls offline, replaying a trajectory file/directory in results/ or 'synthesize'",
+    )
     return parser
 
 
@@ -131,6 +152,79 @@ def create_parser_biased_agent():
     parser.add_argument("--fsm", action="store_true")
     parser.add_argument("--no-model", action="store_true")
     parser.add_argument("--display", "-d", action="store_true")
+    parser.add_argument(
+        "--mock_llm",
+        default=None,
+        type=str,
+        help="answer LLM calls offline, replaying a trajectory file/directory in results/ or 'synthesize'",
+    )
+    return parser
+
+
+def create_parser_sweep():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--config_file",
+        type=argparse.FileType(mode="r"),
+        default="config/algs/play/overcooked.yaml",
+    )
+    parser.add_argument(
+        "--env_config_file",
+        type=argparse.FileType(mode="r"),
+        default="config/envs/overcooked.yaml",
+    )
+    parser.add_argument("--config", default={}, type=yaml.load)
+    parser.add_argument(
+        "--env_config",
+        default={"kernel_gamma": 0.5, "render": 1, "save_folder": "./logs/play"},
+        type=yaml.load,
+    )
+    parser.add_argument("--seed", default=[0], type=int, nargs="+")
+    parser.add_argument("--run_name", default="", type=str)
+    parser.add_argument(
+        "--strategy",
+        "-s",
+        default=["dpt"],
+        type=str,
+        nargs="+",
+        choices=["dpt", "react", "reflexion", "act"],
+    )
+    parser.add_argument(
+        "--model",
+        "-m",
+        default=["4o-mini"],
+        type=str,
+        nargs="+",
+        choices=sorted(set(valid_models) | set(valid_models_act)),
+    )
+    # collaboration experiments (exp2) with the given biased agents, single agent experiments if not given
+    parser.add_argument("--biased_agent", "-ba", default=[], type=int, nargs="*", choices=list(range(10)))
+    parser.add_argument("--send_message", default=False, type=bool)
+    parser.add_argument("--receive_message", default=False, type=bool)
+    parser.add_argument("--infer_human", action="store_true")
+    parser.add_argument("--fsm", action="store_true")
+    parser.add_argument("--no-model", action="store_true")
+    parser.add_argument("--max_concurrent_episodes", "-j", default=4, type=int)
+    parser.add_argument("--compress_traj", action="store_true", help="save trajectories as zstd compressed JSONL")
+    parser.add_argument(
+        "--n_workers",
+        "-p",
+        default=0,
+        type=int,
+        help="run the episodes on a process pool of n workers (all cores if -1), in the main process if 0",
+    )
+    parser.add_argument(
+        "--virtual_clock",
+        action="store_true",
+        help="simulation mode, ticks run as fast as possible and LLM outputs are delivered after their latency in ticks",
+    )
+    parser.add_argument("--display", "-d", action="store_true")
+    parser.add_argument(
+        "--mock_llm",
+        default=None,
+        type=str,
+        help="answer LLM calls offline, replaying a trajectory file/directory in results/ or 'synthesize'",
+    )
     return parser
 
 
@@ -0,0 +1,80 @@
+"""
+Unified experiment runner: runs many episodes concurrently in one process, with all LLM calls going through a shared
+scheduler. Results are saved at the same paths as the `llm_agent_run_*` scripts, existing results are skipped.
+
+    # single agent experiments, react and reflexion with the FSM are saved apart as react-fsm and reflexion-fsm
+    python llm_agent_run.py -s react reflexion dpt -m 4o-mini 4o --seed 0 1 2 --fsm \
+        --env_config_file config/envs/overcooked_single_agent_exp1.yaml
+    # collaboration experiments with the biased agents 0, 1, 2
+    python llm_agent_run.py -s react reflexion dpt -m 4o-mini --seed 0 1 2 --fsm --infer_human -ba 0 1 2 \
+        --env_config_file config/envs/overcooked_burger.yaml
+
+    # simulation mode replaying the recorded LLM outputs and latencies, hundreds of times faster than real time
+    python llm_agent_run.py -s dpt -m 4o-mini --seed 0 1 2 --fsm --virtual_clock --mock_llm results/exp1_2 \
+        --env_config_file config/envs/overcooked_single_agent_exp1.yaml
+
+    # FSM-only baselines on all cores
+    python llm_agent_run.py -s dpt --seed {0..19} --fsm --no-model -ba {0..9} --virtual_clock -p -1 \
+        --env_config_file config/envs/overcooked_burger.yaml
+
+Playing with a human from the keyboard is only supported by the `llm_agent_run_*` scripts.
+"""
+
+import asyncio
+import os
+import sys
+from pprint import pformat
+
+from loguru import logger
+
+from coop_marl.utils import create_parser_sweep, parse_args, utils
+from runners.sweep import create_jobs, run_sweep, run_sweep_parallel, setup_mock_llm
+
+if __name__ == "__main__":
+    logger.remove()
+    logger.add(sys.stdout, level="SUCCESS")
+    os.makedirs("logs", exist_ok=True)
+    f = open("logs/llm_agent_run.log", "w")
+    logger.add(f, level="INFO")
+    args, conf, env_conf, _ = parse_args(create_parser_sweep())
+    utils.set_random_seed(0)
+
+    logger.success("args\n" + pformat(args))
+    logger.success("conf\n" + pformat(conf))
+    logger.success("env_conf\n" + pformat(env_conf))
+
+    if args.biased_agent and env_conf.get("num_agents", 1) < 2:
+        logger.error("The collaboration experiments need an env config with num_agents: 2")
+        sys.exit(1)
+    if args.biased_agent and "act" in args.strategy:
+        logger.error("The act strategy only supports the single agent experiments")
+        sys.exit(1)
+
+    jobs = create_jobs(args)
+    if args.n_workers != 0:
+        run_sweep_parallel(
+            jobs,
+            conf,
+            env_conf,
+            args.n_workers,
+            args.max_concurrent_episodes,
+            args.mock_llm,
+            args.virtual_clock,
+            args.compress_traj,
+        )
+        sys.exit()
+
+    latency_model = setup_mock_llm(args.mock_llm, args.virtual_clock)
+    asyncio.run(
+        run_sweep(
+            jobs,
+            conf,
+            env_conf,
+            args.max_concurrent_episodes,
+            args.mock_llm,
+            args.display,
+            args.virtual_clock,
+            latency_model,
+            args.compress_traj,
+        )
+    )
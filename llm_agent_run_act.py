@@ -16,6 +16,7 @@ from agents.text_agent import TextAgent
 from coop_marl.controllers import LLMController
 from coop_marl.envs.overcooked.overcooked_maker import OvercookedMaker
 from coop_marl.utils import Arrdict, create_parser_act, parse_args, utils
+from llms.mock_llm import enable_mock_llm
 from utils.history import History
 
 KeyToTuple_right = {
@@ -284,6 +285,8 @@ if __name__ == "__main__":
     f = open("logs/llm_agent_act_less.log", "w")
     logger.add(f, level="INFO")
     args, conf, env_conf, _ = parse_args(create_parser_act())
+    if args.mock_llm:
+        enable_mock_llm(args.mock_llm)
 
     # utils.set_random_seed(args.seed)
     utils.set_random_seed(0)
@@ -311,6 +314,9 @@ if __name__ == "__main__":
         file_path = f"results/exp1/{env_conf.mode}/FSM-{args.seed}.json"
     else:
         file_path = f"results/exp1/{env_conf.mode}/{MODEL}-{args.seed}.json"
+    if args.mock_llm:
+        # keep the mock runs apart from the real results
+        file_path = file_path.replace("results/", "results/mock/", 1)
     if os.path.exists(file_path):
         logger.warning(f"File {file_path} already exists, exiting ...")
         sys.exit()
@@ -344,7 +350,12 @@ if __name__ == "__main__":
         )
 
     ## save all history in the buffer
-    history_buffer = History(max_steps=max_steps)
+    history_buffer = History(
+        max_steps=max_steps,
+        compact=conf.get("history_compact", False),
+        max_tokens=conf.get("history_max_tokens", None),
+        max_length=conf.get("history_max_length", None),
+    )
 
     agent_list = [None, None]
 
@@ -16,6 +16,7 @@ from coop_marl.controllers import LLMController
 from coop_marl.envs.overcooked.overcooked_maker import OvercookedMaker
 from coop_marl.utils import Arrdict, create_parser, parse_args, utils
 from llms.get_llm_output import get_openai_llm_output
+from llms.mock_llm import enable_mock_llm
 from utils.history import History
 
 KeyToTuple_right = {
@@ -212,11 +213,6 @@ async def run_game():
                     if mid_action:
                         logger.warning(f"DPT Agent: {mid_action}")
                     message_dict = {}
-                    history_buffer.add(
-                        current_steps,
-                        json_state_simple,
-                        message_dict,
-                    )
                     # init_mid_action = True
                     history_buffer.add(current_steps, json_state_simple, message_dict)
 
@@ -312,6 +308,8 @@ if __name__ == "__main__":
     f = open("logs/llm_agent_dpt_less.log", "w")
     logger.add(f, level="INFO")
     args, conf, env_conf, _ = parse_args(create_parser())
+    if args.mock_llm:
+        enable_mock_llm(args.mock_llm)
 
     utils.set_random_seed(0)
 
@@ -342,6 +340,9 @@ if __name__ == "__main__":
         file_path = f"results/exp1_2/{env_conf.mode}/dpt/{MODEL}-{args.seed}.json"
     else:
         file_path = f"results/exp1_2/{env_conf.mode}/dpt-s2/{MODEL}-{args.seed}.json"
+    if args.mock_llm:
+        # keep the mock runs apart from the real results
+        file_path = file_path.replace("results/", "results/mock/", 1)
     if os.path.exists(file_path):
         logger.warning(f"File {file_path} already exists, exiting ...")
         sys.exit()
@@ -377,7 +378,12 @@ if __name__ == "__main__":
             infer_human=args.infer_human,
         )
 
-    history_buffer = History(max_steps=max_steps)
+    history_buffer = History(
+        max_steps=max_steps,
+        compact=conf.get("history_compact", False),
+        max_tokens=conf.get("history_max_tokens", None),
+        max_length=conf.get("history_max_length", None),
+    )
 
     agent_list = [None, None]
 
@@ -25,6 +25,7 @@ from coop_marl.utils import Arrdict
 from coop_marl.utils import create_parser_biased_agent as create_parser
 from coop_marl.utils import parse_args, utils
 from llms.get_llm_output import get_openai_llm_output
+from llms.mock_llm import enable_mock_llm
 from utils.history import History
 
 
@@ -336,6 +337,8 @@ if __name__ == "__main__":
     f = open("logs/llm_agent_react_less.log", "w")
     logger.add(f, level="INFO")
     args, conf, env_conf, _ = parse_args(create_parser())
+    if args.mock_llm:
+        enable_mock_llm(args.mock_llm)
 
     # utils.set_random_seed(args.seed)
     utils.set_random_seed(0)
@@ -369,6 +372,9 @@ if __name__ == "__main__":
         file_path = f"{dir_path}/FSM-{args.seed}.json"
     else:
         file_path = f"{dir_path}/react/{MODEL}-{args.seed}.json"
+    if args.mock_llm:
+        # keep the mock runs apart from the real results
+        file_path = file_path.replace("results/", "results/mock/", 1)
     if os.path.exists(file_path):
         logger.warning(f"File {file_path} already exists, exiting ...")
         sys.exit()
@@ -422,7 +428,12 @@ if __name__ == "__main__":
         )
 
     ## save all history in the buffer
-    history_buffer = History(max_steps=max_steps)
+    history_buffer = History(
+        max_steps=max_steps,
+        compact=conf.get("history_compact", False),
+        max_tokens=conf.get("history_max_tokens", None),
+        max_length=conf.get("history_max_length", None),
+    )
 
     agent_list = [None, None]
 
@@ -16,6 +16,7 @@ from coop_marl.controllers import LLMController
 from coop_marl.envs.overcooked.overcooked_maker import OvercookedMaker
 from coop_marl.utils import Arrdict, create_parser, parse_args, utils
 from llms.get_llm_output import get_openai_llm_output
+from llms.mock_llm import enable_mock_llm
 from utils.history import History
 
 KeyToTuple_right = {
@@ -338,6 +339,8 @@ if __name__ == "__main__":
     f = open("logs/llm_agent_reflexion_less.log", "w")
     logger.add(f, level="INFO")
     args, conf, env_conf, _ = parse_args(create_parser())
+    if args.mock_llm:
+        enable_mock_llm(args.mock_llm)
 
     # utils.set_random_seed(args.seed)
     utils.set_random_seed(0)
@@ -363,6 +366,9 @@ if __name__ == "__main__":
     assert not FSM and not args.no_model, "FSM and no_model cannot be True"
     dir_path = f"results/exp1_2/{env_conf.mode}/reflexion"
     file_path = f"{dir_path}/{MODEL}-{args.seed}.json"
+    if args.mock_llm:
+        # keep the mock runs apart from the real results
+        file_path = file_path.replace("results/", "results/mock/", 1)
     if os.path.exists(file_path):
         logger.warning(f"File {file_path} already exists, exiting ...")
         sys.exit()
@@ -391,7 +397,12 @@ if __name__ == "__main__":
     )
 
     ## save all history in the buffer
-    history_buffer = History(max_steps=max_steps)
+    history_buffer = History(
+        max_steps=max_steps,
+        compact=conf.get("history_compact", False),
+        max_tokens=conf.get("history_max_tokens", None),
+        max_length=conf.get("history_max_length", None),
+    )
 
     agent_list = [None, None]
 
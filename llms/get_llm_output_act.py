@@ -175,7 +175,7 @@ async def get_openai_llm_output(messages: list[dict[str, str]], model: str, para
         friends_response = completion.choices[0].message
         if "o3" in model:
             logger.warning(
-                f'o3 model think length: {friends_response.to_dict()["usage"]["completion_tokens_details"]["reasoning_tokens"]}'
+                f'o3 model think length: {completion.to_dict()["usage"]["completion_tokens_details"]["reasoning_tokens"]}'
             )
         if friends_response.parsed:
             return friends_response.parsed
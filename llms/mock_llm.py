@@ -0,0 +1,378 @@
+"""
+Deterministic stand-in of the LLM backend for offline benchmarking.
+
+In-process usage, all calls of `get_openai_llm_output` (and of the act agent) go to the mock client:
+    from llms.mock_llm import enable_mock_llm
+    enable_mock_llm("results/exp1_2")  # replay recorded outputs, or "synthesize"
+
+Standalone usage, a server with the OpenAI `chat/completions` API at the address of the LiteLLM proxy:
+    python -m llms.mock_llm --source results/exp1_2 --port 40000
+"""
+
+import argparse
+import ast
+import asyncio
+import glob
+import json
+import math
+import os
+import random
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from loguru import logger
+from openai.types.chat import ChatCompletion, ParsedChatCompletion
+
+from llms import get_llm_output, get_llm_output_act
+from llms.scheduler import current_game_id, estimate_message_tokens
+from utils.trajectory import TRAJECTORY_SUFFIXES, load_trajectory
+
+SYNTHESIZE = "synthesize"
+
+# latency (seconds) of a call, lognormal with the given mean and standard deviation
+DEFAULT_LATENCY = {"mean": 2.0, "std": 0.8}
+MODEL_LATENCIES = {
+    "4o-mini": {"mean": 1.5, "std": 0.5},
+    "4o": {"mean": 2.5, "std": 1.0},
+    # the client receives "o3-mini" with `reasoning_effort` for "o3-mini-low" etc.
+    "o3-mini": {"mean": 8.0, "std": 3.0},
+}
+
+ORDER_NAMES = ["LettuceBurger", "BeefBurger", "BeefLettuceBurger"]
+MOCK_THOUGHTS = [
+    "Things are going well",
+    "Prepare the order with the least remaining time first.",
+    "Cook the beef in advance to save time.",
+]
+MOCK_MESSAGES = ["", "I will prepare the burger.", "We need a Bread"]
+MOCK_GUIDELINE = "Prepare the ingredients of the order with the least remaining time first, and serve burgers in time."
+MOCK_INFERENCE = "The human player prefers to prepare ingredients, so the agent assembles and serves the burgers."
+
+
+# sentences of the output formats of the prompts, the goal prompts and game states mention both kinds
+URGENT_RESPONSE_FORMAT_MARKERS = ["code block representation of the new assigned tasks"]
+REFLECTION_FORMAT_MARKERS = ["You should return new **Behavior Guidelines**", "as your reflection"]
+
+
+def get_request_kind(messages: List[Dict]) -> str:
+    """
+    Kind of a request from the output format in the prompt: "reflection", "urgent_response" or "other".
+    """
+    content = str(messages[-1].get("content", "")) if messages else ""
+    if any(marker in content for marker in URGENT_RESPONSE_FORMAT_MARKERS):
+        return "urgent_response"
+    if any(marker in content for marker in REFLECTION_FORMAT_MARKERS):
+        return "reflection"
+    return "other"
+
+
+def get_client_model(model: str) -> str:
+    """
+    The model name the client receives, `get_openai_llm_output` passes the reasoning effort of "o3-mini-low" etc. apart.
+    """
+    if model.startswith("o3"):
+        for effort in ["-low", "-medium", "-high"]:
+            if model.endswith(effort):
+                return model[: -len(effort)]
+    return model
+
+
+def mid_action_to_act_output(output: str) -> str | None:
+    """
+    The recorded mid action of an act run, e.g. "('prepare', {'food': 'Beef', 'plate': True})", as the JSON of the
+    structured output of `llms.get_llm_output_act.Action`, None if it is not one.
+    """
+    try:
+        func, kwargs = ast.literal_eval(output)
+        kwargs = dict(kwargs)
+    except (ValueError, SyntaxError, TypeError):
+        return None
+    if func == "pass_on":
+        kwargs = {"thing_status_pair": f"{kwargs.get('thing', '')}_{kwargs.get('thing_status', '')}"}
+    elif func == "clean_a_counter":
+        kwargs = {}
+    return json.dumps({"action": {"type": func, **kwargs}})
+
+
+def sample_latency(rng: random.Random, latency: Dict[str, float]) -> float:
+    mean, std = latency["mean"], latency.get("std", 0.0)
+    if mean <= 0:
+        return 0.0
+    if std <= 0:
+        return mean
+    sigma2 = math.log(1 + (std / mean) ** 2)
+    return rng.lognormvariate(math.log(mean) - sigma2 / 2, math.sqrt(sigma2))
+
+
+def load_recorded_outputs(source: str) -> Dict[str, List[Dict]]:
+    """
+    Load the recorded LLM calls in trajectory files, `source` is a trajectory file or a directory of them.
+    Returns {kind: [{"input": messages, "output": str, "latency": float}, ...]} in a deterministic order.
+    """
+    if os.path.isdir(source):
+        file_paths = sorted(
+            file_path
+            for suffix in TRAJECTORY_SUFFIXES
+            for file_path in glob.glob(os.path.join(source, "**", f"*{suffix}"), recursive=True)
+        )
+    else:
+        file_paths = [source]
+    records = defaultdict(list)
+    for file_path in file_paths:
+        try:
+            traj_infos = load_trajectory(file_path)
+        except (OSError, ValueError, ImportError) as e:
+            logger.warning(f"Skip {file_path}: {e}")
+            continue
+        if not isinstance(traj_infos, dict):
+            continue
+        for kind in ["urgent_response", "reflection"]:
+            for call in traj_infos.get(kind, []):
+                if isinstance(call, dict) and isinstance(call.get("output"), str):
+                    records[kind].append(call)
+    logger.info(
+        f"Loaded {dict((k, len(v)) for k, v in records.items())} recorded LLM calls from {len(file_paths)} files"
+    )
+    return records
+
+
+def _message_key(messages: List[Dict]) -> str:
+    return json.dumps([[m.get("role"), m.get("content")] for m in messages], ensure_ascii=False)
+
+
+class MockLLM:
+    """
+    Produces the LLM outputs and latencies.
+
+    - `source`: a trajectory JSON file or a directory of them (e.g. `results/exp1_2`) to replay, or `SYNTHESIZE`.
+        A request replays the recorded output of the same input if there is one, otherwise the recorded outputs of the
+        same kind in turn. Requests without recorded outputs are answered with synthesized outputs.
+    - `latencies`: {model: {"mean": float, "std": float}}, overrides `MODEL_LATENCIES`.
+    - `replay_latency`: sleep the recorded latency of replayed outputs instead of sampling one.
+    - `time_scale`: multiplies all latencies, 0 to answer immediately.
+
+    Each game (`llms.scheduler.current_game_id`) has its own random stream, seeded by `seed` and the game id, and its
+    own replay cursors, so that the answers of a game do not depend on the calls of the games running along it.
+    """
+
+    def __init__(
+        self,
+        source: str = SYNTHESIZE,
+        latencies: Dict[str, Dict[str, float]] = None,
+        replay_latency: bool = False,
+        time_scale: float = 1.0,
+        seed: int = 0,
+    ) -> None:
+        self.seed = seed
+        self.rngs: Dict[int, random.Random] = {}
+        self.latencies = {**MODEL_LATENCIES, **(latencies or {})}
+        self.replay_latency = replay_latency
+        self.time_scale = time_scale
+
+        self.records = {} if source == SYNTHESIZE else load_recorded_outputs(source)
+        self.record_by_input = {}
+        for kind_records in self.records.values():
+            for record in kind_records:
+                if isinstance(record.get("input"), list):
+                    self.record_by_input.setdefault(_message_key(record["input"]), record)
+        self.replay_idx: Dict[Tuple[int, str], int] = defaultdict(int)  # (game id, kind) -> next record
+        self.n_call: Dict[str, int] = defaultdict(int)
+
+    @property
+    def rng(self) -> random.Random:
+        """
+        The random stream of the current game.
+        """
+        game_id = current_game_id.get()
+        if game_id not in self.rngs:
+            self.rngs[game_id] = random.Random(f"{self.seed}-{game_id}")
+        return self.rngs[game_id]
+
+    def synthesize(self, kind: str, messages: List[Dict]) -> str:
+        """
+        Output in the format of the prompt, parsable by `update_assigned_tasks` and `update_reflection`, or the JSON
+        of an `Action` for the structured outputs of the act agent.
+        """
+        content = str(messages[-1].get("content", "")) if messages else ""
+        if kind == "act":
+            food = self.rng.choice(["Lettuce", "Beef", "Bread"])
+            action = self.rng.choice(
+                [
+                    {"type": "prepare", "food": food, "plate": food == "Beef"},
+                    {"type": "assemble", "food": self.rng.choice(ORDER_NAMES)},
+                    {"type": "serve", "food": self.rng.choice(ORDER_NAMES)},
+                ]
+            )
+            return json.dumps({"action": action})
+        if kind == "reflection":
+            output = f"```text\n{MOCK_GUIDELINE}\n```\n"
+            if "inference on the human player's behavior" in content:
+                output += f"```text\n{MOCK_INFERENCE}\n```\n"
+            return output
+        if kind == "urgent_response":
+            output = f"```text\n{self.rng.choice(MOCK_THOUGHTS)}\n```\n"
+            if "as message to the human player" in content:
+                output += f"```text\n{self.rng.choice(MOCK_MESSAGES)}\n```\n"
+            tasks = self.rng.sample(ORDER_NAMES, self.rng.randint(0, 2))
+            output += f"```json\n{json.dumps(tasks)}\n```"
+            return output
+        return "I am a mock LLM for offline benchmarking."
+
+    def _get_latency(self, model: str, record: Dict | None) -> float:
+        if record is not None and self.replay_latency and "latency" in record:
+            return float(record["latency"])
+        return sample_latency(self.rng, self.latencies.get(get_client_model(model), DEFAULT_LATENCY))
+
+    def get_latency(self, model: str, messages: List[Dict] | None = None) -> float:
+        """
+        Modeled latency (seconds) of a call regardless of `time_scale`, e.g. for the virtual clock of the runner:
+        the recorded latency of the same input with `replay_latency`, otherwise a sampled one.
+        """
+        record = self.record_by_input.get(_message_key(messages)) if messages else None
+        return self._get_latency(model, record)
+
+    def get_output(self, model: str, messages: List[Dict], kind: str | None = None) -> tuple[str, float]:
+        """
+        Returns the output and the latency (seconds) of a call, of the kind of the prompt by default.
+        """
+        kind = kind or get_request_kind(messages)
+        self.n_call[kind] += 1
+        record = self.record_by_input.get(_message_key(messages))
+        if record is None and self.records.get(kind):
+            kind_records = self.records[kind]
+            key = (current_game_id.get(), kind)
+            record = kind_records[self.replay_idx[key] % len(kind_records)]
+            self.replay_idx[key] += 1
+
+        latency = self._get_latency(model, record)
+        output = record["output"] if record is not None else None
+        if output is not None and kind == "act":
+            # act runs record the mid action of the structured output
+            output = mid_action_to_act_output(output)
+        if output is None:
+            output = self.synthesize(kind, messages)
+        return output, latency * self.time_scale
+
+    def get_response(self, model: str, messages: List[Dict], kind: str | None = None) -> tuple[Dict, float]:
+        """
+        Returns the response in the OpenAI `chat.completion` format and the latency of a call.
+        """
+        output, latency = self.get_output(model, messages, kind)
+        prompt_tokens = estimate_message_tokens(messages)
+        completion_tokens = len(output) // 4
+        response = {
+            "id": f"mock-{sum(self.n_call.values())}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": output},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "completion_tokens_details": {"reasoning_tokens": 0},
+            },
+        }
+        return response, latency
+
+
+class _MockCompletions:
+    def __init__(self, mock_llm: MockLLM) -> None:
+        self.mock_llm = mock_llm
+
+    async def create(self, model: str, messages: List[Dict], **params) -> ChatCompletion:
+        response, latency = self.mock_llm.get_response(model, messages)
+        await asyncio.sleep(latency)
+        return ChatCompletion.model_validate(response)
+
+
+class _MockParseCompletions:
+    def __init__(self, mock_llm: MockLLM) -> None:
+        self.mock_llm = mock_llm
+
+    async def parse(self, model: str, messages: List[Dict], response_format, **params) -> ParsedChatCompletion:
+        response, latency = self.mock_llm.get_response(model, messages, kind="act")
+        await asyncio.sleep(latency)
+        message = response["choices"][0]["message"]
+        message["parsed"] = response_format.model_validate_json(message["content"])
+        message["refusal"] = None
+        return ParsedChatCompletion.model_validate(response)
+
+
+class _MockChat:
+    def __init__(self, completions) -> None:
+        self.completions = completions
+
+
+class _MockBeta:
+    def __init__(self, mock_llm: MockLLM) -> None:
+        self.chat = _MockChat(_MockParseCompletions(mock_llm))
+
+
+class MockAsyncOpenAI:
+    """
+    In-process client with the `chat.completions.create` and `beta.chat.completions.parse` surfaces of
+    `openai.AsyncOpenAI`.
+    """
+
+    def __init__(self, mock_llm: MockLLM = None, **kwargs) -> None:
+        self.mock_llm = mock_llm if mock_llm is not None else MockLLM(**kwargs)
+        self.chat = _MockChat(_MockCompletions(self.mock_llm))
+        self.beta = _MockBeta(self.mock_llm)
+
+
+def enable_mock_llm(source: str = SYNTHESIZE, **kwargs) -> MockAsyncOpenAI:
+    """
+    Route all calls of `get_openai_llm_output` (both of `llms.get_llm_output` and `llms.get_llm_output_act`) to an
+    in-process mock client, see `MockLLM` for the arguments.
+    """
+    client = MockAsyncOpenAI(source=source, **kwargs)
+    get_llm_output.openai_client = client
+    get_llm_output.model_to_separate_clients.clear()
+    get_llm_output_act.openai_client = client
+    logger.warning(f"LLM calls are answered by the mock LLM ({source})")
+    return client
+
+
+def create_app(mock_llm: MockLLM):
+    from quart import Quart, jsonify, request
+
+    app = Quart(__name__)
+
+    @app.route("/chat/completions", methods=["POST"])
+    @app.route("/v1/chat/completions", methods=["POST"])
+    async def chat_completions():
+        data = await request.get_json()
+        # structured outputs are requested by the act agent only
+        kind = "act" if data.get("response_format") else None
+        response, latency = mock_llm.get_response(data["model"], data["messages"], kind)
+        await asyncio.sleep(latency)
+        return jsonify(response)
+
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--source", default=SYNTHESIZE, type=str, help="trajectory file/directory, or synthesize")
+    parser.add_argument("--port", default=40000, type=int)
+    parser.add_argument("--latencies", default=None, type=json.loads, help='e.g. {"4o": {"mean": 2, "std": 1}}')
+    parser.add_argument("--replay_latency", action="store_true")
+    parser.add_argument("--time_scale", default=1.0, type=float)
+    parser.add_argument("--seed", default=0, type=int)
+    args = parser.parse_args()
+
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+
+    mock_llm = MockLLM(args.source, args.latencies, args.replay_latency, args.time_scale, args.seed)
+    config = Config()
+    config.bind = [f"localhost:{args.port}"]
+    asyncio.run(serve(create_app(mock_llm), config))
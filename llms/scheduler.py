@@ -0,0 +1,288 @@
+import asyncio
+import time
+from collections import defaultdict, deque
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Awaitable, Callable, Dict, List
+
+from loguru import logger
+
+from llms.get_llm_output import get_openai_llm_output
+
+# game of the LLM calls made in the current context, set by the scheduler for the calls it runs and by the episodes
+# of the runner, e.g. so that the mock LLM answers each game from its own random stream
+current_game_id: ContextVar[int] = ContextVar("current_game_id", default=0)
+
+
+class LLMRequestCancelled(Exception):
+    """
+    Raised to the caller of a queued request dropped by `LLMScheduler.cancel_game`.
+    """
+
+
+class Priority(IntEnum):
+    """
+    Priority classes of LLM calls, smaller value is served first.
+    """
+
+    URGENT_RESPONSE = 0  # urgent response and ReAct turns, the agent is waiting for new tasks
+    REFLECTION = 1  # reflection, only updates the behavior guidelines
+
+
+def estimate_message_tokens(messages: List[Dict]) -> int:
+    """
+    Rough token count of chat messages (~4 characters per token), used for tokens-per-minute budgets.
+    """
+    return sum(len(str(message.get("content", ""))) for message in messages) // 4 + 4 * len(messages)
+
+
+def is_staggered_trigger(step: int, interval: int, slot: int, n_slots: int) -> bool:
+    """
+    Whether a periodic trigger with `interval` fires at `step` for the `slot`-th of `n_slots` games.
+    Games are shifted by `slot * interval // n_slots` steps so that their triggers do not happen at the same tick.
+    """
+    if interval <= 0 or step <= 0:
+        return False
+    offset = (slot * interval // max(1, n_slots)) % interval
+    return step >= interval and (step - offset) % interval == 0
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `capacity` per minute.
+    """
+
+    def __init__(self, capacity: float) -> None:
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.last_time = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_time) * self.capacity / 60.0)
+        self.last_time = now
+
+    def wait_time(self, amount: float) -> float:
+        """
+        Seconds to wait until `amount` tokens are available, 0 if they are available now.
+        A request larger than the capacity only waits for a full bucket.
+        """
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) * 60.0 / self.capacity
+
+    def consume(self, amount: float) -> None:
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+
+class _Request:
+    __slots__ = ("model", "messages", "params", "game_id", "priority", "n_tokens", "future", "enqueue_time")
+
+    def __init__(self, model: str, messages: List[Dict], params: Dict, game_id: int, priority: Priority) -> None:
+        self.model = model
+        self.messages = messages
+        self.params = params
+        self.game_id = game_id
+        self.priority = priority
+        self.n_tokens = estimate_message_tokens(messages)
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.enqueue_time = time.monotonic()
+
+
+class LLMScheduler:
+    """
+    Global scheduler for the LLM calls of all games sharing one process.
+
+    - `max_concurrency` calls are in flight at the same time at most.
+    - `model_budgets` maps a model name to its budgets, e.g. {"4o": {"rpm": 500, "tpm": 200000}}, where rpm/tpm are
+        requests/tokens per minute. Models without budgets are only limited by `max_concurrency`.
+    - Requests of a higher priority class are always dispatched first. Inside a priority class, the game with the
+        fewest calls in flight (then the least recently served game) is served first.
+    - The time each request spends in the queue is recorded per priority class and per game, see `get_metrics`.
+    """
+
+    def __init__(
+        self,
+        llm_fn: Callable[..., Awaitable[str]] = get_openai_llm_output,
+        max_concurrency: int = 8,
+        model_budgets: Dict[str, Dict[str, float]] = None,
+        max_n_record: int = 1000,
+    ) -> None:
+        self.llm_fn = llm_fn
+        self.max_concurrency = max_concurrency
+        self.request_buckets: Dict[str, TokenBucket] = {}
+        self.token_buckets: Dict[str, TokenBucket] = {}
+        for model, budget in (model_budgets or {}).items():
+            if budget.get("rpm"):
+                self.request_buckets[model] = TokenBucket(budget["rpm"])
+            if budget.get("tpm"):
+                self.token_buckets[model] = TokenBucket(budget["tpm"])
+
+        self.queues: Dict[Priority, List[_Request]] = {priority: [] for priority in Priority}
+        self.n_in_flight = 0
+        self.game_in_flight: Dict[int, int] = defaultdict(int)
+        self.game_last_served: Dict[int, float] = defaultdict(float)
+        self._wakeup_handle: asyncio.TimerHandle = None
+
+        self.queue_times: Dict[Priority, deque] = {priority: deque(maxlen=max_n_record) for priority in Priority}
+        self.game_queue_times: Dict[int, deque] = defaultdict(lambda: deque(maxlen=max_n_record))
+        self.latencies: Dict[str, deque] = defaultdict(lambda: deque(maxlen=max_n_record))
+        self.n_failed: Dict[str, int] = defaultdict(int)
+
+    async def get_llm_output(
+        self,
+        model: str,
+        messages: List[Dict],
+        params: Dict = None,
+        game_id: int = 0,
+        priority: Priority = Priority.URGENT_RESPONSE,
+    ) -> str:
+        """
+        Drop-in replacement of `get_openai_llm_output(model, messages, params)` going through the scheduler.
+        """
+        request = _Request(model, messages, params, game_id, Priority(priority))
+        self.queues[request.priority].append(request)
+        self._dispatch()
+        return await request.future
+
+    def cancel_game(self, game_id: int) -> None:
+        """
+        Drop the queued (not yet started) requests of a game, e.g. when the game ends or the player disconnects.
+        The callers get a `LLMRequestCancelled` exception.
+        """
+        for priority, queue in self.queues.items():
+            for request in [r for r in queue if r.game_id == game_id]:
+                queue.remove(request)
+                if not request.future.done():
+                    request.future.set_exception(LLMRequestCancelled(f"LLM request of game {game_id} cancelled"))
+
+    def queue_length(self) -> int:
+        return sum(len(queue) for queue in self.queues.values())
+
+    def _budget_wait_time(self, request: _Request) -> float:
+        wait_time = 0.0
+        if request.model in self.request_buckets:
+            wait_time = max(wait_time, self.request_buckets[request.model].wait_time(1))
+        if request.model in self.token_buckets:
+            wait_time = max(wait_time, self.token_buckets[request.model].wait_time(request.n_tokens))
+        return wait_time
+
+    def _select(self) -> _Request | None:
+        """
+        Select the next request to dispatch, return None and schedule a wakeup if budgets do not allow any request.
+        """
+        min_wait_time = None
+        blocked_models = set()
+        for priority in sorted(self.queues):
+            queue = self.queues[priority]
+            candidates = sorted(
+                queue,
+                key=lambda r: (self.game_in_flight[r.game_id], self.game_last_served[r.game_id], r.enqueue_time),
+            )
+            for request in candidates:
+                # lower priority requests can not overtake higher ones waiting for the budgets of the same model
+                if request.model in blocked_models:
+                    continue
+                wait_time = self._budget_wait_time(request)
+                if wait_time <= 0:
+                    queue.remove(request)
+                    return request
+                min_wait_time = wait_time if min_wait_time is None else min(min_wait_time, wait_time)
+            blocked_models.update(request.model for request in queue)
+        if min_wait_time is not None:
+            self._schedule_wakeup(min_wait_time)
+        return None
+
+    def _schedule_wakeup(self, wait_time: float) -> None:
+        """
+        Dispatch again in `wait_time` seconds, unless a pending wakeup comes sooner.
+        """
+        loop = asyncio.get_running_loop()
+        when = loop.time() + wait_time
+        if self._wakeup_handle is not None:
+            if self._wakeup_handle.when() <= when:
+                return
+            self._wakeup_handle.cancel()
+        self._wakeup_handle = loop.call_at(when, self._wakeup)
+
+    def _wakeup(self) -> None:
+        self._wakeup_handle = None
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self.n_in_flight < self.max_concurrency:
+            request = self._select()
+            if request is None:
+                break
+            if request.future.done():  # the caller is cancelled
+                continue
+            if request.model in self.request_buckets:
+                self.request_buckets[request.model].consume(1)
+            if request.model in self.token_buckets:
+                self.token_buckets[request.model].consume(request.n_tokens)
+            self.n_in_flight += 1
+            self.game_in_flight[request.game_id] += 1
+            self.game_last_served[request.game_id] = time.monotonic()
+            queue_time = time.monotonic() - request.enqueue_time
+            self.queue_times[request.priority].append(queue_time)
+            self.game_queue_times[request.game_id].append(queue_time)
+            asyncio.ensure_future(self._run(request))
+
+    async def _run(self, request: _Request) -> None:
+        # the task of the call runs in its own context
+        current_game_id.set(request.game_id)
+        s_time = time.monotonic()
+        try:
+            output = await self.llm_fn(request.model, request.messages, request.params)
+        except Exception as e:
+            self.n_failed[request.model] += 1
+            if not request.future.done():
+                request.future.set_exception(e)
+        else:
+            self.latencies[request.model].append(time.monotonic() - s_time)
+            if not request.future.done():
+                request.future.set_result(output)
+        finally:
+            self.n_in_flight -= 1
+            self.game_in_flight[request.game_id] -= 1
+            self._dispatch()
+
+    def get_metrics(self) -> Dict:
+        """
+        Summary of queue times (seconds) per priority class and per game, and LLM latencies per model.
+        """
+
+        def _summary(values) -> Dict[str, float]:
+            values = sorted(values)
+            if not values:
+                return {"n": 0}
+            return {
+                "n": len(values),
+                "mean": sum(values) / len(values),
+                "p95": values[min(len(values) - 1, int(0.95 * len(values)))],
+                "max": values[-1],
+            }
+
+        return {
+            "in_flight": self.n_in_flight,
+            "queued": self.queue_length(),
+            "queue_time": {priority.name: _summary(times) for priority, times in self.queue_times.items()},
+            "game_queue_time": {game_id: _summary(times) for game_id, times in self.game_queue_times.items()},
+            "latency": {model: _summary(times) for model, times in self.latencies.items()},
+            "failed": dict(self.n_failed),
+        }
+
+    async def report_metrics(self, interval: float = 60) -> None:
+        """
+        Log the metrics every `interval` seconds.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            metrics = self.get_metrics()
+            logger.info(
+                f"LLM scheduler: {metrics['in_flight']} in flight, {metrics['queued']} queued, "
+                f"queue time {metrics['queue_time']}, latency {metrics['latency']}, failed {metrics['failed']}"
+            )
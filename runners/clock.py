@@ -0,0 +1,196 @@
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from contextlib import contextmanager
+from typing import Dict, List
+
+from loguru import logger
+
+
+class VirtualClock:
+    """
+    Discrete-event clock of an episode in the simulation mode, the time only advances when the game loop finishes a
+    tick, so that ticks run as fast as possible instead of every `tick` seconds.
+
+    - `sleep(seconds)` wakes at the first tick not earlier than `seconds` from now.
+    - An LLM call is `pending` until its output is back, the game loop does not advance while a call is pending. The
+        output is then delivered at `call_start_tick + ceil(latency / tick)` by `sleep_until`, as if the game had kept
+        running in real time during the call.
+    """
+
+    def __init__(self, tick: float = 0.25) -> None:
+        self.tick = tick
+        self.n_tick = 0
+        self.closed = False
+        self.n_pending = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._waiters = []  # heap of (tick, seq, future)
+        self._seq = itertools.count()
+
+    @property
+    def now(self) -> float:
+        return self.n_tick * self.tick
+
+    def n_tick_of(self, seconds: float) -> int:
+        """
+        Number of ticks covering `seconds`, with a tolerance for float errors.
+        """
+        return max(0, math.ceil(seconds / self.tick - 1e-6))
+
+    async def sleep_until(self, n_tick: int) -> None:
+        if self.closed or n_tick <= self.n_tick:
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (n_tick, next(self._seq), future))
+        await future
+
+    async def sleep(self, seconds: float) -> None:
+        await self.sleep_until(self.n_tick + max(1, self.n_tick_of(seconds)))
+
+    @contextmanager
+    def pending(self):
+        self.n_pending += 1
+        self._idle.clear()
+        try:
+            yield
+        finally:
+            self.n_pending -= 1
+            if self.n_pending == 0:
+                self._idle.set()
+
+    def _wake(self) -> None:
+        while self._waiters and (self.closed or self._waiters[0][0] <= self.n_tick):
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+
+    async def advance(self) -> None:
+        """
+        Advance one tick once no LLM call is pending, and let the coroutines sleeping until this tick run first.
+        """
+        await self._idle.wait()
+        self.n_tick += 1
+        self._wake()
+        # the woken coroutines run before the game loop resumes
+        await asyncio.sleep(0)
+
+    def close(self) -> None:
+        """
+        Wake all sleeping coroutines at the end of the episode.
+        """
+        self.closed = True
+        self._wake()
+
+
+class TickScheduler:
+    """
+    Real-time clock of a game loop, tick `n` is due at the absolute deadline `start + n * tick` of the monotonic clock,
+    so that the time of the step work is not added to the tick period.
+
+    - `catch_up`: the ticks that missed their deadlines run back to back until the loop is on schedule again, so that
+        the game time keeps up with the wall time. Otherwise the missed deadlines are skipped. The schedule restarts
+        from the late tick if more than `max_catch_up` ticks are missed.
+    - `drop_frames`: `drop_frame()` tells the loop to skip rendering a step that ends after the next deadline.
+    - Overruns (tick start - deadline) of at least `log_overrun` seconds are logged, see `stats()`.
+    """
+
+    def __init__(
+        self,
+        tick: float = 0.25,
+        name: str = "",
+        catch_up: bool = False,
+        drop_frames: bool = False,
+        max_catch_up: int = 4,
+        log_overrun: float = 0.02,
+    ) -> None:
+        self.tick = tick
+        self.name = name
+        self.catch_up = catch_up
+        self.drop_frames = drop_frames
+        self.max_catch_up = max_catch_up
+        self.log_overrun = log_overrun
+        self.n_tick = 0
+        self.n_missed = 0
+        self.n_dropped = 0
+        self.overruns: List[float] = []
+        self._start = None
+        self._first_tick_time = None
+        self._last_tick_time = None
+
+    def start(self) -> None:
+        """
+        (Re)start the schedule from now, e.g. after the loop was paused.
+        """
+        self._start = time.monotonic() - self.n_tick * self.tick
+
+    @property
+    def next_deadline(self) -> float:
+        if self._start is None:
+            self.start()
+        return self._start + (self.n_tick + 1) * self.tick
+
+    def drop_frame(self) -> bool:
+        """
+        Whether to skip rendering the current step, because the next tick is already due.
+        """
+        if self.drop_frames and time.monotonic() > self.next_deadline:
+            self.n_dropped += 1
+            return True
+        return False
+
+    async def wait(self) -> None:
+        """
+        Sleep until the deadline of the next tick.
+        """
+        deadline = self.next_deadline
+        self.n_tick += 1
+        delay = deadline - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        now = time.monotonic()
+        overrun = max(0.0, now - deadline)
+        self.overruns.append(overrun)
+        if self._first_tick_time is None:
+            self._first_tick_time = now
+        self._last_tick_time = now
+        if overrun >= self.log_overrun:
+            logger.debug(f"{self.name} tick {self.n_tick} overran by {overrun * 1000:.0f}ms")
+        n_missed = int(overrun // self.tick)
+        if n_missed > 0 and (not self.catch_up or n_missed > self.max_catch_up):
+            self.n_missed += n_missed
+            self._start += n_missed * self.tick
+            logger.warning(f"{self.name} tick {self.n_tick} is {overrun:.2f}s late, skip {n_missed} ticks")
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Mean tick period and overrun percentiles (seconds), and the numbers of late ticks, missed ticks and dropped
+        frames.
+        """
+        overruns = sorted(self.overruns)
+        n = len(overruns)
+        if n == 0:
+            return {"n_tick": 0}
+        period = (self._last_tick_time - self._first_tick_time) / (n - 1) if n > 1 else self.tick
+        return {
+            "n_tick": n,
+            "period": period,
+            "overrun_p50": overruns[n // 2],
+            "overrun_p95": overruns[min(n - 1, int(n * 0.95))],
+            "overrun_max": overruns[-1],
+            "n_late": sum(overrun >= self.log_overrun for overrun in overruns),
+            "n_missed": self.n_missed,
+            "n_dropped": self.n_dropped,
+        }
+
+    def summary(self) -> str:
+        stats = self.stats()
+        if stats["n_tick"] == 0:
+            return "no tick"
+        return (
+            f"tick period {stats['period']:.3f}s, overrun p50/p95/max {stats['overrun_p50'] * 1000:.0f}/"
+            f"{stats['overrun_p95'] * 1000:.0f}/{stats['overrun_max'] * 1000:.0f}ms, {stats['n_late']} late, "
+            f"{stats['n_missed']} missed, {stats['n_dropped']} frames dropped"
+        )
@@ -0,0 +1,452 @@
+"""
+One episode of the unified experiment runner, the game loop shared by all strategies of `runners.strategies`.
+
+Many episodes run concurrently in one event loop, each with its own env and agents, and all their LLM calls go through
+one shared `LLMScheduler`.
+"""
+
+import asyncio
+import random
+import time
+from copy import deepcopy
+from pprint import pformat
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+from gym_cooking.cooking_world.cooking_world import CookingWorld
+from loguru import logger
+
+from agents.biased_agent import (
+    AssembleServeAgent,
+    PrepareBeefAgent,
+    PrepareLettuceAgent,
+    SwitchAgent,
+)
+from agents.mid_agent import MidAgent
+from agents.rollout import MidActionEvaluator
+from agents.rule_agent import RuleAgent
+from agents.text_agent import TextAgent
+from coop_marl.envs.overcooked.overcooked_maker import OvercookedMaker
+from coop_marl.utils import Arrdict
+from llms.scheduler import LLMScheduler, Priority, current_game_id
+from runners.clock import TickScheduler, VirtualClock
+from runners.random_state import EpisodeRandomState
+from runners.strategies import Strategy
+from utils.history import History
+from utils.state_record import StateRecorder, state_record_path
+from utils.trajectory import TrajectoryWriter
+
+biased_agent_name = {
+    0: "BeefAgent",
+    1: "LettuceAgent",
+    2: "AssembleServeAgent",
+    3: "BeefToLettuceAgent",
+    4: "BeefToAssembleServeAgent",
+    5: "LettuceToBeefAgent",
+    6: "LettuceToAssembleServeAgent",
+    7: "AssembleServeToBeefAgent",
+    8: "AssembleServeToLettuceAgent",
+    9: "FSM",
+}
+
+
+class Episode:
+    """
+    - `biased_agent`: index in `biased_agent_name` of the partner in the collaboration experiments (exp2), the LLM
+        agent plays alone (exp1) if None.
+    - `game_id`: identifies the episode in the shared `scheduler`.
+    - `traj_path`: the trajectory is streamed to this file while the episode runs, see `utils.trajectory`.
+    - `clock`: simulation mode, ticks run as fast as possible and the LLM outputs are delivered after their latency
+        in ticks, see `VirtualClock`. The game runs in real time (a tick every 0.25s) if None, scheduled by `ticker`
+        with the `tick_catch_up` and `tick_drop_frames` options of `conf`, see `TickScheduler`.
+    - `latency_model(model, messages, measured_latency)`: modeled latency of an LLM call with the virtual clock,
+        e.g. `MockLLM.get_latency`, the measured latency is used if None.
+    - `rollout_horizon` of `conf`: the rule agent chooses the ingredients to prepare by rollouts, which block the event
+        loop, so only with the virtual clock. The measured LLM latencies then include the time the loop was blocked.
+    """
+
+    def __init__(
+        self,
+        strategy: Strategy,
+        conf: Dict,
+        env_conf: Dict,
+        seed: int,
+        biased_agent: int | None = None,
+        game_id: int = 0,
+        scheduler: LLMScheduler = None,
+        display: bool = False,
+        clock: VirtualClock | None = None,
+        latency_model: Callable[[str, List[Dict] | None, float], float] | None = None,
+        traj_path: str | None = None,
+        random_seed: int = 0,
+    ) -> None:
+        self.strategy = strategy
+        self.seed = seed
+        self.biased_agent = biased_agent
+        self.exp2 = biased_agent is not None
+        self.game_id = game_id
+        self.scheduler = scheduler if scheduler is not None else LLMScheduler()
+        self.clock = clock
+        self.ticker = None
+        self.latency_model = latency_model
+        self.name = f"[{game_id}] {strategy.variant_name(self.exp2)} {strategy.model} seed {seed}"
+        if self.exp2:
+            self.name += f" {biased_agent_name[biased_agent]}"
+        if clock is None:
+            self.ticker = TickScheduler(
+                0.25,
+                self.name,
+                catch_up=conf.get("tick_catch_up", False),
+                drop_frames=conf.get("tick_drop_frames", False),
+            )
+        self.mode = env_conf["mode"]
+        self.rng = random.Random(seed)
+        self.random_state = EpisodeRandomState(random_seed)
+
+        self.urgent_response_history_n_event = conf.get("urgent_response_history_n_event", 5)
+        self.urgent_response_interval_n_timestep = conf.get("urgent_response_interval_n_timestep", 25)
+        self.reflection_history_n_event = conf.get("reflection_history_n_event", 15)
+        self.reflection_interval_n_timestep = conf.get("reflection_interval_n_timestep", 75)
+
+        self.max_steps = env_conf.get("horizon", 1000) // 2
+        self.current_steps = 0
+        self.finished = False
+        self.to_reflection = False
+        self.to_urgent_response = False
+        self.mid_action = None
+        self.n_execution = 0
+
+        # records: "traj" (time, action, score, message, mid_action), "urgent_response" and "reflection"
+        # (time, input, output, latency), "text_action" (time, agent, action), the states of the traj elements are
+        # recorded by `state_recorder` and saved next to the trajectory
+        self.traj_path = traj_path
+        self.traj_writer = TrajectoryWriter(None)
+
+        self.llm_idx = 1 if self.exp2 else 0
+        self.partner_idx = 1 - self.llm_idx
+        with self.random_state.activate():
+            self.env = OvercookedMaker(**{k: v for k, v in env_conf.items() if k != "name"}, display=display)
+            self.text_agent = TextAgent(
+                self.world,
+                self.llm_idx,
+                cooperative_plan=conf.get("cooperative_path_planning", False),
+                walking_distances=conf.get("walking_distances", False),
+                incremental_plan=conf.get("incremental_path_planning", False),
+            )
+            self.mid_agent = MidAgent(self.text_agent, self.world)
+            self.rule_agent = strategy.create_agent(self)
+            self.rollout_evaluator = None
+            if conf.get("rollout_horizon", 0) > 0 and isinstance(self.rule_agent, RuleAgent):
+                if clock is None:
+                    raise ValueError("rollout_horizon needs the virtual clock, the rollouts would stall the ticks")
+                self.rollout_evaluator = MidActionEvaluator(
+                    conf["rollout_horizon"], conf.get("rollout_workers", 0), seed=seed
+                )
+                self.rule_agent.rollout_evaluator = self.rollout_evaluator
+            self.state_recorder = StateRecorder(
+                CookingWorld.STATE_OBJECT_KEYS,
+                self.env._env.num_agents,
+                self.env._env.unwrapped.max_order,
+                self.max_steps + 1,
+                self.llm_idx,
+            )
+
+            if self.exp2:
+                self.biased_text_agent = TextAgent(
+                    self.world,
+                    self.partner_idx,
+                    walking_distances=conf.get("walking_distances", False),
+                    incremental_plan=conf.get("incremental_path_planning", False),
+                )
+                # the FSM partner plans its paths, the LLM agent plans around them
+                self.text_agent.partner_agents = [self.biased_text_agent]
+                self.biased_mid_agent = MidAgent(self.biased_text_agent, self.world)
+                self.partner_agent = self._create_biased_agent()
+        self.partner_mid_action = None
+        self.partner_n_execution = 0
+
+        self.history_buffer = History(
+            max_steps=self.max_steps,
+            compact=conf.get("history_compact", False),
+            max_tokens=conf.get("history_max_tokens", None),
+            max_length=conf.get("history_max_length", None),
+        )
+
+    @property
+    def world(self) -> CookingWorld:
+        # MARK: world will change after reset
+        return self.env._env.unwrapped.world
+
+    @property
+    def done(self) -> bool:
+        return self.finished or self.current_steps >= self.max_steps
+
+    def _create_biased_agent(self) -> RuleAgent:
+        beef_agent = PrepareBeefAgent(self.biased_text_agent, self.world)
+        lettuce_agent = PrepareLettuceAgent(self.biased_text_agent, self.world)
+        assemble_serve_agent = AssembleServeAgent(self.biased_text_agent, self.world)
+        match self.biased_agent:
+            case 0:
+                return beef_agent
+            case 1:
+                return lettuce_agent
+            case 2:
+                return assemble_serve_agent
+            case 3:
+                return SwitchAgent([0, 250], [beef_agent, lettuce_agent])
+            case 4:
+                return SwitchAgent([0, 250], [beef_agent, assemble_serve_agent])
+            case 5:
+                return SwitchAgent([0, 250], [lettuce_agent, beef_agent])
+            case 6:
+                return SwitchAgent([0, 250], [lettuce_agent, assemble_serve_agent])
+            case 7:
+                return SwitchAgent([0, 250], [assemble_serve_agent, beef_agent])
+            case 8:
+                return SwitchAgent([0, 250], [assemble_serve_agent, lettuce_agent])
+            case 9:
+                return RuleAgent(self.biased_text_agent, self.world)
+
+    def record(self, kind: str, record: Dict) -> None:
+        self.traj_writer.add(kind, record)
+
+    async def sleep(self, seconds: float) -> None:
+        if self.clock is not None:
+            await self.clock.sleep(seconds)
+        else:
+            await asyncio.sleep(seconds)
+
+    async def wait_llm(self, llm_call: Awaitable, llm_input: List[Dict] | None = None) -> Tuple[Any, float]:
+        """
+        Await an LLM call, returns its output and latency (seconds).
+        With the virtual clock, the output is delivered `ceil(latency / tick)` ticks after the call starts.
+        """
+        s_time = time.time()
+        if self.clock is None:
+            output = await llm_call
+            return output, time.time() - s_time
+        start_tick = self.clock.n_tick
+        with self.clock.pending():
+            output = await llm_call
+        latency = time.time() - s_time
+        if self.latency_model is not None:
+            latency = self.latency_model(self.strategy.model, llm_input, latency)
+        await self.clock.sleep_until(start_tick + self.clock.n_tick_of(latency))
+        return output, latency
+
+    async def call_llm(self, kind: str, llm_input: List[Dict]) -> str:
+        """
+        Call the LLM through the shared scheduler and record the call as `kind`.
+        """
+        priority = Priority.REFLECTION if kind == "reflection" else Priority.URGENT_RESPONSE
+        llm_output, latency = await self.wait_llm(
+            self.scheduler.get_llm_output(self.strategy.model, llm_input, game_id=self.game_id, priority=priority),
+            llm_input,
+        )
+        self.record(kind, {"t": self.current_steps, "input": llm_input, "output": llm_output, "latency": latency})
+        logger.success(f"{self.name} {kind} LLM Output, Used {latency: .4f}s")
+        logger.debug(f"Output:\n{llm_output}")
+        return llm_output
+
+    def get_partner_action(self) -> int:
+        """
+        Low-level action of the partner at this step: the biased agent in exp2, staying still in exp1.
+        """
+        if not self.exp2:
+            return 0
+        if not self.partner_mid_action:
+            json_state_simple = self.env.get_json_state_simple(self.partner_idx)
+            if isinstance(self.partner_agent, SwitchAgent):
+                self.partner_mid_action = self.partner_agent.get_action(json_state_simple, self.current_steps)
+            else:
+                self.partner_mid_action = self.partner_agent.get_action(json_state_simple)
+        if self.partner_mid_action:
+            end, action, status = self.biased_mid_agent.get_action(
+                self.partner_mid_action[0], **self.partner_mid_action[1]
+            )
+            self.partner_n_execution += 1
+            if end:
+                logger.debug(f"{self.name} biased agent mid action {status}")
+                self.partner_mid_action = None
+                self.partner_n_execution = 0
+        else:
+            action = self.rng.choice([0, 1, 2, 3, 4])
+        if self.partner_n_execution >= 45:
+            action = self.rng.choice([0, 1, 2, 3, 4])
+            if self.partner_n_execution >= 50:
+                self.partner_mid_action = None
+                self.partner_n_execution = 0
+        return action
+
+    def get_llm_agent_action(self, traj_element: Dict) -> int:
+        """
+        Low-level action of the LLM agent at this step, decides a new mid action with the rule agent when needed.
+        """
+        strategy = self.strategy
+        if not self.mid_action and not strategy.async_decision:
+            json_state_simple = self.env.get_json_state_simple(self.llm_idx)
+            strategy.on_decision(self, json_state_simple)
+            s_time = time.time()
+            if self.exp2 and isinstance(self.rule_agent, RuleAgent):
+                self.rule_agent.partner_mid_actions = (
+                    {self.partner_idx: self.partner_mid_action} if self.partner_mid_action else {}
+                )
+            self.mid_action = self.rule_agent.get_action(json_state_simple)
+            if strategy.no_model and self.exp2:
+                self.record(
+                    "urgent_response",
+                    {
+                        "t": self.current_steps,
+                        "input": str(json_state_simple),
+                        "output": str(self.mid_action),
+                        "latency": time.time() - s_time,
+                    },
+                )
+            self.history_buffer.add(self.current_steps, json_state_simple, {})
+
+        action = 0
+        if self.mid_action:
+            if self.exp2:
+                traj_element["mid_action"][self.llm_idx] = self.mid_action
+            else:
+                traj_element["mid_action"] = self.mid_action
+            end, action, status = self.mid_agent.get_action(self.mid_action[0], **self.mid_action[1])
+            self.n_execution += 1
+            if end:
+                logger.debug(f"{self.name} {status}")
+                self.mid_action = None
+                self.n_execution = 0
+                strategy.on_mid_action_end(self, status)
+
+        if "controlled_by_fsm" in traj_element:
+            traj_element["controlled_by_fsm"] = self.rule_agent.controlled_by_fsm
+        if self.exp2 and self.n_execution >= 45:
+            # the LLM agent is stuck in the mid action
+            action = 0
+            if self.n_execution >= 50:
+                self.mid_action = None
+                self.n_execution = 0
+            traj_element["controlled_by_fsm"] = False
+        return action
+
+    def _new_traj_element(self, t: int, score: int) -> Dict:
+        self.state_recorder.record(self.env, t)
+        traj_element = {
+            "t": t,
+            "score": score,
+            "message": [],
+            "mid_action": {} if self.exp2 else None,
+        }
+        if not self.strategy.async_decision:
+            traj_element["controlled_by_fsm"] = None
+        return traj_element
+
+    async def run_game(self) -> None:
+        try:
+            await self._run_game()
+        finally:
+            self.finished = True
+            if self.clock is not None:
+                self.clock.close()
+
+    async def _run_game(self) -> None:
+        outcome = self.env.reset()
+        self.env.render(mode=True)
+
+        world = self.world
+        self.text_agent.update_agent(world, self.llm_idx)
+        self.mid_agent.update(self.text_agent, world)
+        self.rule_agent.update(self.text_agent, world, self.env.get_json_state_simple(self.llm_idx))
+        if self.exp2:
+            self.biased_text_agent.update_agent(world, self.partner_idx)
+            self.biased_mid_agent.update(self.biased_text_agent, world)
+
+        agent_text_actions = {a_i: [] for a_i in range(self.env._env.num_agents)}
+        agent_mid_actions = {a_i: [] for a_i in range(self.env._env.num_agents)}
+
+        self.mid_action = None
+        self.n_execution = 0
+        current_action = [0, 0]
+        episode_s_time = time.time()
+        traj_element = self._new_traj_element(0, 0)
+        if self.ticker is not None:
+            self.ticker.start()
+
+        while True:
+            decision = Arrdict()
+            for i, k in enumerate(outcome.keys()):
+                if i == self.llm_idx:
+                    current_action[i] = self.get_llm_agent_action(traj_element)
+                else:
+                    current_action[i] = self.get_partner_action()
+                    if self.exp2:
+                        traj_element["mid_action"][i] = self.partner_mid_action
+                decision[k] = Arrdict(action=current_action[i])
+            # env step
+            traj_element["action"] = deepcopy(current_action)
+            self.record("traj", traj_element)
+            outcome, info = self.env.step(decision)
+            if self.ticker is None or not self.ticker.drop_frame():
+                self.env.render(mode=True)
+            text_actions = world.get_events()
+
+            traj_element = self._new_traj_element(self.env.timestep, info["player_0"]["score"])
+
+            for a_i, t_acts in text_actions.items():
+                if len(t_acts) > len(agent_text_actions[a_i]):
+                    agent_text_actions[a_i] = t_acts
+                    self.record("text_action", {"t": self.env.timestep, "agent": a_i, "action": t_acts[-1]})
+            mid_actions = world.get_mid_actions()
+            for a_i, m_acts in mid_actions.items():
+                if len(m_acts) > len(agent_mid_actions[a_i]):
+                    agent_mid_actions[a_i].append(m_acts[len(agent_mid_actions[a_i])])
+                    if self.strategy.record_own_actions or a_i != self.llm_idx:
+                        self.history_buffer.add_action(agent_mid_actions[a_i][-1], a_i)
+
+            self.current_steps = self.env.timestep
+            self.strategy.on_step(self, "")
+            if self.current_steps % 100 == 0:
+                logger.info(
+                    f"{self.name} Step: {self.current_steps} / {self.max_steps}, "
+                    f"FPS: {self.current_steps / (time.time() - episode_s_time): .2f}"
+                    + (f", {self.ticker.summary()}" if self.ticker is not None else "")
+                )
+
+            if self.current_steps >= self.max_steps:
+                json_state_simple = self.env.get_json_state_simple(self.llm_idx)
+                logger.success(f"{self.name} Final Score: {pformat(json_state_simple['total_score'])}")
+                if self.ticker is not None:
+                    logger.info(f"{self.name} {self.ticker.summary()}")
+                break
+
+            if self.clock is not None:
+                await self.clock.advance()
+            else:
+                await self.ticker.wait()
+
+    async def run(self) -> str | None:
+        """
+        Run the game loop and the loops of the strategy until the episode ends, returns the path of the trajectory.
+        """
+        self.traj_writer = TrajectoryWriter(self.traj_path)
+        # the LLM calls made outside the scheduler (e.g. by the act agent) and the latency model see the game
+        current_game_id.set(self.game_id)
+        results = None
+        try:
+            results = await asyncio.gather(
+                *[self.random_state.run(loop) for loop in [self.run_game(), *self.strategy.loops(self)]],
+                return_exceptions=True,
+            )
+        finally:
+            errors = [result for result in results or [] if isinstance(result, BaseException)]
+            self.finished = True
+            self.scheduler.cancel_game(self.game_id)
+            self.history_buffer.close()
+            if self.rollout_evaluator is not None:
+                self.rollout_evaluator.close()
+            # the trajectory of a failed episode is kept as a partial file
+            traj_path = self.traj_writer.close(finished=results is not None and not errors)
+            if self.traj_path is not None:
+                self.state_recorder.save(state_record_path(self.traj_path))
+        if errors:
+            raise errors[0]
+        return traj_path
@@ -0,0 +1,65 @@
+"""
+Random states of the episodes running concurrently in one event loop, see `EpisodeRandomState`.
+"""
+
+import random
+import types
+from contextlib import contextmanager
+from typing import Any, Coroutine
+
+import numpy as np
+
+
+class EpisodeRandomState:
+    """
+    The `random` and `np.random` states of one episode.
+
+    The env (orders, level layouts), the planners, the rule agents and the LLM agents draw from the global random
+    states. While the code of the episode runs (`activate`, or each step of the coroutines wrapped by `run`), the global
+    states are swapped with the states of the episode, so that concurrent episodes do not share one random stream and
+    an episode gives the same results whatever runs along it. Each episode starts from `random.seed(seed)` and
+    `np.random.seed(seed)`, as the `llm_agent_run_*` scripts do before their episode.
+    """
+
+    def __init__(self, seed: int = 0) -> None:
+        global_state = (random.getstate(), np.random.get_state())
+        random.seed(seed)
+        np.random.seed(seed)
+        self.state = (random.getstate(), np.random.get_state())
+        random.setstate(global_state[0])
+        np.random.set_state(global_state[1])
+
+    @contextmanager
+    def activate(self):
+        global_state = (random.getstate(), np.random.get_state())
+        random.setstate(self.state[0])
+        np.random.set_state(self.state[1])
+        try:
+            yield
+        finally:
+            self.state = (random.getstate(), np.random.get_state())
+            random.setstate(global_state[0])
+            np.random.set_state(global_state[1])
+
+    async def run(self, coro: Coroutine) -> Any:
+        """
+        Await `coro` with the states of the episode active in each of its steps, and not while it is suspended.
+        """
+        return await self._step(coro)
+
+    @types.coroutine
+    def _step(self, coro: Coroutine):
+        send, value = coro.send, None
+        while True:
+            with self.activate():
+                try:
+                    yielded = send(value)
+                except StopIteration as e:
+                    return e.value
+            try:
+                value, send = (yield yielded), coro.send
+            except GeneratorExit:
+                coro.close()
+                raise
+            except BaseException as e:
+                value, send = e, coro.throw
@@ -0,0 +1,354 @@
+"""
+Agent strategies of the unified experiment runner `llm_agent_run.py`.
+
+A strategy decides which rule agent the LLM drives, where its results are saved, and how System 2 (the LLM) is
+called during an episode. The game loop itself is shared in `runners.episode.Episode`.
+"""
+
+import time
+from typing import TYPE_CHECKING, Coroutine, Dict, List
+
+from loguru import logger
+
+from agents.action_llm_agent import LLMActionAgent
+from agents.comm_infer_llm_agent import CommInferAgent, CommInferAgentNoFSM
+from agents.react_llm_agent import ReActAgent, ReActAgentNoFSM
+from agents.reflexion_llm_agent import ReflexionAgent, ReflexionAgentNoFSM
+from agents.rule_agent import RuleAgent
+from llms.get_llm_output_act import get_openai_llm_output as get_act_llm_output
+from llms.scheduler import LLMScheduler
+
+if TYPE_CHECKING:
+    from runners.episode import Episode
+
+
+class Strategy:
+    """
+    Base strategy, subclasses implement `create_agent` and the System 2 loops.
+
+    - `fsm`: the LLM assigns tasks to the FSM-based rule agent, otherwise to the rule agent without FSM.
+    - `no_model`: FSM-only baseline without LLM calls.
+    - `infer_human`, `send_message`, `receive_message`: variants of the agents, see `agents/`.
+    """
+
+    name = ""
+    # whether the mid actions of the LLM agent itself are added to the history
+    record_own_actions = True
+    # whether the mid actions are decided in a background loop instead of in the game loop
+    async_decision = False
+
+    def __init__(
+        self,
+        model: str,
+        fsm: bool = False,
+        no_model: bool = False,
+        infer_human: bool = False,
+        send_message: bool = False,
+        receive_message: bool = False,
+    ) -> None:
+        self.model = model
+        self.fsm = fsm
+        self.no_model = no_model
+        self.infer_human = infer_human
+        self.send_message = send_message
+        self.receive_message = receive_message
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(model={self.model}, fsm={self.fsm}, no_model={self.no_model})"
+
+    def variant_name(self, exp2: bool) -> str:
+        """
+        Result directory of the strategy, under `results/exp1_2/{mode}` or `results/exp2/{mode}/{biased agent}`.
+        """
+        return self.name
+
+    def result_path(self, mode: str, seed: int, biased_agent_name: str | None = None) -> str:
+        """
+        Same result paths as the `llm_agent_run_*` scripts.
+        """
+        exp2 = biased_agent_name is not None
+        dir_path = f"results/exp2/{mode}/{biased_agent_name}" if exp2 else f"results/exp1_2/{mode}"
+        if self.no_model:
+            return f"{dir_path}/FSM-{seed}.json"
+        return f"{dir_path}/{self.variant_name(exp2)}/{self.model}-{seed}.json"
+
+    def create_agent(self, episode: "Episode") -> RuleAgent:
+        """
+        Agent of the FSM-only baseline, subclasses create their LLM-driven agents.
+        """
+        return RuleAgent(episode.text_agent, episode.world)
+
+    def on_decision(self, episode: "Episode", json_state_simple: Dict) -> None:
+        """
+        Called before the rule agent decides a new mid action.
+        """
+
+    def on_step(self, episode: "Episode", human_message: str) -> None:
+        """
+        Called after each env step, sets the triggers of System 2.
+        """
+
+    def on_mid_action_end(self, episode: "Episode", status: str) -> None:
+        """
+        Called when the LLM agent finishes or fails a mid action.
+        """
+
+    def loops(self, episode: "Episode") -> List[Coroutine]:
+        """
+        Coroutines running along the game loop, e.g. the System 2 loops.
+        """
+        return []
+
+    async def warm_start(self, scheduler: LLMScheduler) -> None:
+        if self.no_model:
+            return
+        s_time = time.time()
+        await scheduler.get_llm_output(self.model, [{"role": "user", "content": "Hello! Who are you?"}])
+        logger.success(f"Warm start time of {self.model}: {time.time() - s_time: .2f}")
+
+
+class DPTStrategy(Strategy):
+    """
+    DPT-Agent: the FSM (System 1) acts every tick, the LLM (System 2) gives urgent responses and reflections.
+    """
+
+    name = "dpt"
+
+    def variant_name(self, exp2: bool) -> str:
+        if not exp2:
+            return "dpt" if self.fsm else "dpt-s2"
+        name = "dpt-wtom" if self.infer_human else "dpt-wotom"
+        return name if self.fsm else f"{name}-s2"
+
+    def create_agent(self, episode: "Episode") -> RuleAgent:
+        if self.no_model:
+            return super().create_agent(episode)
+        agent_class = CommInferAgent if self.fsm else CommInferAgentNoFSM
+        return agent_class(
+            episode.text_agent,
+            episode.world,
+            send_message=self.send_message,
+            receive_message=self.receive_message,
+            infer_human=self.infer_human,
+        )
+
+    def on_step(self, episode: "Episode", human_message: str) -> None:
+        current_steps = episode.current_steps
+        if current_steps > 0 and current_steps % episode.reflection_interval_n_timestep == 0:
+            episode.to_reflection = True
+        if current_steps > 0 and (current_steps % episode.urgent_response_interval_n_timestep == 0 or human_message):
+            episode.to_urgent_response = True
+
+    def loops(self, episode: "Episode") -> List[Coroutine]:
+        if self.no_model:
+            return []
+        return [self.urgent_response(episode), self.reflection(episode)]
+
+    async def urgent_response(self, episode: "Episode") -> None:
+        rule_agent = episode.rule_agent
+        while True:
+            if episode.to_urgent_response:
+                history = episode.history_buffer.get_formatted_history(
+                    episode.urgent_response_history_n_event, episode.llm_idx
+                )
+                llm_input = rule_agent.get_urgent_response_llm_input(history)
+                llm_output = await episode.call_llm("urgent_response", llm_input)
+                rule_agent.update_assigned_tasks(llm_output)
+                if rule_agent.message:
+                    episode.history_buffer.add_message(rule_agent.message, episode.llm_idx)
+                episode.to_urgent_response = False
+            if episode.done:
+                break
+            await episode.sleep(0.1)
+
+    async def reflection(self, episode: "Episode") -> None:
+        rule_agent = episode.rule_agent
+        while True:
+            if episode.to_reflection:
+                history = episode.history_buffer.get_formatted_history(
+                    episode.reflection_history_n_event, episode.llm_idx
+                )
+                llm_input = rule_agent.get_reflection_llm_input(history)
+                llm_output = await episode.call_llm("reflection", llm_input)
+                rule_agent.update_reflection(llm_output)
+                episode.to_reflection = False
+            if episode.done:
+                break
+            await episode.sleep(1)
+
+
+class ReActStrategy(Strategy):
+    """
+    ReAct: the LLM gives a thought and the assigned tasks every `urgent_response_interval_n_timestep` steps.
+    """
+
+    name = "react"
+
+    def variant_name(self, exp2: bool) -> str:
+        # the llm_agent_run_*_exp1 scripts only run without the FSM, keep the FSM results apart
+        if not exp2 and self.fsm:
+            return f"{self.name}-fsm"
+        return self.name
+
+    def create_agent(self, episode: "Episode") -> RuleAgent:
+        if self.no_model:
+            return super().create_agent(episode)
+        agent_class = ReActAgent if self.fsm else ReActAgentNoFSM
+        return agent_class(
+            episode.text_agent,
+            episode.world,
+            send_message=self.send_message,
+            receive_message=self.receive_message,
+            max_n_react_turn=episode.urgent_response_history_n_event,
+        )
+
+    def on_step(self, episode: "Episode", human_message: str) -> None:
+        if episode.current_steps % episode.urgent_response_interval_n_timestep == 0 or human_message:
+            episode.to_urgent_response = True
+
+    def loops(self, episode: "Episode") -> List[Coroutine]:
+        if self.no_model:
+            return []
+        return [self.react(episode)]
+
+    def get_react_llm_input(self, episode: "Episode") -> List[Dict]:
+        return episode.rule_agent.get_react_llm_input()
+
+    async def react(self, episode: "Episode") -> None:
+        rule_agent = episode.rule_agent
+        episode.to_urgent_response = True
+        while True:
+            if episode.to_urgent_response:
+                history = episode.history_buffer.get_formatted_history(1, episode.llm_idx)
+                rule_agent.update_trajectory(history)
+                llm_input = self.get_react_llm_input(episode)
+                llm_output = await episode.call_llm("urgent_response", llm_input)
+                thought_task = rule_agent.update_assigned_tasks(llm_output)
+                if thought_task:
+                    rule_agent.update_react(thought_task[0], thought_task[1])
+                else:
+                    rule_agent.update_react(llm_output, "")
+                episode.to_urgent_response = False
+            if episode.done:
+                break
+            await episode.sleep(0.1)
+
+
+class ReflexionStrategy(ReActStrategy):
+    """
+    Reflexion: ReAct with reflections triggered by losing scores or fires.
+    """
+
+    name = "reflexion"
+
+    def create_agent(self, episode: "Episode") -> RuleAgent:
+        if self.no_model:
+            return super().create_agent(episode)
+        agent_class = ReflexionAgent if self.fsm else ReflexionAgentNoFSM
+        return agent_class(
+            episode.text_agent,
+            episode.world,
+            send_message=self.send_message,
+            receive_message=self.receive_message,
+            max_n_react_turn=episode.urgent_response_history_n_event,
+            max_n_reflection_event=episode.reflection_history_n_event,
+        )
+
+    def on_decision(self, episode: "Episode", json_state_simple: Dict) -> None:
+        if not self.no_model:
+            episode.to_reflection = episode.rule_agent.to_reflection(json_state_simple)
+
+    def loops(self, episode: "Episode") -> List[Coroutine]:
+        if self.no_model:
+            return []
+        return [self.react(episode), self.reflection(episode)]
+
+    def get_react_llm_input(self, episode: "Episode") -> List[Dict]:
+        return episode.rule_agent.get_reflection_react_llm_input()
+
+    async def reflection(self, episode: "Episode") -> None:
+        rule_agent = episode.rule_agent
+        while True:
+            if episode.to_reflection:
+                llm_input = rule_agent.get_reflection_llm_input()
+                llm_output = await episode.call_llm("reflection", llm_input)
+                rule_agent.update_reflection(llm_output)
+                episode.to_reflection = False
+            if episode.done:
+                break
+            await episode.sleep(1)
+
+
+class ActStrategy(Strategy):
+    """
+    LLM as an independent System 1: the LLM chooses every mid action, results are saved in `results/exp1`.
+    The LLM calls go through `llms.get_llm_output_act` with structured outputs.
+    """
+
+    name = "act"
+    record_own_actions = False
+    async_decision = True
+
+    def result_path(self, mode: str, seed: int, biased_agent_name: str | None = None) -> str:
+        assert biased_agent_name is None, "The act strategy only supports the single agent experiments"
+        if self.no_model:
+            return f"results/exp1/{mode}/FSM-{seed}.json"
+        return f"results/exp1/{mode}/{self.model}-{seed}.json"
+
+    def create_agent(self, episode: "Episode") -> RuleAgent:
+        if self.no_model:
+            return super().create_agent(episode)
+        return LLMActionAgent(
+            episode.text_agent,
+            episode.world,
+            self.model,
+            None,
+            episode.urgent_response_history_n_event,
+        )
+
+    def loops(self, episode: "Episode") -> List[Coroutine]:
+        # the FSM baseline is also decided in the background loop
+        return [self.get_mid_action(episode)]
+
+    async def get_mid_action(self, episode: "Episode") -> None:
+        rule_agent = episode.rule_agent
+        while True:
+            if not episode.mid_action:
+                json_state_simple = episode.env.get_json_state_simple(episode.llm_idx)
+                episode.history_buffer.add(episode.current_steps, json_state_simple, {})
+                s_time = time.time()
+                if isinstance(rule_agent, LLMActionAgent):
+                    history = episode.history_buffer.get_formatted_history(1, episode.llm_idx)
+                    (mid_action, llm_input), latency = await episode.wait_llm(rule_agent.get_action(history))
+                else:
+                    mid_action, llm_input = rule_agent.get_action(json_state_simple), str(json_state_simple)
+                    latency = time.time() - s_time
+                episode.record(
+                    "urgent_response",
+                    {"t": episode.current_steps, "input": llm_input, "output": str(mid_action), "latency": latency},
+                )
+                if mid_action:
+                    logger.info(f"{episode.name} Act Agent: {mid_action}")
+                episode.mid_action = mid_action
+            if episode.done:
+                break
+            await episode.sleep(0.01)
+
+    def on_mid_action_end(self, episode: "Episode", status: str) -> None:
+        if isinstance(episode.rule_agent, LLMActionAgent):
+            episode.rule_agent.store_result("Failed" if "Failed" in status else "Success")
+
+    async def warm_start(self, scheduler: LLMScheduler) -> None:
+        if self.no_model:
+            return
+        s_time = time.time()
+        await get_act_llm_output([{"role": "system", "content": "Hello! Who are you?"}], self.model, None)
+        logger.success(f"Warm start time of {self.model}: {time.time() - s_time: .2f}")
+
+
+STRATEGIES = {
+    "dpt": DPTStrategy,
+    "react": ReActStrategy,
+    "reflexion": ReflexionStrategy,
+    "act": ActStrategy,
+}
@@ -0,0 +1,360 @@
+"""
+Sweep of episodes over models x biased agents x seeds x strategies, run concurrently in one event loop
+(`run_sweep`), or sharded across a process pool with one event loop per worker (`run_sweep_parallel`).
+"""
+
+import asyncio
+import math
+import multiprocessing
+import os
+import queue
+import sys
+from concurrent.futures import FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List, Tuple
+
+from loguru import logger
+from rebar.parallel import VariableExecutor
+from tqdm.auto import tqdm
+
+from llms.mock_llm import SYNTHESIZE, enable_mock_llm
+from llms.scheduler import LLMScheduler
+from runners.clock import VirtualClock
+from runners.episode import Episode, biased_agent_name
+from runners.strategies import STRATEGIES, Strategy
+from utils.trajectory import find_trajectory, trajectory_path
+
+
+def create_jobs(args: Dict) -> List[Dict]:
+    """
+    One job per episode to run, {"strategy": Strategy, "seed": int, "biased_agent": int | None, "game_id": int}.
+    The game id of a job is its index in the sweep, whichever chunk or worker runs it.
+    """
+    jobs = []
+    for model in args.model:
+        for biased_agent in args.biased_agent or [None]:
+            for seed in args.seed:
+                for name in args.strategy:
+                    strategy = STRATEGIES[name](
+                        model,
+                        fsm=args.fsm,
+                        no_model=args.no_model,
+                        infer_human=args.infer_human,
+                        send_message=args.send_message,
+                        receive_message=args.receive_message,
+                    )
+                    jobs.append(
+                        {"strategy": strategy, "seed": seed, "biased_agent": biased_agent, "game_id": len(jobs)}
+                    )
+    return jobs
+
+
+def get_file_path(job: Dict, mode: str, mock_llm: str | None = None, compress_traj: bool = False) -> str:
+    file_path = job["strategy"].result_path(mode, job["seed"], biased_agent_name.get(job["biased_agent"]))
+    if mock_llm:
+        # keep the mock runs apart from the real results
+        file_path = file_path.replace("results/", "results/mock/", 1)
+    return trajectory_path(file_path, compress_traj)
+
+
+def get_pending_jobs(
+    jobs: List[Dict], mode: str, mock_llm: str | None = None, compress_traj: bool = False
+) -> List[Tuple[int, Dict, str]]:
+    """
+    (game_id, job, file_path) of the jobs whose results do not exist yet in any format, duplicated result paths run
+    once.
+    """
+    pending, file_paths = [], set()
+    for i, job in enumerate(jobs):
+        game_id = job.get("game_id", i)
+        file_path = get_file_path(job, mode, mock_llm, compress_traj)
+        existing_path = find_trajectory(file_path)
+        if existing_path is not None or file_path in file_paths:
+            logger.warning(f"File {existing_path or file_path} already exists, skipping ...")
+            continue
+        file_paths.add(file_path)
+        pending.append((game_id, job, file_path))
+    return pending
+
+
+def setup_mock_llm(mock_llm: str | None, virtual_clock: bool = False) -> Callable | None:
+    """
+    Route the LLM calls to the mock LLM, returns the latency model of the virtual clock if any.
+    """
+    if not mock_llm:
+        return None
+    if not virtual_clock:
+        enable_mock_llm(mock_llm)
+        return None
+    # answer immediately, the modeled latencies are applied by the virtual clock
+    client = enable_mock_llm(mock_llm, time_scale=0, replay_latency=mock_llm != SYNTHESIZE)
+    return lambda model, messages, measured_latency: client.mock_llm.get_latency(model, messages)
+
+
+async def run_job(
+    job: Dict,
+    game_id: int,
+    conf: Dict,
+    env_conf: Dict,
+    scheduler: LLMScheduler,
+    semaphore: asyncio.Semaphore,
+    file_path: str,
+    display: bool = False,
+    virtual_clock: bool = False,
+    latency_model: Callable | None = None,
+) -> str | None:
+    """
+    Run the episode of a job and save its trajectory, a failed episode is logged and not saved.
+    """
+    async with semaphore:
+        try:
+            episode = Episode(
+                job["strategy"],
+                conf,
+                env_conf,
+                job["seed"],
+                biased_agent=job["biased_agent"],
+                game_id=game_id,
+                scheduler=scheduler,
+                display=display,
+                clock=VirtualClock() if virtual_clock else None,
+                latency_model=latency_model,
+                traj_path=file_path,
+            )
+            await episode.run()
+        except Exception:
+            logger.exception(f"Episode {game_id} ({file_path}) failed")
+            return None
+        logger.success(f"{episode.name} Save in {file_path}")
+        return file_path
+
+
+async def run_sweep(
+    jobs: List[Dict],
+    conf: Dict,
+    env_conf: Dict,
+    max_concurrent_episodes: int = 4,
+    mock_llm: str | None = None,
+    display: bool = False,
+    virtual_clock: bool = False,
+    latency_model: Callable | None = None,
+    compress_traj: bool = False,
+    on_episode_end: Callable[[int, str | None], None] | None = None,
+) -> List[str]:
+    """
+    Run the jobs whose results do not exist yet, returns the paths of the saved trajectories.
+    With `virtual_clock`, the episodes run in the simulation mode, see `runners.clock.VirtualClock`.
+    `on_episode_end(game_id, file_path)` is called when an episode ends, with None as path if it failed.
+    """
+    scheduler = LLMScheduler(
+        max_concurrency=conf.get("llm_max_concurrency", 8),
+        model_budgets=conf.get("llm_model_budgets") or {},
+    )
+
+    pending = get_pending_jobs(jobs, env_conf["mode"], mock_llm, compress_traj)
+    logger.success(f"{len(pending)} / {len(jobs)} episodes to run")
+
+    # warm start each LLM backend once
+    warm_started = set()
+    for _, job, _ in pending:
+        strategy: Strategy = job["strategy"]
+        key = (type(strategy).warm_start, strategy.model)
+        if key not in warm_started:
+            warm_started.add(key)
+            await strategy.warm_start(scheduler)
+
+    async def run_and_report(game_id: int, job: Dict, file_path: str) -> str | None:
+        saved_path = await run_job(
+            job, game_id, conf, env_conf, scheduler, semaphore, file_path, display, virtual_clock, latency_model
+        )
+        if on_episode_end is not None:
+            on_episode_end(game_id, saved_path)
+        return saved_path
+
+    report_task = asyncio.ensure_future(scheduler.report_metrics())
+    semaphore = asyncio.Semaphore(max_concurrent_episodes)
+    try:
+        results = await asyncio.gather(
+            *[run_and_report(game_id, job, file_path) for game_id, job, file_path in pending]
+        )
+    finally:
+        report_task.cancel()
+    logger.success(f"LLM scheduler metrics: {scheduler.get_metrics()}")
+    saved = [file_path for file_path in results if file_path is not None]
+    logger.success(f"{len(saved)} / {len(pending)} episodes saved")
+    return saved
+
+
+_worker_latency_model = None
+_worker_progress_queue = None
+
+
+def _init_worker(mock_llm: str | None, virtual_clock: bool, progress_queue) -> None:
+    global _worker_latency_model, _worker_progress_queue
+    from coop_marl.utils import utils
+
+    logger.remove()
+    logger.add(sys.stderr, level="ERROR")
+    logger.add(f"logs/llm_agent_run_{os.getpid()}.log", level="INFO")
+    _worker_latency_model = setup_mock_llm(mock_llm, virtual_clock)
+    _worker_progress_queue = progress_queue
+    # the episodes run from their own random states (see runners.random_state), whatever the worker ran before
+    utils.set_random_seed(0)
+
+
+def _run_chunk(
+    chunk: List[Dict],
+    conf: Dict,
+    env_conf: Dict,
+    max_concurrent_episodes: int,
+    mock_llm: str | None,
+    virtual_clock: bool,
+    compress_traj: bool,
+) -> List[Tuple[int, str | None]]:
+    """
+    Run a chunk in the worker, returns the (game_id, saved path or None) of its episodes, which are also put to the
+    progress queue as they end.
+    """
+    episodes = []
+
+    def _report_episode(game_id: int, file_path: str | None) -> None:
+        episodes.append((game_id, file_path))
+        _worker_progress_queue.put((game_id, file_path))
+
+    asyncio.run(
+        run_sweep(
+            chunk,
+            conf,
+            env_conf,
+            max_concurrent_episodes,
+            mock_llm,
+            virtual_clock=virtual_clock,
+            latency_model=_worker_latency_model,
+            compress_traj=compress_traj,
+            on_episode_end=_report_episode,
+        )
+    )
+    return episodes
+
+
+def run_sweep_parallel(
+    jobs: List[Dict],
+    conf: Dict,
+    env_conf: Dict,
+    n_workers: int | None = None,
+    max_concurrent_episodes: int = 4,
+    mock_llm: str | None = None,
+    virtual_clock: bool = False,
+    compress_traj: bool = False,
+    max_pool_restarts: int = 2,
+) -> List[str]:
+    """
+    Run the jobs whose results do not exist yet on `n_workers` processes (all cores if None or -1), each worker
+    runs chunks of `max_concurrent_episodes` episodes concurrently. The LLM concurrency and budgets in `conf` are
+    split evenly between the workers.
+
+    A failed episode, or a chunk failing with an exception, is logged and does not stop the sweep. If a worker dies
+    (e.g. OOM or segfault), the pool is broken for all the chunks not finished yet: the pool is rebuilt and these
+    chunks are submitted again, at most `max_pool_restarts` times, the episodes saved before are not run again. The
+    episodes that are not saved are run again by the next sweep.
+    """
+    pending = get_pending_jobs(jobs, env_conf["mode"], mock_llm, compress_traj)
+    # the chunks keep the game ids of the sweep
+    pending_jobs = [{**job, "game_id": game_id} for game_id, job, _ in pending]
+    file_paths = {game_id: file_path for game_id, _, file_path in pending}
+    chunks = [
+        pending_jobs[i : i + max_concurrent_episodes] for i in range(0, len(pending_jobs), max_concurrent_episodes)
+    ]
+    if n_workers is None or n_workers < 0:
+        n_workers = os.cpu_count()
+    logger.success(f"{len(pending)} / {len(jobs)} episodes to run in {len(chunks)} chunks on {n_workers} workers")
+
+    worker_conf = dict(conf)
+    worker_conf["llm_max_concurrency"] = max(1, math.ceil(conf.get("llm_max_concurrency", 8) / n_workers))
+    worker_conf["llm_model_budgets"] = {
+        model: {key: value / n_workers for key, value in budget.items()}
+        for model, budget in (conf.get("llm_model_budgets") or {}).items()
+    }
+
+    progress_queue = multiprocessing.Queue()
+    ended: Dict[int, str | None] = {}  # game id -> saved path, None if the episode failed
+
+    def _end_episodes(episodes: List[Tuple[int, str | None]]) -> None:
+        for game_id, file_path in episodes:
+            if game_id not in ended:
+                progress.update(1)
+            ended[game_id] = file_path
+        n_saved = sum(file_path is not None for file_path in ended.values())
+        progress.set_postfix(saved=n_saved, failed=len(ended) - n_saved)
+
+    def _drain_progress_queue() -> None:
+        episodes = []
+        while True:
+            try:
+                episodes.append(progress_queue.get_nowait())
+            except queue.Empty:
+                break
+        if episodes:
+            _end_episodes(episodes)
+
+    remaining_chunks, n_restarts = chunks, 0
+    with tqdm(total=len(pending_jobs), desc="Episodes", unit="ep") as progress:
+        while remaining_chunks:
+            broken_chunks = []
+            with VariableExecutor(
+                n_workers, initializer=_init_worker, initargs=(mock_llm, virtual_clock, progress_queue)
+            ) as pool:
+                futures = {
+                    pool.submit(
+                        _run_chunk,
+                        chunk,
+                        worker_conf,
+                        env_conf,
+                        max_concurrent_episodes,
+                        mock_llm,
+                        virtual_clock,
+                        compress_traj,
+                    ): chunk
+                    for chunk in remaining_chunks
+                }
+                not_done = set(futures)
+                while not_done:
+                    done, not_done = wait(not_done, timeout=0.5, return_when=FIRST_COMPLETED)
+                    _drain_progress_queue()
+                    for future in done:
+                        chunk = futures[future]
+                        try:
+                            _end_episodes(future.result())
+                            # the progress of a worker dying later may be lost, the results of the chunk are saved
+                            _end_episodes(
+                                [
+                                    (job["game_id"], find_trajectory(file_paths[job["game_id"]]))
+                                    for job in chunk
+                                    if job["game_id"] not in ended
+                                ]
+                            )
+                        except BrokenProcessPool:
+                            broken_chunks.append(chunk)
+                        except Exception as e:
+                            logger.error(f"Worker failed on a chunk of {len(chunk)} episodes: {e!r}")
+                            _end_episodes([(job["game_id"], None) for job in chunk if job["game_id"] not in ended])
+            _drain_progress_queue()
+
+            # the episodes ended before the pool broke are not run again
+            broken_chunks = [[job for job in chunk if job["game_id"] not in ended] for chunk in broken_chunks]
+            broken_chunks = [chunk for chunk in broken_chunks if chunk]
+            remaining_chunks = broken_chunks
+            if broken_chunks and n_restarts < max_pool_restarts:
+                n_restarts += 1
+                logger.error(
+                    f"A worker died, restart the pool for the {len(broken_chunks)} unfinished chunks "
+                    f"({n_restarts} / {max_pool_restarts})"
+                )
+            elif broken_chunks:
+                logger.error(f"A worker died again, give up the {len(broken_chunks)} unfinished chunks")
+                _end_episodes([(job["game_id"], None) for chunk in broken_chunks for job in chunk])
+                remaining_chunks = []
+
+    saved = [file_path for file_path in ended.values() if file_path is not None]
+    logger.success(f"{len(saved)} / {len(pending)} episodes saved, {len(pending) - len(saved)} failed")
+    return saved
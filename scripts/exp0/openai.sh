@@ -6,9 +6,5 @@ models=(
     "o3-mini"
 )
 
-for model in "${models[@]}"; do
-    for seed in {0..19}; do
-        echo "Running $model with seed $seed"
-        python llm_agent_run_act.py -m "$model" --seed "$seed"
-    done
-done
+echo "##### act #####"
+python llm_agent_run.py -s act -m "${models[@]}" --seed {0..19} --env_config_file config/envs/overcooked_single_agent_exp1.yaml
@@ -0,0 +1,151 @@
+import random
+
+import numpy as np
+import pytest
+
+from utils.astar import DStarLite, find_path, find_path_cooperative, reserve_paths
+
+
+def random_level(rng: random.Random):
+    # find_path gives up after (n_rows // 2) ** 10 iterations, too few with less than 4 rows
+    n_rows, n_columns = rng.randint(4, 10), rng.randint(3, 10)
+    return np.array([[int(rng.random() < 0.3) for _ in range(n_columns)] for _ in range(n_rows)])
+
+
+def assert_valid_path(path, start, goal, level):
+    assert path[0] == tuple(start) and path[-1] == tuple(goal)
+    for position, next_position in zip(path, path[1:]):
+        assert abs(position[0] - next_position[0]) + abs(position[1] - next_position[1]) == 1
+        assert level[next_position] == 0
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_dstar_lite(seed):
+    """
+    The paths repaired as the start moves and the blockers change are as short as find_path on the level with the
+    blockers, and empty when it finds none
+    """
+    rng = random.Random(seed)
+    n_compared = n_unreachable = 0
+    for _ in range(60):
+        level = random_level(rng)
+        free = [tuple(p) for p in np.argwhere(level == 0).tolist()]
+        if len(free) < 3:
+            continue
+        goal = rng.choice(free)
+        planner = DStarLite(level, goal)
+        start = rng.choice(free)
+        for _ in range(12):
+            blocked = {rng.choice(free) for _ in range(rng.randint(0, 2))} - {start}
+            blocked_level = level.copy()
+            for position in blocked:
+                blocked_level[position] = 1
+            expected = find_path(start, goal, blocked_level)
+            path = planner.find_path(start, blocked)
+            assert len(path) == len(expected), (level, start, goal, blocked)
+            n_compared += 1
+            if not path:
+                n_unreachable += 1
+                continue
+            assert_valid_path(path, start, goal, blocked_level)
+            if len(path) > 1 and rng.random() < 0.8:
+                start = path[1]
+    assert n_compared > 500 and n_unreachable > 0
+
+
+def test_dstar_lite_goal():
+    level = np.array([[0, 0, 0], [1, 1, 0], [0, 0, 0]])
+    planner = DStarLite(level, (2, 0))
+    assert planner.find_path((2, 0)) == [(2, 0)]
+    assert planner.find_path((0, 0)) == [(0, 0), (0, 1), (0, 2), (1, 2), (2, 2), (2, 1), (2, 0)]
+    # the only way is blocked, then free again
+    assert planner.find_path((0, 0), {(1, 2)}) == []
+    assert len(planner.find_path((0, 1))) == 6
+    # a goal on a counter is unreachable
+    assert DStarLite(level, (1, 0)).find_path((0, 0)) == []
+
+
+def assert_valid_timed_path(path, start, goal, level, reserved):
+    """
+    One position per tick from the start, waiting or moving one cell, never in a reserved cell
+    """
+    assert path[0] == tuple(start) and path[-1] == tuple(goal)
+    for t, (position, next_position) in enumerate(zip(path, path[1:])):
+        assert abs(position[0] - next_position[0]) + abs(position[1] - next_position[1]) <= 1
+        assert level[next_position] == 0
+        assert (next_position[0], next_position[1], t + 1) not in reserved
+
+
+def test_reserve_paths():
+    reserved = reserve_paths([[(1, 1), (1, 2)], [], [(3, 3)]], horizon=2)
+    assert reserved == {
+        (1, 1, 0),
+        (1, 1, 1),
+        (1, 2, 1),
+        (1, 2, 2),
+        (1, 2, 3),
+        (3, 3, 0),
+        (3, 3, 1),
+        (3, 3, 2),
+        (3, 3, 3),
+    }
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_cooperative_shortest(seed):
+    """
+    Without reservations, the paths are as short as find_path, with reservations they avoid them and are not shorter
+    """
+    rng = random.Random(seed)
+    n_compared = n_detours = 0
+    for _ in range(100):
+        level = random_level(rng)
+        free = [tuple(p) for p in np.argwhere(level == 0).tolist()]
+        if len(free) < 3:
+            continue
+        start, goal = rng.sample(free, 2)
+        expected = find_path(start, goal, level)
+        path = find_path_cooperative(start, goal, level, set(), horizon=64)
+        assert len(path) == len(expected)
+        if not path:
+            continue
+        assert_valid_timed_path(path, start, goal, level, set())
+        n_compared += 1
+
+        partner_path = [rng.choice(free)]
+        for _ in range(rng.randint(0, 6)):
+            x, y = partner_path[-1]
+            moves = [p for p in [(x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)] if p in free]
+            partner_path.append(rng.choice(moves) if moves else (x, y))
+        if start in partner_path or goal in partner_path:
+            continue
+        reserved = reserve_paths([partner_path], 64)
+        path = find_path_cooperative(start, goal, level, reserved, horizon=64)
+        if path:
+            assert_valid_timed_path(path, start, goal, level, reserved)
+            assert len(path) >= len(expected)
+            n_detours += len(path) > len(expected)
+    assert n_compared > 50 and n_detours > 0
+
+
+def test_cooperative_corridor():
+    """
+    A partner coming along a corridor with a pocket, the agent steps into the pocket instead of swapping cells
+    """
+    level = np.array(
+        [
+            [1, 0, 1],
+            [0, 0, 1],
+            [1, 0, 1],
+            [1, 0, 1],
+        ]
+    )
+    partner_path = [(3, 1), (2, 1), (1, 1), (0, 1)]
+    reserved = reserve_paths([partner_path], 16)
+    path = find_path_cooperative((0, 1), (3, 1), level, reserved, horizon=16)
+    assert_valid_timed_path(path, (0, 1), (3, 1), level, reserved)
+    assert (1, 0) in path
+    # the corridor is taken for longer than the horizon
+    assert find_path_cooperative((0, 1), (3, 1), level, reserved, horizon=3) == []
+    # a goal behind a counter
+    assert find_path_cooperative((0, 1), (0, 0), level, set()) == []
@@ -0,0 +1,160 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from runners import clock as clock_module
+from runners.clock import TickScheduler, VirtualClock
+
+
+def test_n_tick_of():
+    clock = VirtualClock(0.25)
+    assert [clock.n_tick_of(seconds) for seconds in [0, 0.1, 0.25, 0.25000001, 0.26, 1.0, 2.6]] == [
+        0,
+        1,
+        1,
+        1,
+        2,
+        4,
+        11,
+    ]
+
+
+def test_sleep():
+    async def main():
+        clock = VirtualClock(0.25)
+        woken = []
+
+        async def sleeper(name, seconds):
+            await clock.sleep(seconds)
+            woken.append((name, clock.n_tick))
+
+        tasks = [asyncio.ensure_future(sleeper(name, seconds)) for name, seconds in [("a", 1), ("b", 0.1), ("c", 0)]]
+        await asyncio.sleep(0)
+        for _ in range(6):
+            await clock.advance()
+        await asyncio.gather(*tasks)
+        # a sleep lasts at least one tick
+        return woken
+
+    assert asyncio.run(main()) == [("b", 1), ("c", 1), ("a", 4)]
+
+
+def test_pending_llm_call():
+    """
+    The game loop does not advance while a call is pending, the output is delivered after its latency in ticks
+    """
+
+    async def main():
+        clock = VirtualClock(0.25)
+        answered = asyncio.Event()
+        delivered = []
+
+        async def llm_call():
+            start_tick = clock.n_tick
+            with clock.pending():
+                await answered.wait()
+            await clock.sleep_until(start_tick + clock.n_tick_of(1.1))
+            delivered.append(clock.n_tick)
+
+        async def game_loop():
+            for _ in range(10):
+                await clock.advance()
+
+        await clock.advance()
+        call = asyncio.ensure_future(llm_call())
+        loop = asyncio.ensure_future(game_loop())
+        for _ in range(20):
+            await asyncio.sleep(0)
+        # waiting for the output
+        assert clock.n_tick == 1 and not loop.done()
+        answered.set()
+        await asyncio.gather(call, loop)
+        return delivered, clock.n_tick
+
+    assert asyncio.run(main()) == ([6], 11)
+
+
+def test_close():
+    async def main():
+        clock = VirtualClock()
+        sleeper = asyncio.ensure_future(clock.sleep(100))
+        await asyncio.sleep(0)
+        clock.close()
+        await asyncio.wait_for(sleeper, 1)
+        # sleeping after the episode returns at once
+        await asyncio.wait_for(clock.sleep(100), 1)
+
+    asyncio.run(main())
+
+
+class FakeTime:
+    """
+    Monotonic clock only advanced by the sleeps and the work of the test loop
+    """
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    async def sleep(self, delay: float) -> None:
+        self.now += delay
+
+
+def run_ticks(monkeypatch, works, **kwargs):
+    """
+    A game loop waiting for each tick then working `works[i]` seconds, returns the tick times, the dropped frames and
+    the scheduler
+    """
+    fake_time = FakeTime()
+    monkeypatch.setattr(clock_module, "time", SimpleNamespace(monotonic=fake_time.monotonic))
+    monkeypatch.setattr(clock_module, "asyncio", SimpleNamespace(sleep=fake_time.sleep))
+    scheduler = TickScheduler(0.25, **kwargs)
+
+    async def main():
+        tick_times, dropped = [], []
+        for work in works:
+            await scheduler.wait()
+            tick_times.append(fake_time.now)
+            fake_time.now += work
+            dropped.append(scheduler.drop_frame())
+        return tick_times, dropped
+
+    return *asyncio.run(main()), scheduler
+
+
+def test_tick_deadlines(monkeypatch):
+    # the work does not add to the period
+    tick_times, dropped, scheduler = run_ticks(monkeypatch, [0.1, 0.2, 0.0, 0.24])
+    assert tick_times == pytest.approx([0.25, 0.5, 0.75, 1.0])
+    assert not any(dropped)
+    stats = scheduler.stats()
+    assert stats["n_tick"] == 4 and stats["period"] == pytest.approx(0.25)
+    assert stats["overrun_max"] == pytest.approx(0) and stats["n_late"] == 0
+
+
+def test_tick_missed(monkeypatch):
+    works = [0.1, 0.1, 0.6, 0.1, 0.1, 0.1]
+    # the missed deadline of tick 4 is skipped, the next ones are shifted
+    tick_times, dropped, scheduler = run_ticks(monkeypatch, works, drop_frames=True)
+    assert tick_times == pytest.approx([0.25, 0.5, 0.75, 1.35, 1.5, 1.75])
+    assert dropped == [False, False, True, False, False, False]
+    stats = scheduler.stats()
+    assert (stats["n_missed"], stats["n_dropped"], stats["n_late"]) == (1, 1, 1)
+    assert stats["overrun_max"] == pytest.approx(0.35)
+    # the late ticks run back to back until on schedule
+    tick_times, dropped, scheduler = run_ticks(monkeypatch, works, catch_up=True)
+    assert tick_times == pytest.approx([0.25, 0.5, 0.75, 1.35, 1.45, 1.55])
+    assert not any(dropped)
+    assert scheduler.stats()["n_missed"] == 0 and scheduler.next_deadline == pytest.approx(1.75)
+    # too late to catch up
+    tick_times, _, scheduler = run_ticks(monkeypatch, [0.1, 0.1, 1.0, 0.1], catch_up=True, max_catch_up=1)
+    assert tick_times == pytest.approx([0.25, 0.5, 0.75, 1.75])
+    assert scheduler.stats()["n_missed"] == 3 and scheduler.next_deadline == pytest.approx(2.0)
+
+
+def test_tick_stats():
+    scheduler = TickScheduler()
+    assert scheduler.stats() == {"n_tick": 0} and scheduler.summary() == "no tick"
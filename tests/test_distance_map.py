@@ -0,0 +1,69 @@
+import random
+from collections import deque
+
+import numpy as np
+import pytest
+from gym_cooking.cooking_world.cooking_world import CookingWorld
+
+from utils.astar import find_path
+from utils.distance_map import UNREACHABLE, distance_map, get_distance_maps
+
+
+def bfs_distances(level, sources, blocked=()):
+    """
+    Plain BFS: the sources and the walkable cells are expanded, the other cells only reached
+    """
+    n_rows, n_columns = len(level), len(level[0])
+    blocked = set(blocked)
+    distances = [[UNREACHABLE] * n_columns for _ in range(n_rows)]
+    queue = deque()
+    for x, y in sources:
+        if distances[x][y] == UNREACHABLE:
+            distances[x][y] = 0
+            queue.append((x, y))
+    while queue:
+        x, y = queue.popleft()
+        if distances[x][y] > 0 and (level[x][y] != 0 or (x, y) in blocked):
+            continue
+        for nx, ny in [(x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)]:
+            if 0 <= nx < n_rows and 0 <= ny < n_columns and distances[nx][ny] == UNREACHABLE:
+                distances[nx][ny] = distances[x][y] + 1
+                queue.append((nx, ny))
+    return distances
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_distance_map(seed):
+    rng = random.Random(seed)
+    for _ in range(100):
+        n_rows, n_columns = rng.randint(1, 12), rng.randint(1, 12)
+        level = np.array([[int(rng.random() < 0.35) for _ in range(n_columns)] for _ in range(n_rows)])
+        cells = [(x, y) for x in range(n_rows) for y in range(n_columns)]
+        sources = rng.sample(cells, rng.randint(1, min(3, len(cells))))
+        blocked = rng.sample(cells, rng.randint(0, min(2, len(cells))))
+        distances = distance_map(level, sources, blocked)
+        assert distances.dtype == np.int16
+        assert distances.tolist() == bfs_distances(level, sources, blocked), (level, sources, blocked)
+
+
+def test_world_distances():
+    """
+    On the levels, the distance to a walkable cell is the length of the path of find_path, the maps are cached until
+    the world changes
+    """
+    for level_name in ["burger", "burger_aa_new", "bottleneck", "forced_coordination"]:
+        world = CookingWorld()
+        world.load_level(level_name, 2)
+        world.total_score = 0
+        level = np.array(world.level_array)
+        source = world.agents[0].location
+        distances = get_distance_maps(world).get([source])
+        for x, y in np.argwhere(level == 0).tolist():
+            path = find_path(source, (x, y), level)
+            assert distances[x, y] == (len(path) - 1 if path else UNREACHABLE), (level_name, (x, y))
+
+        maps = get_distance_maps(world)
+        assert maps is get_distance_maps(world)
+        assert maps.get([source]) is distances and not distances.flags.writeable
+        world.perform_agent_actions(world.agents, [0, 0])
+        assert maps.get([source]) is not distances
@@ -0,0 +1,129 @@
+import json
+
+from utils.history import History, _compact_state, _diff_state, estimate_tokens
+
+
+def json_state(t: int = 0, beef: int = 0, score: int = 0, orders=("BeefBurger",), other=None):
+    return {
+        "objects": {("Beef", "Fresh"): beef, ("Bread", ""): 2, ("Fire", ""): 0},
+        "counters": {"Empty": 10 - beef},
+        "inventory_other_player": {1: other},
+        "deliver_log": [],
+        "total_score": score,
+        "orders": [{"name": name, "remain_time": 100 - t} for name in orders],
+    }
+
+
+def test_compact_state():
+    state = _compact_state(json_state(beef=0))
+    assert state == {
+        "objects": {("Bread", ""): 2},
+        "counters": {"Empty": 10},
+        "orders": [{"name": "BeefBurger", "remain_time": 100}],
+    }
+
+
+def test_diff_state():
+    prev = _compact_state(json_state(t=0, beef=1, other="Plate"))
+    curr = _compact_state(json_state(t=5, beef=0))
+    # the removed entries are given as 0 and None, the remaining times of the same orders are not changes
+    assert _diff_state(prev, curr) == {
+        "objects": {("Beef", "Fresh"): 0},
+        "counters": {"Empty": 10},
+        "inventory_other_player": {1: None},
+    }
+    curr = _compact_state(json_state(t=5, beef=1, orders=("BeefBurger", "LettuceBurger"), other="Plate"))
+    assert _diff_state(prev, curr) == {"orders": curr["orders"]}
+
+
+def test_compact_history():
+    history = History(max_steps=100, compact=True)
+    for t in range(7):
+        history.add(t, json_state(t, beef=1 if t in (3, 4) else 0))
+    history.add_action(["prepare", "Beef", True], 1)
+    text = history.get_formatted_history(10, 0)
+    scenes = text.split("\n\n")
+    assert scenes[0].startswith("Scene 1:\n    Remained Timestep: 100,\n    Score: 0,\n    State: {")
+    assert "Action: {'Human': ('prepare', {'food': 'Beef', 'plate': True})}" in scenes[0]
+    assert scenes[1] == "Scene 2-3: no changes"
+    assert "State Changes: {'counters': {'Empty': 9}, 'objects': {('Beef', 'Fresh'): 1}}" in scenes[2]
+    assert scenes[3] == "Scene 5: no changes"
+    assert "State Changes: {'counters': {'Empty': 10}, 'objects': {('Beef', 'Fresh'): 0}}" in scenes[4]
+    # the last scene gives the full state
+    assert scenes[5].startswith("Scene 7:") and "    State: {" in scenes[5]
+
+
+def test_compact_history_max_tokens():
+    history = History(max_steps=100, compact=True)
+    for t in range(20):
+        history.add(t, json_state(t, beef=t % 2))
+    full = history.get_compact_history(20, 0)
+    max_tokens = estimate_tokens(full) // 2
+    text = history.get_compact_history(20, 0, max_tokens)
+    assert estimate_tokens(text) <= max_tokens
+    assert text.startswith("Scene ") and not text.startswith("Scene 1:")
+    assert text.endswith(full[full.index("Scene 20:") :])
+    # at least the last scene is kept
+    assert history.get_compact_history(20, 0, 1).startswith("Scene 20:")
+
+
+def test_snapshots_and_scene_cache():
+    history = History(max_steps=100)
+    state = json_state(0)
+    history.add(0, state)
+    state["objects"][("Beef", "Fresh")] = 5
+    assert history.get_history(1)[0].state["objects"][("Beef", "Fresh")] == 0
+
+    history.add(1, json_state(1))
+    text = history.get_formatted_history(2, 0)
+    assert history.get_formatted_history(2, 0) == text
+    assert set(history._scene_cache) == {0, 1}
+    history.add_message("Need beef", 0)
+    assert 1 not in history._scene_cache and 0 in history._scene_cache
+    text = history.get_formatted_history(2, 0)
+    assert "Message: {'You': 'Need beef'}" in text
+    assert "Message: {'Human': 'Need beef'}" in history.get_formatted_history(2, 1)
+
+
+def read_spill(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_ring_buffer():
+    history = History(max_steps=100, max_length=3)
+    for t in range(5):
+        history.add(t, json_state(t))
+    assert [info.timestep for info in history.get_history(10)] == [2, 3, 4]
+    assert history.n_dropped == 2 and history.n_added == 5
+    # scenes keep their numbers after the oldest are dropped
+    assert history.get_formatted_history(2, 0).startswith("Scene 4:")
+    # the scene of an action dropped from the buffer is the oldest scene
+    history.add_action(["serve", "BeefBurger"], 1)
+    assert history.get_history(3)[0].action == {1: ("serve", {"food": "BeefBurger"})}
+    assert history.last_human_action_index == 4
+    history.add_action(["putout_fire"], 1)
+    assert history.get_history(1)[0].action == {1: ("putout_fire", {})}
+
+
+def test_spill(tmp_path):
+    path = str(tmp_path / "history" / "spill.jsonl")
+    history = History(max_steps=100, max_length=2, spill_path=path)
+    for t in range(5):
+        history.add(t, json_state(t))
+    history.add_message("hello", 0)
+    history.close()
+    history.close()
+    records = read_spill(path)
+    assert [record["index"] for record in records] == [0, 1, 2, 3, 4]
+    assert [record["timestep"] for record in records] == [0, 1, 2, 3, 4]
+    assert records[-1]["message"] == {"0": "hello"}
+    assert records[0]["state"]["objects"]["('Bread', '')"] == 2
+
+    # the Infos spilled by close are not spilled again by reset, the next episode is appended
+    history.reset(max_steps=100)
+    history.add(0, json_state(0))
+    history.close()
+    records = read_spill(path)
+    assert [record["index"] for record in records] == [0, 1, 2, 3, 4, 0]
+    assert history.n_added == 1
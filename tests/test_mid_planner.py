@@ -0,0 +1,184 @@
+import json
+import os
+import random
+
+import numpy as np
+import pytest
+from gym_cooking.cooking_world.cooking_world import CookingWorld
+
+from agents.mid_agent import MidAgent
+from agents.mid_planner import MidPlanner
+from agents.text_agent import TextAgent
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+LEVELS = ["burger", "burger_aa_new", "bottleneck", "forced_coordination"]
+# mid actions choosing randomly (the recipe to assemble, the object to clean), and the seeds tried when running them
+RANDOM_MID_ACTIONS = ("assemble", "clean_a_counter")
+N_RANDOM_SEEDS = 4
+N_SEEDS_FAST_FORWARD = 2
+
+
+def new_world(level: str) -> CookingWorld:
+    world = CookingWorld()
+    world.load_level(level, 2)
+    world.total_score = 0
+    return world
+
+
+def describe_graphs() -> str:
+    """
+    The compiled graphs of the processes keyed by their parameters, with their predicates
+    """
+    planner = MidPlanner(TextAgent(new_world("burger"), 0), new_world("burger"))
+    # compile the graphs of pass_on, serve and putout_fire, no subtask is valid so no predicate is checked
+    for thing_status in MidPlanner.valid_actions["pass_on"]:
+        planner._can_pass_on([], **thing_status)
+    for food in MidPlanner.valid_actions["serve"]:
+        planner._can_serve([], **food)
+    planner._can_putout_fire([])
+
+    lines = []
+    for key, graph in sorted(MidPlanner.compile_processes().items(), key=lambda item: repr(item[0])):
+        if key[0] == "clean_a_counter":
+            continue
+        lines.append(f"{key!r}")
+        lines.append(graph.describe())
+        for i, (predicate, args) in enumerate(graph.predicates):
+            lines.append(f"  [{i}] {predicate.__name__}{args!r}")
+    return "\n".join(lines) + "\n"
+
+
+def decision_trace(level: str, seed: int, n_ticks: int = 150, fast_forward: bool = True) -> dict:
+    """
+    Two MidAgents running random mid actions (parameters included, valid or not) until they end, the actions of each
+    tick and the statuses of the mid actions ended as [tick, agent, mid action, params, status]
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+    rng = random.Random(seed)  # the choices of the mid actions, apart from the random state of the planners
+    world = new_world(level)
+    mid_agents = [MidAgent(TextAgent(world, i), world) for i in range(2)]
+    for mid_agent in mid_agents:
+        mid_agent.fast_forward = fast_forward
+    mid_actions = [None, None]
+    actions_trace, ended = [], []
+    for t in range(n_ticks):
+        actions = [0, 0]
+        for i, mid_agent in enumerate(mid_agents):
+            if mid_actions[i] is None:
+                func = rng.choice(sorted(MidPlanner.valid_actions))
+                mid_actions[i] = (func, rng.choice(MidPlanner.valid_actions[func]))
+            func, params = mid_actions[i]
+            end, actions[i], status = mid_agent.get_action(func, **params)
+            if end:
+                ended.append([t, i, func, params, status])
+                mid_actions[i] = None
+        world.perform_agent_actions(world.agents, actions)
+        actions_trace.append("".join(str(action) for action in actions))
+    return {"actions": " ".join(actions_trace), "ended": ended}
+
+
+def test_process_graphs():
+    """
+    The graphs compiled from the process tables, see tests/data/process_graphs.txt
+    """
+    with open(os.path.join(DATA_DIR, "process_graphs.txt"), encoding="utf-8") as f:
+        expected = f.read()
+    assert describe_graphs() == expected
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+@pytest.mark.parametrize("level", LEVELS)
+def test_decision_traces(level, seed):
+    """
+    The traces recorded with the planner before the processes were compiled into graphs
+    """
+    with open(os.path.join(DATA_DIR, "mid_planner_traces.json"), encoding="utf-8") as f:
+        expected = json.load(f)[f"{level} {seed}"]
+    trace = decision_trace(level, seed)
+    assert trace["actions"] == expected["actions"]
+    assert trace["ended"] == expected["ended"]
+
+
+def test_fast_forward(monkeypatch):
+    """
+    The traces are the same without skipping the idle ticks
+    """
+    n_skipped = 0
+    skip_idle_tick = TextAgent.skip_idle_tick
+
+    def counted_skip_idle_tick(text_agent):
+        nonlocal n_skipped
+        n_skipped += 1
+        return skip_idle_tick(text_agent)
+
+    monkeypatch.setattr(TextAgent, "skip_idle_tick", counted_skip_idle_tick)
+    for level in LEVELS:
+        for seed in range(N_SEEDS_FAST_FORWARD):
+            n_skipped_before = n_skipped
+            expected = decision_trace(level, seed, n_ticks=300, fast_forward=False)
+            assert n_skipped == n_skipped_before
+            assert decision_trace(level, seed, n_ticks=300) == expected, (level, seed)
+    assert n_skipped > 0
+
+
+def run_mid_action(text_agent: TextAgent, world: CookingWorld, func: str, params: dict, seed: int) -> bool:
+    """
+    Whether the mid action starts on a new planner, i.e., does not end at once
+    """
+    random_state = random.getstate()
+    random.seed(seed)
+    try:
+        end, _ = getattr(MidPlanner(text_agent, world), func)(**params)
+    finally:
+        random.setstate(random_state)
+    return not end
+
+
+def random_play_states(level: str, n_states: int, interval: int, seed: int = 0):
+    """
+    Yield the world and the MidAgents every `interval` ticks of two agents running random valid mid actions
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+    rng = random.Random(seed)
+    world = new_world(level)
+    mid_agents = [MidAgent(TextAgent(world, i), world) for i in range(2)]
+    mid_actions = [None, None]
+    for t in range(n_states * interval):
+        if t % interval == 0:
+            yield world, mid_agents
+        actions = [0, 0]
+        for i, mid_agent in enumerate(mid_agents):
+            if mid_actions[i] is None:
+                valid = mid_agent.mid_planner.get_valid_mid_actions()
+                options = [(func, params) for func, params_list in valid.items() for params in params_list]
+                if not options:
+                    continue
+                mid_actions[i] = rng.choice(options)
+            end, actions[i], _ = mid_agent.get_action(mid_actions[i][0], **mid_actions[i][1])
+            if end:
+                mid_actions[i] = None
+        world.perform_agent_actions(world.agents, actions)
+
+
+@pytest.mark.parametrize("level", LEVELS)
+def test_valid_mid_actions(level):
+    """
+    get_valid_mid_actions agrees with running every mid action from a new planner, valid if any of the seeds starts
+    for the mid actions choosing randomly
+    """
+    n_checked, n_valid = 0, 0
+    for world, mid_agents in random_play_states(level, n_states=25, interval=8):
+        for idx, mid_agent in enumerate(mid_agents):
+            valid = MidPlanner(mid_agent.text_agent, world).get_valid_mid_actions()
+            text_agent = TextAgent(world, idx)
+            for func, params_list in MidPlanner.valid_actions.items():
+                seeds = range(N_RANDOM_SEEDS) if func in RANDOM_MID_ACTIONS else [0]
+                for params in params_list:
+                    expected = any(run_mid_action(text_agent, world, func, params, seed) for seed in seeds)
+                    assert (params in valid[func]) == expected, (level, world.state_version, idx, func, params)
+                    n_valid += expected
+            n_checked += 1
+    assert n_checked == 50
+    assert n_valid > 0
@@ -0,0 +1,114 @@
+import asyncio
+import json
+
+from llms.mock_llm import (
+    SYNTHESIZE,
+    MockLLM,
+    get_client_model,
+    get_request_kind,
+    mid_action_to_act_output,
+)
+from llms.scheduler import LLMScheduler, current_game_id
+
+URGENT_RESPONSE = [
+    {"role": "system", "content": "You are a cook."},
+    {"role": "user", "content": "Give the code block representation of the new assigned tasks."},
+]
+REFLECTION = [{"role": "user", "content": "You should return new **Behavior Guidelines** as your reflection."}]
+
+
+def game_calls(mock_llm: MockLLM, game_id: int, n: int = 5):
+    token = current_game_id.set(game_id)
+    try:
+        return [mock_llm.get_output("4o", URGENT_RESPONSE) for _ in range(n)]
+    finally:
+        current_game_id.reset(token)
+
+
+def write_trajectory(path, outputs):
+    records = {
+        "traj": [],
+        "urgent_response": [
+            {"t": i, "input": [{"role": "user", "content": f"recorded {i}"}], "output": output, "latency": i + 1.0}
+            for i, output in enumerate(outputs)
+        ],
+        "reflection": [],
+        "text_action": [],
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(records, f)
+
+
+def test_request_kind():
+    assert get_request_kind(URGENT_RESPONSE) == "urgent_response"
+    assert get_request_kind(REFLECTION) == "reflection"
+    assert get_request_kind([{"role": "user", "content": "Hello! Who are you?"}]) == "other"
+    assert get_client_model("o3-mini-low") == "o3-mini"
+    assert get_client_model("4o-mini") == "4o-mini"
+    assert json.loads(mid_action_to_act_output("('pass_on', {'thing': 'Plate', 'thing_status': 'Empty'})")) == {
+        "action": {"type": "pass_on", "thing_status_pair": "Plate_Empty"}
+    }
+    assert mid_action_to_act_output("Working...") is None
+
+
+def test_synthesized_outputs():
+    output, latency = MockLLM(SYNTHESIZE, time_scale=0).get_output("4o", URGENT_RESPONSE)
+    assert output.startswith("```text\n") and "```json\n" in output
+    assert latency == 0
+    output, _ = MockLLM(SYNTHESIZE).get_output("4o", REFLECTION)
+    assert output.startswith("```text\n")
+
+
+def test_games_are_independent():
+    """
+    The outputs and latencies of a game do not depend on the calls of other games in between
+    """
+    alone = MockLLM(SYNTHESIZE)
+    expected = game_calls(alone, 0), game_calls(alone, 1)
+    interleaved = MockLLM(SYNTHESIZE)
+    calls = {0: [], 1: []}
+    for _ in range(5):
+        for game_id in [1, 0, 1]:
+            calls[game_id] += game_calls(interleaved, game_id, 1)
+    assert calls[0] == expected[0]
+    assert calls[1][:5] == expected[1]
+    assert expected[0] != expected[1]
+
+
+def test_replay(tmp_path):
+    write_trajectory(tmp_path / "a.json", ['```json\n["BeefBurger"]\n```', '```json\n["LettuceBurger"]\n```'])
+    mock_llm = MockLLM(str(tmp_path), replay_latency=True)
+    # the recorded output of the same input
+    output, latency = mock_llm.get_output("4o", [{"role": "user", "content": "recorded 1"}], kind="urgent_response")
+    assert (output, latency) == ('```json\n["LettuceBurger"]\n```', 2.0)
+    # the outputs of the kind in turn, each game from the first one
+    assert [output for output, _ in game_calls(mock_llm, 0, 3)] == [
+        '```json\n["BeefBurger"]\n```',
+        '```json\n["LettuceBurger"]\n```',
+        '```json\n["BeefBurger"]\n```',
+    ]
+    assert game_calls(mock_llm, 1, 1)[0] == ('```json\n["BeefBurger"]\n```', 1.0)
+    # no recorded reflection
+    assert mock_llm.get_output("4o", REFLECTION)[0].startswith("```text\n")
+
+
+def test_scheduler_game_ids():
+    """
+    The calls run by the scheduler are answered from the stream of the game of the request
+    """
+    mock_llm = MockLLM(SYNTHESIZE, time_scale=0)
+    expected = [output for output, _ in game_calls(MockLLM(SYNTHESIZE), 3, 4)]
+
+    async def llm_fn(model, messages, params=None):
+        await asyncio.sleep(0)
+        return mock_llm.get_output(model, messages)[0]
+
+    async def main():
+        scheduler = LLMScheduler(llm_fn, max_concurrency=2)
+        outputs = {}
+        for game_id in [3, 7, 3, 3, 7, 3]:
+            output = await scheduler.get_llm_output("4o", URGENT_RESPONSE, game_id=game_id)
+            outputs.setdefault(game_id, []).append(output)
+        return outputs
+
+    assert asyncio.run(main())[3] == expected
@@ -0,0 +1,272 @@
+import glob
+import json
+import os
+import random
+import re
+
+import numpy as np
+import pytest
+
+from agents.precondition import (
+    MAX_ORDER,
+    OBJECT_KEYS,
+    PreconditionError,
+    compile_precondition,
+    evaluate_preconditions,
+    state_vector,
+)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# the preconditions are quoted in the prompts, escaped in the json examples
+_PRECONDITION_PATTERN = re.compile(r'\\?"(lambda json_state:[^"\\\n]*)\\?"')
+FOODS = ["BeefBurger", "LettuceBurger", "BeefLettuceBurger"]
+
+
+def prompt_preconditions():
+    sources = set()
+    for path in glob.glob(os.path.join(ROOT, "prompts", "*.py")):
+        with open(path) as f:
+            sources.update(_PRECONDITION_PATTERN.findall(f.read()))
+    for path in glob.glob(os.path.join(ROOT, "prompts", "*.json")):
+        with open(path) as f:
+            for text in json.load(f).values():
+                sources.update(_PRECONDITION_PATTERN.findall(text))
+    return sorted(sources)
+
+
+PROMPT_PRECONDITIONS = prompt_preconditions()
+
+GRAMMAR_PRECONDITIONS = [
+    "lambda json_state: False",
+    "lambda s: s['objects'][('Beef', 'Fresh')] >= 1 and not s['objects'][('Plate', 'Empty')]",
+    "lambda s: s['objects'].get(('Bread', ''), 0) + 2 * s['objects'][('Lettuce', 'Chopped')] - 1 > 3",
+    "lambda s: 0 < s['objects'][('Beef', 'Well-cooked')] <= 2 or s['counters']['Empty'] != 0",
+    "lambda s: -s['total_score'] + 40 < 0",
+    "lambda s: len(s['orders']) > 2",
+    "lambda s: any(order['name'] == 'BeefBurger' for order in s['orders'])",
+    "lambda s: all(order['name'] in ['BeefBurger', 'BeefLettuceBurger'] for order in s['orders'])",
+    "lambda s: sum(1 for order in s['orders'] if order['name'] != 'LettuceBurger') == s['objects'][('Bread', '')]",
+    "lambda s: sum(order['name'] == 'LettuceBurger' for order in s['orders']) > 1",
+    "lambda s: s['orders'][1]['remain_time'] - s['orders'][0]['remain_time'] < 50",
+    f"lambda s: s['orders'][{MAX_ORDER - 1}]['remain_time'] > 0",
+]
+
+REJECTED_PRECONDITIONS = [
+    # not a lambda of the json state
+    "json_state['objects'][('Fire', '')] > 0",
+    "lambda: True",
+    "lambda a, b: True",
+    "lambda json_state: json_state['objects'][('Fire', '')] >",
+    # names
+    "lambda s: x > 0",
+    "lambda s: __import__ > 0",
+    # attributes
+    "lambda s: s.objects > 0",
+    "lambda s: s['objects'].__class__ > 0",
+    "lambda s: s['objects'].keys() > 0",
+    # calls
+    "lambda s: __import__('os').system('true') == 0",
+    "lambda s: print(s) is None",
+    "lambda s: max(s['objects'][('Fire', '')], 1) > 0",
+    "lambda s: s['objects'].get(('Fire', ''), 0, 1) > 0",
+    # unknown entries
+    "lambda s: s['objects'][('Fire', '', '')] > 0",
+    "lambda s: s['objects'][('Unicorn', '')] > 0",
+    "lambda s: s['inventory_other_player'][1] == 0",
+    "lambda s: s['orders'][0]['name'] == 'BeefBurger'",
+    "lambda s: s['orders'][-1]['remain_time'] > 0",
+    f"lambda s: s['orders'][{MAX_ORDER}]['remain_time'] > 0",
+    # non-linear
+    "lambda s: s['objects'][('Bread', '')] * s['objects'][('Plate', 'Empty')] > 0",
+    "lambda s: s['objects'][('Bread', '')] / 2 > 0",
+    "lambda s: s['objects'][('Bread', '')] is 0",
+]
+
+
+def sample_json_state(rng: random.Random, n_orders: int | None = None):
+    if n_orders is None:
+        n_orders = rng.randint(1, MAX_ORDER)
+    return {
+        "objects": {key: rng.choice([0, 0, 1, 2, 3]) for key in OBJECT_KEYS},
+        "counters": {"Empty": rng.randint(0, 6)},
+        "inventory_other_player": {1: None},
+        "deliver_log": [],
+        "total_score": rng.choice([0, 20, 40, 65, 100]),
+        "orders": sorted(
+            ({"name": rng.choice(FOODS), "remain_time": rng.randint(0, 300)} for _ in range(n_orders)),
+            key=lambda order: order["remain_time"],
+        ),
+    }
+
+
+def sample_json_states(n: int = 300, seed: int = 0):
+    rng = random.Random(seed)
+    return [sample_json_state(rng) for _ in range(n)]
+
+
+def test_prompt_examples_found():
+    assert len(PROMPT_PRECONDITIONS) > 10
+    assert "lambda json_state: json_state['orders'][0]['remain_time'] <= 100" in PROMPT_PRECONDITIONS
+
+
+@pytest.mark.parametrize("source", PROMPT_PRECONDITIONS)
+def test_prompt_examples(source):
+    """
+    The examples of the prompts compile and agree with eval, or are rejected where eval fails.
+    """
+    json_states = sample_json_states()
+    try:
+        precondition = compile_precondition(source)
+    except PreconditionError:
+        with pytest.raises(KeyError):
+            eval(source)(json_states[0])
+        return
+    expected = [eval(source)(json_state) for json_state in json_states]
+    assert [precondition(json_state) for json_state in json_states] == [bool(value) for value in expected]
+
+
+@pytest.mark.parametrize("source", GRAMMAR_PRECONDITIONS)
+def test_equivalent_to_eval(source):
+    precondition = compile_precondition(source)
+    n_compared = 0
+    for json_state in sample_json_states():
+        try:
+            expected = bool(eval(source)(json_state))
+        except IndexError:
+            # fewer orders than indexed, see test_missing_orders
+            with pytest.raises(IndexError):
+                precondition(json_state)
+            assert not precondition.holds(state_vector(json_state))
+            continue
+        assert precondition(json_state) == expected, json_state
+        n_compared += 1
+    assert n_compared >= 50
+
+
+@pytest.mark.parametrize("source", REJECTED_PRECONDITIONS)
+def test_rejected(source):
+    with pytest.raises(PreconditionError):
+        compile_precondition(source)
+
+
+def test_not_a_string():
+    with pytest.raises(PreconditionError):
+        compile_precondition(lambda json_state: True)
+
+
+def test_missing_orders():
+    """
+    A precondition reading the remaining time of a missing order raises like eval on a json state, so that the action
+    is rejected, and does not hold on the state vector, even negated.
+    """
+    rng = random.Random(0)
+    for source in [
+        "lambda json_state: json_state['orders'][0]['remain_time'] <= 30",
+        "lambda json_state: not json_state['orders'][2]['remain_time'] > 30",
+        "lambda json_state: json_state['total_score'] > 0 or json_state['orders'][2]['remain_time'] > 30",
+    ]:
+        precondition = compile_precondition(source)
+        for n_orders in range(MAX_ORDER + 1):
+            json_state = sample_json_state(rng, n_orders=n_orders)
+            json_state["total_score"] = 20
+            try:
+                expected = bool(eval(source)(json_state))
+            except IndexError:
+                with pytest.raises(IndexError):
+                    precondition(json_state)
+                expected = False
+            else:
+                assert precondition(json_state) == expected
+            assert precondition.holds(state_vector(json_state)) == expected
+            assert evaluate_preconditions([precondition], state_vector(json_state)).tolist() == [expected]
+    precondition = compile_precondition("lambda json_state: len(json_state['orders']) == 0")
+    assert precondition({"objects": {}})
+
+
+def holds(precondition, json_state) -> bool:
+    try:
+        return precondition(json_state)
+    except IndexError:
+        return False
+
+
+def test_evaluate_together():
+    sources = PROMPT_PRECONDITIONS + GRAMMAR_PRECONDITIONS
+    preconditions = []
+    for source in sources:
+        try:
+            preconditions.append(compile_precondition(source))
+        except PreconditionError:
+            pass
+    for json_state in sample_json_states(50, seed=1):
+        state = state_vector(json_state)
+        expected = [holds(precondition, json_state) for precondition in preconditions]
+        assert evaluate_preconditions(preconditions, state).tolist() == expected
+    states = np.stack([state_vector(json_state) for json_state in sample_json_states(50, seed=1)])
+    batch = evaluate_preconditions(preconditions, states)
+    assert batch.shape == (50, len(preconditions))
+
+
+def test_world_states():
+    """
+    The counts vector of the json states of a world, played randomly, agrees with the dict lookups of eval.
+    """
+    from gym_cooking.cooking_world.cooking_world import CookingWorld
+
+    world = CookingWorld()
+    world.load_level("burger_aa_new", 2)
+    world.total_score = 0
+    rng = random.Random(0)
+    sources = [source for source in GRAMMAR_PRECONDITIONS if "remain_time" not in source]
+    preconditions = [compile_precondition(source) for source in sources]
+    for _ in range(100):
+        world.perform_agent_actions(world.agents, [rng.randint(0, 5) for _ in world.agents])
+        json_state = world.get_json_state_simple(0)
+        json_state["orders"] = [{"name": rng.choice(FOODS), "remain_time": 100}]
+        for source, precondition in zip(sources, preconditions):
+            assert precondition(json_state) == bool(eval(source)(json_state)), source
+
+
+@pytest.mark.parametrize(
+    "change",
+    [
+        lambda objects: objects.__setitem__(("Bread", ""), 5),
+        lambda objects: objects.update({("Bread", ""): 5}),
+        lambda objects: objects.update(a=1),
+        lambda objects: objects.__ior__({("Bread", ""): 5}),
+        lambda objects: objects.pop(("Bread", "")),
+        lambda objects: objects.popitem(),
+        lambda objects: objects.__delitem__(("Bread", "")),
+        lambda objects: objects.clear(),
+        lambda objects: objects.setdefault(("Unicorn", ""), 1),
+    ],
+)
+def test_changed_world_objects(change):
+    """
+    The state vector of a json state follows the objects dict changed after get_json_state_simple
+    """
+    from gym_cooking.cooking_world.cooking_world import CookingWorld
+
+    world = CookingWorld()
+    world.load_level("burger", 2)
+    world.total_score = 0
+    json_state = world.get_json_state_simple(0)
+    assert json_state["objects"].vector is not None
+    change(json_state["objects"])
+    assert json_state["objects"].vector is None
+    assert (
+        state_vector(json_state).tolist()
+        == state_vector({**json_state, "objects": dict(json_state["objects"])}).tolist()
+    )
+
+
+def test_unchanged_world_objects():
+    from gym_cooking.cooking_world.cooking_world import CookingWorld
+
+    world = CookingWorld()
+    world.load_level("burger", 2)
+    world.total_score = 0
+    objects = world.get_json_state_simple(0)["objects"]
+    objects.setdefault(("Bread", ""), 5)
+    objects.pop(("Unicorn", ""), None)
+    assert objects.vector is not None
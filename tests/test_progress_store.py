@@ -0,0 +1,73 @@
+import asyncio
+import json
+import os
+
+from webapp.progress_store import ProgressStore
+
+PROGRESS = {"user": {"game_sequence": [0, 1], "game_sequence_idx": 1, "config": {}, "game_id": "é"}}
+
+
+def write_json(path, data):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+
+def test_recover(tmp_path):
+    path = str(tmp_path / "progress.json")
+    assert ProgressStore(path).data == {}
+    write_json(path, {"old": {}})
+    assert ProgressStore(path).data == {"old": {}}
+    # a crash between writing the temporary file and renaming it
+    write_json(path + ".tmp", PROGRESS)
+    assert ProgressStore(path).data == PROGRESS
+    # a crash while writing it
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        f.write(json.dumps(PROGRESS)[:20])
+    assert ProgressStore(path).data == {"old": {}}
+
+
+def test_flush(tmp_path):
+    path = str(tmp_path / "new" / "progress.json")
+    store = ProgressStore(path)
+    store.data.update(PROGRESS)
+    asyncio.run(store.flush())
+    assert not os.path.exists(path + ".tmp")
+    assert ProgressStore(path).data == PROGRESS
+    store.data["other"] = {}
+    store.flush_sync()
+    assert ProgressStore(path).data == {**PROGRESS, "other": {}}
+
+
+def test_run(tmp_path):
+    """
+    The changes within the flush interval are written once, a failed write is retried
+    """
+    path = str(tmp_path / "progress.json")
+    store = ProgressStore(path, flush_interval=0.05)
+    writes = []
+    write = store._write
+
+    def failing_write(text):
+        writes.append(json.loads(text))
+        if len(writes) == 2:
+            raise OSError("disk full")
+        write(text)
+
+    store._write = failing_write
+
+    async def main():
+        task = asyncio.ensure_future(store.run())
+        for i in range(3):
+            store.data[str(i)] = {}
+            store.mark_dirty()
+            await asyncio.sleep(0)
+        await asyncio.sleep(0.2)
+        store.data["3"] = {}
+        store.mark_dirty()
+        await asyncio.sleep(0.3)
+        task.cancel()
+
+    asyncio.run(main())
+    assert writes[0] == {"0": {}, "1": {}, "2": {}}
+    assert writes[1:] == [{"0": {}, "1": {}, "2": {}, "3": {}}] * 2
+    assert ProgressStore(path).data == {"0": {}, "1": {}, "2": {}, "3": {}}
@@ -0,0 +1,117 @@
+import asyncio
+import random
+
+import numpy as np
+import pytest
+from gym_cooking.cooking_world.cooking_world import CookingWorld
+
+from agents.mid_agent import MidAgent
+from agents.mid_planner import MidPlanner
+from agents.text_agent import TextAgent
+from runners.random_state import EpisodeRandomState
+
+
+def draws(n: int = 5):
+    return [random.random() for _ in range(n)] + list(np.random.rand(n))
+
+
+async def play(level: str, n_ticks: int = 60, n_yields: int = 1) -> list:
+    """
+    Two MidAgents on a new world choosing random mid actions from the global random state, yielding to the event loop
+    `n_yields` times between the ticks like the game loop of an episode
+    """
+    world = CookingWorld()
+    world.load_level(level, 2)
+    world.total_score = 0
+    mid_agents = [MidAgent(TextAgent(world, i), world) for i in range(2)]
+    mid_actions = [None, None]
+    trace = []
+    for _ in range(n_ticks):
+        actions = [0, 0]
+        for i, mid_agent in enumerate(mid_agents):
+            if mid_actions[i] is None:
+                func = random.choice(sorted(MidPlanner.valid_actions))
+                mid_actions[i] = (func, random.choice(MidPlanner.valid_actions[func]))
+            end, actions[i], _ = mid_agent.get_action(mid_actions[i][0], **mid_actions[i][1])
+            if end:
+                mid_actions[i] = None
+        world.perform_agent_actions(world.agents, actions)
+        trace.append(tuple(actions))
+        for _ in range(n_yields):
+            await asyncio.sleep(0)
+    return trace
+
+
+async def noise() -> None:
+    # another user of the global random state, e.g. an episode not wrapped
+    for _ in range(500):
+        random.random()
+        np.random.rand()
+        await asyncio.sleep(0)
+
+
+def test_activate():
+    random_state = EpisodeRandomState(0)
+    random.seed(1)
+    np.random.seed(1)
+    expected_global = draws()
+    random.seed(1)
+    np.random.seed(1)
+    with random_state.activate():
+        first = draws()
+    assert draws() == expected_global
+    with random_state.activate():
+        second = draws()
+    random.seed(0)
+    np.random.seed(0)
+    assert first + second == draws() + draws()
+
+
+def test_concurrent_episodes():
+    """
+    Each episode gives the same trace whether it runs alone or along others interleaving differently
+    """
+
+    async def alone(level):
+        return await EpisodeRandomState(0).run(play(level))
+
+    async def together():
+        return await asyncio.gather(
+            EpisodeRandomState(0).run(play("burger", n_yields=1)),
+            EpisodeRandomState(0).run(play("burger_aa_new", n_yields=3)),
+            noise(),
+            EpisodeRandomState(0).run(play("burger", n_yields=2)),
+        )
+
+    expected = {level: asyncio.run(alone(level)) for level in ["burger", "burger_aa_new"]}
+    traces = asyncio.run(together())
+    assert traces[0] == expected["burger"]
+    assert traces[1] == expected["burger_aa_new"]
+    assert traces[3] == expected["burger"]
+
+
+def test_run_result_and_errors():
+    random_state = EpisodeRandomState(0)
+
+    async def returns():
+        await asyncio.sleep(0)
+        return random.random()
+
+    async def fails():
+        await asyncio.sleep(0)
+        raise ValueError("episode failed")
+
+    random.seed(0)
+    expected = random.random()
+    assert asyncio.run(random_state.run(returns())) == expected
+    with pytest.raises(ValueError):
+        asyncio.run(random_state.run(fails()))
+
+    async def cancelled():
+        task = asyncio.ensure_future(random_state.run(asyncio.sleep(10)))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancelled())
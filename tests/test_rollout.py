@@ -0,0 +1,54 @@
+import random
+
+import numpy as np
+from gym_cooking.cooking_world.cooking_world import CookingWorld
+
+from agents.rollout import MidActionEvaluator
+
+CANDIDATES = [
+    ("prepare", {"food": "Beef", "plate": True}),
+    ("prepare", {"food": "Lettuce", "plate": False}),
+    ("prepare", {"food": "Bread", "plate": False}),
+]
+
+
+def new_world(level: str = "burger_aa_new") -> CookingWorld:
+    world = CookingWorld()
+    world.load_level(level, 2)
+    world.total_score = 0
+    return world
+
+
+def test_evaluate():
+    """
+    The rollouts leave the world and the global random states unchanged, and give the same results in processes
+    """
+    world = new_world()
+    locations = [agent.location for agent in world.agents]
+    random.seed(1)
+    np.random.seed(1)
+    expected_random = random.random(), np.random.rand()
+    random.seed(1)
+    np.random.seed(1)
+    evaluator = MidActionEvaluator(40)
+    partner = {1: ("prepare", {"food": "Lettuce", "plate": False})}
+    results = evaluator.evaluate(world, 0, CANDIDATES, partner)
+    assert (random.random(), np.random.rand()) == expected_random
+    assert [agent.location for agent in world.agents] == locations
+    assert [result.mid_action for result in results] == CANDIDATES
+    assert all(result.succeeded for result in results[1:])
+    assert evaluator.best(world, 0, CANDIDATES, partner) == min(results, key=lambda result: result.cost).mid_action
+
+    pool_evaluator = MidActionEvaluator(40, n_workers=2)
+    try:
+        assert pool_evaluator.evaluate(world, 0, CANDIDATES, partner) == results
+    finally:
+        pool_evaluator.close()
+    assert pool_evaluator._pool is None
+    # closing twice is a no-op
+    pool_evaluator.close()
+
+
+def test_horizon():
+    result = MidActionEvaluator(2).evaluate(new_world(), 0, CANDIDATES[:1])[0]
+    assert (result.ticks, result.succeeded, result.failed, result.status) == (2, False, False, "Working...")
@@ -0,0 +1,119 @@
+import random
+
+import pytest
+from gym_cooking.cooking_world.cooking_world import CookingWorld
+
+from agents.precondition import compile_precondition
+from agents.rule_agent import OrderPatternTrie, PatternMatch, RuleAgent
+from agents.text_agent import TextAgent
+
+FOODS = ["BeefBurger", "LettuceBurger", "BeefLettuceBurger"]
+
+
+def sorted_prefix_match(order_tuples, orders):
+    """
+    The matching before the trie, the first of the order tuples sorted by length that is a prefix of the orders
+    """
+    for o_t in sorted(list(order_tuples), key=len, reverse=True):
+        if orders[: len(o_t)] == list(o_t):
+            return o_t
+    return None
+
+
+def random_order_tuples(rng: random.Random):
+    order_tuples = {tuple(rng.choices(FOODS, k=rng.randint(1, 4))) for _ in range(rng.randint(0, 8))}
+    if rng.random() < 0.2:
+        order_tuples.add(())
+    return list(order_tuples)
+
+
+def random_steps(rng: random.Random):
+    """
+    Steps of a pattern, the orders to prepare and the mid actions
+    """
+    steps = []
+    for _ in range(rng.randint(0, 8)):
+        if rng.random() < 0.6:
+            steps.append(rng.choice(FOODS))
+        else:
+            steps.append({"mid_action": "serve", "food": rng.choice(FOODS)})
+    return tuple(steps)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_longest_match(seed):
+    rng = random.Random(seed)
+    for _ in range(200):
+        order_tuples = random_order_tuples(rng)
+        trie = OrderPatternTrie(order_tuples)
+        for _ in range(10):
+            orders = rng.choices(FOODS, k=rng.randint(0, 5))
+            assert trie.longest_match(orders) == sorted_prefix_match(order_tuples, orders), (order_tuples, orders)
+
+
+def test_longest_match_prefixes():
+    trie = OrderPatternTrie([("BeefBurger",), ("BeefBurger", "LettuceBurger", "BeefBurger"), ()])
+    assert trie.longest_match(["BeefBurger", "LettuceBurger"]) == ("BeefBurger",)
+    assert trie.longest_match(["BeefBurger", "LettuceBurger", "BeefBurger", "BeefBurger"]) == (
+        "BeefBurger",
+        "LettuceBurger",
+        "BeefBurger",
+    )
+    assert trie.longest_match(["LettuceBurger"]) == ()
+    assert OrderPatternTrie().longest_match(["BeefBurger"]) is None
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_pattern_match(seed):
+    """
+    The cursor agrees with the list of the remaining steps popped and removed from before
+    """
+    rng = random.Random(seed)
+    for _ in range(200):
+        steps = random_steps(rng)
+        pattern_match = PatternMatch(("BeefBurger",), steps)
+        remaining = list(steps)
+        for _ in range(rng.randint(0, 12)):
+            assert pattern_match.current() == (remaining[0] if remaining else None), (steps, remaining)
+            if not remaining:
+                break
+            if rng.random() < 0.5:
+                pattern_match.advance()
+                remaining.pop(0)
+            else:
+                food = rng.choice(FOODS)
+                pattern_match.remove(food)
+                if food in remaining:
+                    remaining.remove(food)
+        assert repr(pattern_match) == f"PatternMatch({('BeefBurger',)}, {remaining})"
+        assert pattern_match.steps == steps
+
+
+def test_behavior_patterns():
+    """
+    The (precondition, action) steps of the behavior patterns are kept as compiled pairs, the invalid ones dropped
+    """
+    world = CookingWorld()
+    world.load_level("burger", 2)
+    world.total_score = 0
+    agent = RuleAgent(TextAgent(world, 0), world)
+    agent.dummy_json_state = {**world.get_json_state_simple(0), "orders": [{"name": "BeefBurger", "remain_time": 100}]}
+    serve = ("serve", {"food": "BeefBurger"})
+    fire = "lambda json_state: json_state['objects'][('Fire', '')] > 0"
+    agent.update_assignments(
+        behavior_patterns={
+            ("BeefBurger",): [
+                "BeefBurger",
+                ("lambda json_state: True", serve),
+                ("lambda json_state: x > 0", serve),
+                ("lambda json_state: True", ("serve", {"food": "Unicorn"})),
+            ],
+            fire: ("putout_fire", {}),
+            "lambda json_state: json_state['orders'][3]['remain_time'] > 0": ("putout_fire", {}),
+        }
+    )
+    assert agent.order_patterns == {
+        ("BeefBurger",): ("BeefBurger", (compile_precondition("lambda json_state: True"), serve))
+    }
+    assert agent.action_patterns == {compile_precondition(fire): ("putout_fire", {})}
+    assert agent.order_pattern_trie.longest_match(["BeefBurger", "LettuceBurger"]) == ("BeefBurger",)
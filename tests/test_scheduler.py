@@ -0,0 +1,172 @@
+import asyncio
+
+import pytest
+
+from llms.scheduler import (
+    LLMRequestCancelled,
+    LLMScheduler,
+    Priority,
+    estimate_message_tokens,
+    is_staggered_trigger,
+)
+
+
+def messages(n_chars: int = 16):
+    return [{"role": "user", "content": "x" * n_chars}]
+
+
+class BlockingLLM:
+    """
+    LLM function answering in the order of the calls when released, records the calls as (model, content)
+    """
+
+    def __init__(self, blocking: bool = True) -> None:
+        self.calls = []
+        self.release = asyncio.Event()
+        if not blocking:
+            self.release.set()
+
+    async def __call__(self, model, messages, params=None) -> str:
+        self.calls.append((model, messages[0]["content"]))
+        await self.release.wait()
+        return messages[0]["content"]
+
+
+async def settle() -> None:
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def test_priority_and_fairness():
+    async def main():
+        llm = BlockingLLM()
+        scheduler = LLMScheduler(llm, max_concurrency=1)
+        first = asyncio.ensure_future(scheduler.get_llm_output("m", messages(0), game_id=0))
+        await settle()
+        requests = [
+            asyncio.ensure_future(scheduler.get_llm_output("m", [{"content": content}], game_id=game_id, priority=p))
+            for content, game_id, p in [
+                ("reflection 1", 1, Priority.REFLECTION),
+                ("urgent 0", 0, Priority.URGENT_RESPONSE),
+                ("urgent 2", 2, Priority.URGENT_RESPONSE),
+            ]
+        ]
+        await settle()
+        assert len(llm.calls) == 1 and scheduler.queue_length() == 3
+        llm.release.set()
+        await asyncio.gather(first, *requests)
+        # urgent responses first, the game served least recently first
+        assert [content for _, content in llm.calls[1:]] == ["urgent 2", "urgent 0", "reflection 1"]
+        metrics = scheduler.get_metrics()
+        assert metrics["queue_time"]["URGENT_RESPONSE"]["n"] == 3
+        assert metrics["queue_time"]["REFLECTION"]["n"] == 1
+        assert metrics["in_flight"] == 0 and metrics["queued"] == 0
+
+    asyncio.run(main())
+
+
+def test_max_concurrency():
+    async def main():
+        llm = BlockingLLM()
+        scheduler = LLMScheduler(llm, max_concurrency=2)
+        futures = [asyncio.ensure_future(scheduler.get_llm_output("m", messages(), game_id=i)) for i in range(5)]
+        await settle()
+        assert len(llm.calls) == 2 and scheduler.n_in_flight == 2
+        llm.release.set()
+        await asyncio.gather(*futures)
+        assert len(llm.calls) == 5 and scheduler.n_in_flight == 0
+
+    asyncio.run(main())
+
+
+def test_budget_ordering():
+    """
+    A request waiting for the budget of its model blocks the lower priorities of the same model, not other models
+    """
+
+    async def main():
+        llm = BlockingLLM(blocking=False)
+        # 100 tokens per second
+        scheduler = LLMScheduler(llm, model_budgets={"a": {"tpm": 6000}})
+        await scheduler.get_llm_output("a", messages(40000), game_id=0)  # empties the bucket
+        requests = [
+            asyncio.ensure_future(scheduler.get_llm_output(model, [{"content": content}], game_id=1, priority=p))
+            for model, content, p in [
+                ("a", "urgent a", Priority.URGENT_RESPONSE),
+                ("a", "reflection a", Priority.REFLECTION),
+                ("b", "reflection b", Priority.REFLECTION),
+            ]
+        ]
+        await settle()
+        assert [content for _, content in llm.calls[1:]] == ["reflection b"]
+        await asyncio.wait_for(asyncio.gather(*requests), 2)
+        assert [content for _, content in llm.calls[1:]] == ["reflection b", "urgent a", "reflection a"]
+
+    asyncio.run(main())
+
+
+def test_sooner_wakeup():
+    """
+    A request whose budget frees up sooner than the pending wakeup does not wait for it
+    """
+
+    async def main():
+        llm = BlockingLLM(blocking=False)
+        scheduler = LLMScheduler(llm, model_budgets={"slow": {"tpm": 60}, "fast": {"tpm": 6000}})
+        await scheduler.get_llm_output("slow", messages(4000), game_id=0)
+        await scheduler.get_llm_output("fast", messages(40000), game_id=1)
+        slow = asyncio.ensure_future(scheduler.get_llm_output("slow", messages(), game_id=0))
+        await settle()
+        await asyncio.wait_for(scheduler.get_llm_output("fast", messages(), game_id=1), 1)
+        assert not slow.done()
+        scheduler.cancel_game(0)
+        with pytest.raises(LLMRequestCancelled):
+            await slow
+
+    asyncio.run(main())
+
+
+def test_cancel_game():
+    async def main():
+        llm = BlockingLLM()
+        scheduler = LLMScheduler(llm, max_concurrency=1)
+        in_flight = asyncio.ensure_future(scheduler.get_llm_output("m", messages(), game_id=0))
+        await settle()
+        queued = [
+            asyncio.ensure_future(scheduler.get_llm_output("m", [{"content": f"game {game_id}"}], game_id=game_id))
+            for game_id in [0, 1, 0]
+        ]
+        await settle()
+        scheduler.cancel_game(0)
+        assert scheduler.queue_length() == 1
+        llm.release.set()
+        # the request in flight is not cancelled
+        assert await in_flight == "x" * 16
+        assert await queued[1] == "game 1"
+        for future in [queued[0], queued[2]]:
+            with pytest.raises(LLMRequestCancelled):
+                await future
+        assert [content for _, content in llm.calls[1:]] == ["game 1"]
+
+    asyncio.run(main())
+
+
+def test_failed_request():
+    async def main():
+        async def llm_fn(model, messages, params=None):
+            raise RuntimeError("rate limited")
+
+        scheduler = LLMScheduler(llm_fn)
+        with pytest.raises(RuntimeError):
+            await scheduler.get_llm_output("m", messages())
+        assert scheduler.get_metrics()["failed"] == {"m": 1}
+        assert scheduler.n_in_flight == 0
+
+    asyncio.run(main())
+
+
+def test_helpers():
+    assert estimate_message_tokens(messages(40)) == 14
+    fired = [step for step in range(1, 101) if is_staggered_trigger(step, 25, 1, 5)]
+    assert fired == [30, 55, 80]
+    assert not is_staggered_trigger(0, 25, 0, 1)
@@ -0,0 +1,98 @@
+import random
+
+from gym_cooking.cooking_world.cooking_world import CookingWorld
+
+from utils.state_record import StateRecorder, load_states, state_record_path
+from utils.trajectory import TrajectoryWriter, load_trajectory
+
+MAX_ORDER = 4
+
+
+class WorldOrders:
+    """
+    The world with a list of (food, remain_time) orders, recorded like `OvercookedMaker.get_state_record`
+    """
+
+    def __init__(self, world: CookingWorld, orders) -> None:
+        self.world = world
+        self.orders = orders
+
+    def get_state_record(self, agent_idx, out):
+        col = self.world.get_state_record(agent_idx, out)
+        out[col:] = -1
+        for food, remain_time in self.orders[:MAX_ORDER]:
+            out[col] = CookingWorld.STATE_OBJECT_IDS[(food, "")]
+            out[col + 1] = remain_time
+            col += 2
+        return col
+
+    def json_state(self, agent_idx):
+        json_state = self.world.get_json_state_simple(agent_idx)
+        del json_state["deliver_log"]
+        json_state["objects"] = dict(json_state["objects"])
+        json_state["orders"] = [{"name": food, "remain_time": t} for food, t in self.orders[:MAX_ORDER]]
+        return json_state
+
+
+def random_play(level: str, agent_idx: int, n_steps: int, seed: int = 0):
+    """
+    Yield the step and the env of a world played randomly, with random orders
+    """
+    rng = random.Random(seed)
+    world = CookingWorld()
+    world.load_level(level, 2)
+    world.total_score = 0
+    env = WorldOrders(world, [])
+    for t in range(n_steps):
+        env.orders = [
+            (rng.choice(["BeefBurger", "LettuceBurger", "BeefLettuceBurger"]), rng.randint(0, 300))
+            for _ in range(rng.randint(0, MAX_ORDER + 1))
+        ]
+        world.total_score = rng.randint(0, 100)
+        yield t, env
+        world.perform_agent_actions(world.agents, [rng.randint(0, 5) for _ in world.agents])
+
+
+def new_recorder(n_steps: int, agent_idx: int) -> StateRecorder:
+    return StateRecorder(CookingWorld.STATE_OBJECT_KEYS, 2, MAX_ORDER, n_steps, agent_idx)
+
+
+def test_decode():
+    for agent_idx in [0, 1]:
+        recorder = new_recorder(50, agent_idx)
+        for t, env in random_play("burger_aa_new", agent_idx, 200, seed=agent_idx):
+            recorder.record(env, t)
+            assert recorder.decode(t) == env.json_state(agent_idx), t
+        # the array grows past the preallocated steps
+        assert recorder.n_recorded == 200 and len(recorder.states) >= 200
+
+
+def test_not_recorded():
+    recorder = new_recorder(10, 0)
+    for t, env in random_play("burger", 0, 3):
+        recorder.record(env, 2 * t)
+    assert recorder.decode(1) is None and recorder.decode(2) is not None
+    assert recorder.n_recorded == 5
+
+
+def test_save_and_attach(tmp_path):
+    """
+    The saved states decode the same, and load_trajectory attaches them to the traj records as their str
+    """
+    traj_path = str(tmp_path / "dpt" / "4o-0.jsonl")
+    writer = TrajectoryWriter(traj_path)
+    recorder = new_recorder(20, 1)
+    expected = []
+    for t, env in random_play("burger", 1, 20):
+        recorder.record(env, t)
+        expected.append(recorder.decode(t))
+        writer.add("traj", {"t": t, "score": 0})
+    writer.add("traj", {"t": 20, "score": 0, "state": "kept"})
+    writer.close()
+    recorder.save(state_record_path(traj_path))
+    assert state_record_path(traj_path) == str(tmp_path / "dpt" / "4o-0.states.npz")
+
+    states = load_states(state_record_path(traj_path))
+    assert [states.decode(t) for t in range(20)] == expected
+    traj = load_trajectory(traj_path)["traj"]
+    assert [record["state"] for record in traj] == [str(state) for state in expected] + ["kept"]
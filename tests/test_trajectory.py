@@ -0,0 +1,98 @@
+import json
+import os
+
+import pytest
+
+from utils.trajectory import (
+    PARTIAL_SUFFIX,
+    TrajectoryWriter,
+    find_trajectory,
+    load_trajectory,
+    trajectory_path,
+)
+
+RECORDS = [
+    ("traj", {"t": 0, "score": 0, "message": [], "mid_action": None, "action": [0, 0]}),
+    ("urgent_response", {"t": 0, "input": [{"role": "user", "content": "état"}], "output": "[]", "latency": 1.5}),
+    ("traj", {"t": 1, "score": 20, "message": [], "mid_action": ["serve", {"food": "BeefBurger"}], "action": [5, 1]}),
+    ("text_action", {"t": 1, "agent": 0, "action": "serve BeefBurger"}),
+]
+
+
+def write(path, records=RECORDS, close=True, **kwargs):
+    writer = TrajectoryWriter(path, **kwargs)
+    for kind, record in records:
+        writer.add(kind, record)
+    if close:
+        writer.close()
+    return writer
+
+
+def expected_traj_infos(records=RECORDS):
+    traj_infos = {"traj": [], "urgent_response": [], "reflection": [], "text_action": []}
+    for kind, record in records:
+        traj_infos[kind].append(record)
+    return traj_infos
+
+
+def test_paths(tmp_path):
+    assert trajectory_path("results/exp1_2/burger/dpt/4o-0.json") == "results/exp1_2/burger/dpt/4o-0.jsonl"
+    assert trajectory_path("results/exp1_2/burger/dpt/4o-0.json", compress=True) == (
+        "results/exp1_2/burger/dpt/4o-0.jsonl.zst"
+    )
+    path = str(tmp_path / "4o-0.jsonl")
+    assert find_trajectory(path) is None
+    with open(str(tmp_path / "4o-0.json"), "w") as f:
+        json.dump(expected_traj_infos(), f)
+    # a finished trajectory in another format
+    assert find_trajectory(path) == str(tmp_path / "4o-0.json")
+    assert load_trajectory(str(tmp_path / "4o-0.json")) == expected_traj_infos()
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "dpt" / "4o-0.jsonl")
+    writer = write(path)
+    assert writer.n_record == len(RECORDS)
+    assert os.path.exists(path) and not os.path.exists(path + PARTIAL_SUFFIX)
+    assert find_trajectory(path) == path
+    assert load_trajectory(path) == expected_traj_infos()
+    # closing again is a no-op
+    assert writer.close() == path
+
+
+def test_partial_recovery(tmp_path):
+    """
+    A crashed episode keeps its records up to the last flush in the .part file, a broken last line is skipped
+    """
+    path = str(tmp_path / "4o-0.jsonl")
+    writer = write(path, close=False, flush_interval=0)
+    assert not os.path.exists(path) and find_trajectory(path) is None
+    with open(path + PARTIAL_SUFFIX, "ab") as f:
+        f.write(b'["traj",{"t":2,"sco')
+    assert load_trajectory(path + PARTIAL_SUFFIX) == expected_traj_infos()
+    writer._file.close()
+
+
+def test_unfinished(tmp_path):
+    path = str(tmp_path / "4o-0.jsonl")
+    writer = TrajectoryWriter(path)
+    for kind, record in RECORDS:
+        writer.add(kind, record)
+    assert writer.close(finished=False) == path + PARTIAL_SUFFIX
+    assert not os.path.exists(path)
+    assert load_trajectory(path + PARTIAL_SUFFIX) == expected_traj_infos()
+
+
+def test_no_path():
+    writer = write(None)
+    assert writer.n_record == 0 and writer.close() is None
+
+
+def test_compressed(tmp_path):
+    pytest.importorskip("zstandard")
+    path = str(tmp_path / "4o-0.jsonl.zst")
+    write(path)
+    assert load_trajectory(path) == expected_traj_infos()
+    writer = write(str(tmp_path / "4o-1.jsonl.zst"), close=False, flush_interval=0)
+    assert load_trajectory(writer.path + PARTIAL_SUFFIX) == expected_traj_infos()
+    writer.close()
@@ -1,6 +1,7 @@
 # (C) Yoshi Sato <satyoshi.com>
 
-from typing import List, Tuple
+import heapq
+from typing import Dict, List, Sequence, Set, Tuple
 
 import numpy as np
 from loguru import logger
@@ -224,3 +225,183 @@ def search(maze, cost, start, end):
 
 
 ######################################################################################################
+
+
+def reserve_paths(paths: Sequence[Sequence[Tuple[int, int]]], horizon: int) -> Set[Tuple[int, int, int]]:
+    """
+    Reservation table of the predicted paths of other agents, path[t] is the position at tick t, and the agent stays at
+    the end of its path. An agent can not enter a cell that another agent occupies before or after the move, so (x, y, t)
+    is reserved if another agent is at (x, y) at tick t - 1 or t.
+    """
+    reserved = set()
+    for path in paths:
+        if not path:
+            continue
+        for t in range(horizon + 1):
+            x, y = path[min(t, len(path) - 1)]
+            reserved.add((x, y, t))
+            reserved.add((x, y, t + 1))
+    return reserved
+
+
+def find_path_cooperative(
+    start: Tuple[int, int],
+    end: Tuple[int, int],
+    level: list,
+    reserved: Set[Tuple[int, int, int]],
+    horizon: int = 32,
+) -> List[Tuple[int, int]]:
+    """
+    Cooperative A*, search in space-time for a path from start to end on the walkable cells (0) of level, waiting or
+    moving one cell per tick, avoiding the cells (x, y, t) reserved by other agents. Returns the position at each tick,
+    empty if end is not reached within horizon ticks.
+    """
+    start, end = tuple(start), tuple(end)
+    no_rows, no_columns = len(level), len(level[0])
+
+    def h(position: Tuple[int, int]) -> int:
+        return abs(position[0] - end[0]) + abs(position[1] - end[1])
+
+    # (f, h, t, position), ties are broken towards the goal, then the earliest
+    open_list = [(h(start), h(start), 0, start)]
+    parents: Dict[Tuple[Tuple[int, int], int], Tuple[int, int] | None] = {(start, 0): None}
+    while open_list:
+        _, _, t, position = heapq.heappop(open_list)
+        if position == end:
+            path = [position]
+            while t > 0:
+                position = parents[(position, t)]
+                t -= 1
+                path.append(position)
+            return path[::-1]
+        if t >= horizon:
+            continue
+        x, y = position
+        for child in ((x, y), (x - 1, y), (x, y - 1), (x + 1, y), (x, y + 1)):
+            if not (0 <= child[0] < no_rows and 0 <= child[1] < no_columns) or level[child[0]][child[1]] != 0:
+                continue
+            if (child[0], child[1], t + 1) in reserved or (child, t + 1) in parents:
+                continue
+            parents[(child, t + 1)] = position
+            heapq.heappush(open_list, (t + 1 + h(child), h(child), t + 1, child))
+    return []
+
+
+class DStarLite:
+    """
+    D* Lite (Koenig and Likhachev, 2002), shortest paths to a fixed goal on the walkable cells (0) of level, some of
+    which can be blocked by moving agents. The search runs backwards from the goal, so its tree is kept as the start
+    moves, and only the cells around the blockers that moved are repaired.
+    """
+
+    # same order as the moves of `search`
+    moves = ((-1, 0), (0, -1), (1, 0), (0, 1))
+
+    def __init__(self, level, goal: Tuple[int, int]) -> None:
+        self.level = level
+        self.goal = tuple(goal)
+        self.free = {(x, y) for x in range(len(level)) for y in range(len(level[0])) if level[x][y] == 0}
+        self.blocked: Set[Tuple[int, int]] = set()
+        self.start: Tuple[int, int] | None = None
+        self.km = 0
+        self.g: Dict[Tuple[int, int], float] = {}
+        self.rhs: Dict[Tuple[int, int], float] = {}
+        self.open: List[Tuple[Tuple[float, float], Tuple[int, int]]] = []
+        self.open_keys: Dict[Tuple[int, int], Tuple[float, float]] = {}
+        if self.goal in self.free:
+            self.rhs[self.goal] = 0
+            self._push(self.goal, (self._h(self.goal), 0))
+
+    def _h(self, position: Tuple[int, int]) -> int:
+        if self.start is None:
+            return 0
+        return abs(position[0] - self.start[0]) + abs(position[1] - self.start[1])
+
+    def _key(self, position: Tuple[int, int]) -> Tuple[float, float]:
+        m = min(self.g.get(position, np.inf), self.rhs.get(position, np.inf))
+        return (m + self._h(position) + self.km, m)
+
+    def _push(self, position: Tuple[int, int], key: Tuple[float, float]) -> None:
+        self.open_keys[position] = key
+        heapq.heappush(self.open, (key, position))
+
+    def _neighbors(self, position: Tuple[int, int]) -> List[Tuple[int, int]]:
+        x, y = position
+        return [(x + dx, y + dy) for dx, dy in self.moves if (x + dx, y + dy) in self.free]
+
+    def _walkable(self, position: Tuple[int, int]) -> bool:
+        return position in self.free and position not in self.blocked
+
+    def _update(self, position: Tuple[int, int]) -> None:
+        if position == self.goal:
+            rhs = 0 if self._walkable(position) else np.inf
+        elif self._walkable(position):
+            rhs = min(
+                (self.g.get(n, np.inf) + 1 for n in self._neighbors(position) if n not in self.blocked),
+                default=np.inf,
+            )
+        else:
+            rhs = np.inf
+        self.rhs[position] = rhs
+        self.open_keys.pop(position, None)
+        if self.g.get(position, np.inf) != rhs:
+            self._push(position, self._key(position))
+
+    def _compute(self) -> None:
+        start = self.start
+        while self.open:
+            key, position = self.open[0]
+            if self.open_keys.get(position) != key:
+                heapq.heappop(self.open)
+                continue
+            if not (key < self._key(start) or self.rhs.get(start, np.inf) != self.g.get(start, np.inf)):
+                break
+            heapq.heappop(self.open)
+            new_key = self._key(position)
+            if key < new_key:
+                self._push(position, new_key)
+            elif self.g.get(position, np.inf) > self.rhs.get(position, np.inf):
+                self.g[position] = self.rhs[position]
+                del self.open_keys[position]
+                for n in self._neighbors(position):
+                    self._update(n)
+            else:
+                self.g[position] = np.inf
+                self._update(position)
+                for n in self._neighbors(position):
+                    self._update(n)
+
+    def find_path(self, start: Tuple[int, int], blocked: Set[Tuple[int, int]] = frozenset()) -> List[Tuple[int, int]]:
+        """
+        A shortest path from start to the goal avoiding the blocked cells, empty if there is none, like `find_path`
+        """
+        start = tuple(start)
+        if start == self.goal:
+            return [start]
+        if self.start is None:
+            self.start = start
+        elif start != self.start:
+            self.km += abs(start[0] - self.start[0]) + abs(start[1] - self.start[1])
+            self.start = start
+        blocked = set(blocked)
+        blocked.discard(start)
+        changed = self.blocked ^ blocked
+        self.blocked = blocked
+        for position in changed:
+            if position in self.free:
+                self._update(position)
+                for n in self._neighbors(position):
+                    self._update(n)
+        self._compute()
+
+        if self.g.get(start, np.inf) == np.inf:
+            return []
+        path = [start]
+        position = start
+        while position != self.goal and len(path) <= len(self.free):
+            position = min(
+                (n for n in self._neighbors(position) if n not in self.blocked),
+                key=lambda n: self.g.get(n, np.inf),
+            )
+            path.append(position)
+        return path
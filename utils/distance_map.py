@@ -0,0 +1,83 @@
+"""
+Distance maps of a level, the number of steps from the nearest of some source cells to every cell.
+
+The maps are computed by a multi-source BFS over the walkable cells (0) of `level_array`, expanding the whole frontier
+with NumPy shifts at each step. Cells that are not walkable (counters, stations, or cells blocked by agents) get the
+distance at which they are reached, but are not expanded, so the distance to a counter is the steps to stand next to
+it plus one, comparable to the Manhattan distances used elsewhere.
+"""
+
+import weakref
+from typing import Dict, FrozenSet, Iterable, Tuple
+
+import numpy as np
+
+UNREACHABLE = -1
+
+Position = Tuple[int, int]
+
+
+def distance_map(level, sources: Iterable[Position], blocked: Iterable[Position] = ()) -> np.ndarray:
+    """
+    The int16 array of the distances from the nearest source to every cell of level, UNREACHABLE if there is no path
+    """
+    walkable = np.asarray(level) == 0
+    for x, y in blocked:
+        walkable[x, y] = False
+    distances = np.full(walkable.shape, UNREACHABLE, dtype=np.int16)
+    frontier = np.zeros(walkable.shape, dtype=bool)
+    for x, y in sources:
+        frontier[x, y] = True
+    distances[frontier] = 0
+
+    d = 0
+    while frontier.any():
+        d += 1
+        reached = np.zeros_like(frontier)
+        reached[1:] |= frontier[:-1]
+        reached[:-1] |= frontier[1:]
+        reached[:, 1:] |= frontier[:, :-1]
+        reached[:, :-1] |= frontier[:, 1:]
+        reached &= distances == UNREACHABLE
+        distances[reached] = d
+        frontier = reached & walkable
+    return distances
+
+
+class DistanceMaps:
+    """
+    The distance maps of a world, cached until its state version changes. The returned maps are read-only.
+    """
+
+    def __init__(self, world) -> None:
+        self.world = world
+        self.level = world.level_array
+        self.version = None
+        self.maps: Dict[Tuple[FrozenSet[Position], FrozenSet[Position]], np.ndarray] = {}
+
+    def get(self, sources: Iterable[Position], blocked: Iterable[Position] = ()) -> np.ndarray:
+        version = getattr(self.world, "state_version", None)
+        if version != self.version or self.level is not self.world.level_array:
+            self.version = version
+            self.level = self.world.level_array
+            self.maps.clear()
+        key = (frozenset(map(tuple, sources)), frozenset(map(tuple, blocked)))
+        distances = self.maps.get(key)
+        if distances is None:
+            distances = distance_map(self.level, *key)
+            distances.flags.writeable = False
+            self.maps[key] = distances
+        return distances
+
+
+_distance_maps: "weakref.WeakKeyDictionary[object, DistanceMaps]" = weakref.WeakKeyDictionary()
+
+
+def get_distance_maps(world) -> DistanceMaps:
+    """
+    The distance maps shared by the agents of the world
+    """
+    maps = _distance_maps.get(world)
+    if maps is None:
+        maps = _distance_maps[world] = DistanceMaps(world)
+    return maps
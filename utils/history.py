@@ -1,6 +1,23 @@
-from copy import deepcopy
+import json
+import os
+import sys
+from collections import deque
+from functools import lru_cache
 from pprint import pformat
-from typing import Dict, List, NamedTuple, Tuple
+from typing import Deque, Dict, List, NamedTuple, Tuple
+
+from loguru import logger
+
+FORMATTED_SCENE_TEMPLATE = """\
+Scene {scene_n}:
+    Remained Timestep: {timestep},
+    Score: {score},
+    State: {state},
+    Action: {action},
+    Delivery: {delivery},
+    Missed Orders: {missed_orders},
+    Message: {message},
+"""
 
 
 class Info(NamedTuple):
@@ -10,21 +27,206 @@ class Info(NamedTuple):
     action: Dict[int, Tuple[str, Dict]] = {}
 
 
+@lru_cache(maxsize=1)
+def _get_tokenizer():
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        logger.warning(f"No local tokenizer ({e}), estimate tokens by characters")
+        return None
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Number of tokens of `text` by the local tiktoken tokenizer if available, otherwise ~4 characters per token.
+    """
+    tokenizer = _get_tokenizer()
+    if tokenizer is None:
+        return len(text) // 4 + 1
+    return len(tokenizer.encode(text))
+
+
+def _snapshot(value):
+    """
+    Copy of the nested dicts/lists of a state, so that the stored state is not changed by the caller later.
+    """
+    if isinstance(value, dict):
+        return {k: _snapshot(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_snapshot(v) for v in value]
+    return value
+
+
+def _to_jsonable(value):
+    """
+    JSON compatible copy of a state, non-string keys (e.g. ("Beef", "Fresh")) are converted by `str`.
+    """
+    if isinstance(value, dict):
+        return {k if isinstance(k, str) else str(k): _to_jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_jsonable(v) for v in value]
+    return value
+
+
+def _indent_text(text: str, indent_size: int = 8, indent_first_line: bool = False) -> str:
+    """
+    Indents each line of the provided text with the specified indent.
+    """
+    lines = text.split("\n")
+    if indent_first_line:
+        return "\n".join(" " * indent_size + line if line.strip() else line for line in lines)
+    else:
+        return "\n".join([lines[0]] + [" " * indent_size + line if line.strip() else line for line in lines[1:]])
+
+
+def _one_line(value) -> str:
+    return pformat(value, compact=True, width=sys.maxsize)
+
+
+def _compact_state(state: Dict) -> Dict:
+    """
+    State without deliver_log/total_score and without zero (or empty) entries.
+    """
+    compact = {}
+    for key, value in state.items():
+        if key in ["deliver_log", "total_score"]:
+            continue
+        if isinstance(value, dict):
+            value = {k: v for k, v in value.items() if v}
+        if value:
+            compact[key] = value
+    return compact
+
+
+def _diff_state(prev: Dict, curr: Dict) -> Dict:
+    """
+    Entries of the compact state `curr` changed from `prev`, removed entries are given as 0 (None for inventories).
+    Orders are included only when the order names change.
+    """
+    diff = {}
+    for key in list(curr) + [k for k in prev if k not in curr]:
+        prev_value, curr_value = prev.get(key), curr.get(key)
+        if key == "orders":
+            prev_names = [order["name"] for order in prev_value or []]
+            curr_names = [order["name"] for order in curr_value or []]
+            if prev_names != curr_names:
+                diff[key] = curr_value or []
+        elif isinstance(prev_value, dict) or isinstance(curr_value, dict):
+            prev_value, curr_value = prev_value or {}, curr_value or {}
+            default = None if key == "inventory_other_player" else 0
+            changed = {
+                k: curr_value.get(k, default)
+                for k in list(curr_value) + [k for k in prev_value if k not in curr_value]
+                if prev_value.get(k, default) != curr_value.get(k, default)
+            }
+            if changed:
+                diff[key] = changed
+        elif prev_value != curr_value:
+            diff[key] = curr_value
+    return diff
+
+
 class History:
-    def __init__(self, max_steps: int = 1000) -> None:
-        self.buffer: List[Info] = []
+    """
+    Buffer of the game history for the LLM prompts.
+
+    The stored Infos are snapshots which are never modified in place, `add_action` and `add_message` replace the
+    Info. The rendered text of each scene is cached and only re-rendered when its Info is replaced.
+
+    The buffer is a ring buffer keeping the last `max_length` Infos (all Infos if None). Scenes are indexed by the
+    number of Infos added before them, so the indexes (e.g. `last_human_action_index`) stay valid after the oldest
+    Infos are dropped. With `spill_path`, the dropped Infos (and the remaining ones on `close`/`reset`) are appended
+    to a JSONL file to log the full episode.
+
+    With `compact`, `get_formatted_history` is rendered by `get_compact_history` within `max_tokens` tokens.
+    """
+
+    def __init__(
+        self,
+        max_steps: int = 1000,
+        compact: bool = False,
+        max_tokens: int | None = None,
+        max_length: int | None = None,
+        spill_path: str | None = None,
+    ) -> None:
+        self.buffer: Deque[Info] = deque(maxlen=max_length)
+        self.n_dropped: int = 0  # index of buffer[0]
         self.last_human_action_index: int = 0
         self.max_steps = max_steps
+        self.compact = compact
+        self.max_tokens = max_tokens
+        self.spill_path = spill_path
+        self._spill_file = None
+        self._n_spilled = 0  # the Infos before this index are spilled, e.g. by `close`
+        self._scene_cache: Dict[int, Dict[int, str]] = {}  # index -> llm_idx -> rendered scene
+        self._compact_state_cache: Dict[int, Dict] = {}
 
-    def reset(self, max_steps: int = 1000) -> None:
-        self.buffer = []
+    def reset(self, max_steps: int = 1000, spill_path: str | None = None) -> None:
+        """
+        Start a new episode, the remaining Infos of the last episode are spilled first.
+        """
+        self.close()
+        if spill_path is not None:
+            self.spill_path = spill_path
+        self.buffer = deque(maxlen=self.buffer.maxlen)
+        self.n_dropped = 0
+        self._n_spilled = 0
         self.last_human_action_index = 0
         self.max_steps = max_steps
+        self._scene_cache = {}
+        self._compact_state_cache = {}
 
     def add(
         self, timestep: int, state: Dict, message: List[Dict[int, str]] = [], action: Dict[int, Tuple[str, Dict]] = {}
     ) -> None:
-        self.buffer.append(Info(timestep, state, message, action))
+        if len(self.buffer) == self.buffer.maxlen:
+            self._drop_oldest()
+        self.buffer.append(Info(timestep, _snapshot(state), dict(message), dict(action)))
+
+    @property
+    def n_added(self) -> int:
+        """
+        Number of Infos added in the episode, i.e., the index of the next Info.
+        """
+        return self.n_dropped + len(self.buffer)
+
+    def _drop_oldest(self) -> None:
+        info = self.buffer.popleft()
+        self._spill(self.n_dropped, info)
+        self._scene_cache.pop(self.n_dropped, None)
+        self._compact_state_cache.pop(self.n_dropped, None)
+        self.n_dropped += 1
+
+    def _spill(self, index: int, info: Info) -> None:
+        if self.spill_path is None or index < self._n_spilled:
+            return
+        if self._spill_file is None:
+            if os.path.dirname(self.spill_path):
+                os.makedirs(os.path.dirname(self.spill_path), exist_ok=True)
+            self._spill_file = open(self.spill_path, "a", encoding="utf-8")
+        self._spill_file.write(json.dumps({"index": index, **_to_jsonable(info._asdict())}) + "\n")
+        self._n_spilled = index + 1
+
+    def close(self) -> None:
+        """
+        Spill the remaining Infos and close the spill file. The buffer is kept, the Infos spilled are not spilled again by
+        another `close` or `reset`.
+        """
+        if self.spill_path is not None:
+            for index, info in enumerate(self.buffer, start=self.n_dropped):
+                self._spill(index, info)
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
+
+    def _info(self, index: int) -> Info:
+        return self.buffer[index - self.n_dropped]
+
+    def _replace(self, index: int, **fields) -> None:
+        self.buffer[index - self.n_dropped] = self._info(index)._replace(**fields)
+        self._scene_cache.pop(index, None)
 
     def add_action(self, action: List[List[str]], index: int) -> None:
         def _action_dict(action: List[List[str]]) -> Dict:
@@ -52,17 +254,21 @@ class History:
             elif action[0] == "putout_fire":
                 return (action[0], {})
 
-        self.buffer[self.last_human_action_index].action[index] = _action_dict(action)
-        self.last_human_action_index = len(self.buffer) - 1
+        # the scene of the last human action may be dropped, then the action is given to the oldest scene
+        info_index = max(self.last_human_action_index, self.n_dropped)
+        info = self._info(info_index)
+        self._replace(info_index, action={**info.action, index: _action_dict(action)})
+        self.last_human_action_index = self.n_added - 1
 
     def add_message(self, message: str, index: int) -> None:
-        self.buffer[-1].message[index] = message
+        self._replace(self.n_added - 1, message={**self.buffer[-1].message, index: message})
 
     def get_history(self, length: int) -> List[Info]:
         """
-        return history of `length` Infos
+        return history of `length` Infos, the Infos are shared snapshots and should not be modified
         """
-        return deepcopy(self.buffer[-length:])
+        start = len(self.buffer) - length if 0 < length < len(self.buffer) else 0
+        return [self.buffer[i] for i in range(start, len(self.buffer))]
 
     def get_formatted_history(self, length: int, llm_idx: int) -> str:
         """
@@ -79,72 +285,130 @@ class History:
             }
         """
 
-        def indent_text(text, indent_size: int = 8, indent_first_line: bool = False):
-            """
-            Indents each line of the provided text with the specified indent.
-            """
-            lines = text.split("\n")
-            if indent_first_line:
-                return "\n".join(" " * indent_size + line if line.strip() else line for line in lines)
-            else:
-                return "\n".join(
-                    [lines[0]] + [" " * indent_size + line if line.strip() else line for line in lines[1:]]
-                )
+        if self.compact:
+            return self.get_compact_history(length, llm_idx, self.max_tokens)
 
-        formatted_history_template = """\
-Scene {scene_n}:
-    Remained Timestep: {timestep},
-    Score: {score},
-    State: {state},
-    Action: {action},
-    Delivery: {delivery},
-    Missed Orders: {missed_orders},
-    Message: {message},
-"""
-        formatted_history = ""
         history = self.get_history(length)
-        for i, info in enumerate(history):
-            scene_n = max(0, len(self.buffer) - length) + i + 1
-            state = deepcopy(info.state)
-            if "deliver_log" in state:
-                deliver_log = state.pop("deliver_log")
-            else:
-                deliver_log = []
-            total_score = state.pop("total_score")
-            delivery = {}
-            missed_orders = {}
-            for id, name, score, _ in deliver_log:
-                if isinstance(id, int):
-                    delivery[name] = score
-                else:
-                    missed_orders[name] = score
-            action = {}
-            for idx, act in info.action.items():
-                if idx == llm_idx:
-                    action["You"] = act
-                else:
-                    action["Human"] = act
-            message = {}
-            for idx, msg in info.message.items():
-                if idx == llm_idx:
-                    message["You"] = msg
-                else:
-                    message["Human"] = msg
-            formatted_history += (
-                formatted_history_template.format(
-                    scene_n=scene_n,
-                    timestep=self.max_steps - info.timestep,
-                    state=indent_text(pformat(state, compact=True), len("    State: ")),
-                    action=pformat(action, compact=True),
-                    message=pformat(message, compact=True),
-                    delivery=pformat(delivery, compact=True),
-                    missed_orders=pformat(missed_orders, compact=True),
-                    score=total_score,
-                )
-                + "\n"
-            )
+        first_index = self.n_added - len(history)
+        formatted_history = ""
+        for index in range(first_index, self.n_added):
+            scene_cache = self._scene_cache.setdefault(index, {})
+            if llm_idx not in scene_cache:
+                scene_cache[llm_idx] = self._format_scene(index, llm_idx)
+            formatted_history += scene_cache[llm_idx]
         return formatted_history
 
+    def _format_scene(self, index: int, llm_idx: int) -> str:
+        info = self._info(index)
+        state = {key: value for key, value in info.state.items() if key not in ["deliver_log", "total_score"]}
+        delivery, missed_orders, action, message = self._scene_events(info, llm_idx)
+        return (
+            FORMATTED_SCENE_TEMPLATE.format(
+                scene_n=index + 1,
+                timestep=self.max_steps - info.timestep,
+                state=_indent_text(pformat(state, compact=True), len("    State: ")),
+                action=pformat(action, compact=True),
+                message=pformat(message, compact=True),
+                delivery=pformat(delivery, compact=True),
+                missed_orders=pformat(missed_orders, compact=True),
+                score=info.state["total_score"],
+            )
+            + "\n"
+        )
+
+    @staticmethod
+    def _scene_events(info: Info, llm_idx: int) -> Tuple[Dict, Dict, Dict, Dict]:
+        """
+        Delivery, missed orders, action and message of a scene, the agents are named "You" and "Human".
+        """
+        delivery = {}
+        missed_orders = {}
+        for id, name, score, _ in info.state.get("deliver_log", []):
+            if isinstance(id, int):
+                delivery[name] = score
+            else:
+                missed_orders[name] = score
+        action = {}
+        for idx, act in info.action.items():
+            if idx == llm_idx:
+                action["You"] = act
+            else:
+                action["Human"] = act
+        message = {}
+        for idx, msg in info.message.items():
+            if idx == llm_idx:
+                message["You"] = msg
+            else:
+                message["Human"] = msg
+        return delivery, missed_orders, action, message
+
+    def get_compact_history(self, length: int, llm_idx: int, max_tokens: int | None = None) -> str:
+        """
+        Compact version of `get_formatted_history`:
+        - zero counts and empty fields are dropped,
+        - the first and the last scenes give the full state, the others only give the changes of the state,
+        - consecutive scenes without any change are collapsed into one line,
+        - the oldest scenes are dropped until the text fits in `max_tokens` tokens (at least one scene is kept).
+        """
+        history = self.get_history(length)
+        first_index = self.n_added - len(history)
+        for start in range(first_index, self.n_added):
+            formatted_history = self._format_compact_scenes(start, llm_idx)
+            if max_tokens is None or start == self.n_added - 1 or estimate_tokens(formatted_history) <= max_tokens:
+                return formatted_history
+        return ""
+
+    def _get_compact_state(self, index: int) -> Dict:
+        if index not in self._compact_state_cache:
+            self._compact_state_cache[index] = _compact_state(self._info(index).state)
+        return self._compact_state_cache[index]
+
+    def _format_compact_scenes(self, first_index: int, llm_idx: int) -> str:
+        lines = []
+        prev_state = None
+        idle_scene_ns = []
+
+        def _flush_idle_scenes():
+            if len(idle_scene_ns) == 1:
+                lines.append(f"Scene {idle_scene_ns[0]}: no changes\n")
+            elif idle_scene_ns:
+                lines.append(f"Scene {idle_scene_ns[0]}-{idle_scene_ns[-1]}: no changes\n")
+            idle_scene_ns.clear()
+
+        for index in range(first_index, self.n_added):
+            info = self._info(index)
+            scene_n = index + 1
+            state = self._get_compact_state(index)
+            delivery, missed_orders, action, message = self._scene_events(info, llm_idx)
+            is_full = prev_state is None or index == self.n_added - 1
+            diff = None if is_full else _diff_state(prev_state, state)
+            prev_state = state
+            if not is_full and not (diff or delivery or missed_orders or action or message):
+                idle_scene_ns.append(scene_n)
+                continue
+            _flush_idle_scenes()
+
+            scene = [
+                f"Scene {scene_n}:",
+                f"    Remained Timestep: {self.max_steps - info.timestep},",
+                f"    Score: {info.state.get('total_score', 0)},",
+            ]
+            if is_full:
+                scene.append(f"    State: {_one_line(state)},")
+            elif diff:
+                scene.append(f"    State Changes: {_one_line(diff)},")
+            for name, value in [
+                ("Action", action),
+                ("Delivery", delivery),
+                ("Missed Orders", missed_orders),
+                ("Message", message),
+            ]:
+                if value:
+                    scene.append(f"    {name}: {_one_line(value)},")
+            lines.append("\n".join(scene) + "\n")
+        _flush_idle_scenes()
+        return "\n".join(lines)
+
 
 if __name__ == "__main__":
     info = Info({"a": 1}, {1: ("a", "b")}, {1: ("c", {"d": 2})})
@@ -0,0 +1,343 @@
+"""
+Columnar index of the trajectories in `results/` for fast aggregation.
+
+The trajectories are parsed once into NumPy columns saved as `.npy` files (loaded memory-mapped) plus one JSON table
+of the runs, so that the paper tables are recomputed without parsing the JSON trajectories again. Re-indexing only
+parses the trajectories added or changed since the last index.
+
+    python -m utils.results --root results            # index and print the summary table
+    python -m utils.results --root results --by exp mode model
+
+    index = ResultsIndex.build("results")
+    index.aggregate("final_score", by=("exp", "mode", "biased_agent", "variant", "model"))
+"""
+
+import argparse
+import glob
+import json
+import os
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+from loguru import logger
+
+from llms.scheduler import estimate_message_tokens
+from utils.trajectory import TRAJECTORY_SUFFIXES, load_trajectory
+
+INDEX_VERSION = 1
+RUN_FIELDS = ("exp", "mode", "biased_agent", "variant", "model", "seed", "mock")
+# per step of all runs, concatenated run by run
+STEP_COLUMNS = {
+    "run": np.int32,
+    "t": np.int32,
+    "score": np.float32,
+    "action": np.int8,  # (n, 2), -1 for missing agents
+    "mid_action": np.int16,  # name of the mid action of the LLM agent in `mid_action_names`, -1 if None
+    "controlled_by_fsm": np.int8,  # 1 / 0, -1 if not recorded
+}
+# per LLM call of all runs, concatenated run by run
+CALL_COLUMNS = {
+    "run": np.int32,
+    "kind": np.int8,  # index in CALL_KINDS
+    "t": np.int32,
+    "latency": np.float32,  # NaN if not recorded
+    "input_tokens": np.int32,  # estimated, ~4 characters per token
+    "output_tokens": np.int32,
+}
+CALL_KINDS = ("urgent_response", "reflection")
+
+
+def parse_result_path(rel_path: str) -> Dict:
+    """
+    Run fields from a path relative to the results root, e.g. `exp2/burger/BeefAgent/dpt-wtom/4o-mini-3.json`.
+    Fields which can not be parsed are None.
+    """
+    parts = rel_path.replace("\\", "/").split("/")
+    fields = dict.fromkeys(RUN_FIELDS)
+    fields["mock"] = parts[0] == "mock"
+    if fields["mock"]:
+        parts = parts[1:]
+    name = parts[-1]
+    for suffix in TRAJECTORY_SUFFIXES:
+        if name.endswith(suffix):
+            name = name[: -len(suffix)]
+            break
+    model, _, seed = name.rpartition("-")
+    if model and seed.lstrip("-").isdigit():
+        fields["model"], fields["seed"] = model, int(seed)
+    else:
+        fields["model"] = name
+    if len(parts) >= 3:
+        fields["exp"], fields["mode"] = parts[0], parts[1]
+        middle = parts[2:-1]
+        if fields["exp"] == "exp2" and middle:
+            fields["biased_agent"], middle = middle[0], middle[1:]
+        if middle:
+            fields["variant"] = "/".join(middle)
+        elif fields["model"] == "FSM":
+            fields["variant"] = "FSM"
+        elif fields["exp"] == "exp1":
+            fields["variant"] = "act"
+    return fields
+
+
+def _mid_action_name(mid_action, llm_idx: int) -> str | None:
+    if isinstance(mid_action, dict):
+        mid_action = mid_action.get(str(llm_idx), mid_action.get(llm_idx))
+    if isinstance(mid_action, (list, tuple)) and mid_action:
+        return str(mid_action[0])
+    return None
+
+
+def _count_tokens(value) -> int:
+    if isinstance(value, list):
+        return estimate_message_tokens([m for m in value if isinstance(m, dict)])
+    return len(str(value)) // 4
+
+
+def extract_columns(traj_infos: Dict, llm_idx: int, mid_action_ids: Dict[str, int]) -> Tuple[Dict, Dict]:
+    """
+    Step and call columns (without the "run" column) of one trajectory, new mid action names are added to
+    `mid_action_ids`.
+    """
+    traj = traj_infos.get("traj", [])
+    steps = {
+        "t": np.array([element.get("t", i) for i, element in enumerate(traj)], dtype=np.int32),
+        "score": np.array([element.get("score", 0) or 0 for element in traj], dtype=np.float32),
+        "action": np.full((len(traj), 2), -1, dtype=np.int8),
+        "mid_action": np.full(len(traj), -1, dtype=np.int16),
+        "controlled_by_fsm": np.full(len(traj), -1, dtype=np.int8),
+    }
+    for i, element in enumerate(traj):
+        action = element.get("action") or []
+        for a_i, a in enumerate(action[:2]):
+            steps["action"][i, a_i] = a if a is not None else -1
+        name = _mid_action_name(element.get("mid_action"), llm_idx)
+        if name is not None:
+            steps["mid_action"][i] = mid_action_ids.setdefault(name, len(mid_action_ids))
+        if element.get("controlled_by_fsm") is not None:
+            steps["controlled_by_fsm"][i] = int(bool(element["controlled_by_fsm"]))
+
+    calls = defaultdict(list)
+    for kind_idx, kind in enumerate(CALL_KINDS):
+        for call in traj_infos.get(kind, []):
+            calls["kind"].append(kind_idx)
+            calls["t"].append(call.get("t", -1))
+            calls["latency"].append(call.get("latency", np.nan))
+            calls["input_tokens"].append(_count_tokens(call.get("input", "")))
+            calls["output_tokens"].append(_count_tokens(call.get("output", "")))
+    calls = {name: np.array(calls[name], dtype=CALL_COLUMNS[name]) for name in CALL_COLUMNS if name != "run"}
+    return steps, calls
+
+
+def _summary(values: np.ndarray) -> Dict[str, float]:
+    values = values[~np.isnan(values)] if values.dtype.kind == "f" else values
+    if len(values) == 0:
+        return {"n": 0}
+    return {
+        "n": int(len(values)),
+        "mean": float(values.mean()),
+        "std": float(values.std()),
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+    }
+
+
+class ResultsIndex:
+    """
+    - `runs`: one dict per trajectory with the fields of `parse_result_path`, "path", "final_score", and the offsets
+        of its rows in the step and call columns.
+    - `steps`, `calls`: the columns of `STEP_COLUMNS` and `CALL_COLUMNS`.
+    """
+
+    def __init__(self, runs: List[Dict], steps: Dict[str, np.ndarray], calls: Dict[str, np.ndarray], meta: Dict):
+        self.runs = runs
+        self.steps = steps
+        self.calls = calls
+        self.meta = meta
+        self.mid_action_names = meta.get("mid_action_names", [])
+
+    @staticmethod
+    def default_index_dir(root: str) -> str:
+        return os.path.join(root, ".index")
+
+    @classmethod
+    def load(cls, index_dir: str, mmap: bool = True) -> "ResultsIndex":
+        with open(os.path.join(index_dir, "runs.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        mmap_mode = "r" if mmap else None
+        steps = {
+            name: np.load(os.path.join(index_dir, f"steps_{name}.npy"), mmap_mode=mmap_mode) for name in STEP_COLUMNS
+        }
+        calls = {
+            name: np.load(os.path.join(index_dir, f"calls_{name}.npy"), mmap_mode=mmap_mode) for name in CALL_COLUMNS
+        }
+        return cls(meta.pop("runs"), steps, calls, meta)
+
+    def save(self, index_dir: str) -> None:
+        os.makedirs(index_dir, exist_ok=True)
+        for prefix, columns in [("steps", self.steps), ("calls", self.calls)]:
+            for name, column in columns.items():
+                np.save(os.path.join(index_dir, f"{prefix}_{name}.npy"), np.ascontiguousarray(column))
+        meta = {**self.meta, "mid_action_names": self.mid_action_names, "runs": self.runs}
+        tmp_path = os.path.join(index_dir, "runs.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(index_dir, "runs.json"))
+
+    @classmethod
+    def build(cls, root: str = "results", index_dir: str | None = None, save: bool = True) -> "ResultsIndex":
+        """
+        Index the trajectories under `root`, reusing the rows of the unchanged trajectories of an existing index.
+        """
+        index_dir = index_dir or cls.default_index_dir(root)
+        old = None
+        if os.path.exists(os.path.join(index_dir, "runs.json")):
+            try:
+                old = cls.load(index_dir, mmap=False)
+                if old.meta.get("version") != INDEX_VERSION:
+                    old = None
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Rebuild the index {index_dir}: {e}")
+                old = None
+        old_runs = {run["path"]: run for run in old.runs} if old is not None else {}
+        mid_action_ids = {name: i for i, name in enumerate(old.mid_action_names)} if old is not None else {}
+
+        file_paths = sorted(
+            file_path
+            for suffix in TRAJECTORY_SUFFIXES
+            for file_path in glob.glob(os.path.join(root, "**", f"*{suffix}"), recursive=True)
+        )
+        runs, step_parts, call_parts = [], defaultdict(list), defaultdict(list)
+        n_parsed = 0
+        for file_path in file_paths:
+            rel_path = os.path.relpath(file_path, root).replace("\\", "/")
+            stat = os.stat(file_path)
+            old_run = old_runs.get(rel_path)
+            if old_run is not None and old_run["mtime"] == stat.st_mtime and old_run["size"] == stat.st_size:
+                steps = {name: old.steps[name][old_run["step_offset"] : old_run["step_end"]] for name in STEP_COLUMNS}
+                calls = {name: old.calls[name][old_run["call_offset"] : old_run["call_end"]] for name in CALL_COLUMNS}
+                run = {k: v for k, v in old_run.items()}
+            else:
+                try:
+                    traj_infos = load_trajectory(file_path)
+                except (OSError, ValueError, ImportError) as e:
+                    logger.warning(f"Skip {file_path}: {e}")
+                    continue
+                if not isinstance(traj_infos, dict) or "traj" not in traj_infos:
+                    continue
+                run = parse_result_path(rel_path)
+                llm_idx = 1 if run["exp"] == "exp2" else 0
+                steps, calls = extract_columns(traj_infos, llm_idx, mid_action_ids)
+                run.update(path=rel_path, mtime=stat.st_mtime, size=stat.st_size)
+                run["final_score"] = float(steps["score"].sum())
+                n_parsed += 1
+
+            run_idx = len(runs)
+            steps["run"] = np.full(len(steps["t"]), run_idx, dtype=np.int32)
+            calls["run"] = np.full(len(calls["t"]), run_idx, dtype=np.int32)
+            run["step_offset"] = sum(len(part) for part in step_parts["t"])
+            run["step_end"] = run["step_offset"] + len(steps["t"])
+            run["call_offset"] = sum(len(part) for part in call_parts["t"])
+            run["call_end"] = run["call_offset"] + len(calls["t"])
+            for name in STEP_COLUMNS:
+                step_parts[name].append(steps[name])
+            for name in CALL_COLUMNS:
+                call_parts[name].append(calls[name])
+            runs.append(run)
+
+        def _concat(parts: Dict[str, List[np.ndarray]], columns: Dict) -> Dict[str, np.ndarray]:
+            result = {}
+            for name, dtype in columns.items():
+                if parts[name]:
+                    result[name] = np.concatenate(parts[name]).astype(dtype, copy=False)
+                else:
+                    result[name] = np.zeros((0, 2) if name == "action" else 0, dtype=dtype)
+            return result
+
+        mid_action_names = [name for name, _ in sorted(mid_action_ids.items(), key=lambda item: item[1])]
+        meta = {"version": INDEX_VERSION, "root": root, "mid_action_names": mid_action_names}
+        index = cls(runs, _concat(step_parts, STEP_COLUMNS), _concat(call_parts, CALL_COLUMNS), meta)
+        logger.info(f"Indexed {len(runs)} trajectories in {root}, parsed {n_parsed}")
+        if save:
+            index.save(index_dir)
+        return index
+
+    def select(self, **fields) -> List[int]:
+        """
+        Indexes of the runs whose fields equal the given values, e.g. `select(exp="exp2", model="4o")`.
+        """
+        return [i for i, run in enumerate(self.runs) if all(run.get(k) == v for k, v in fields.items())]
+
+    def group_runs(self, by: Iterable[str], runs: List[int] | None = None) -> Dict[Tuple, np.ndarray]:
+        groups = defaultdict(list)
+        for i in range(len(self.runs)) if runs is None else runs:
+            groups[tuple(self.runs[i].get(k) for k in by)].append(i)
+        return {key: np.array(indexes, dtype=np.int32) for key, indexes in groups.items()}
+
+    def final_scores(self) -> np.ndarray:
+        return np.array([run["final_score"] for run in self.runs], dtype=np.float32)
+
+    def fsm_control_ratios(self) -> np.ndarray:
+        """
+        Per run, the fraction of the recorded steps in which the LLM agent was controlled by the FSM, NaN if not
+        recorded.
+        """
+        recorded = self.steps["controlled_by_fsm"] >= 0
+        n_steps = np.bincount(self.steps["run"][recorded], minlength=len(self.runs))
+        n_fsm = np.bincount(self.steps["run"][self.steps["controlled_by_fsm"] == 1], minlength=len(self.runs))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(n_steps > 0, n_fsm / np.maximum(n_steps, 1), np.nan)
+
+    def aggregate(self, metric: str = "final_score", by: Iterable[str] = ("exp", "mode", "variant", "model"), **fields):
+        """
+        Summary (n, mean, std, p50, p95) of a metric per group of runs with the given `fields`.
+
+        - Per run metrics: "final_score", "fsm_control_ratio", "n_calls".
+        - Per call metrics: "latency", "input_tokens", "output_tokens", optionally of one kind with e.g.
+            "latency:reflection".
+        """
+        by = tuple(by)
+        groups = self.group_runs(by, self.select(**fields) if fields else None)
+        metric, _, kind = metric.partition(":")
+        if metric in CALL_COLUMNS:
+            mask = np.ones(len(self.calls["run"]), dtype=bool)
+            if kind:
+                mask &= self.calls["kind"] == CALL_KINDS.index(kind)
+            call_runs, values = self.calls["run"][mask], np.asarray(self.calls[metric][mask], dtype=np.float64)
+            return {key: _summary(values[np.isin(call_runs, runs)]) for key, runs in groups.items()}
+        if metric == "final_score":
+            values = self.final_scores()
+        elif metric == "fsm_control_ratio":
+            values = self.fsm_control_ratios()
+        elif metric == "n_calls":
+            values = np.bincount(self.calls["run"], minlength=len(self.runs)).astype(np.float64)
+        else:
+            raise ValueError(f"Unknown metric {metric}")
+        return {key: _summary(np.asarray(values[runs], dtype=np.float64)) for key, runs in groups.items()}
+
+    def summary_table(self, by: Iterable[str] = ("exp", "mode", "biased_agent", "variant", "model")) -> str:
+        by = tuple(by)
+        scores = self.aggregate("final_score", by)
+        latencies = self.aggregate("latency", by)
+        fsm_ratios = self.aggregate("fsm_control_ratio", by)
+        lines = [" | ".join([*by, "runs", "score", "latency p50/p95 (s)", "FSM control"])]
+        for key in sorted(scores, key=lambda key: tuple(str(k) for k in key)):
+            score, latency, fsm_ratio = scores[key], latencies[key], fsm_ratios[key]
+            cells = [str(k) for k in key] + [str(score["n"]), f"{score['mean']:.1f} ± {score['std']:.1f}"]
+            cells.append(f"{latency['p50']:.2f} / {latency['p95']:.2f}" if latency["n"] else "-")
+            cells.append(f"{fsm_ratio['mean']:.2f}" if fsm_ratio["n"] else "-")
+            lines.append(" | ".join(cells))
+        return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--root", default="results", type=str)
+    parser.add_argument("--index_dir", default=None, type=str, help="default: {root}/.index")
+    parser.add_argument("--by", default=["exp", "mode", "biased_agent", "variant", "model"], nargs="+")
+    args = parser.parse_args()
+
+    index = ResultsIndex.build(args.root, args.index_dir)
+    print(index.summary_table(args.by))
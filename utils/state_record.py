@@ -0,0 +1,130 @@
+"""
+Compact per-step state records of an episode.
+
+Instead of `str(env.get_json_state_simple(llm_idx))` in every traj element, the state of each step is written by
+`OvercookedMaker.get_state_record` into one row of an integer array preallocated for the episode, and saved next to
+the trajectory as `{stem}.states.npz` with the layout needed to decode it:
+    recorder = StateRecorder(CookingWorld.STATE_OBJECT_KEYS, num_agents=2, max_order=4, n_steps=601, agent_idx=1)
+    recorder.record(env, t)
+    recorder.save(state_record_path(traj_path))
+
+    states = load_states(state_record_path(traj_path))
+    states.decode(t)  # get_json_state_simple layout, without deliver_log
+"""
+
+import json
+import os
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+
+from utils.trajectory import TRAJECTORY_SUFFIXES
+
+STATE_RECORD_SUFFIX = ".states.npz"
+
+
+def state_record_path(traj_path: str) -> str:
+    """
+    Path of the state records of the trajectory `traj_path` in any format.
+    """
+    for suffix in TRAJECTORY_SUFFIXES:
+        if traj_path.endswith(suffix):
+            return traj_path[: -len(suffix)] + STATE_RECORD_SUFFIX
+    return traj_path + STATE_RECORD_SUFFIX
+
+
+class StateRecorder:
+    """
+    - `object_keys`: the (name, status) keys of the object counts, `CookingWorld.STATE_OBJECT_KEYS`.
+    - `n_steps`: rows preallocated, one per time step. Steps which were not recorded are all -1.
+    - `agent_idx`: the agent whose view is recorded, its own held object is not recorded.
+    """
+
+    def __init__(
+        self,
+        object_keys: Sequence[Tuple[str, str]],
+        num_agents: int,
+        max_order: int,
+        n_steps: int,
+        agent_idx: int = 0,
+        states: np.ndarray | None = None,
+    ) -> None:
+        self.object_keys = [tuple(key) for key in object_keys]
+        self.num_agents = num_agents
+        self.max_order = max_order
+        self.agent_idx = agent_idx
+        self.n_columns = len(self.object_keys) + 1 + num_agents + 3 + 2 * max_order
+        self.n_recorded = 0 if states is None else len(states)
+        if states is None:
+            states = np.full((n_steps, self.n_columns), -1, dtype=np.int16)
+        self.states = states
+
+    def record(self, env, t: int) -> np.ndarray:
+        """
+        Record the state at time step `t` with `env.get_state_record`.
+        """
+        if t >= len(self.states):
+            grown = np.full((max(t + 1, 2 * len(self.states)), self.n_columns), -1, dtype=self.states.dtype)
+            grown[: len(self.states)] = self.states
+            self.states = grown
+        row = self.states[t]
+        env.get_state_record(self.agent_idx, row)
+        self.n_recorded = max(self.n_recorded, t + 1)
+        return row
+
+    def decode(self, t: int) -> Dict | None:
+        """
+        State at time step `t` in the layout of get_json_state_simple (without deliver_log), None if not recorded.
+        The numbers of deliveries and missed orders of the step are recorded but not part of that layout.
+        """
+        row = self.states[t].tolist()
+        n_objects = len(self.object_keys)
+        if row[n_objects] < 0:
+            return None
+        col = n_objects + 1
+        inventory = {}
+        for agent_idx in range(self.num_agents):
+            if agent_idx != self.agent_idx:
+                inventory[agent_idx] = self._object_desc(row[col + agent_idx])
+        col += self.num_agents
+        orders = []
+        for slot in range(self.max_order):
+            food, remain_time = row[col + 3 + 2 * slot], row[col + 4 + 2 * slot]
+            if food >= 0:
+                orders.append({"name": self.object_keys[food][0], "remain_time": remain_time})
+        return {
+            "objects": {key: count for key, count in zip(self.object_keys, row)},
+            "counters": {"Empty": row[n_objects]},
+            "inventory_other_player": inventory,
+            "total_score": row[col],
+            "orders": orders,
+        }
+
+    def _object_desc(self, object_id: int) -> Dict | None:
+        if object_id < 0:
+            return None
+        name, status = self.object_keys[object_id]
+        return {"name": name, "status": status}
+
+    def layout(self) -> Dict:
+        return {
+            "object_keys": self.object_keys,
+            "num_agents": self.num_agents,
+            "max_order": self.max_order,
+            "agent_idx": self.agent_idx,
+        }
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp.npz"
+        np.savez_compressed(tmp_path, states=self.states[: self.n_recorded], layout=np.array(json.dumps(self.layout())))
+        os.replace(tmp_path, path)
+
+
+def load_states(path: str) -> StateRecorder:
+    with np.load(path) as data:
+        layout = json.loads(str(data["layout"]))
+        states = data["states"]
+    return StateRecorder(
+        layout["object_keys"], layout["num_agents"], layout["max_order"], len(states), layout["agent_idx"], states
+    )
@@ -0,0 +1,182 @@
+"""
+Streaming trajectory files.
+
+A trajectory is written as one JSON line `[kind, record]` per record while the episode runs, where kind is one of
+`TRAJECTORY_KINDS`, instead of one `json.dump` of the whole `traj_infos` dict at the end:
+    writer = TrajectoryWriter("results/exp1_2/burger_exp1/dpt/4o-0.jsonl")
+    writer.add("traj", {"t": 0, "score": 0, ...})
+    writer.close()
+
+`load_trajectory` reads both formats back into the `traj_infos` layout {kind: [record, ...]}, with the states of the
+traj records from the `.states.npz` file next to the trajectory if it exists, see `utils.state_record`.
+"""
+
+import json
+import os
+import time
+from typing import Dict, List
+
+from loguru import logger
+
+TRAJECTORY_KINDS = ("traj", "urgent_response", "reflection", "text_action")
+TRAJECTORY_SUFFIXES = (".json", ".jsonl", ".jsonl.zst")
+PARTIAL_SUFFIX = ".part"
+
+
+def _get_zstandard():
+    try:
+        import zstandard
+    except ImportError as e:
+        raise ImportError("zstd compressed trajectories need the zstandard package: pip install zstandard") from e
+    return zstandard
+
+
+def trajectory_path(file_path: str, compress: bool = False) -> str:
+    """
+    Path of the streamed trajectory for a result path `*.json`.
+    """
+    stem = file_path[: -len(".json")] if file_path.endswith(".json") else file_path
+    return f"{stem}.jsonl.zst" if compress else f"{stem}.jsonl"
+
+
+def find_trajectory(file_path: str) -> str | None:
+    """
+    Existing finished trajectory of a result path in any format, e.g. to skip finished runs.
+    """
+    stem = file_path
+    for suffix in TRAJECTORY_SUFFIXES:
+        if file_path.endswith(suffix):
+            stem = file_path[: -len(suffix)]
+            break
+    for suffix in TRAJECTORY_SUFFIXES:
+        if os.path.exists(stem + suffix):
+            return stem + suffix
+    return None
+
+
+class TrajectoryWriter:
+    """
+    Appends the records of an episode to `path` (zstd compressed if it ends with `.zst`).
+
+    Records go to `path + ".part"` and are flushed every `flush_interval` seconds, so a crashed episode keeps its
+    records up to the last flush. `close()` renames the file to `path`. With `path=None` the records are dropped,
+    e.g. for trial games.
+    """
+
+    def __init__(self, path: str | None, flush_interval: float = 5.0) -> None:
+        self.path = path
+        self.flush_interval = flush_interval
+        self.n_record = 0
+        self.closed = False
+        self._file = None
+        self._compressor = None
+        self._last_flush = time.monotonic()
+        if path is None:
+            return
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path + PARTIAL_SUFFIX, "wb")
+        if path.endswith(".zst"):
+            self._compressor = _get_zstandard().ZstdCompressor().stream_writer(self._file, closefd=False)
+
+    def add(self, kind: str, record: Dict) -> None:
+        if self._file is None:
+            return
+        line = json.dumps([kind, record], ensure_ascii=False, separators=(",", ":")) + "\n"
+        if self._compressor is not None:
+            self._compressor.write(line.encode("utf-8"))
+        else:
+            self._file.write(line.encode("utf-8"))
+        self.n_record += 1
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._file is None:
+            return
+        if self._compressor is not None:
+            self._compressor.flush(_get_zstandard().FLUSH_BLOCK)
+        self._file.flush()
+        self._last_flush = time.monotonic()
+
+    def close(self, finished: bool = True) -> str | None:
+        """
+        Close the file, and rename it to `path` if the episode is `finished`. Returns the path of the file.
+        """
+        if self.closed:
+            return self.path
+        self.closed = True
+        if self._file is None:
+            return None
+        if self._compressor is not None:
+            self._compressor.close()
+        self._file.close()
+        self._file = None
+        if not finished:
+            logger.warning(f"Unfinished trajectory kept in {self.path + PARTIAL_SUFFIX}")
+            return self.path + PARTIAL_SUFFIX
+        os.replace(self.path + PARTIAL_SUFFIX, self.path)
+        return self.path
+
+
+def _read_lines(path: str) -> List[str]:
+    if path.endswith(".zst") or path.endswith(".zst" + PARTIAL_SUFFIX):
+        with open(path, "rb") as f:
+            reader = _get_zstandard().ZstdDecompressor().stream_reader(f, read_across_frames=True)
+            try:
+                data = reader.read()
+            except Exception as e:  # truncated by a crash
+                logger.warning(f"Truncated trajectory {path}: {e}")
+                data = b""
+        return data.decode("utf-8", errors="replace").splitlines()
+    with open(path, encoding="utf-8") as f:
+        return f.read().splitlines()
+
+
+def load_trajectory(path: str) -> Dict[str, List[Dict]]:
+    """
+    Load a trajectory (`.json`, `.jsonl`, `.jsonl.zst`, or an unfinished `.part` file) in the `traj_infos` layout.
+    """
+    if path.endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            traj_infos = json.load(f)
+    else:
+        traj_infos = _load_records(path)
+    _attach_states(traj_infos, path)
+    return traj_infos
+
+
+def _load_records(path: str) -> Dict[str, List[Dict]]:
+    traj_infos = {kind: [] for kind in TRAJECTORY_KINDS}
+    for line in _read_lines(path):
+        if not line:
+            continue
+        try:
+            kind, record = json.loads(line)
+        except ValueError:
+            # the last line of a crashed episode may be incomplete
+            logger.warning(f"Skip a broken line in {path}")
+            continue
+        traj_infos.setdefault(kind, []).append(record)
+    return traj_infos
+
+
+def _attach_states(traj_infos: Dict[str, List[Dict]], path: str) -> None:
+    """
+    Set the `state` of the traj records without one from the state records next to the trajectory, as the `str` of
+    the state like the `llm_agent_run_*` scripts (without deliver_log).
+    """
+    from utils.state_record import load_states, state_record_path
+
+    if path.endswith(PARTIAL_SUFFIX):
+        path = path[: -len(PARTIAL_SUFFIX)]
+    states_path = state_record_path(path)
+    if not os.path.exists(states_path):
+        return
+    states = load_states(states_path)
+    for record in traj_infos.get("traj", []):
+        t = record.get("t")
+        if "state" in record or not isinstance(t, int) or not 0 <= t < len(states.states):
+            continue
+        state = states.decode(t)
+        if state is not None:
+            record["state"] = str(state)
@@ -18,17 +18,17 @@ from PIL import Image
 from quart import Quart, jsonify, request, websocket
 
 from agents.comm_infer_llm_agent import CommInferAgent, CommInferAgentNoFSM
-from agents.mid_agent import MidAgent
 from agents.react_llm_agent import ReActAgent, ReActAgentNoFSM
 from agents.reflexion_llm_agent import ReflexionAgent, ReflexionAgentNoFSM
-from agents.text_agent import TextAgent
-from coop_marl.controllers import MultiController
-from coop_marl.envs.overcooked.overcooked_maker import OvercookedMaker
 
 # from coop_marl.runners.runners import PlayRunner
-from coop_marl.utils import Arrdict, create_parser, parse_args, utils
-from llms.get_llm_output import get_openai_llm_output
-from utils.history import History
+from coop_marl.utils import Arrdict, create_parser_webapp, parse_args, utils
+from llms.mock_llm import enable_mock_llm
+from llms.scheduler import LLMScheduler, Priority, is_staggered_trigger
+from runners.clock import TickScheduler
+from utils.trajectory import TrajectoryWriter
+from webapp.game_pool import GameSlot
+from webapp.progress_store import ProgressStore
 
 GAME_ID = 0
 MAX_GAME = 15
@@ -126,6 +126,59 @@ def process_frame(frame):
     return base64_encoded
 
 
+def create_rule_agent(kind, text_agent, world):
+    """
+    Rule agent of a kind of phase in PHASE_2_AGENT, None for the phases without an LLM agent.
+    """
+    if kind in ["warmup", "trail"]:
+        return None
+    if kind in ["wtom", "wotom"]:
+        agent_class = CommInferAgent if FSM else CommInferAgentNoFSM
+        return agent_class(
+            text_agent,
+            world,
+            send_message=SEND_MESSAGE,
+            receive_message=RECEIVE_MESSAGE,
+            infer_human=kind == "wtom",
+        )
+    elif kind == "reflexion":
+        agent_class = ReflexionAgent if FSM else ReflexionAgentNoFSM
+        return agent_class(
+            text_agent,
+            world,
+            send_message=SEND_MESSAGE,
+            receive_message=RECEIVE_MESSAGE,
+            max_n_react_turn=urgent_response_history_n_event,
+            max_n_reflection_event=reflection_history_n_event,
+        )
+    elif kind == "react":
+        agent_class = ReActAgent if FSM else ReActAgentNoFSM
+        return agent_class(
+            text_agent,
+            world,
+            send_message=SEND_MESSAGE,
+            receive_message=RECEIVE_MESSAGE,
+            max_n_react_turn=urgent_response_history_n_event,
+        )
+    logger.error(f"agent {kind} error!")
+    return None
+
+
+def prepare_next_game(id):
+    """
+    Prepare the env and the rule agent of the next phase of the participant in game `id`, or of the warmup of the next
+    participant.
+    """
+    next_phase = None
+    if id_assigned[id] and hasattr(game_sequence[id], "__next__"):
+        # the remaining phases, set again from the progress when the participant reconnects for the next phase
+        next_phase = next(game_sequence[id], None)
+    if next_phase is None:
+        next_phase = -1
+    _max_steps = half_max_steps if next_phase >= 0 else quarter_and_half_max_steps
+    game_slots[id].prepare(PHASE_2_AGENT[next_phase], _max_steps)
+
+
 async def run_inner_loop(id, outcome, current_traj_element, info_list):
 
     env = envs[id]
@@ -137,16 +190,22 @@ async def run_inner_loop(id, outcome, current_traj_element, info_list):
         _max_steps = half_max_steps
     else:
         _max_steps = quarter_and_half_max_steps
+    ticker = TickScheduler(STEP_INTERVAL, f"game {id}", catch_up=tick_catch_up, drop_frames=tick_drop_frames)
+    ticker.start()
 
     while True:
         # for each step
+        paused = False
         while True:
             if connection[id] or not id_assigned[id]:
                 break
             logger.trace(f"{id} not connect and assigned")
+            paused = True
             await asyncio.sleep(1)
         if not id_assigned[id]:
             break
+        if paused:
+            ticker.start()
         logger.debug(f"{id}=")
         decision = Arrdict({p: dummy_decision[p] for p in outcome})
         inp = Arrdict(data=outcome, prev_decision=decision)
@@ -214,11 +273,12 @@ async def run_inner_loop(id, outcome, current_traj_element, info_list):
         transition = Arrdict(inp=inp, decision=decision)
 
         # env step
-        traj_infos[id]["traj"].append(current_traj_element)
+        traj_writers[id].add("traj", current_traj_element)
+        total_scores[id] += current_traj_element["score"]
         outcome, info = env.step(decision)
+        step_time = time.time()
         logger.debug(f"""Timestep and score: {info["player_0"]["t"]}, {info["player_0"]["score"]}""")
-        # total_score = sum(traj_infos[id]["score"])
-        total_score = sum(ele["score"] for ele in traj_infos[id]["traj"])
+        total_score = total_scores[id]
         current_traj_element = {
             "t": info["player_0"]["t"],
             "score": info["player_0"]["score"],
@@ -239,7 +299,7 @@ async def run_inner_loop(id, outcome, current_traj_element, info_list):
                 if len(t_acts) > len(agent_text_actions[id][a_i]):
                     logger.trace(f"Agent {a_i} perform text_action {t_acts[len(agent_text_actions[id][a_i]):]}")
                     agent_text_actions[id][a_i] = t_acts
-                    traj_infos[id]["text_action"].append({"t": current_steps[id], "agent": a_i, "action": t_acts[-1]})
+                    traj_writers[id].add("text_action", {"t": current_steps[id], "agent": a_i, "action": t_acts[-1]})
         if game_phases[id] > 0:
             try:
                 current_mid_actions = world.get_mid_actions()
@@ -253,8 +313,11 @@ async def run_inner_loop(id, outcome, current_traj_element, info_list):
                     agent_mid_actions[id][a_i].append(m_acts[len(agent_mid_actions[id][a_i])])
                     history_buffers[id].add_action(agent_mid_actions[id][a_i][-1], a_i)
 
-        frame = env.render(mode=render_mode)
-        data = process_frame(frame)
+        # the last frame tells the client that the game is over
+        drop_frame = _max_steps - info["player_0"]["t"] > 0 and ticker.drop_frame()
+        if not drop_frame:
+            frame = env.render(mode=render_mode)
+            data = process_frame(frame)
 
         if game_phases[id] > 0:
             if rule_agents[id].message:
@@ -283,39 +346,43 @@ async def run_inner_loop(id, outcome, current_traj_element, info_list):
             history_buffers[id].add_message(human_message, 1 - llm_idxs[id])
             current_traj_element["message"].append((human_idxs[id], human_message))
 
-        state[id] = {
-            "frame": data,
-            "time": _max_steps - info["player_0"]["t"],
-            "score": total_score,
-            "info_list": info_list,
-        }
-
-        updated[id] = True
+        if not drop_frame:
+            state[id] = {
+                "frame": data,
+                "time": _max_steps - info["player_0"]["t"],
+                "score": total_score,
+                "info_list": info_list,
+                "step_time": step_time,
+            }
+            updated[id] = True
         current_steps[id] = env.timestep
 
         if game_phases[id] > 0:
             if len(rule_agents[id].text_assign_tasks) > 0:
                 current_traj_element["assigned_tasks"] = rule_agents[id].text_assign_tasks
 
-        if current_steps[id] > 0 and (current_steps[id] % urgent_response_interval_n_timestep == 0 or human_message):
+        # periodic triggers are staggered across games to smooth the load of the LLM backend
+        if current_steps[id] > 0 and (
+            is_staggered_trigger(current_steps[id], urgent_response_interval_n_timestep, id, MAX_GAME) or human_message
+        ):
             to_urgent_responses[id] = True
         if PHASE_2_AGENT[game_phases[id]] in ["wtom", "wotom"]:
-            if current_steps[id] > 0 and current_steps[id] % reflection_interval_n_timestep == 0:
+            if is_staggered_trigger(current_steps[id], reflection_interval_n_timestep, id, MAX_GAME):
                 to_reflections[id] = True
 
         if _max_steps - info["player_0"]["t"] == 0:
-            if game_phases[id] >= 0:
-                filename = f"{traj_names[id]}".replace(":", "_")
-                traj_path = f"{traj_savepath}/{filename}.json".replace("\\", "/")
-                with open(traj_path, "w") as f:
-                    logger.info(f"save traj to {traj_path}")
-                    json.dump(traj_infos[id], f, ensure_ascii=False)
+            traj_path = traj_writers[id].close()
+            if traj_path is not None:
+                logger.info(f"save traj to {traj_path}")
             await asyncio.sleep(1)
             status[id] = False
             episode_end = True
             logger.info(f"Game finished at step {_max_steps} for {id_name_phone_list[id]} in phase {game_phases[id]}")
+            logger.info(f"Game {id} {ticker.summary()}")
             break
-        await asyncio.sleep(STEP_INTERVAL)
+        await ticker.wait()
+        if current_steps[id] % 100 == 0:
+            logger.info(f"Game {id} step {current_steps[id]}: {ticker.summary()}")
 
     return episode_end
 
@@ -338,17 +405,22 @@ async def startgame(id):
             # Wait for connection
             while not connection[id]:
                 logger.trace(f"game {id} for connection {id}")
-                await asyncio.sleep(1)
+                await asyncio.sleep(0.1)
 
             while game_phases[id] is None:
-                await asyncio.sleep(1)
+                await asyncio.sleep(0.1)
 
-            traj_infos[id] = {
-                "traj": [],  # time, state, action, score, message, mid_action
-                "urgent_response": [],  # time, input, output, latency
-                "reflection": [],  # time, input, output, latency
-                "text_action": [],  # time, agent, action
-            }
+            # records: "traj" (time, state, action, score, message, mid_action), "urgent_response" and "reflection"
+            # (time, input, output, latency), "text_action" (time, agent, action), streamed while the game runs
+            if traj_writers[id] is not None:
+                # keeps the records of an unfinished last game of this id
+                traj_writers[id].close(finished=False)
+            if game_phases[id] >= 0:
+                filename = f"{traj_names[id]}".replace(":", "_")
+                traj_writers[id] = TrajectoryWriter(f"{traj_savepath}/{filename}.jsonl".replace("\\", "/"))
+            else:
+                traj_writers[id] = TrajectoryWriter(None)
+            total_scores[id] = 0
 
             await PROGRESS_EVENT.wait()
             PROGRESS_EVENT.clear()
@@ -357,7 +429,8 @@ async def startgame(id):
             else:
                 _max_steps = quarter_and_half_max_steps
 
-            outcome = env.reset(_max_steps)
+            # the env and the rule agent are usually prepared at the end of the last game
+            outcome, rule_agent = game_slots[id].acquire(PHASE_2_AGENT[game_phases[id]], _max_steps)
 
             env._env.unwrapped.world.agents[1 - llm_idxs[id]].color = "black"
             if game_phases[id] <= 0:
@@ -386,80 +459,7 @@ async def startgame(id):
             }
 
             mid_actions[id] = None
-
-            if game_phases[id] > 0:
-                if PHASE_2_AGENT[game_phases[id]] == "wotom":
-                    if FSM:
-                        rule_agents[id] = CommInferAgent(
-                            text_agents[id],
-                            envs[id]._env.unwrapped.world,
-                            send_message=SEND_MESSAGE,
-                            receive_message=RECEIVE_MESSAGE,
-                            infer_human=False,
-                        )
-                    else:
-                        rule_agents[id] = CommInferAgentNoFSM(
-                            text_agents[id],
-                            env._env.unwrapped.world,
-                            send_message=SEND_MESSAGE,
-                            receive_message=RECEIVE_MESSAGE,
-                            infer_human=False,
-                        )
-                elif PHASE_2_AGENT[game_phases[id]] == "wtom":
-                    if FSM:
-                        rule_agents[id] = CommInferAgent(
-                            text_agents[id],
-                            envs[id]._env.unwrapped.world,
-                            send_message=SEND_MESSAGE,
-                            receive_message=RECEIVE_MESSAGE,
-                            infer_human=True,
-                        )
-                    else:
-                        rule_agents[id] = CommInferAgentNoFSM(
-                            text_agents[id],
-                            env._env.unwrapped.world,
-                            send_message=SEND_MESSAGE,
-                            receive_message=RECEIVE_MESSAGE,
-                            infer_human=True,
-                        )
-                elif PHASE_2_AGENT[game_phases[id]] == "reflexion":
-                    if FSM:
-                        rule_agents[id] = ReflexionAgent(
-                            text_agents[id],
-                            envs[id]._env.unwrapped.world,
-                            send_message=SEND_MESSAGE,
-                            receive_message=RECEIVE_MESSAGE,
-                            max_n_react_turn=urgent_response_history_n_event,
-                            max_n_reflection_event=reflection_history_n_event,
-                        )
-                    else:
-                        rule_agents[id] = ReflexionAgentNoFSM(
-                            text_agents[id],
-                            env._env.unwrapped.world,
-                            send_message=SEND_MESSAGE,
-                            receive_message=RECEIVE_MESSAGE,
-                            max_n_react_turn=urgent_response_history_n_event,
-                            max_n_reflection_event=reflection_history_n_event,
-                        )
-                elif PHASE_2_AGENT[game_phases[id]] == "react":
-                    if FSM:
-                        rule_agents[id] = ReActAgent(
-                            text_agents[id],
-                            envs[id]._env.unwrapped.world,
-                            send_message=SEND_MESSAGE,
-                            receive_message=RECEIVE_MESSAGE,
-                            max_n_react_turn=urgent_response_history_n_event,
-                        )
-                    else:
-                        rule_agents[id] = ReActAgentNoFSM(
-                            text_agents[id],
-                            env._env.unwrapped.world,
-                            send_message=SEND_MESSAGE,
-                            receive_message=RECEIVE_MESSAGE,
-                            max_n_react_turn=urgent_response_history_n_event,
-                        )
-                else:
-                    logger.error(f"game_phases[id] {game_phases[id]} error!")
+            rule_agents[id] = rule_agent
 
             logger.info(
                 f"game phase {game_phases[id]} with steps {_max_steps} for {id_name_phone_list[id]} in game id {id}"
@@ -485,6 +485,7 @@ async def startgame(id):
                 raise
             except:
                 is_game_healthy[id] = False
+            llm_scheduler.cancel_game(id)
             connection[id] = False
             rule_agents[id] = None
             if episode_end:
@@ -493,13 +494,12 @@ async def startgame(id):
                 else:
                     logger.info(f"All game finished for {id_name_phone_list[id]} in game_id {id}")
                     async with PROGRESS_LOCK:
-                        with open(progress_savepath, encoding="utf-8") as f:
-                            progress = json.load(f)
+                        progress = progress_store.data
                         progress[id_name_phone_list[id]]["game_id"] = -1
-                        with open(progress_savepath, "w", encoding="utf-8") as f:
-                            json.dump(progress, f, ensure_ascii=False)
+                        progress_store.mark_dirty()
                     id_name_phone_list[id] = None
                     id_assigned[id] = False
+                prepare_next_game(id)
     except KeyboardInterrupt:
         logger.error("Ctrl+C detected")
         raise
@@ -530,10 +530,13 @@ async def react(id) -> str:
                 s_time = time.time()
 
                 ## interact with an LLM, generate thought and action together
-                llm_output = await get_openai_llm_output(MODEL, llm_input)
+                llm_output = await llm_scheduler.get_llm_output(
+                    MODEL, llm_input, game_id=id, priority=Priority.URGENT_RESPONSE
+                )
                 e_time = time.time()
-                traj_infos[id]["urgent_response"].append(
-                    {"t": current_steps[id], "input": llm_input, "output": llm_output, "latency": e_time - s_time}
+                traj_writers[id].add(
+                    "urgent_response",
+                    {"t": current_steps[id], "input": llm_input, "output": llm_output, "latency": e_time - s_time},
                 )
                 logger.success(f"ReAct LLM Output, Used {e_time - s_time: .4f}s")
                 logger.trace("ReAct LLM Output")
@@ -576,10 +579,13 @@ async def reflection(id) -> str:
                 logger.debug("Reflection LLM Input")
                 logger.debug(llm_input[1]["content"])
                 s_time = time.time()
-                llm_output = await get_openai_llm_output(MODEL, llm_input)
+                llm_output = await llm_scheduler.get_llm_output(
+                    MODEL, llm_input, game_id=id, priority=Priority.REFLECTION
+                )
                 e_time = time.time()
-                traj_infos[id]["reflection"].append(
-                    {"t": current_steps[id], "input": llm_input, "output": llm_output, "latency": e_time - s_time}
+                traj_writers[id].add(
+                    "reflection",
+                    {"t": current_steps[id], "input": llm_input, "output": llm_output, "latency": e_time - s_time},
                 )
                 logger.info(f"Game {id} Reflection LLM Output, Used {e_time - s_time: .4f}s")
                 logger.debug(llm_output)
@@ -610,10 +616,13 @@ async def urgent_response(id) -> str:
                 logger.debug("Urgent Response LLM Input")
                 logger.debug(llm_input[1]["content"])
                 s_time = time.time()
-                llm_output = await get_openai_llm_output(MODEL, llm_input)
+                llm_output = await llm_scheduler.get_llm_output(
+                    MODEL, llm_input, game_id=id, priority=Priority.URGENT_RESPONSE
+                )
                 e_time = time.time()
-                traj_infos[id]["urgent_response"].append(
-                    {"t": current_steps[id], "input": llm_input, "output": llm_output, "latency": e_time - s_time}
+                traj_writers[id].add(
+                    "urgent_response",
+                    {"t": current_steps[id], "input": llm_input, "output": llm_output, "latency": e_time - s_time},
                 )
                 logger.info(f"Game {id} Urgent Response LLM Output, Used {e_time - s_time: .4f}s")
                 logger.debug(f"Output:\n{llm_output}")
@@ -621,8 +630,8 @@ async def urgent_response(id) -> str:
                 rule_agents[id].update_assigned_tasks(llm_output)
                 if rule_agents[id].message:
                     history_buffers[id].add_message(rule_agents[id].message, llm_idxs[id])
-                traj_infos[id]["urgent_response"].append(
-                    {"t": current_steps[id], "input": llm_input, "output": llm_output}
+                traj_writers[id].add(
+                    "urgent_response", {"t": current_steps[id], "input": llm_input, "output": llm_output}
                 )
                 to_urgent_responses[id] = False
             except KeyboardInterrupt:
@@ -644,6 +653,13 @@ async def startup():
     loop.create_task(start_reacts())
     loop.create_task(start_urgent_responses())
     loop.create_task(start_check_connections())
+    loop.create_task(llm_scheduler.report_metrics())
+    loop.create_task(progress_store.run())
+
+
+@app.after_serving
+async def shutdown():
+    await progress_store.flush()
 
 
 async def start_check_connections():
@@ -722,8 +738,7 @@ async def getsettings():
             request_data = await request.get_data()
             data_json = json.loads(request_data)
             id_name_phone = f"""{data_json["name"]}_{data_json["phone"]}"""
-            with open(progress_savepath, encoding="utf-8") as f:
-                progress = json.load(f)
+            progress = progress_store.data
 
             if id_name_phone in progress.keys():
                 # Existing user, check id
@@ -806,8 +821,7 @@ async def getsettings():
 
                 logger.info(f"\n\n\n save progress {id_name_phone}\n\n\n")
 
-            with open(progress_savepath, "w", encoding="utf-8") as f:
-                json.dump(progress, f, ensure_ascii=False)
+            progress_store.mark_dirty()
 
         id_assigned[agent_id] = True
 
@@ -854,8 +868,7 @@ async def getphase(id):
                         if game_phase % 2 == 0:
                             logger.info(f"{game_phase}")
                             to_questionnaire = True
-            with open(progress_savepath, encoding="utf-8") as f:
-                progress = json.load(f)
+            progress = progress_store.data
         logger.info(progress)
         if progress.get(id_name_phone, None) is not None:
             game_seq = progress[id_name_phone]["game_sequence"]
@@ -950,14 +963,12 @@ async def save_traj_info():
         request_data = await request.get_data()
         data_json = json.loads(request_data)
         async with PROGRESS_LOCK:
-            with open(progress_savepath, encoding="utf-8") as f:
-                progress = json.load(f)
+            progress = progress_store.data
             id_name_phone = f"{data_json.get('name')}_{data_json.get('phone')}"
             phase_idx = progress[id_name_phone]["game_sequence_idx"]
             if phase_idx <= 0 or phase_idx % 2 != 0:
                 progress[id_name_phone]["game_sequence_idx"] += 1
-                with open(progress_savepath, "w", encoding="utf-8") as f:
-                    json.dump(progress, f, ensure_ascii=False)
+                progress_store.mark_dirty()
         if phase_idx >= 0:
             questionnaire_path = os.path.join(questionnaire_savepath, id_name_phone)
             with open(f"{questionnaire_path}.json", encoding="utf-8") as f:
@@ -968,7 +979,7 @@ async def save_traj_info():
                 in_game = questionnaire["in_game"]
             traj_id = data_json["traj_id"]
             save_path = os.path.normpath(traj_savepath)
-            filename = f"{traj_id}.json".replace(":", "_")
+            filename = f"{traj_id}.jsonl".replace(":", "_")
             phase = int(data_json["gamephase"])
             phase_key = f"phase_{phase}"
             if phase_key in in_game.keys():
@@ -1037,12 +1048,10 @@ async def create_questionnaire_in_game():
     with open(f"{questionnaire_path}.json", "w", encoding="utf-8") as fw:
         json.dump(questionnaire, fw, ensure_ascii=False)
     async with PROGRESS_LOCK:
-        with open(progress_savepath, encoding="utf-8") as f:
-            progress = json.load(f)
+        progress = progress_store.data
         id_name_phone = f"{data_json.get('name')}_{data_json.get('phone')}"
         progress[id_name_phone]["game_sequence_idx"] += 1
-        with open(progress_savepath, "w", encoding="utf-8") as f:
-            json.dump(progress, f, ensure_ascii=False)
+        progress_store.mark_dirty()
     return questionnaire
 
 
@@ -1100,11 +1109,9 @@ async def check_connection(id) -> str:
         if lost_time[id] >= 300:
             logger.info(f"Connection lost for {id_name_phone_list[id]} in game_id {id}")
             async with PROGRESS_LOCK:
-                with open(progress_savepath, encoding="utf-8") as f:
-                    progress = json.load(f)
+                progress = progress_store.data
                 progress[id_name_phone_list[id]]["game_id"] = -1
-                with open(progress_savepath, "w", encoding="utf-8") as f:
-                    json.dump(progress, f, ensure_ascii=False)
+                progress_store.mark_dirty()
             id_name_phone_list[id] = None
             id_assigned[id] = False
             lost_time[id] = 0
@@ -1117,9 +1124,14 @@ if __name__ == "__main__":
     os.makedirs("logs", exist_ok=True)
     logger.add("logs/day4.log", level="TRACE")
     logger.add("logs/day4_less.log", level="INFO")
-    args, conf, env_conf, _ = parse_args(create_parser())
+    args, conf, env_conf, _ = parse_args(create_parser_webapp())
+    if args.mock_llm:
+        enable_mock_llm(args.mock_llm)
 
     utils.set_random_seed(args.seed)
+    questionnaire_savepath = os.path.join(args.data_dir, "questionnaire")
+    traj_savepath = os.path.join(args.data_dir, "traj")
+    progress_savepath = os.path.join(args.data_dir, "progress.json")
 
     logger.success("args\n" + pformat(args))
     logger.success("conf\n" + pformat(conf))
@@ -1129,6 +1141,8 @@ if __name__ == "__main__":
     reflection_interval_n_timestep = conf.get("reflection_interval_n_timestep", 50)
     urgent_response_history_n_event = conf.get("urgent_response_history_n_event", 3)
     urgent_response_interval_n_timestep = conf.get("urgent_response_interval_n_timestep", 20)
+    tick_catch_up = conf.get("tick_catch_up", False)
+    tick_drop_frames = conf.get("tick_drop_frames", False)
     max_steps = env_conf.get("horizon", 1000)
 
     half_max_steps = max_steps // 2
@@ -1140,13 +1154,30 @@ if __name__ == "__main__":
     MODEL = args.model
     FSM = args.fsm
 
+    llm_scheduler = LLMScheduler(
+        max_concurrency=conf.get("llm_max_concurrency", 8),
+        model_budgets=conf.get("llm_model_budgets", {}),
+    )
+
     reg_env_name = env_conf.name
     del env_conf["name"]
-    envs = [OvercookedMaker(**env_conf, display=True) for _ in range(MAX_GAME)]
-    [env.reset() for env in envs]
-
-    action_spaces = envs[0].action_spaces
-    controllers = [MultiController(action_spaces) for _ in range(MAX_GAME)]
+    llm_idxs = [1 for _ in range(MAX_GAME)]
+    game_slots = [
+        GameSlot(
+            env_conf,
+            llm_idxs[idx],
+            create_rule_agent,
+            history_kwargs=dict(
+                max_steps=max_steps,
+                compact=conf.get("history_compact", False),
+                max_tokens=conf.get("history_max_tokens", None),
+                max_length=conf.get("history_max_length", None),
+            ),
+        )
+        for idx in range(MAX_GAME)
+    ]
+    envs = [slot.env for slot in game_slots]
+    controllers = [slot.controller for slot in game_slots]
 
     num_episodes = 1
     render_mode = "rgb_array"
@@ -1162,12 +1193,12 @@ if __name__ == "__main__":
 
     state = [None for _ in range(MAX_GAME)]
     updated = [False for _ in range(MAX_GAME)]
-    traj_infos = [None for _ in range(MAX_GAME)]
+    traj_writers = [None for _ in range(MAX_GAME)]
+    total_scores = [0 for _ in range(MAX_GAME)]
 
     globalstate = False
 
     traj_names = ["" for _ in range(MAX_GAME)]
-    llm_idxs = [1 for _ in range(MAX_GAME)]
     human_idxs = [0 for _ in range(MAX_GAME)]
     current_steps = [0 for _ in range(MAX_GAME)]
     mid_actions = [None for _ in range(MAX_GAME)]
@@ -1182,32 +1213,27 @@ if __name__ == "__main__":
     #! remember to change back to 0
     game_phases = [-1 for _ in range(MAX_GAME)]  # 0 is trail
 
-    text_agents = [TextAgent(envs[idx]._env.unwrapped.world, llm_idxs[idx]) for idx in range(MAX_GAME)]
-
-    mid_agents = [MidAgent(text_agents[idx], envs[idx]._env.unwrapped.world) for idx in range(MAX_GAME)]
+    text_agents = [slot.text_agent for slot in game_slots]
+    mid_agents = [slot.mid_agent for slot in game_slots]
     rule_agents = [None] * MAX_GAME
     game_sequence = [None for _ in range(MAX_GAME)]
     last_phases = [0 for _ in range(MAX_GAME)]
-    history_buffers = [History(max_steps=max_steps) for _ in range(MAX_GAME)]
-
-    if not os.path.exists(progress_savepath):
-        os.makedirs(os.path.dirname(progress_savepath), exist_ok=True)
-        with open(progress_savepath, "w", encoding="utf-8") as f:
-            json.dump({}, f)
-            # user_progress:
-            #     {
-            #         user_id:
-            #             - game_sequence
-            #             - game_sequence_idx
-            #             - config
-            #     }
-    else:
-        with open(progress_savepath, encoding="utf-8") as f:
-            progress = json.load(f)
-        for user_id, user_progress in progress.items():
-            user_progress["game_id"] = -1
-        with open(progress_savepath, "w", encoding="utf-8") as f:
-            json.dump(progress, f, ensure_ascii=False)
+    history_buffers = [slot.history_buffer for slot in game_slots]
+    for idx in range(MAX_GAME):
+        prepare_next_game(idx)
+
+    # user_progress:
+    #     {
+    #         user_id:
+    #             - game_sequence
+    #             - game_sequence_idx
+    #             - config
+    #             - game_id
+    #     }
+    progress_store = ProgressStore(progress_savepath)
+    for user_id, user_progress in progress_store.data.items():
+        user_progress["game_id"] = -1
+    progress_store.flush_sync()
     os.makedirs(questionnaire_savepath, exist_ok=True)
     os.makedirs(traj_savepath, exist_ok=True)
 
@@ -1215,5 +1241,5 @@ if __name__ == "__main__":
     config = Config()
     config.worker_class = "asyncio.ThreadPoolWorker"
     config.threads = 5
-    config.bind = ["0.0.0.0:63000"]
+    config.bind = [f"0.0.0.0:{args.port}"]
     asyncio.run(serve(app, config))
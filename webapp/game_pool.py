@@ -0,0 +1,76 @@
+"""
+Pre-warmed env and agent bundles of the game slots of the webapp.
+
+Each slot builds its env, graphics, controller, text/mid agents and history buffer once at startup. At the end of a
+game, `prepare` resets the env and builds the rule agent of the expected next phase, so that the phase change only
+takes them with `acquire` instead of rebuilding them while the participant waits.
+"""
+
+from typing import Any, Callable, Dict, Tuple
+
+from gym_cooking.cooking_world.cooking_world import CookingWorld
+from loguru import logger
+
+from agents.mid_agent import MidAgent
+from agents.rule_agent import RuleAgent
+from agents.text_agent import TextAgent
+from coop_marl.controllers import MultiController
+from coop_marl.envs.overcooked.overcooked_maker import OvercookedMaker
+from utils.history import History
+
+
+class GameSlot:
+    """
+    - `create_rule_agent(kind, text_agent, world)`: the rule agent of a kind of phase, None for the phases without an
+        LLM agent.
+    """
+
+    def __init__(
+        self,
+        env_conf: Dict,
+        llm_idx: int,
+        create_rule_agent: Callable[[str, TextAgent, CookingWorld], RuleAgent | None],
+        history_kwargs: Dict,
+        display: bool = True,
+    ) -> None:
+        self.llm_idx = llm_idx
+        self.create_rule_agent = create_rule_agent
+        self.env = OvercookedMaker(**env_conf, display=display)
+        self.env.reset()
+        self.controller = MultiController(self.env.action_spaces)
+        self.text_agent = TextAgent(self.world, llm_idx)
+        self.mid_agent = MidAgent(self.text_agent, self.world)
+        self.history_buffer = History(**history_kwargs)
+        # (kind, horizon, world, outcome, rule_agent) of the prepared game
+        self._prepared: Tuple[str, int, CookingWorld, Any, RuleAgent | None] | None = None
+
+    @property
+    def world(self) -> CookingWorld:
+        # MARK: world will change after reset
+        return self.env._env.unwrapped.world
+
+    def prepare(self, kind: str, horizon: int) -> None:
+        """
+        Reset the env for a game of `horizon` steps and build its rule agent ahead of the phase change.
+        """
+        outcome = self.env.reset(horizon)
+        rule_agent = self.create_rule_agent(kind, self.text_agent, self.world)
+        self._prepared = (kind, horizon, self.world, outcome, rule_agent)
+
+    def acquire(self, kind: str, horizon: int) -> Tuple[Any, RuleAgent | None]:
+        """
+        The reset env outcome and the rule agent of the next game, prepared now if the prepared game does not match.
+        """
+        prepared = self._prepared
+        self._prepared = None
+        # the env may have been reset (e.g. by /inigame) since it was prepared
+        if (
+            prepared is None
+            or prepared[:2] != (kind, horizon)
+            or prepared[2] is not self.world
+            or self.env.timestep != 0
+        ):
+            logger.debug(f"No prepared {kind} game of {horizon} steps")
+            self.prepare(kind, horizon)
+            prepared, self._prepared = self._prepared, None
+        return prepared[3], prepared[4]
@@ -0,0 +1,333 @@
+"""
+Load test of the human-LLM webapp with simulated participants.
+
+Starts `webapp/app_human_llm.py` with the mock LLM and a temporary data dir, in which `n_games` participants are set
+to play the given phase, then each simulated browser drives the real endpoints (`/getsettings`, `/<id>/getphase`,
+`/<id>/connect`, `/save_traj_info`) and sends key presses, random ones or the human actions replayed from recorded
+trajectories:
+    python webapp/load_test.py --n_games 15 --phase 5 --max_seconds 60
+    python webapp/load_test.py --n_games 8 --input data/traj --url http://127.0.0.1:63000  # a running server
+
+Reports per game the tick period and its jitter (from the server step time of each frame), the frame latency from
+the env step to the client, the websocket bytes/sec, and the CPU time of the server per game. Needs aiohttp.
+"""
+
+import argparse
+import asyncio
+import glob
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+from loguru import logger
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from utils.trajectory import TRAJECTORY_SUFFIXES, load_trajectory  # noqa: E402
+
+STEP_INTERVAL = 0.25
+HUMAN_IDX = 0
+
+
+def _get_aiohttp():
+    try:
+        import aiohttp
+    except ImportError as e:
+        raise ImportError("The load test needs the aiohttp package: pip install aiohttp") from e
+    return aiohttp
+
+
+def load_human_actions(path: str) -> List[List[int]]:
+    """
+    Action sequences of the human (agent 0) in the trajectories at `path` (a file or a directory), one per trajectory.
+    """
+    if os.path.isdir(path):
+        file_paths = sorted(
+            f for suffix in TRAJECTORY_SUFFIXES for f in glob.glob(f"{path}/**/*{suffix}", recursive=True)
+        )
+    else:
+        file_paths = [path]
+    sequences = []
+    for file_path in file_paths:
+        traj = load_trajectory(file_path).get("traj", [])
+        actions = [element["action"][HUMAN_IDX] for element in traj if element.get("action")]
+        if any(actions):
+            sequences.append(actions)
+    if not sequences:
+        raise ValueError(f"No human actions in {path}")
+    return sequences
+
+
+def seed_data_dir(data_dir: str, n_games: int, phase: int) -> List[Dict]:
+    """
+    Participants of the load test, set to play `phase` next.
+    """
+    os.makedirs(os.path.join(data_dir, "questionnaire"), exist_ok=True)
+    participants, progress = [], {}
+    for i in range(n_games):
+        participant = {"name": f"load{i}", "phone": str(i)}
+        user_id = f"{participant['name']}_{participant['phone']}"
+        progress[user_id] = {
+            "game_sequence": [0, phase],
+            "game_sequence_idx": 1,
+            # only compared with the config of the webapp for a warning
+            "config": {"RECEIVE_MESSAGE": False, "SEND_MESSAGE": False},
+            "game_id": -1,
+        }
+        with open(os.path.join(data_dir, "questionnaire", f"{user_id}.json"), "w", encoding="utf-8") as f:
+            json.dump({}, f)
+        participants.append(participant)
+    with open(os.path.join(data_dir, "progress.json"), "w", encoding="utf-8") as f:
+        json.dump(progress, f)
+    return participants
+
+
+def start_server(args, data_dir: str) -> subprocess.Popen:
+    command = [
+        sys.executable,
+        "webapp/app_human_llm.py",
+        "--config_file",
+        args.config_file,
+        "--env_config_file",
+        args.env_config_file,
+        "--seed",
+        "0",
+        "--fsm",
+        "-m",
+        args.model,
+        "--mock_llm",
+        args.mock_llm,
+        "--data_dir",
+        data_dir,
+        "--port",
+        str(args.port),
+    ]
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT_DIR, os.environ.get("PYTHONPATH", "")]))
+    log_file = open(os.path.join(data_dir, "server.log"), "w")
+    logger.info(f"Start the server: {' '.join(command)}")
+    return subprocess.Popen(command, cwd=ROOT_DIR, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+
+
+async def wait_for_port(host: str, port: int, server: subprocess.Popen | None, timeout: float = 300) -> None:
+    s_time = time.time()
+    while time.time() - s_time < timeout:
+        if server is not None and server.poll() is not None:
+            raise RuntimeError(f"The server exited with {server.returncode}, see server.log in the data dir")
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return
+        except OSError:
+            await asyncio.sleep(1)
+    raise TimeoutError(f"The server is not listening on {host}:{port} after {timeout}s")
+
+
+def cpu_seconds(pid: int) -> float | None:
+    """
+    User + system CPU time of a process (Linux only).
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+async def run_client(
+    session, url: str, participant: Dict, actions: List[int] | None, actions_per_second: float, max_seconds: float
+) -> Dict:
+    """
+    One simulated browser, plays one game and returns its measurements.
+    """
+    aiohttp = _get_aiohttp()
+    user_info = json.dumps(participant)
+    async with session.post(f"{url}/getsettings", data=user_info) as response:
+        settings = json.loads(await response.text())
+    game_id = settings["agentid"]
+    async with session.post(f"{url}/{game_id}/getphase", data=user_info) as response:
+        phase = json.loads(await response.text())["gamephase"]
+
+    result = {"game_id": game_id, "phase": phase, "step_times": [], "latencies": [], "n_bytes": 0, "finished": False}
+    ws_url = url.replace("http://", "ws://", 1) + f"/{game_id}/connect"
+    async with session.ws_connect(ws_url, max_msg_size=0) as ws:
+
+        async def _send():
+            t = 0
+            while True:
+                if actions is not None:
+                    # the recorded action of each tick
+                    await asyncio.sleep(STEP_INTERVAL)
+                    action = actions[t % len(actions)]
+                    t += 1
+                    if action:
+                        await ws.send_str(f"{action} 0 0")
+                else:
+                    await asyncio.sleep(random.expovariate(actions_per_second))
+                    await ws.send_str(f"{random.randint(1, 5)} 0 0")
+
+        # the server waits for a first message to mark the connection
+        await ws.send_str("0 0 0")
+        sender = asyncio.create_task(_send())
+        s_time = time.time()
+        try:
+            async for msg in ws:
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    break
+                recv_time = time.time()
+                result["n_bytes"] += len(msg.data)
+                data = json.loads(msg.data)
+                if "step_time" in data:
+                    result["step_times"].append(data["step_time"])
+                    result["latencies"].append(recv_time - data["step_time"])
+                if data["time"] == 0:
+                    result["finished"] = True
+                    break
+                if recv_time - s_time >= max_seconds:
+                    break
+        finally:
+            sender.cancel()
+        result["duration"] = time.time() - s_time
+
+    if result["finished"]:
+        domdata = dict(participant, gamephase=phase, traj_id=settings["trajname"])
+        async with session.post(f"{url}/save_traj_info", json=domdata) as response:
+            await response.read()
+    return result
+
+
+def _percentiles(values: np.ndarray) -> Dict[str, float]:
+    if len(values) == 0:
+        return {}
+    return {f"p{q}": float(np.percentile(values, q)) for q in [50, 95, 99]} | {"max": float(values.max())}
+
+
+def summarize(results: List[Dict], cpu_time: float | None, wall_time: float) -> Dict:
+    games = []
+    for result in results:
+        step_times = np.array(result["step_times"])
+        periods = np.diff(step_times)
+        games.append(
+            {
+                "game_id": result["game_id"],
+                "phase": result["phase"],
+                "n_frames": len(step_times),
+                "finished": result["finished"],
+                "tick_period_mean": float(periods.mean()) if len(periods) else None,
+                "tick_jitter": _percentiles(np.abs(periods - STEP_INTERVAL)),
+                "frame_latency": _percentiles(np.array(result["latencies"])),
+                "ws_bytes_per_second": result["n_bytes"] / max(result["duration"], 1e-6),
+            }
+        )
+    all_periods = np.concatenate([np.diff(r["step_times"]) for r in results if len(r["step_times"]) > 1] or [[]])
+    all_latencies = np.concatenate([r["latencies"] for r in results] or [[]])
+    summary = {
+        "n_games": len(results),
+        "wall_time": wall_time,
+        "tick_period_mean": float(all_periods.mean()) if len(all_periods) else None,
+        "tick_jitter": _percentiles(np.abs(all_periods - STEP_INTERVAL)),
+        "frame_latency": _percentiles(all_latencies),
+        "ws_bytes_per_second_per_game": float(np.mean([g["ws_bytes_per_second"] for g in games])) if games else 0,
+        "server_cpu_per_game": cpu_time / wall_time / len(results) if cpu_time is not None and results else None,
+        "games": games,
+    }
+    return summary
+
+
+def print_summary(summary: Dict) -> None:
+    def _fmt(stats: Dict) -> str:
+        return " / ".join(f"{stats[k] * 1000:.0f}" for k in ["p50", "p95", "p99", "max"]) if stats else "-"
+
+    print(f"{summary['n_games']} games in {summary['wall_time']:.0f}s")
+    print(f"tick period mean: {summary['tick_period_mean'] or 0:.3f}s (target {STEP_INTERVAL}s)")
+    print(f"tick jitter p50/p95/p99/max (ms): {_fmt(summary['tick_jitter'])}")
+    print(f"frame latency p50/p95/p99/max (ms): {_fmt(summary['frame_latency'])}")
+    print(f"websocket: {summary['ws_bytes_per_second_per_game'] / 1024:.1f} KB/s per game")
+    if summary["server_cpu_per_game"] is not None:
+        print(f"server CPU: {summary['server_cpu_per_game'] * 100:.1f}% of a core per game")
+    print("game | phase | frames | tick mean (s) | jitter p99 (ms) | latency p99 (ms) | KB/s")
+    for game in summary["games"]:
+        print(
+            f"{game['game_id']} | {game['phase']} | {game['n_frames']} | {game['tick_period_mean'] or 0:.3f} | "
+            f"{game['tick_jitter'].get('p99', 0) * 1000:.0f} | {game['frame_latency'].get('p99', 0) * 1000:.0f} | "
+            f"{game['ws_bytes_per_second'] / 1024:.1f}"
+        )
+
+
+async def main(args) -> Dict:
+    aiohttp = _get_aiohttp()
+    server, data_dir = None, args.data_dir
+    if args.url is None:
+        data_dir = data_dir or tempfile.mkdtemp(prefix="dpt_load_test_")
+        participants = seed_data_dir(data_dir, args.n_games, args.phase)
+        server = start_server(args, data_dir)
+        url = f"http://127.0.0.1:{args.port}"
+    else:
+        participants = [{"name": f"load{i}", "phone": str(i)} for i in range(args.n_games)]
+        url = args.url.rstrip("/")
+    sequences = load_human_actions(args.input) if args.input != "random" else None
+    try:
+        host, port = url.split("://", 1)[1].split(":")
+        await wait_for_port(host, int(port), server)
+        cpu_start = cpu_seconds(server.pid) if server is not None else None
+        s_time = time.time()
+        async with aiohttp.ClientSession() as session:
+            tasks = []
+            for i, participant in enumerate(participants):
+                actions = sequences[i % len(sequences)] if sequences is not None else None
+                tasks.append(
+                    asyncio.create_task(
+                        run_client(session, url, participant, actions, args.actions_per_second, args.max_seconds)
+                    )
+                )
+                # participants arriving at the same time would race for the start of their games
+                await asyncio.sleep(args.ramp_up)
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+        wall_time = time.time() - s_time
+        cpu_end = cpu_seconds(server.pid) if server is not None else None
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    for result in results:
+        if isinstance(result, BaseException):
+            logger.error(f"Client failed: {result!r}")
+    results = [result for result in results if not isinstance(result, BaseException)]
+    cpu_time = cpu_end - cpu_start if cpu_start is not None and cpu_end is not None else None
+    summary = summarize(results, cpu_time, wall_time)
+    summary["data_dir"] = data_dir
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n_games", "-n", default=4, type=int)
+    parser.add_argument("--phase", default=5, type=int, help="game phase of the participants, see PHASE_2_AGENT")
+    parser.add_argument(
+        "--input", default="random", type=str, help="'random' key presses, or trajectories to replay the human actions"
+    )
+    parser.add_argument("--actions_per_second", default=4.0, type=float, help="rate of the random key presses")
+    parser.add_argument("--max_seconds", default=float("inf"), type=float, help="stop each game after this time")
+    parser.add_argument("--ramp_up", default=2.0, type=float, help="seconds between the arrivals of participants")
+    parser.add_argument("--url", default=None, type=str, help="test a running server instead of starting one")
+    parser.add_argument("--port", default=63100, type=int)
+    parser.add_argument("--data_dir", default=None, type=str, help="data dir of the started server, temporary if None")
+    parser.add_argument("--config_file", default="config/algs/play/overcooked.yaml", type=str)
+    parser.add_argument("--env_config_file", default="config/envs/overcooked.yaml", type=str)
+    parser.add_argument("--model", "-m", default="4o-mini", type=str)
+    parser.add_argument("--mock_llm", default="synthesize", type=str)
+    parser.add_argument("--output", default=None, type=str, help="save the measurements as JSON")
+    args = parser.parse_args()
+
+    summary = asyncio.run(main(args))
+    print_summary(summary)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
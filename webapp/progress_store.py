@@ -0,0 +1,75 @@
+"""
+Participant progress of the webapp, {user_id: {"game_sequence", "game_sequence_idx", "config", "game_id"}}.
+
+The progress is kept in memory as the authoritative copy, routes change `store.data` (under PROGRESS_LOCK) and call
+`mark_dirty()` instead of rewriting the file. The `run()` task writes the changes made within `flush_interval` seconds
+as one file write in a thread, to a temporary file renamed over `path`, so that the file is always complete.
+"""
+
+import asyncio
+import json
+import os
+from typing import Dict
+
+from loguru import logger
+
+
+class ProgressStore:
+    def __init__(self, path: str, flush_interval: float = 1.0) -> None:
+        self.path = path
+        self.flush_interval = flush_interval
+        self.data: Dict[str, Dict] = self._recover()
+        self._changed = asyncio.Event()
+
+    def _recover(self) -> Dict[str, Dict]:
+        """
+        The last complete progress: the temporary file if a crash happened between writing and renaming it (an
+        incomplete one is not valid JSON), otherwise `path`.
+        """
+        for path in [self.path + ".tmp", self.path]:
+            if not os.path.exists(path):
+                continue
+            try:
+                with open(path, encoding="utf-8") as f:
+                    data = json.load(f)
+            except ValueError as e:
+                logger.warning(f"Skip the broken progress file {path}: {e}")
+                continue
+            if path != self.path:
+                logger.warning(f"Recover the progress from {path}")
+            return data
+        return {}
+
+    def mark_dirty(self) -> None:
+        self._changed.set()
+
+    def _write(self, text: str) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    async def flush(self) -> None:
+        # serialized in the event loop, so that no route changes the data during the dump
+        text = json.dumps(self.data, ensure_ascii=False)
+        await asyncio.to_thread(self._write, text)
+
+    def flush_sync(self) -> None:
+        self._write(json.dumps(self.data, ensure_ascii=False))
+
+    async def run(self) -> None:
+        """
+        Write-behind loop, started with the server.
+        """
+        while True:
+            await self._changed.wait()
+            await asyncio.sleep(self.flush_interval)
+            self._changed.clear()
+            try:
+                await self.flush()
+            except OSError as e:
+                logger.error(f"Failed to save the progress: {e}")
+                self._changed.set()